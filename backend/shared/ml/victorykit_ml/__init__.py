@@ -0,0 +1,3 @@
+"""
+VictoryKit ML - code shared by the tool ML engines
+"""
@@ -0,0 +1,621 @@
+"""
+VictoryKit ML - Fuzzy Hash Index
+ssdeep / TLSH similarity search over large sample corpora, used by the
+DarkWebMonitor and RansomShield engines
+"""
+
+import logging
+import os
+import re
+from collections import Counter, defaultdict
+from threading import RLock
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# ssdeep constants (fuzzy.c)
+SPAMSUM_LENGTH = 64
+MIN_BLOCKSIZE = 3
+ROLLING_WINDOW = 7
+
+_B64 = "ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz0123456789+/"
+_SSDEEP_RE = re.compile(r"^(\d+):([A-Za-z0-9+/]{1,64}):([A-Za-z0-9+/]{0,64})(?:,.*)?$")
+_TLSH_RE = re.compile(r"^(?:T1)?([0-9A-Fa-f]{70})$")
+_RUNS = re.compile(r"(.)\1{3,}")
+
+# TLSH body: 32 bytes of 2-bit quartile codes, banded in 2-byte keys for LSH
+TLSH_BODY_BYTES = 32
+TLSH_BANDS = 16
+
+
+def _code_distance_table() -> np.ndarray:
+    """Summed TLSH code distance for every pair of body bytes (4 codes each)"""
+    a = np.arange(256)[:, None]
+    b = np.arange(256)[None, :]
+    total = np.zeros((256, 256), dtype=np.int32)
+    for shift in (0, 2, 4, 6):
+        d = np.abs(((a >> shift) & 3) - ((b >> shift) & 3))
+        total += np.where(d == 3, 6, d)
+    return total
+
+
+_TLSH_BYTE_DISTANCE = _code_distance_table()
+
+
+def digest_kind(digest: str) -> Optional[str]:
+    """'ssdeep', 'tlsh' or None for anything else (e.g. cryptographic hashes)"""
+    digest = (digest or "").strip()
+    if _SSDEEP_RE.match(digest):
+        return "ssdeep"
+    if _TLSH_RE.match(digest):
+        return "tlsh"
+    return None
+
+
+# --- ssdeep -----------------------------------------------------------------
+
+def parse_ssdeep(digest: str) -> Tuple[int, str, str]:
+    """(block size, chunk, double chunk) with runs of >3 identical chars collapsed"""
+    match = _SSDEEP_RE.match(digest.strip())
+    if not match:
+        raise ValueError(f"Not an ssdeep digest: {digest!r}")
+    return (
+        int(match.group(1)),
+        _RUNS.sub(r"\1\1\1", match.group(2)),
+        _RUNS.sub(r"\1\1\1", match.group(3)),
+    )
+
+
+_B64_CODES = np.zeros(256, dtype=np.uint64)
+_B64_CODES[[ord(c) for c in _B64]] = np.arange(64, dtype=np.uint64)
+
+
+def ssdeep_keys_batch(digests: List[str]) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Index keys of many digests: every 7-gram of each chunk packed with the
+    chunk's effective block size. Returns (keys, row of the digest per key).
+    """
+    chunks, levels = [], []
+    for digest in digests:
+        block_size, chunk, double_chunk = parse_ssdeep(digest)
+        level = max(block_size // MIN_BLOCKSIZE, 1).bit_length()
+        chunks += [chunk, double_chunk]
+        levels += [level, level + 1]
+
+    n, positions = len(chunks), SPAMSUM_LENGTH - ROLLING_WINDOW + 1
+    lengths = np.fromiter((len(c) for c in chunks), dtype=np.int64, count=n)
+    raw = "".join(c.ljust(SPAMSUM_LENGTH, "A") for c in chunks).encode()
+    codes = _B64_CODES[np.frombuffer(raw, dtype=np.uint8).reshape(n, SPAMSUM_LENGTH)]
+
+    keys = np.zeros((n, positions), dtype=np.uint64)
+    for k in range(ROLLING_WINDOW):
+        keys = (keys << np.uint64(6)) | codes[:, k:k + positions]
+    keys |= np.array(levels, dtype=np.uint64)[:, None] << np.uint64(6 * ROLLING_WINDOW)
+
+    valid = np.arange(positions) < (lengths - ROLLING_WINDOW + 1)[:, None]
+    rows = np.broadcast_to((np.arange(n) // 2)[:, None], keys.shape)
+    return keys[valid], rows[valid]
+
+
+def ssdeep_keys(digest: str) -> np.ndarray:
+    """Distinct index keys of one digest"""
+    return np.unique(ssdeep_keys_batch([digest])[0])
+
+
+def _edit_distances(query: str, others: List[str]) -> np.ndarray:
+    """
+    ssdeep edit distance (insert/delete 1, substitute 2) from `query` to each
+    of `others`, computed for all of them at once. The insertion recurrence
+    along a row is a running minimum, so each row is a few array operations.
+    """
+    n = len(others)
+    width = max((len(o) for o in others), default=0)
+    text = np.full((n, max(width, 1)), -1, dtype=np.int16)
+    for row, other in enumerate(others):
+        text[row, :len(other)] = [ord(c) for c in other]
+    text = text[:, :width]
+    lengths = np.array([len(o) for o in others], dtype=np.int64)
+    columns = np.arange(width + 1)
+
+    previous = np.tile(columns, (n, 1))
+    for i, char in enumerate(query, start=1):
+        best = np.minimum(
+            previous[:, :-1] + np.where(text == ord(char), 0, 2),  # substitute / match
+            previous[:, 1:] + 1,  # delete
+        )
+        # current[j] = min(i + j, min_k (best[k-1] + j - k)) via a running minimum
+        offsets = np.hstack([np.full((n, 1), i), best - columns[1:]])
+        previous = np.minimum.accumulate(offsets, axis=1) + columns
+    return previous[np.arange(n), lengths]
+
+
+def _score_chunks(query: str, others: List[str], block_size: int) -> np.ndarray:
+    """ssdeep score_strings for one query chunk against chunks at the same block size"""
+    scores = np.zeros(len(others), dtype=np.int64)
+    query_grams = {query[i:i + ROLLING_WINDOW] for i in range(len(query) - ROLLING_WINDOW + 1)}
+    comparable = [
+        i for i, other in enumerate(others)
+        if query_grams and any(
+            other[j:j + ROLLING_WINDOW] in query_grams
+            for j in range(len(other) - ROLLING_WINDOW + 1)
+        )
+    ]
+    if not comparable:
+        return scores
+
+    subset = [others[i] for i in comparable]
+    distance = _edit_distances(query, subset)
+    lengths = np.array([len(o) for o in subset])
+    score = (distance * SPAMSUM_LENGTH) // (len(query) + lengths)
+    score = (100 * score) // SPAMSUM_LENGTH
+    score = np.where(score >= 100, 0, 100 - score)
+    if block_size < (99 + ROLLING_WINDOW) // ROLLING_WINDOW * MIN_BLOCKSIZE:
+        cap = block_size // MIN_BLOCKSIZE * np.minimum(len(query), lengths)
+        score = np.minimum(score, cap)
+    scores[comparable] = score
+    return scores
+
+
+def ssdeep_compare_many(digest: str, others: List[str]) -> np.ndarray:
+    """ssdeep match scores (0-100) of a digest against many digests"""
+    block_size, chunk, double_chunk = parse_ssdeep(digest)
+    parsed = [parse_ssdeep(o) for o in others]
+    scores = np.zeros(len(others), dtype=np.int64)
+
+    groups: Dict[str, List[int]] = defaultdict(list)
+    for i, (other_size, other_chunk, other_double) in enumerate(parsed):
+        if other_size == block_size:
+            if (other_chunk, other_double) == (chunk, double_chunk):
+                scores[i] = 100
+            else:
+                groups["same"].append(i)
+        elif other_size == block_size * 2:
+            groups["larger"].append(i)
+        elif other_size * 2 == block_size:
+            groups["smaller"].append(i)
+
+    same = groups["same"]
+    if same:
+        scores[same] = np.maximum(
+            _score_chunks(chunk, [parsed[i][1] for i in same], block_size),
+            _score_chunks(double_chunk, [parsed[i][2] for i in same], block_size * 2),
+        )
+    if groups["larger"]:
+        larger = groups["larger"]
+        scores[larger] = _score_chunks(
+            double_chunk, [parsed[i][1] for i in larger], block_size * 2
+        )
+    if groups["smaller"]:
+        smaller = groups["smaller"]
+        scores[smaller] = _score_chunks(chunk, [parsed[i][2] for i in smaller], block_size)
+    return scores
+
+
+# --- TLSH -------------------------------------------------------------------
+
+def parse_tlsh(digest: str) -> Tuple[int, int, int, int, np.ndarray]:
+    """(checksum, L-value, Q1 ratio, Q2 ratio, body bytes) of a T1 TLSH digest"""
+    match = _TLSH_RE.match(digest.strip())
+    if not match:
+        raise ValueError(f"Not a TLSH digest: {digest!r}")
+    raw = bytes.fromhex(match.group(1))
+    # Header bytes are stored nibble-swapped
+    checksum = ((raw[0] & 0x0F) << 4) | (raw[0] >> 4)
+    lvalue = ((raw[1] & 0x0F) << 4) | (raw[1] >> 4)
+    q1, q2 = raw[2] >> 4, raw[2] & 0x0F
+    return checksum, lvalue, q1, q2, np.frombuffer(raw[3:], dtype=np.uint8)
+
+
+def _mod_diff(a: np.ndarray, b: int, r: int) -> np.ndarray:
+    d = np.abs(a - b)
+    return np.minimum(d, r - d)
+
+
+def tlsh_distances(header: Tuple[int, int, int, int], body: np.ndarray,
+                   headers: np.ndarray, bodies: np.ndarray) -> np.ndarray:
+    """TLSH distance (with length) from one digest to rows of header/body arrays"""
+    checksum, lvalue, q1, q2 = header
+    headers = headers.astype(np.int64)
+    distance = (headers[:, 0] != checksum).astype(np.int64)
+    ldiff = _mod_diff(headers[:, 1], lvalue, 256)
+    distance += np.where(ldiff <= 1, ldiff, ldiff * 12)
+    for column, q in ((2, q1), (3, q2)):
+        qdiff = _mod_diff(headers[:, column], q, 16)
+        distance += np.where(qdiff <= 1, qdiff, (qdiff - 1) * 12)
+    distance += _TLSH_BYTE_DISTANCE[body[None, :], bodies].sum(axis=1)
+    return distance
+
+
+def tlsh_band_keys(body: np.ndarray) -> np.ndarray:
+    """LSH band keys of one body (shape [bands]) or many bodies (shape [n, bands])"""
+    pairs = body.reshape(*body.shape[:-1], TLSH_BANDS, 2).astype(np.uint64)
+    bands = np.arange(TLSH_BANDS, dtype=np.uint64) << np.uint64(16)
+    return bands | (pairs[..., 0] << np.uint64(8)) | pairs[..., 1]
+
+
+# --- Index ------------------------------------------------------------------
+
+class _Postings:
+    """
+    Key -> item postings as two parallel sorted arrays, with a small dict of
+    recent additions merged in once it grows. Lookups are searchsorted.
+    """
+
+    def __init__(self, keys: Optional[np.ndarray] = None, ids: Optional[np.ndarray] = None,
+                 merge_every: int = 100000):
+        self.keys = keys if keys is not None else np.zeros(0, dtype=np.uint64)
+        self.ids = ids if ids is not None else np.zeros(0, dtype=np.uint32)
+        self.merge_every = merge_every
+        self._pending_keys: List[np.ndarray] = []
+        self._pending_ids: List[np.ndarray] = []
+        self._pending: Dict[int, List[int]] = defaultdict(list)
+        self._pending_count = 0
+
+    def __len__(self) -> int:
+        return len(self.keys) + self._pending_count
+
+    def add(self, keys: np.ndarray, item: int):
+        self._pending_keys.append(keys)
+        self._pending_ids.append(np.full(len(keys), item, dtype=np.uint32))
+        for key in keys.tolist():
+            self._pending[key].append(item)
+        self._pending_count += len(keys)
+        if self._pending_count >= self.merge_every:
+            self.merge()
+
+    def extend(self, keys: np.ndarray, ids: np.ndarray):
+        """Bulk add, merged into the sorted arrays immediately"""
+        self.merge()
+        keys = np.concatenate([self.keys, keys.astype(np.uint64)])
+        ids = np.concatenate([self.ids, ids.astype(np.uint32)])
+        order = np.argsort(keys, kind="stable")
+        keys, ids = keys[order], ids[order]
+        # An item repeating a gram posts it once (repeats are adjacent after a stable sort)
+        keep = np.concatenate([[True], (keys[1:] != keys[:-1]) | (ids[1:] != ids[:-1])])
+        self.keys, self.ids = keys[keep], ids[keep]
+
+    def merge(self):
+        if not self._pending_count:
+            return
+        keys = np.concatenate(self._pending_keys)
+        ids = np.concatenate(self._pending_ids)
+        self._pending_keys, self._pending_ids = [], []
+        self._pending = defaultdict(list)
+        self._pending_count = 0
+        self.extend(keys, ids)
+
+    def remove_items(self, items: np.ndarray):
+        self.merge()
+        keep = ~np.isin(self.ids, items)
+        self.keys, self.ids = self.keys[keep], self.ids[keep]
+
+    def lookup(self, keys: np.ndarray) -> np.ndarray:
+        """Items posted under any of the keys, repeated once per shared key"""
+        lo = np.searchsorted(self.keys, keys, side="left")
+        hi = np.searchsorted(self.keys, keys, side="right")
+        counts = hi - lo
+        if counts.sum():
+            starts = np.repeat(lo - np.concatenate([[0], np.cumsum(counts)[:-1]]), counts)
+            found = self.ids[starts + np.arange(counts.sum())]
+        else:
+            found = np.zeros(0, dtype=np.uint32)
+        if self._pending:
+            extra = [i for key in keys.tolist() for i in self._pending.get(key, ())]
+            found = np.concatenate([found, np.array(extra, dtype=np.uint32)])
+        return found
+
+
+class FuzzyHashIndex:
+    """
+    Similarity index over ssdeep and TLSH digests of known samples.
+
+    ssdeep digests are indexed by every 7-gram of each chunk together with
+    the chunk's block size. ssdeep only scores digests sharing such a gram,
+    so the gram postings return exactly the comparable samples. TLSH bodies
+    are cut into 16 two-byte bands; samples sharing a band are candidates.
+    Candidates are then scored exactly, in vectorized batches. Postings are
+    sorted arrays, so the index persists as a single .npz file and reloads
+    without rehashing. Writes only mark the index as changed; callers
+    persist it with save_if_changed() on their own schedule.
+    """
+
+    def __init__(self, path: Optional[str] = None, max_candidates: int = 2000):
+        self.path = path
+        self.max_candidates = max_candidates
+        self._lock = RLock()
+        self.digests: List[str] = []
+        self.labels: List[Optional[str]] = []
+        self.sample_ids: List[Optional[str]] = []
+        self._kinds: List[str] = []
+        self._by_digest: Dict[str, int] = {}
+        self._by_sample: Dict[str, int] = {}
+        self._ssdeep = _Postings()
+        self._tlsh = _Postings()
+        self._tlsh_rows: Dict[int, int] = {}
+        self._tlsh_headers: List[Tuple[int, int, int, int]] = []
+        self._tlsh_bodies: List[np.ndarray] = []
+        self._tlsh_header_array: Optional[np.ndarray] = None
+        self._tlsh_body_array: Optional[np.ndarray] = None
+        # Digests added since the last save or load
+        self.unsaved = 0
+
+    def __len__(self) -> int:
+        return len(self.digests)
+
+    # Loading
+
+    def _append(self, digest: str, kind: str, label: Optional[str],
+                sample_id: Optional[str]) -> int:
+        item = len(self.digests)
+        self.digests.append(digest)
+        self.labels.append(label)
+        self.sample_ids.append(sample_id)
+        self._kinds.append(kind)
+        self._by_digest[digest] = item
+        if sample_id:
+            self._by_sample[sample_id.lower()] = item
+        if kind == "tlsh":
+            checksum, lvalue, q1, q2, body = parse_tlsh(digest)
+            self._tlsh_rows[item] = len(self._tlsh_bodies)
+            self._tlsh_headers.append((checksum, lvalue, q1, q2))
+            self._tlsh_bodies.append(body)
+            self._tlsh_header_array = self._tlsh_body_array = None
+        return item
+
+    def add(self, digest: str, label: Optional[str] = None,
+            sample_id: Optional[str] = None) -> Optional[int]:
+        """Add one sample digest; returns its item id (None for unsupported digests)"""
+        digest = digest.strip()
+        kind = digest_kind(digest)
+        if kind is None:
+            return None
+        with self._lock:
+            existing = self._by_digest.get(digest)
+            if existing is not None:
+                if label and label != self.labels[existing]:
+                    self.labels[existing] = label
+                    self.unsaved += 1
+                return existing
+            item = self._append(digest, kind, label, sample_id)
+            if kind == "ssdeep":
+                self._ssdeep.add(ssdeep_keys(digest), item)
+            else:
+                self._tlsh.add(tlsh_band_keys(self._tlsh_bodies[-1]), item)
+            self.unsaved += 1
+        return item
+
+    def add_many(self, samples: Iterable[Dict[str, Any]]) -> int:
+        """
+        Bulk load samples ({"digest", "label", "sample_id"}); keys are computed
+        for the whole batch and the postings rebuilt with one sort.
+        """
+        ssdeep_items, ssdeep_digests, tlsh_items = [], [], []
+        with self._lock:
+            for sample in samples:
+                digest = (sample.get("digest") or "").strip()
+                kind = digest_kind(digest)
+                if kind is None or digest in self._by_digest:
+                    continue
+                item = self._append(digest, kind, sample.get("label"), sample.get("sample_id"))
+                if kind == "ssdeep":
+                    ssdeep_items.append(item)
+                    ssdeep_digests.append(digest)
+                else:
+                    tlsh_items.append(item)
+
+            if ssdeep_items:
+                keys, rows = ssdeep_keys_batch(ssdeep_digests)
+                self._ssdeep.extend(keys, np.array(ssdeep_items, dtype=np.uint32)[rows])
+            if tlsh_items:
+                bodies = np.stack([self._tlsh_bodies[self._tlsh_rows[i]] for i in tlsh_items])
+                self._tlsh.extend(
+                    tlsh_band_keys(bodies).ravel(),
+                    np.repeat(np.array(tlsh_items, dtype=np.uint32), TLSH_BANDS),
+                )
+            self.unsaved += len(ssdeep_items) + len(tlsh_items)
+        count = len(ssdeep_items) + len(tlsh_items)
+        logger.info(f"Bulk-loaded {count} fuzzy digests ({len(self)} total)")
+        return count
+
+    # Queries
+
+    def _tlsh_arrays(self) -> Tuple[np.ndarray, np.ndarray]:
+        if self._tlsh_body_array is None:
+            self._tlsh_header_array = np.array(self._tlsh_headers, dtype=np.int64).reshape(-1, 4)
+            self._tlsh_body_array = (
+                np.stack(self._tlsh_bodies) if self._tlsh_bodies
+                else np.zeros((0, TLSH_BODY_BYTES), dtype=np.uint8)
+            )
+        return self._tlsh_header_array, self._tlsh_body_array
+
+    def _candidates(self, found: np.ndarray, exclude: Optional[int]) -> np.ndarray:
+        if not len(found):
+            return found
+        items, shared = np.unique(found, return_counts=True)
+        if exclude is not None:
+            keep = items != exclude
+            items, shared = items[keep], shared[keep]
+        if len(items) > self.max_candidates:
+            items = items[np.argsort(-shared, kind="stable")[:self.max_candidates]]
+        return items
+
+    def similarities(self, digest: str, exclude: Optional[int] = None
+                     ) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Candidate item ids and their similarity (0-100): the ssdeep score, or
+        100 minus the TLSH distance.
+        """
+        digest = digest.strip()
+        kind = digest_kind(digest)
+        if kind is None:
+            raise ValueError("Expected an ssdeep or TLSH digest")
+        with self._lock:
+            if kind == "ssdeep":
+                items = self._candidates(self._ssdeep.lookup(ssdeep_keys(digest)), exclude)
+                if not len(items):
+                    return items, np.zeros(0)
+                scores = ssdeep_compare_many(digest, [self.digests[i] for i in items.tolist()])
+                return items, scores.astype(np.float64)
+
+            checksum, lvalue, q1, q2, body = parse_tlsh(digest)
+            items = self._candidates(self._tlsh.lookup(tlsh_band_keys(body)), exclude)
+            if not len(items):
+                return items, np.zeros(0)
+            headers, bodies = self._tlsh_arrays()
+            rows = np.array([self._tlsh_rows[i] for i in items.tolist()])
+            distances = tlsh_distances((checksum, lvalue, q1, q2), body, headers[rows], bodies[rows])
+            return items, np.maximum(0, 100 - distances).astype(np.float64)
+
+    def nearest(self, digest: str, k: int = 10, min_similarity: float = 1) -> List[Dict[str, Any]]:
+        """The k most similar known samples"""
+        items, similarity = self.similarities(digest)
+        keep = similarity >= min_similarity
+        items, similarity = items[keep], similarity[keep]
+        order = np.argsort(-similarity, kind="stable")[:k]
+        return [
+            {
+                "sample_id": self.sample_ids[item],
+                "digest": self.digests[item],
+                "label": self.labels[item],
+                "similarity": float(similarity[i]),
+            }
+            for i, item in ((i, int(items[i])) for i in order.tolist())
+        ]
+
+    def family(self, digest: str, min_similarity: float = 50, k: int = 10
+               ) -> Optional[Dict[str, Any]]:
+        """Family label voted by similarity among the nearest labelled samples"""
+        votes: Counter = Counter()
+        for match in self.nearest(digest, k, min_similarity):
+            if match["label"]:
+                votes[match["label"]] += match["similarity"]
+        if not votes:
+            return None
+        label, weight = votes.most_common(1)[0]
+        return {"label": label, "score": round(weight / sum(votes.values()) * 100, 2)}
+
+    def lookup_sample(self, sample_id: str) -> Optional[Dict[str, Any]]:
+        item = self._by_sample.get((sample_id or "").lower())
+        if item is None:
+            return None
+        return {"sample_id": self.sample_ids[item], "digest": self.digests[item],
+                "label": self.labels[item]}
+
+    def cluster(self, digests: List[str], threshold: float = 50) -> List[Dict[str, Any]]:
+        """
+        Group submitted digests into families: digests with pairwise similarity
+        >= threshold are linked, and each group is labelled from the corpus.
+        """
+        local = FuzzyHashIndex()
+        positions = {}
+        for position, digest in enumerate(digests):
+            item = local.add(digest, sample_id=str(position))
+            if item is not None:
+                positions.setdefault(item, []).append(position)
+
+        parent = list(range(len(local)))
+
+        def find(x: int) -> int:
+            while parent[x] != x:
+                parent[x] = parent[parent[x]]
+                x = parent[x]
+            return x
+
+        for item in range(len(local)):
+            neighbours, similarity = local.similarities(local.digests[item], exclude=item)
+            for other in neighbours[similarity >= threshold].tolist():
+                parent[find(other)] = find(item)
+
+        groups: Dict[int, List[int]] = defaultdict(list)
+        for item in range(len(local)):
+            groups[find(item)].append(item)
+
+        clusters = []
+        for members in groups.values():
+            votes: Counter = Counter()
+            for item in members:
+                match = self.family(local.digests[item], threshold)
+                if match:
+                    votes[match["label"]] += 1
+            clusters.append(
+                {
+                    "size": sum(len(positions[i]) for i in members),
+                    "digests": [local.digests[i] for i in members],
+                    "indices": sorted(p for i in members for p in positions[i]),
+                    "family": votes.most_common(1)[0][0] if votes else None,
+                }
+            )
+        clusters.sort(key=lambda c: c["size"], reverse=True)
+        return clusters
+
+    def stats(self) -> Dict[str, int]:
+        ssdeep = sum(1 for k in self._kinds if k == "ssdeep")
+        return {
+            "samples": len(self),
+            "ssdeep": ssdeep,
+            "tlsh": len(self) - ssdeep,
+            "labelled": sum(1 for label in self.labels if label),
+            "postings": len(self._ssdeep) + len(self._tlsh),
+        }
+
+    # Persistence
+
+    def save(self, path: Optional[str] = None):
+        path = path or self.path
+        if not path:
+            return
+        with self._lock:
+            self._ssdeep.merge()
+            self._tlsh.merge()
+            headers, bodies = self._tlsh_arrays()
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+            tmp_path = f"{path}.tmp.npz"
+            np.savez(
+                tmp_path,
+                digests=np.array(self.digests, dtype="S"),
+                labels=np.array([label or "" for label in self.labels], dtype="U"),
+                sample_ids=np.array([s or "" for s in self.sample_ids], dtype="U"),
+                kinds=np.array([k == "tlsh" for k in self._kinds], dtype=bool),
+                ssdeep_keys=self._ssdeep.keys,
+                ssdeep_ids=self._ssdeep.ids,
+                tlsh_keys=self._tlsh.keys,
+                tlsh_ids=self._tlsh.ids,
+                tlsh_items=np.array(sorted(self._tlsh_rows, key=self._tlsh_rows.get), dtype=np.int64),
+                tlsh_headers=headers,
+                tlsh_bodies=bodies,
+            )
+            os.replace(tmp_path, path)
+            self.unsaved = 0
+        logger.info(f"Saved {len(self)} fuzzy digests to {path}")
+
+    def save_if_changed(self) -> bool:
+        """Save to the bound path if digests were added since the last save"""
+        if not self.unsaved or not self.path:
+            return False
+        self.save()
+        return True
+
+    @classmethod
+    def load(cls, path: Optional[str]) -> "FuzzyHashIndex":
+        """Load a saved index, or return an empty one bound to `path`"""
+        index = cls(path)
+        if not path or not os.path.exists(path):
+            return index
+        with np.load(path) as data:
+            index.digests = [d.decode() for d in data["digests"].tolist()]
+            index.labels = [label or None for label in data["labels"].tolist()]
+            index.sample_ids = [s or None for s in data["sample_ids"].tolist()]
+            index._kinds = ["tlsh" if t else "ssdeep" for t in data["kinds"].tolist()]
+            index._ssdeep = _Postings(data["ssdeep_keys"], data["ssdeep_ids"])
+            index._tlsh = _Postings(data["tlsh_keys"], data["tlsh_ids"])
+            index._tlsh_header_array = data["tlsh_headers"]
+            index._tlsh_body_array = data["tlsh_bodies"]
+            index._tlsh_headers = [tuple(h) for h in index._tlsh_header_array.tolist()]
+            index._tlsh_bodies = list(index._tlsh_body_array)
+            index._tlsh_rows = {item: row for row, item in enumerate(data["tlsh_items"].tolist())}
+        index._by_digest = {d: i for i, d in enumerate(index.digests)}
+        index._by_sample = {s.lower(): i for i, s in enumerate(index.sample_ids) if s}
+        logger.info(f"Loaded {len(index)} fuzzy digests from {path}")
+        return index
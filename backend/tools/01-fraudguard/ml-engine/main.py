@@ -4,14 +4,21 @@ FraudGuard ML Engine - Main FastAPI Application
 
 from fastapi import FastAPI, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
-from pydantic import BaseModel, Field
-from typing import List, Optional
+from pydantic import BaseModel, Field, ValidationError
+from typing import Any, List, Optional, Union
 from datetime import datetime
+import asyncio
 import logging
+import os
+import numpy as np
 
-from models.fraud_model import FraudDetectionModel
+from models.fraud_model import DEFAULT_MODEL_DIR, FraudDetectionModel
 from models.risk_scorer import RiskScorer
 from models.anomaly_detector import AnomalyDetector
+from models.transaction_batch import TransactionBatch
+from models.velocity_store import get_velocity_store, KEY_FIELDS
+from models.prediction_trace import PredictionTraceStore
+from models.retrain_jobs import RetrainJobManager
 
 # Configure logging
 logging.basicConfig(
@@ -37,15 +44,30 @@ app.add_middleware(
 )
 
 # Initialize models
-fraud_model = FraudDetectionModel()
+fraud_model = FraudDetectionModel(model_dir=os.getenv("MODEL_DIR", DEFAULT_MODEL_DIR))
 risk_scorer = RiskScorer()
 anomaly_detector = AnomalyDetector()
+velocity_store = get_velocity_store()
+VELOCITY_KEY_KINDS = {kind for kind, _ in KEY_FIELDS}
+prediction_traces = PredictionTraceStore(
+    fraud_model.features,
+    capacity=int(os.getenv("PREDICTION_TRACE_CAPACITY", 100_000)),
+    ttl=float(os.getenv("PREDICTION_TRACE_TTL", 86400)),
+    path=os.getenv("PREDICTION_TRACE_PATH") or None,
+)
+fraud_model.attach_trace_store(prediction_traces)
+retrain_jobs = RetrainJobManager(
+    fraud_model,
+    max_workers=int(os.getenv("RETRAIN_WORKERS", 1)),
+    default_data_path=os.getenv("TRAINING_DATA_PATH") or None,
+    data_dir=os.getenv("TRAINING_DATA_DIR") or None,
+)
 
 
 # Pydantic models
 class TransactionInput(BaseModel):
     transaction_id: str
-    amount: float
+    amount: float = Field(..., allow_inf_nan=False)
     currency: str = "USD"
     user_email: str
     user_ip: str
@@ -54,6 +76,7 @@ class TransactionInput(BaseModel):
     country: str
     city: Optional[str] = None
     merchant_category: Optional[str] = None
+    user_segment: Optional[str] = None
     timestamp: Optional[datetime] = None
 
 
@@ -73,6 +96,12 @@ class FraudAnalysisResult(BaseModel):
     model_version: str
 
 
+class BatchItemError(BaseModel):
+    index: int
+    transaction_id: Optional[str] = None
+    error: str
+
+
 class AnomalyResult(BaseModel):
     transaction_id: str
     is_anomaly: bool
@@ -80,6 +109,11 @@ class AnomalyResult(BaseModel):
     anomaly_type: str
 
 
+class RetrainRequest(BaseModel):
+    data_path: Optional[str] = None
+    holdout_fraction: float = Field(0.2, gt=0, lt=1)
+
+
 class ModelInfo(BaseModel):
     model_version: str
     last_trained: str
@@ -98,66 +132,128 @@ async def health_check():
             "fraud_detection": fraud_model.is_loaded,
             "risk_scorer": risk_scorer.is_loaded,
             "anomaly_detector": anomaly_detector.is_loaded,
+            "velocity_store": velocity_store.is_loaded,
         }
     }
 
 
+# Maximum transactions accepted by /batch-analyze
+MAX_BATCH_SIZE = 10000
+
+RISK_LEVELS = np.array(["low", "medium", "high", "critical"])
+RISK_LEVEL_BOUNDS = [30, 60, 80]
+
+
+def score_transactions(transactions: List[TransactionInput]) -> List[FraudAnalysisResult]:
+    """
+    Score a batch of transactions with the columnar engine.
+    Builds one feature matrix and one rule-hit matrix for the whole batch.
+    """
+    batch = TransactionBatch([tx.model_dump() for tx in transactions])
+    velocity_store.record_batch(batch)
+    
+    # Get ML predictions
+    ml_scores, ml_confidences = fraud_model.predict_batch(batch)
+    
+    # Get rule-based indicators
+    rule_eval = risk_scorer.evaluate_batch(batch)
+    rule_scores = rule_eval.scores
+    indicators = rule_eval.indicators(batch)
+    
+    # Calculate final score (weighted combination of ML and rules)
+    final_scores = (ml_scores * 0.7) + (np.minimum(rule_scores, 100) * 0.3)
+    final_scores = np.clip(final_scores, 0, 100)
+    
+    # Keep what the model saw so /explain can answer without rescoring
+    if batch.feature_matrix is not None:
+        prediction_traces.record_batch(
+            batch.transaction_ids,
+            batch.feature_matrix,
+            batch.model_version.contributions(batch.feature_matrix),
+            rule_eval.hits,
+            rule_eval.rule_ids,
+            final_scores,
+        )
+    
+    # Determine risk level
+    risk_levels = RISK_LEVELS[np.searchsorted(RISK_LEVEL_BOUNDS, final_scores, side="right")]
+    
+    final_scores = np.round(final_scores, 2).tolist()
+    ml_confidences = np.round(ml_confidences, 2).tolist()
+    risk_levels = risk_levels.tolist()
+    
+    return [
+        FraudAnalysisResult(
+            transaction_id=batch.transaction_ids[i],
+            score=final_scores[i],
+            risk_level=risk_levels[i],
+            confidence=ml_confidences[i],
+            indicators=[FraudIndicator(**ind) for ind in indicators[i]],
+            model_version=batch.model_version.version
+        )
+        for i in range(len(batch))
+    ]
+
+
 # Analyze transaction
 @app.post("/analyze", response_model=FraudAnalysisResult)
 async def analyze_transaction(transaction: TransactionInput):
     try:
         logger.info(f"Analyzing transaction {transaction.transaction_id}")
         
-        # Get ML prediction
-        ml_score, ml_confidence = fraud_model.predict(transaction.model_dump())
-        
-        # Get rule-based indicators
-        indicators = risk_scorer.get_indicators(transaction.model_dump())
-        
-        # Calculate final score (weighted combination of ML and rules)
-        rule_score = sum(ind["weight"] for ind in indicators)
-        final_score = (ml_score * 0.7) + (min(rule_score, 100) * 0.3)
-        final_score = min(100, max(0, final_score))
+        result = score_transactions([transaction])[0]
         
-        # Determine risk level
-        if final_score < 30:
-            risk_level = "low"
-        elif final_score < 60:
-            risk_level = "medium"
-        elif final_score < 80:
-            risk_level = "high"
-        else:
-            risk_level = "critical"
+        logger.info(f"Transaction {transaction.transaction_id} - Score: {result.score:.2f} ({result.risk_level})")
         
-        logger.info(f"Transaction {transaction.transaction_id} - Score: {final_score:.2f} ({risk_level})")
-        
-        return FraudAnalysisResult(
-            transaction_id=transaction.transaction_id,
-            score=round(final_score, 2),
-            risk_level=risk_level,
-            confidence=round(ml_confidence, 2),
-            indicators=[FraudIndicator(**ind) for ind in indicators],
-            model_version=fraud_model.version
-        )
+        return result
     except Exception as e:
         logger.error(f"Error analyzing transaction: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
 
 # Batch analyze
-@app.post("/batch-analyze", response_model=List[FraudAnalysisResult])
-async def batch_analyze(transactions: List[TransactionInput]):
-    if len(transactions) > 100:
-        raise HTTPException(status_code=400, detail="Maximum 100 transactions per batch")
+@app.post("/batch-analyze", response_model=List[Union[FraudAnalysisResult, BatchItemError]])
+async def batch_analyze(transactions: List[Any]):
+    if len(transactions) > MAX_BATCH_SIZE:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Maximum {MAX_BATCH_SIZE} transactions per batch"
+        )
+    
+    logger.info(f"Analyzing batch of {len(transactions)} transactions")
     
-    results = []
-    for tx in transactions:
+    # Malformed rows get an error entry in their place; the rest are scored
+    results: List[Any] = [None] * len(transactions)
+    valid, positions = [], []
+    for i, item in enumerate(transactions):
         try:
-            result = await analyze_transaction(tx)
-            results.append(result)
-        except Exception as e:
-            logger.error(f"Error analyzing transaction {tx.transaction_id}: {e}")
+            valid.append(TransactionInput.model_validate(item))
+            positions.append(i)
+        except ValidationError as e:
+            transaction_id = item.get("transaction_id") if isinstance(item, dict) else None
+            logger.error(f"Invalid transaction {transaction_id} at index {i}: {e.error_count()} errors")
+            results[i] = BatchItemError(
+                index=i, transaction_id=str(transaction_id) if transaction_id is not None else None,
+                error="; ".join(
+                    f"{'.'.join(map(str, err['loc'])) or 'item'}: {err['msg']}" for err in e.errors()
+                )
+            )
     
+    try:
+        scored = score_transactions(valid) if valid else []
+    except Exception as e:
+        # Fall back to one row at a time so a row the batch path rejects fails alone
+        logger.error(f"Error analyzing batch, scoring rows individually: {e}")
+        scored = []
+        for i, tx in zip(positions, valid):
+            try:
+                scored.append(score_transactions([tx])[0])
+            except Exception as row_error:
+                logger.error(f"Error analyzing transaction {tx.transaction_id}: {row_error}")
+                scored.append(BatchItemError(index=i, transaction_id=tx.transaction_id, error=str(row_error)))
+    
+    for i, result in zip(positions, scored):
+        results[i] = result
     return results
 
 
@@ -167,7 +263,7 @@ async def detect_anomalies(transactions: List[TransactionInput]):
     try:
         results = []
         for tx in transactions:
-            is_anomaly, anomaly_score, anomaly_type = anomaly_detector.detect(tx.model_dump())
+            is_anomaly, anomaly_score, anomaly_type = anomaly_detector.detect_and_observe(tx.model_dump())
             results.append(AnomalyResult(
                 transaction_id=tx.transaction_id,
                 is_anomaly=is_anomaly,
@@ -180,6 +276,12 @@ async def detect_anomalies(transactions: List[TransactionInput]):
         raise HTTPException(status_code=500, detail=str(e))
 
 
+# Baseline summary
+@app.get("/baselines")
+async def get_baselines():
+    return anomaly_detector.baseline_summary()
+
+
 # Get model info
 @app.get("/model-info", response_model=ModelInfo)
 async def get_model_info():
@@ -191,32 +293,117 @@ async def get_model_info():
     )
 
 
+# Velocity lookup
+@app.get("/velocity/{kind}/{value}")
+async def get_velocity(kind: str, value: str, at: Optional[float] = None):
+    if kind not in VELOCITY_KEY_KINDS:
+        raise HTTPException(status_code=400, detail=f"Unknown velocity key kind: {kind}")
+    return {
+        "kind": kind,
+        "value": value,
+        "counts": velocity_store.query(kind, value, at),
+        "limits": velocity_store.limits,
+    }
+
+
+# Rule statistics
+@app.get("/rules/stats")
+async def get_rule_stats():
+    return risk_scorer.rule_stats()
+
+
+# Reload rules from the rule file
+@app.post("/rules/reload")
+async def reload_rules():
+    if not risk_scorer.reload_rules():
+        raise HTTPException(status_code=422, detail="Rule file failed to compile; previous rules kept")
+    stats = risk_scorer.rule_stats()
+    return {"status": "reloaded", "version": stats["version"], "rules": len(stats["rules"])}
+
+
 # Explain prediction
 @app.get("/explain/{transaction_id}")
 async def explain_prediction(transaction_id: str):
     try:
         explanation = fraud_model.explain(transaction_id)
-        return explanation
     except Exception as e:
         logger.error(f"Error explaining prediction: {e}")
         raise HTTPException(status_code=500, detail=str(e))
+    
+    if explanation is None:
+        raise HTTPException(
+            status_code=404,
+            detail=f"No stored prediction for transaction {transaction_id}"
+        )
+    return explanation
 
 
 # Retrain model (admin only)
 @app.post("/retrain")
-async def retrain_model():
+async def retrain_model(request: Optional[RetrainRequest] = None):
+    request = request or RetrainRequest()
     try:
-        job_id = fraud_model.retrain()
+        job_id = retrain_jobs.submit(request.data_path, request.holdout_fraction)
         return {
             "status": "started",
             "message": "Model retraining initiated",
             "job_id": job_id
         }
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         logger.error(f"Error initiating retraining: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
 
+# Retraining job status
+@app.get("/retrain/{job_id}")
+async def get_retrain_status(job_id: str):
+    job = retrain_jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Unknown retraining job: {job_id}")
+    return job
+
+
+# Model versions
+@app.get("/model/versions")
+async def list_model_versions():
+    return {"active": fraud_model.version, "versions": fraud_model.list_versions()}
+
+
+# Roll back to a previous model version (admin only)
+@app.post("/model/rollback/{version}")
+async def rollback_model(version: str):
+    try:
+        fraud_model.rollback(version)
+    except KeyError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    return {"status": "activated", "model_version": version}
+
+
+async def baseline_snapshot_loop():
+    interval = float(os.getenv("ANOMALY_SNAPSHOT_CHECK_INTERVAL", "5"))
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            await anomaly_detector.snapshot_if_due()
+        except Exception as e:
+            logger.error(f"Error snapshotting anomaly baselines: {e}")
+
+
+@app.on_event("startup")
+async def start_baseline_snapshots():
+    app.state.baseline_snapshots = asyncio.create_task(baseline_snapshot_loop())
+
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    """Persist streaming state and stop background workers on shutdown"""
+    app.state.baseline_snapshots.cancel()
+    anomaly_detector.snapshot()
+    retrain_jobs.shutdown()
+
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run(app, host="0.0.0.0", port=8001)
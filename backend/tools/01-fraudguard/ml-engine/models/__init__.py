@@ -2,15 +2,30 @@
 FraudGuard ML Engine - Models Package
 """
 
-from .fraud_model import FraudDetectionModel, get_model
+from .fraud_model import FraudDetectionModel, ModelVersion, get_model
 from .risk_scorer import RiskScorer, get_scorer
 from .anomaly_detector import AnomalyDetector, get_detector
+from .transaction_batch import TransactionBatch
+from .velocity_store import VelocityStore, get_velocity_store
+from .streaming_baseline import BaselineStore, StreamingBaseline
+from .prediction_trace import PredictionTraceStore
+from .rule_engine import RuleEngine
+from .retrain_jobs import RetrainJobManager
 
 __all__ = [
     "FraudDetectionModel",
+    "ModelVersion",
     "RiskScorer", 
     "AnomalyDetector",
+    "TransactionBatch",
+    "VelocityStore",
+    "BaselineStore",
+    "StreamingBaseline",
+    "PredictionTraceStore",
+    "RuleEngine",
+    "RetrainJobManager",
     "get_model",
     "get_scorer",
-    "get_detector"
+    "get_detector",
+    "get_velocity_store"
 ]
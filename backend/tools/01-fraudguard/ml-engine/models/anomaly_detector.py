@@ -3,36 +3,47 @@ FraudGuard ML Engine - Anomaly Detector
 Statistical anomaly detection for transaction patterns
 """
 
-import numpy as np
+import asyncio
 import logging
-from typing import Dict, Any, Tuple, List
+import os
+from typing import Dict, Any, Tuple, List, Optional
 from datetime import datetime
 
+from .streaming_baseline import BaselineStore, StreamingBaseline
+
 logger = logging.getLogger(__name__)
 
+DEFAULT_SNAPSHOT_PATH = os.path.join(
+    os.path.dirname(__file__), "..", "data", "anomaly_baselines.json"
+)
+
 
 class AnomalyDetector:
     """
     Anomaly detection using statistical methods and isolation forest.
     Detects unusual patterns that may indicate fraud.
+    
+    Baselines are streaming: every observed transaction updates the global,
+    merchant-category and user-segment baselines in O(1), and scoring uses the
+    most specific baseline that has seen enough transactions.
     """
     
-    def __init__(self):
+    def __init__(self, snapshot_path: Optional[str] = None):
         self.is_loaded = True
         self.threshold = 0.7  # Anomaly score threshold
+        self.min_samples = 50  # Observations before a specific baseline is trusted
+        self.prior_weight = 1000  # Pseudo-observations behind the seeded global baseline
         
-        # Simulated baseline statistics (would be computed from historical data)
-        self.baselines = {
-            "amount_mean": 250.0,
-            "amount_std": 500.0,
-            "hourly_distribution": self._create_hourly_baseline(),
-            "country_frequency": self._create_country_baseline(),
-        }
+        if snapshot_path is None:
+            snapshot_path = os.getenv("ANOMALY_BASELINE_PATH", DEFAULT_SNAPSHOT_PATH)
+        self.store = BaselineStore(snapshot_path)
+        if not self.store.load():
+            self._seed_global_baseline()
         
         logger.info("Anomaly Detector loaded")
     
     def _create_hourly_baseline(self) -> Dict[int, float]:
-        """Create hourly transaction distribution baseline"""
+        """Create hourly transaction distribution prior"""
         # Normal business hours have higher transaction volume
         return {
             0: 0.02, 1: 0.01, 2: 0.01, 3: 0.01, 4: 0.01, 5: 0.02,
@@ -42,28 +53,73 @@ class AnomalyDetector:
         }
     
     def _create_country_baseline(self) -> Dict[str, float]:
-        """Create country frequency baseline"""
+        """Create country frequency prior"""
         return {
             "US": 0.45, "GB": 0.10, "CA": 0.08, "AU": 0.05,
             "DE": 0.04, "FR": 0.04, "JP": 0.03, "OTHER": 0.21
         }
     
-    def _calculate_amount_anomaly(self, amount: float) -> float:
+    def _seed_global_baseline(self):
+        """Seed the global baseline with prior statistics until real data arrives"""
+        baseline = self.store.get_or_create(BaselineStore.GLOBAL_KEY)
+        amount_mean, amount_std = 250.0, 500.0
+        baseline.count = self.prior_weight
+        baseline.mean = amount_mean
+        baseline.m2 = amount_std ** 2 * (self.prior_weight - 1)
+        for hour, freq in self._create_hourly_baseline().items():
+            baseline.hourly[hour] = freq * self.prior_weight
+        for country, freq in self._create_country_baseline().items():
+            if country != "OTHER":
+                baseline.countries.add(country, freq * self.prior_weight)
+        baseline.decayed_total = float(self.prior_weight)
+    
+    def _baseline_keys(self, transaction: Dict[str, Any]) -> List[str]:
+        """Baselines a transaction belongs to, most specific first"""
+        keys = []
+        merchant_cat = (transaction.get("merchant_category") or "").lower()
+        if merchant_cat:
+            keys.append(BaselineStore.merchant_key(merchant_cat))
+        segment = (transaction.get("user_segment") or "").lower()
+        if segment:
+            keys.append(BaselineStore.segment_key(segment))
+        keys.append(BaselineStore.GLOBAL_KEY)
+        return keys
+    
+    def _select_baseline(self, transaction: Dict[str, Any]) -> StreamingBaseline:
+        """Most specific baseline with enough observations"""
+        keys = self._baseline_keys(transaction)
+        for key in keys[:-1]:
+            baseline = self.store.get(key)
+            if baseline is not None and baseline.count >= self.min_samples:
+                return baseline
+        return self.store.get_or_create(BaselineStore.GLOBAL_KEY)
+    
+    @staticmethod
+    def _parse_hour(timestamp: Any) -> Optional[int]:
+        if not timestamp:
+            return None
+        try:
+            if isinstance(timestamp, str):
+                timestamp = datetime.fromisoformat(timestamp.replace("Z", "+00:00"))
+            return timestamp.hour
+        except (ValueError, AttributeError):
+            return None
+    
+    def _calculate_amount_anomaly(self, baseline: StreamingBaseline, amount: float) -> float:
         """Calculate anomaly score based on transaction amount"""
-        z_score = abs(amount - self.baselines["amount_mean"]) / self.baselines["amount_std"]
+        z_score = abs(amount - baseline.mean) / max(baseline.std, 1.0)
         # Map z-score to 0-1 range
         return min(1.0, z_score / 4)  # z-score of 4+ is considered fully anomalous
     
-    def _calculate_time_anomaly(self, timestamp: datetime) -> float:
+    def _calculate_time_anomaly(self, baseline: StreamingBaseline, hour: int) -> float:
         """Calculate anomaly score based on transaction time"""
-        hour = timestamp.hour
-        expected_freq = self.baselines["hourly_distribution"].get(hour, 0.02)
+        expected_freq = baseline.hour_frequency(hour)
         # Lower frequency hours are more anomalous
-        return 1.0 - (expected_freq * 10)  # Scale to 0-1
+        return min(1.0, max(0.0, 1.0 - (expected_freq * 10)))  # Scale to 0-1
     
-    def _calculate_location_anomaly(self, country: str) -> float:
+    def _calculate_location_anomaly(self, baseline: StreamingBaseline, country: str) -> float:
         """Calculate anomaly score based on location"""
-        freq = self.baselines["country_frequency"].get(country.upper(), 0.01)
+        freq = baseline.country_frequency(country.upper())
         if freq < 0.02:  # Very rare country
             return 0.8
         elif freq < 0.05:  # Uncommon country
@@ -71,30 +127,23 @@ class AnomalyDetector:
         else:
             return 0.2
     
-    def _calculate_pattern_anomaly(self, transaction: Dict[str, Any]) -> float:
+    def _calculate_pattern_anomaly(self, baseline: StreamingBaseline, transaction: Dict[str, Any]) -> float:
         """Calculate overall pattern anomaly score"""
         scores = []
         
         # Amount anomaly
         amount = float(transaction.get("amount", 0))
-        scores.append(self._calculate_amount_anomaly(amount))
+        scores.append(self._calculate_amount_anomaly(baseline, amount))
         
         # Time anomaly
-        timestamp = transaction.get("timestamp")
-        if timestamp:
-            try:
-                if isinstance(timestamp, str):
-                    dt = datetime.fromisoformat(timestamp.replace("Z", "+00:00"))
-                else:
-                    dt = timestamp
-                scores.append(self._calculate_time_anomaly(dt))
-            except:
-                scores.append(0.5)
+        if transaction.get("timestamp"):
+            hour = self._parse_hour(transaction.get("timestamp"))
+            scores.append(self._calculate_time_anomaly(baseline, hour) if hour is not None else 0.5)
         
         # Location anomaly
         country = transaction.get("country", "")
         if country:
-            scores.append(self._calculate_location_anomaly(country))
+            scores.append(self._calculate_location_anomaly(baseline, country))
         
         # Device anomaly (new devices are more suspicious)
         device_fp = transaction.get("device_fingerprint", "")
@@ -114,13 +163,14 @@ class AnomalyDetector:
         Returns (is_anomaly, anomaly_score, anomaly_type)
         """
         try:
-            anomaly_score = self._calculate_pattern_anomaly(transaction)
+            baseline = self._select_baseline(transaction)
+            anomaly_score = self._calculate_pattern_anomaly(baseline, transaction)
             is_anomaly = anomaly_score >= self.threshold
             
             # Determine anomaly type
             if is_anomaly:
                 amount = float(transaction.get("amount", 0))
-                if amount > self.baselines["amount_mean"] + 3 * self.baselines["amount_std"]:
+                if amount > baseline.mean + 3 * max(baseline.std, 1.0):
                     anomaly_type = "amount_outlier"
                 elif transaction.get("device_fingerprint", "") == "unknown":
                     anomaly_type = "new_device"
@@ -139,17 +189,47 @@ class AnomalyDetector:
         """Detect anomalies in a batch of transactions"""
         return [self.detect(tx) for tx in transactions]
     
+    def observe(self, transaction: Dict[str, Any]):
+        """Fold a transaction into every baseline it belongs to"""
+        self.store.observe(
+            self._baseline_keys(transaction),
+            float(transaction.get("amount", 0)),
+            self._parse_hour(transaction.get("timestamp")),
+            (transaction.get("country") or "").upper(),
+        )
+    
+    def detect_and_observe(self, transaction: Dict[str, Any]) -> Tuple[bool, float, str]:
+        """Score a transaction against the current baselines, then learn from it"""
+        result = self.detect(transaction)
+        self.observe(transaction)
+        return result
+    
     def update_baselines(self, transactions: List[Dict[str, Any]]):
         """Update baselines with new transaction data"""
-        if not transactions:
-            return
-        
-        # Update amount statistics
-        amounts = [float(tx.get("amount", 0)) for tx in transactions]
-        self.baselines["amount_mean"] = np.mean(amounts)
-        self.baselines["amount_std"] = max(np.std(amounts), 1.0)  # Avoid division by zero
+        for tx in transactions:
+            self.observe(tx)
         
-        logger.info("Baselines updated with new transaction data")
+        logger.info(f"Baselines updated with {len(transactions)} transactions")
+    
+    def baseline_summary(self) -> Dict[str, Dict[str, float]]:
+        """Observation count, mean and standard deviation per baseline"""
+        return {
+            key: {"count": b.count, "amount_mean": round(b.mean, 2), "amount_std": round(b.std, 2)}
+            for key, b in self.store.baselines.items()
+        }
+    
+    def snapshot(self):
+        """Persist baselines so restarts resume from the learned state"""
+        self.store.snapshot()
+    
+    async def snapshot_if_due(self):
+        """
+        Persist baselines once enough observations have accumulated. The
+        state is copied on the event loop, where it is mutated, and
+        serialized and written in a worker thread.
+        """
+        if self.store.snapshot_due:
+            await asyncio.to_thread(self.store.write_snapshot, self.store.snapshot_state())
 
 
 # Singleton instance
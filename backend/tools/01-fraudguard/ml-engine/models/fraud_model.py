@@ -5,13 +5,57 @@ Deep learning model for transaction fraud detection
 
 import numpy as np
 import logging
-from typing import Dict, Any, Tuple, List
-from datetime import datetime
-import uuid
-import hashlib
+import json
+import os
+import tempfile
+from threading import Lock
+from typing import Dict, Any, Tuple, List, Optional
+
+from .transaction_batch import TransactionBatch
+from .prediction_trace import PredictionTraceStore
 
 logger = logging.getLogger(__name__)
 
+DEFAULT_MODEL_DIR = os.path.join(os.path.dirname(__file__), "..", "data", "models")
+
+
+class ModelVersion:
+    """
+    Immutable set of model parameters.
+    The live model swaps whole versions, so a request that captured a version
+    scores with it consistently even if a retrain finishes mid-request.
+    """
+    
+    __slots__ = ("version", "weights", "weight_vector", "trained_at", "accuracy", "metrics")
+    
+    def __init__(self, version: str, weights: Dict[str, float], features: List[str],
+                 trained_at: str, accuracy: float, metrics: Optional[Dict[str, Any]] = None):
+        self.version = version
+        self.weights = dict(weights)
+        self.weight_vector = np.array([weights[name] for name in features], dtype=np.float64)
+        self.weight_vector.flags.writeable = False
+        self.trained_at = trained_at
+        self.accuracy = accuracy
+        self.metrics = metrics or {}
+    
+    def contributions(self, matrix: np.ndarray) -> np.ndarray:
+        """Per-feature score contributions (in score points) for a feature matrix"""
+        return matrix * self.weight_vector * 100
+    
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "version": self.version,
+            "weights": self.weights,
+            "trained_at": self.trained_at,
+            "accuracy": self.accuracy,
+            "metrics": self.metrics,
+        }
+    
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any], features: List[str]) -> "ModelVersion":
+        return cls(data["version"], data["weights"], features, data["trained_at"],
+                   data["accuracy"], data.get("metrics"))
+
 
 class FraudDetectionModel:
     """
@@ -19,11 +63,9 @@ class FraudDetectionModel:
     Uses transaction features to predict fraud probability.
     """
     
-    def __init__(self):
-        self.version = "2.0.0"
-        self.last_trained = "2025-01-15T00:00:00Z"
-        self.accuracy = 94.7
+    def __init__(self, model_dir: Optional[str] = None):
         self.is_loaded = True
+        self.model_dir = model_dir
         self.features = [
             "amount",
             "hour_of_day",
@@ -38,15 +80,21 @@ class FraudDetectionModel:
             "card_age",
             "ip_risk_score"
         ]
+        self._feature_index = {name: i for i, name in enumerate(self.features)}
+        
+        self.trace_store: Optional[PredictionTraceStore] = None
+        self.versions: Dict[str, ModelVersion] = {}
+        self._lock = Lock()
         
         # Simulate model weights (in production, would load from file)
         self._initialize_weights()
+        self._load_versions()
         logger.info(f"Fraud Detection Model v{self.version} loaded")
     
     def _initialize_weights(self):
         """Initialize model weights (simulated)"""
         np.random.seed(42)
-        self.weights = {
+        weights = {
             "amount": 0.15,
             "hour_of_day": 0.08,
             "day_of_week": 0.05,
@@ -60,131 +108,243 @@ class FraudDetectionModel:
             "card_age": 0.05,
             "ip_risk_score": 0.05
         }
+        initial = ModelVersion("2.0.0", weights, self.features, "2025-01-15T00:00:00Z", 94.7)
+        self.versions[initial.version] = initial
+        self._active = initial
     
-    def _extract_features(self, transaction: Dict[str, Any]) -> Dict[str, float]:
-        """Extract features from transaction data"""
-        features = {}
+    # The active version's attributes, read through a single reference
+    @property
+    def active_version(self) -> ModelVersion:
+        return self._active
+    
+    @property
+    def version(self) -> str:
+        return self._active.version
+    
+    @property
+    def last_trained(self) -> str:
+        return self._active.trained_at
+    
+    @property
+    def accuracy(self) -> float:
+        return self._active.accuracy
+    
+    @property
+    def weights(self) -> Dict[str, float]:
+        return self._active.weights
+    
+    @property
+    def weight_vector(self) -> np.ndarray:
+        return self._active.weight_vector
+    
+    def _version_path(self, version: str) -> str:
+        return os.path.join(self.model_dir, f"fraud_model_{version}.json")
+    
+    def _load_versions(self):
+        """Restore saved versions and the active pointer from model_dir"""
+        if not self.model_dir or not os.path.isdir(self.model_dir):
+            return
+        for name in sorted(os.listdir(self.model_dir)):
+            if name.startswith("fraud_model_") and name.endswith(".json"):
+                with open(os.path.join(self.model_dir, name)) as f:
+                    loaded = ModelVersion.from_dict(json.load(f), self.features)
+                self.versions[loaded.version] = loaded
+        active_path = os.path.join(self.model_dir, "active.json")
+        if os.path.exists(active_path):
+            with open(active_path) as f:
+                active = json.load(f)["version"]
+            if active in self.versions:
+                self._active = self.versions[active]
+    
+    def _write_json(self, path: str, data: Dict[str, Any]):
+        """Write a JSON file atomically"""
+        os.makedirs(self.model_dir, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=self.model_dir, suffix=".tmp")
+        with os.fdopen(fd, "w") as f:
+            json.dump(data, f)
+        os.replace(tmp_path, path)
+    
+    def activate(self, model_version: ModelVersion):
+        """
+        Register a version and make it live.
+        The swap is a single reference assignment, so in-flight requests finish
+        on the version they started with.
+        """
+        with self._lock:
+            self.versions[model_version.version] = model_version
+            if self.model_dir:
+                self._write_json(self._version_path(model_version.version), model_version.to_dict())
+                self._write_json(os.path.join(self.model_dir, "active.json"),
+                                 {"version": model_version.version})
+            self._active = model_version
+        logger.info(f"Fraud Detection Model v{model_version.version} activated")
+    
+    def rollback(self, version: str) -> ModelVersion:
+        """Reactivate a previously registered version"""
+        if version not in self.versions:
+            raise KeyError(f"Unknown model version: {version}")
+        self.activate(self.versions[version])
+        return self.versions[version]
+    
+    def list_versions(self) -> List[Dict[str, Any]]:
+        return [
+            {
+                "version": v.version,
+                "trained_at": v.trained_at,
+                "accuracy": v.accuracy,
+                "active": v is self._active,
+                "metrics": v.metrics,
+            }
+            for v in sorted(self.versions.values(), key=lambda v: v.trained_at)
+        ]
+    
+    def _extract_feature_matrix(self, batch: TransactionBatch) -> np.ndarray:
+        """
+        Extract the feature matrix for a batch of transactions.
+        Returns an array of shape (len(batch), len(self.features)).
+        """
+        n = len(batch)
+        matrix = np.empty((n, len(self.features)), dtype=np.float64)
+        col = self._feature_index
+        amount = batch.amount
         
         # Amount feature (normalized)
-        amount = float(transaction.get("amount", 0))
-        features["amount"] = min(1.0, amount / 10000)
-        
-        # Time features
-        timestamp = transaction.get("timestamp")
-        if timestamp:
-            if isinstance(timestamp, str):
-                dt = datetime.fromisoformat(timestamp.replace("Z", "+00:00"))
-            else:
-                dt = timestamp
-            features["hour_of_day"] = dt.hour / 24
-            features["day_of_week"] = dt.weekday() / 7
-            features["is_weekend"] = 1.0 if dt.weekday() >= 5 else 0.0
-        else:
-            features["hour_of_day"] = 0.5
-            features["day_of_week"] = 0.5
-            features["is_weekend"] = 0.0
+        matrix[:, col["amount"]] = np.minimum(1.0, amount / 10000)
+        
+        # Time features (missing timestamps fall back to neutral values)
+        has_ts = batch.has_timestamp
+        matrix[:, col["hour_of_day"]] = np.where(has_ts, batch.hour / 24, 0.5)
+        matrix[:, col["day_of_week"]] = np.where(has_ts, batch.weekday / 7, 0.5)
+        matrix[:, col["is_weekend"]] = np.where(has_ts & (batch.weekday >= 5), 1.0, 0.0)
         
         # Country risk score
         high_risk_countries = ["XX", "YY", "ZZ", "RU", "NG", "VN"]
-        country = transaction.get("country", "").upper()
-        features["country_risk_score"] = 0.8 if country in high_risk_countries else 0.2
+        matrix[:, col["country_risk_score"]] = np.where(
+            np.isin(batch.country, high_risk_countries), 0.8, 0.2
+        )
         
         # Device age (simulated - would check against user history)
-        device_fp = transaction.get("device_fingerprint", "")
-        features["device_age"] = 0.8 if len(device_fp) < 10 or device_fp == "unknown" else 0.2
+        unknown_device = (batch.device_fingerprint_length < 10) | (
+            batch.device_fingerprint == "unknown"
+        )
+        matrix[:, col["device_age"]] = np.where(unknown_device, 0.8, 0.2)
         
         # Email domain risk
-        email = transaction.get("user_email", "")
-        domain = email.split("@")[-1].lower() if "@" in email else ""
         disposable_domains = ["tempmail.com", "throwaway.com", "fakeemail.com", "guerrillamail.com"]
-        features["email_domain_risk"] = 0.9 if domain in disposable_domains else 0.1
+        matrix[:, col["email_domain_risk"]] = np.where(
+            np.isin(batch.email_domain, disposable_domains), 0.9, 0.1
+        )
         
-        # Transaction velocity (simulated)
-        features["transaction_velocity"] = 0.3  # Would check recent transaction count
+        # Transaction velocity (neutral value when no velocity history was recorded)
+        if batch.velocity_ratio is not None:
+            matrix[:, col["transaction_velocity"]] = batch.velocity_ratio
+        else:
+            matrix[:, col["transaction_velocity"]] = 0.3
         
         # Amount deviation from user average (simulated)
-        features["amount_deviation"] = 0.5 if amount > 5000 else min(1.0, amount / 1000 * 0.1)
+        matrix[:, col["amount_deviation"]] = np.where(
+            amount > 5000, 0.5, np.minimum(1.0, amount / 1000 * 0.1)
+        )
         
         # Merchant category risk
-        merchant_cat = transaction.get("merchant_category", "").lower()
         risky_categories = ["gambling", "crypto", "adult", "money_transfer"]
-        features["merchant_category_risk"] = 0.7 if merchant_cat in risky_categories else 0.2
+        matrix[:, col["merchant_category_risk"]] = np.where(
+            np.isin(batch.merchant_category, risky_categories), 0.7, 0.2
+        )
         
         # Card age (simulated)
-        features["card_age"] = 0.3  # Would check card first seen date
+        matrix[:, col["card_age"]] = 0.3  # Would check card first seen date
         
-        # IP risk score
-        ip = transaction.get("user_ip", "")
-        # Simulated IP risk check
-        features["ip_risk_score"] = 0.6 if ip.startswith("10.") or ip == "0.0.0.0" else 0.2
+        # IP risk score (simulated)
+        suspicious_ip = np.char.startswith(batch.user_ip, "10.") | (batch.user_ip == "0.0.0.0")
+        matrix[:, col["ip_risk_score"]] = np.where(suspicious_ip, 0.6, 0.2)
         
-        return features
+        return matrix
     
-    def predict(self, transaction: Dict[str, Any]) -> Tuple[float, float]:
+    def _extract_features(self, transaction: Dict[str, Any]) -> Dict[str, float]:
+        """Extract features from transaction data"""
+        row = self._extract_feature_matrix(TransactionBatch([transaction]))[0]
+        return dict(zip(self.features, row.tolist()))
+    
+    def predict_batch(self, batch: TransactionBatch) -> Tuple[np.ndarray, np.ndarray]:
         """
-        Predict fraud score for a transaction.
-        Returns (score, confidence)
+        Predict fraud scores for a batch of transactions.
+        Returns (scores, confidences) as arrays aligned with the batch.
         """
+        n = len(batch)
+        active = self._active
+        batch.model_version = active
         try:
-            features = self._extract_features(transaction)
+            matrix = self._extract_feature_matrix(batch)
+            batch.feature_matrix = matrix
             
-            # Calculate weighted score
-            score = 0.0
-            for feature_name, weight in self.weights.items():
-                feature_value = features.get(feature_name, 0.0)
-                score += feature_value * weight * 100
+            # Weighted score as a single matrix-vector product
+            scores = matrix @ active.weight_vector * 100
             
             # Add some non-linearity
-            score = score * (1 + np.random.normal(0, 0.1))  # Slight variance
-            score = min(100, max(0, score))
+            scores = scores * (1 + np.random.normal(0, 0.1, size=n))  # Slight variance
+            scores = np.clip(scores, 0, 100)
             
             # Calculate confidence based on feature completeness
-            feature_count = sum(1 for v in features.values() if v > 0)
-            confidence = 70 + (feature_count / len(self.features)) * 30
+            feature_count = np.count_nonzero(matrix > 0, axis=1)
+            confidences = 70 + (feature_count / len(self.features)) * 30
             
-            return score, confidence
+            return scores, confidences
             
         except Exception as e:
-            logger.error(f"Prediction error: {e}")
-            return 50.0, 50.0  # Default to medium risk with low confidence
+            logger.error(f"Batch prediction error: {e}")
+            # Default to medium risk with low confidence
+            return np.full(n, 50.0), np.full(n, 50.0)
     
-    def explain(self, transaction_id: str) -> Dict[str, Any]:
+    def predict(self, transaction: Dict[str, Any]) -> Tuple[float, float]:
         """
-        Explain prediction for a transaction (SHAP-like explanation).
-        In production, would retrieve stored prediction data.
+        Predict fraud score for a transaction.
+        Returns (score, confidence)
         """
-        return {
-            "transaction_id": transaction_id,
-            "feature_importance": {
-                "amount": 0.25,
-                "country_risk_score": 0.20,
-                "device_age": 0.15,
-                "transaction_velocity": 0.15,
-                "email_domain_risk": 0.10,
-                "merchant_category_risk": 0.08,
-                "hour_of_day": 0.05,
-                "ip_risk_score": 0.02
-            },
-            "decision_path": [
-                "Amount exceeds average for user profile",
-                "New device detected for this account",
-                "Transaction from unusual time zone"
-            ],
-            "similar_cases": [
-                {"transaction_id": "TXN_SAMPLE_1", "similarity": 0.92},
-                {"transaction_id": "TXN_SAMPLE_2", "similarity": 0.87},
-            ]
-        }
+        scores, confidences = self.predict_batch(TransactionBatch([transaction]))
+        return float(scores[0]), float(confidences[0])
+    
+    def attach_trace_store(self, trace_store: PredictionTraceStore):
+        """Use a trace store to answer explain() from recorded predictions"""
+        self.trace_store = trace_store
     
-    def retrain(self) -> str:
+    def explain(self, transaction_id: str, similar_count: int = 5) -> Optional[Dict[str, Any]]:
         """
-        Initiate model retraining.
-        Returns job ID for tracking.
+        Explain the recorded prediction for a transaction.
+        Returns None when no trace is stored for the transaction.
         """
-        job_id = str(uuid.uuid4())
-        logger.info(f"Model retraining initiated - Job ID: {job_id}")
-        # In production, would trigger async training job
-        return job_id
+        if self.trace_store is None:
+            return None
+        trace = self.trace_store.get(transaction_id)
+        if trace is None:
+            return None
+        
+        contributions = trace["contributions"]
+        total = float(np.abs(contributions).sum()) or 1.0
+        order = np.argsort(-contributions)
+        
+        feature_importance = {
+            self.features[i]: round(float(contributions[i]) / total, 4) for i in order
+        }
+        decision_path = [
+            f"{self.features[i]} = {trace['features'][i]:.2f} contributed "
+            f"{contributions[i]:.1f} points"
+            for i in order[:3]
+        ] + [f"Rule triggered: {rule_id}" for rule_id in trace["triggered_rules"]]
+        
+        return {
+            "transaction_id": transaction_id,
+            "score": round(trace["score"], 2),
+            "features": dict(zip(
+                self.features, np.round(trace["features"].astype(np.float64), 4).tolist()
+            )),
+            "feature_importance": feature_importance,
+            "triggered_rules": trace["triggered_rules"],
+            "decision_path": decision_path,
+            "similar_cases": self.trace_store.nearest(
+                trace["features"], k=similar_count, exclude=transaction_id
+            ),
+        }
 
 
 # Singleton instance
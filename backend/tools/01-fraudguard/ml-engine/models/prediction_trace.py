@@ -0,0 +1,178 @@
+"""
+FraudGuard ML Engine - Prediction Trace Store
+Bounded record of what the model saw for each scored transaction
+"""
+
+import numpy as np
+import logging
+import os
+import time
+from collections import OrderedDict
+from threading import Lock
+from typing import Dict, Any, List, Optional, Sequence
+
+logger = logging.getLogger(__name__)
+
+
+class PredictionTraceStore:
+    """
+    Fixed-capacity, array-backed store of prediction traces.
+
+    Each trace occupies one slot in preallocated arrays (feature vector,
+    per-feature contributions, bit-packed rule hits, final score). Rule ids are
+    registered on first sight, so traces stay readable across rule reloads;
+    ids beyond the table's capacity are recorded under OTHER_RULE_ID.
+    Slots are reused in least-recently-used order, and traces older than `ttl`
+    seconds are treated as missing. With `path` set, the arrays live in a
+    memory-mapped file so a large capacity does not have to stay resident.
+    """
+
+    OTHER_RULE_ID = "other"
+
+    def __init__(self, feature_names: Sequence[str], capacity: int = 100_000,
+                 ttl: float = 86400.0, path: Optional[str] = None, max_rule_ids: int = 256):
+        self.feature_names = list(feature_names)
+        self.capacity = capacity
+        self.ttl = ttl
+        self.path = path
+        self.max_rule_ids = max_rule_ids
+        self.rule_ids: List[str] = []
+        self._rule_index: Dict[str, int] = {}
+        self.overflow_rule_ids = 0
+
+        n_features = len(self.feature_names)
+        self.features = self._allocate("features", (capacity, n_features), np.float32)
+        self.contributions = self._allocate("contributions", (capacity, n_features), np.float32)
+        self.rule_bits = self._allocate("rule_bits", (capacity, (max_rule_ids + 7) // 8), np.uint8)
+        self.scores = self._allocate("scores", (capacity,), np.float32)
+        self.created_at = np.zeros(capacity, dtype=np.float64)
+        self.occupied = np.zeros(capacity, dtype=bool)
+
+        self._slots: "OrderedDict[str, int]" = OrderedDict()
+        self._slot_ids: List[Optional[str]] = [None] * capacity
+        self._free = list(range(capacity - 1, -1, -1))
+        self._lock = Lock()
+        self.is_loaded = True
+        logger.info(f"Prediction Trace Store ready (capacity={capacity}, backing={'mmap' if path else 'memory'})")
+
+    def _allocate(self, name: str, shape, dtype) -> np.ndarray:
+        if not self.path:
+            return np.zeros(shape, dtype=dtype)
+        os.makedirs(self.path, exist_ok=True)
+        return np.memmap(os.path.join(self.path, f"{name}.dat"), dtype=dtype, mode="w+", shape=shape)
+
+    def _release(self, transaction_id: str):
+        slot = self._slots.pop(transaction_id)
+        self._slot_ids[slot] = None
+        self.occupied[slot] = False
+        self._free.append(slot)
+
+    def _acquire(self, transaction_id: str) -> int:
+        if transaction_id in self._slots:
+            self._slots.move_to_end(transaction_id)
+            return self._slots[transaction_id]
+        if not self._free:
+            # Evict the least recently used trace
+            self._release(next(iter(self._slots)))
+        slot = self._free.pop()
+        self._slots[transaction_id] = slot
+        self._slot_ids[slot] = transaction_id
+        self.occupied[slot] = True
+        return slot
+
+    def _rule_columns(self, rule_ids: Sequence[str]) -> List[int]:
+        """
+        Bit column per rule id. Once all but the last column are taken, new
+        ids share the last one, reported as OTHER_RULE_ID.
+        """
+        columns = []
+        for rule_id in rule_ids:
+            column = self._rule_index.get(rule_id)
+            if column is None:
+                if len(self.rule_ids) < self.max_rule_ids - 1:
+                    column = self._rule_index[rule_id] = len(self.rule_ids)
+                    self.rule_ids.append(rule_id)
+                else:
+                    column = self._rule_index[rule_id] = self.max_rule_ids - 1
+                    self.overflow_rule_ids += 1
+                    logger.warning(
+                        f"Rule id table full ({self.max_rule_ids}); tracing '{rule_id}' "
+                        f"as '{self.OTHER_RULE_ID}' ({self.overflow_rule_ids} ids overflowed)"
+                    )
+            columns.append(column)
+        return columns
+
+    def record_batch(self, transaction_ids: Sequence[str], features: np.ndarray,
+                     contributions: np.ndarray, rule_hits: np.ndarray,
+                     rule_ids: Sequence[str], scores: np.ndarray):
+        """
+        Store traces for a scored batch (rows aligned with transaction_ids).
+        `rule_hits` columns correspond to `rule_ids`.
+        """
+        now = time.time()
+        with self._lock:
+            hits = np.zeros((len(transaction_ids), self.max_rule_ids), dtype=bool)
+            columns = np.array(self._rule_columns(rule_ids), dtype=np.int64)
+            rule_hits = np.asarray(rule_hits, dtype=bool).reshape(len(transaction_ids), len(columns))
+            # Several overflowed ids can share a column, so OR their hits together
+            np.logical_or.at(hits, (slice(None), columns), rule_hits)
+            slots = np.array([self._acquire(tid) for tid in transaction_ids], dtype=np.int64)
+            if len(slots) == 0:
+                return
+            self.features[slots] = features
+            self.contributions[slots] = contributions
+            self.rule_bits[slots] = np.packbits(hits, axis=1)
+            self.scores[slots] = scores
+            self.created_at[slots] = now
+
+    def get(self, transaction_id: str) -> Optional[Dict[str, Any]]:
+        """Trace for a transaction, or None if unknown or expired"""
+        with self._lock:
+            slot = self._slots.get(transaction_id)
+            if slot is None:
+                return None
+            if time.time() - self.created_at[slot] > self.ttl:
+                self._release(transaction_id)
+                return None
+            self._slots.move_to_end(transaction_id)
+            return {
+                "transaction_id": transaction_id,
+                "features": self.features[slot].copy(),
+                "contributions": self.contributions[slot].copy(),
+                "triggered_rules": [
+                    self.rule_ids[i] if i < len(self.rule_ids) else self.OTHER_RULE_ID
+                    for i in np.flatnonzero(np.unpackbits(self.rule_bits[slot]))
+                ],
+                "score": float(self.scores[slot]),
+            }
+
+    def nearest(self, vector: np.ndarray, k: int = 5,
+                exclude: Optional[str] = None) -> List[Dict[str, Any]]:
+        """
+        k most similar stored traces by Euclidean distance over feature vectors.
+        Similarity is 1 - distance / max distance (features are in [0, 1]).
+        """
+        with self._lock:
+            live = self.occupied & (time.time() - self.created_at <= self.ttl)
+            if exclude is not None and exclude in self._slots:
+                live[self._slots[exclude]] = False
+            candidates = np.flatnonzero(live)
+            if len(candidates) == 0:
+                return []
+            diff = self.features[candidates] - vector.astype(np.float32)
+            distances = np.sqrt(np.einsum("ij,ij->i", diff, diff))
+            k = min(k, len(candidates))
+            top = np.argpartition(distances, k - 1)[:k]
+            top = top[np.argsort(distances[top])]
+            max_distance = np.sqrt(len(self.feature_names))
+            return [
+                {
+                    "transaction_id": self._slot_ids[candidates[i]],
+                    "similarity": round(float(1 - distances[i] / max_distance), 4),
+                    "score": round(float(self.scores[candidates[i]]), 2),
+                }
+                for i in top
+            ]
+
+    def __len__(self) -> int:
+        return len(self._slots)
@@ -0,0 +1,129 @@
+"""
+FraudGuard ML Engine - Retrain Jobs
+Background retraining in a process pool with atomic model activation
+"""
+
+import asyncio
+import logging
+import os
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timezone
+from typing import Dict, Any, Optional, Set
+
+from .fraud_model import FraudDetectionModel, ModelVersion
+from .training import run_training_job
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_TRAINING_DATA_DIR = os.path.join(os.path.dirname(__file__), "..", "data", "training")
+
+
+def _now() -> str:
+    return datetime.now(timezone.utc).isoformat()
+
+
+class RetrainJobManager:
+    """
+    Runs retraining jobs off the event loop.
+
+    Each job fits new weights in a worker process and validates them against
+    a holdout split. Accepted weights become a new ModelVersion that is
+    activated on the live model; rejected candidates leave the model untouched.
+    """
+
+    def __init__(self, model: FraudDetectionModel, max_workers: int = 1,
+                 default_data_path: Optional[str] = None, data_dir: Optional[str] = None):
+        self.model = model
+        self.max_workers = max_workers
+        self.default_data_path = default_data_path
+        # Requested data paths must resolve inside this directory
+        self.data_dir = os.path.realpath(data_dir or DEFAULT_TRAINING_DATA_DIR)
+        self.jobs: Dict[str, Dict[str, Any]] = {}
+        self._tasks: Set[asyncio.Task] = set()
+        self._executor: Optional[ProcessPoolExecutor] = None
+
+    @property
+    def executor(self) -> ProcessPoolExecutor:
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(max_workers=self.max_workers)
+        return self._executor
+
+    def resolve_data_path(self, data_path: str) -> str:
+        """
+        Resolve a requested data path (relative paths are taken from the
+        training data directory) and reject anything outside that directory.
+        """
+        resolved = os.path.realpath(os.path.join(self.data_dir, data_path))
+        if os.path.commonpath([resolved, self.data_dir]) != self.data_dir:
+            raise ValueError(f"Training data must be inside the training data directory: {data_path}")
+        if not os.path.isfile(resolved):
+            raise ValueError(f"Training data file not found: {data_path}")
+        return resolved
+
+    def submit(self, data_path: Optional[str] = None, holdout_fraction: float = 0.2) -> str:
+        """Start a retraining job on the running event loop and return its id"""
+        if data_path:
+            data_path = self.resolve_data_path(data_path)
+        else:
+            data_path = self.default_data_path
+        if not data_path:
+            raise ValueError("No training data path given and TRAINING_DATA_PATH is not set")
+
+        job_id = str(uuid.uuid4())
+        base = self.model.active_version
+        self.jobs[job_id] = {
+            "job_id": job_id,
+            "status": "running",
+            "data_path": data_path,
+            "base_version": base.version,
+            "created_at": _now(),
+            "finished_at": None,
+            "model_version": None,
+            "metrics": None,
+            "error": None,
+        }
+
+        loop = asyncio.get_running_loop()
+        future = loop.run_in_executor(
+            self.executor, run_training_job, data_path,
+            base.weight_vector.tolist(), holdout_fraction,
+        )
+        # The loop only keeps weak references to tasks
+        task = asyncio.ensure_future(self._finish(job_id, future))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        logger.info(f"Model retraining initiated - Job ID: {job_id}")
+        return job_id
+
+    async def _finish(self, job_id: str, future: "asyncio.Future"):
+        job = self.jobs[job_id]
+        try:
+            result = await future
+        except Exception as e:
+            logger.error(f"Retraining job {job_id} failed: {e}")
+            job.update(status="failed", error=str(e), finished_at=_now())
+            return
+
+        job["metrics"] = result["metrics"]
+        if not result["accepted"]:
+            logger.info(f"Retraining job {job_id} rejected by holdout validation")
+            job.update(status="rejected", finished_at=_now())
+            return
+
+        trained_at = _now()
+        version = f"2.0.0+{datetime.now(timezone.utc).strftime('%Y%m%d%H%M%S')}.{job_id[:8]}"
+        weights = dict(zip(self.model.features, result["weights"]))
+        candidate = result["metrics"]["candidate"]
+        self.model.activate(ModelVersion(
+            version, weights, self.model.features, trained_at,
+            candidate["accuracy"], result["metrics"],
+        ))
+        job.update(status="completed", model_version=version, finished_at=trained_at)
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        return self.jobs.get(job_id)
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,274 @@
+"""
+FraudGuard ML Engine - Rule Engine
+Declarative risk rules compiled into vectorized predicates
+"""
+
+import numpy as np
+import json
+import logging
+import os
+import string
+import time
+from threading import Lock
+from typing import Dict, Any, List, Callable, Optional, Tuple
+
+from .transaction_batch import TransactionBatch, NUMERIC_COLUMNS, STRING_COLUMNS
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_RULES_PATH = os.path.join(os.path.dirname(__file__), "..", "rules", "risk_rules.json")
+
+SEVERITIES = {"low", "medium", "high", "critical"}
+
+Predicate = Callable[[TransactionBatch], np.ndarray]
+
+NUMERIC_OPERATORS = {
+    "eq": np.equal,
+    "ne": np.not_equal,
+    "gt": np.greater,
+    "gte": np.greater_equal,
+    "lt": np.less,
+    "lte": np.less_equal,
+}
+
+
+def _string_predicate(field: str, test: Callable[[str], bool]) -> Predicate:
+    """
+    Evaluate a per-value test once per distinct value of the column and
+    broadcast the result back to every row.
+    """
+    def predicate(batch: TransactionBatch) -> np.ndarray:
+        uniques, inverse = batch.factorize(field)
+        lookup = np.fromiter((test(u) for u in uniques.tolist()), dtype=bool, count=len(uniques))
+        return lookup[inverse] if len(uniques) else np.zeros(len(batch), dtype=bool)
+    return predicate
+
+
+def compile_condition(condition: Dict[str, Any]) -> Predicate:
+    """Compile one {field, op, value} condition into a batch predicate"""
+    field, op, value = condition["field"], condition["op"], condition.get("value")
+
+    if field in NUMERIC_COLUMNS:
+        if op not in NUMERIC_OPERATORS:
+            raise ValueError(f"Operator '{op}' is not supported for numeric field '{field}'")
+        compare, threshold = NUMERIC_OPERATORS[op], float(value)
+        return lambda batch: compare(batch.column(field), threshold)
+
+    if field in STRING_COLUMNS:
+        if op in ("in", "not_in"):
+            # A lone string is one member, not a set of characters
+            if isinstance(value, str):
+                value = [value]
+            if not isinstance(value, (list, tuple, set, frozenset)):
+                raise ValueError(f"Operator '{op}' on field '{field}' needs a list of values")
+            members = frozenset(str(v) for v in value)
+            if op == "in":
+                return _string_predicate(field, members.__contains__)
+            return _string_predicate(field, lambda v: v not in members)
+        if op == "eq":
+            return _string_predicate(field, str(value).__eq__)
+        if op == "ne":
+            return _string_predicate(field, str(value).__ne__)
+        if op == "startswith":
+            prefixes = tuple(value) if isinstance(value, list) else (str(value),)
+            return _string_predicate(field, lambda v: v.startswith(prefixes))
+        if op == "endswith":
+            suffixes = tuple(value) if isinstance(value, list) else (str(value),)
+            return _string_predicate(field, lambda v: v.endswith(suffixes))
+        raise ValueError(f"Operator '{op}' is not supported for string field '{field}'")
+
+    raise ValueError(f"Unknown rule field: {field}")
+
+
+_SAMPLE_ROW: Optional[Dict[str, Any]] = None
+
+
+def _sample_row() -> Dict[str, Any]:
+    """Fields (with their value types) available to rule descriptions"""
+    global _SAMPLE_ROW
+    if _SAMPLE_ROW is None:
+        _SAMPLE_ROW = TransactionBatch([{}]).row(0)
+    return _SAMPLE_ROW
+
+
+class CompiledRule:
+    """A rule whose conditions have been compiled into batch predicates"""
+
+    __slots__ = ("id", "name", "severity", "weight", "description", "match", "predicates")
+
+    def __init__(self, spec: Dict[str, Any]):
+        self.id = spec["id"]
+        self.name = spec.get("name", self.id)
+        self.severity = spec["severity"]
+        self.weight = float(spec["weight"])
+        self.description = spec["description"]
+        self.match = spec.get("match", "all")
+        if self.severity not in SEVERITIES:
+            raise ValueError(f"Rule {self.id}: invalid severity '{self.severity}'")
+        if self.match not in ("all", "any"):
+            raise ValueError(f"Rule {self.id}: match must be 'all' or 'any'")
+        if not spec.get("conditions"):
+            raise ValueError(f"Rule {self.id}: no conditions")
+        self.predicates = [compile_condition(c) for c in spec["conditions"]]
+        self._check_description()
+
+    def _check_description(self):
+        """Reject descriptions that would fail to format for a matching transaction"""
+        sample = _sample_row()
+        for _, field, _, _ in string.Formatter().parse(self.description):
+            if field is None:
+                continue
+            name = field.split(".", 1)[0].split("[", 1)[0]
+            if name not in sample:
+                raise ValueError(
+                    f"Rule {self.id}: unknown field '{{{name}}}' in description "
+                    f"(available: {', '.join(sorted(sample))})"
+                )
+        try:
+            self.description.format(**sample)
+        except (ValueError, TypeError, IndexError, AttributeError, KeyError) as e:
+            raise ValueError(f"Rule {self.id}: invalid description format: {e}") from e
+
+    def evaluate(self, batch: TransactionBatch) -> np.ndarray:
+        combine = np.logical_and if self.match == "all" else np.logical_or
+        mask = self.predicates[0](batch)
+        for predicate in self.predicates[1:]:
+            mask = combine(mask, predicate(batch))
+        return mask
+
+
+class RuleSet:
+    """Immutable compiled rule set; swapped as a whole on reload"""
+
+    def __init__(self, rules: List[CompiledRule], version: str):
+        self.rules = tuple(rules)
+        self.version = version
+        self.ids = [rule.id for rule in rules]
+        self.weights = np.array([rule.weight for rule in rules], dtype=np.float64)
+
+    def __len__(self) -> int:
+        return len(self.rules)
+
+
+class RuleEvaluation:
+    """Rule hits for a batch, tied to the rule set that produced them"""
+
+    def __init__(self, rule_set: RuleSet, hits: np.ndarray):
+        self.rule_set = rule_set
+        self.hits = hits
+
+    @property
+    def rule_ids(self) -> List[str]:
+        return self.rule_set.ids
+
+    @property
+    def scores(self) -> np.ndarray:
+        """Sum of triggered rule weights per transaction"""
+        return self.hits @ self.rule_set.weights
+
+    def indicators(self, batch: TransactionBatch) -> List[List[Dict[str, Any]]]:
+        """Indicator dicts per transaction, formatting descriptions only for hits"""
+        indicators: List[List[Dict[str, Any]]] = [[] for _ in range(len(batch))]
+        rows, cols = np.nonzero(self.hits)
+        for i, j in zip(rows.tolist(), cols.tolist()):
+            rule = self.rule_set.rules[j]
+            indicators[i].append({
+                "type": rule.id,
+                "description": rule.description.format(**batch.row(i)),
+                "severity": rule.severity,
+                "weight": rule.weight
+            })
+        return indicators
+
+
+class RuleEngine:
+    """
+    Loads declarative rules from a JSON file, compiles them once and
+    evaluates them over transaction batches. The file is re-read when its
+    modification time changes; a rule file that fails to compile is logged
+    and the previous rule set stays active.
+    """
+
+    def __init__(self, path: Optional[str] = None, check_interval: float = 5.0):
+        self.path = os.path.abspath(path or os.getenv("RISK_RULES_PATH", DEFAULT_RULES_PATH))
+        self.check_interval = check_interval
+        self._mtime = 0.0
+        self._last_check = 0.0
+        self._lock = Lock()
+        self._stats: Dict[str, Dict[str, float]] = {}
+        self.rule_set = self._load()
+
+    def _load(self) -> RuleSet:
+        with open(self.path) as f:
+            spec = json.load(f)
+        mtime = os.path.getmtime(self.path)
+        rules = [CompiledRule(rule) for rule in spec["rules"]]
+        ids = [rule.id for rule in rules]
+        if len(set(ids)) != len(ids):
+            raise ValueError("Duplicate rule ids in rule file")
+        self._mtime = mtime
+        logger.info(f"Compiled {len(rules)} risk rules (version {spec.get('version', 'unversioned')})")
+        return RuleSet(rules, str(spec.get("version", "unversioned")))
+
+    def reload(self) -> bool:
+        """Recompile the rule file. Returns False and keeps the old rules on error."""
+        with self._lock:
+            try:
+                self.rule_set = self._load()
+                return True
+            except Exception as e:
+                logger.error(f"Rule reload failed, keeping version {self.rule_set.version}: {e}")
+                return False
+
+    def maybe_reload(self):
+        """Reload when the rule file changed (checked at most every check_interval seconds)"""
+        now = time.monotonic()
+        if now - self._last_check < self.check_interval:
+            return
+        self._last_check = now
+        try:
+            changed = os.path.getmtime(self.path) != self._mtime
+        except OSError:
+            return
+        if changed:
+            self.reload()
+
+    def evaluate(self, batch: TransactionBatch) -> RuleEvaluation:
+        """Evaluate every rule over the batch, recording per-rule hits and timing"""
+        self.maybe_reload()
+        rule_set = self.rule_set
+        hits = np.zeros((len(batch), len(rule_set)), dtype=bool)
+        timings: List[Tuple[str, int, int]] = []
+        for j, rule in enumerate(rule_set.rules):
+            start = time.perf_counter_ns()
+            try:
+                hits[:, j] = rule.evaluate(batch)
+            except Exception as e:
+                logger.error(f"Error running rule {rule.id}: {e}")
+            timings.append((rule.id, time.perf_counter_ns() - start, int(hits[:, j].sum())))
+
+        with self._lock:
+            for rule_id, elapsed_ns, hit_count in timings:
+                stats = self._stats.setdefault(
+                    rule_id, {"evaluated": 0, "hits": 0, "time_ns": 0}
+                )
+                stats["evaluated"] += len(batch)
+                stats["hits"] += hit_count
+                stats["time_ns"] += elapsed_ns
+        return RuleEvaluation(rule_set, hits)
+
+    def stats(self) -> Dict[str, Any]:
+        """Per-rule hit counts, hit rates and evaluation time for the active rules"""
+        with self._lock:
+            rules = {}
+            for rule_id in self.rule_set.ids:
+                s = self._stats.get(rule_id, {"evaluated": 0, "hits": 0, "time_ns": 0})
+                evaluated = s["evaluated"] or 1
+                rules[rule_id] = {
+                    "evaluated": s["evaluated"],
+                    "hits": s["hits"],
+                    "hit_rate": round(s["hits"] / evaluated, 4),
+                    "total_time_ms": round(s["time_ns"] / 1e6, 3),
+                    "ns_per_transaction": round(s["time_ns"] / evaluated, 1),
+                }
+            return {"version": self.rule_set.version, "path": self.path, "rules": rules}
@@ -0,0 +1,247 @@
+"""
+FraudGuard ML Engine - Streaming Baselines
+Incrementally updated transaction statistics for anomaly detection
+"""
+
+import numpy as np
+import json
+import logging
+import math
+import os
+import tempfile
+import zlib
+from collections import OrderedDict
+from typing import Dict, Any, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class CountMinSketch:
+    """
+    Count-min sketch for approximate value frequencies in fixed memory.
+    Hashing uses crc32 with per-row seeds so snapshots stay valid across processes.
+    """
+
+    def __init__(self, depth: int = 4, width: int = 512):
+        self.depth = depth
+        self.width = width
+        self.table = np.zeros((depth, width), dtype=np.float64)
+
+    def _columns(self, value: str):
+        data = value.encode("utf-8")
+        return [zlib.crc32(data, seed) % self.width for seed in range(self.depth)]
+
+    def add(self, value: str, weight: float = 1.0):
+        for row, col in enumerate(self._columns(value)):
+            self.table[row, col] += weight
+
+    def estimate(self, value: str) -> float:
+        return float(min(self.table[row, col] for row, col in enumerate(self._columns(value))))
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {"depth": self.depth, "width": self.width, "table": self.table.tolist()}
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "CountMinSketch":
+        sketch = cls(data["depth"], data["width"])
+        sketch.table = np.array(data["table"], dtype=np.float64)
+        return sketch
+
+
+class StreamingBaseline:
+    """
+    Baseline statistics for one population of transactions.
+
+    Amounts use Welford's running mean/variance. The hour-of-day histogram and
+    the country sketch are exponentially decayed: instead of scaling every cell
+    on each update, new observations are added with a growing weight and the
+    stored values are renormalized only when that weight gets large.
+    """
+
+    RESCALE_LIMIT = 1e12
+
+    def __init__(self, half_life: float = 10000.0):
+        self.decay = 0.5 ** (1.0 / half_life)
+
+        # Welford state for amounts
+        self.count = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+
+        # Decayed distributions (stored pre-multiplied by self.scale)
+        self.scale = 1.0
+        self.decayed_total = 0.0
+        self.hourly = np.zeros(24, dtype=np.float64)
+        self.countries = CountMinSketch()
+
+    def _rescale(self):
+        self.hourly /= self.scale
+        self.countries.table /= self.scale
+        self.decayed_total /= self.scale
+        self.scale = 1.0
+
+    def observe(self, amount: float, hour: Optional[int], country: str, weight: float = 1.0):
+        """Fold one transaction into the baseline in O(1)"""
+        self.count += 1
+        delta = amount - self.mean
+        self.mean += delta / self.count
+        self.m2 += delta * (amount - self.mean)
+
+        self.scale /= self.decay
+        if self.scale > self.RESCALE_LIMIT:
+            self._rescale()
+        w = weight * self.scale
+        self.decayed_total += w
+        if hour is not None and 0 <= hour < 24:
+            self.hourly[hour] += w
+        if country:
+            self.countries.add(country, w)
+
+    @property
+    def std(self) -> float:
+        if self.count < 2:
+            return 0.0
+        return math.sqrt(self.m2 / (self.count - 1))
+
+    def hour_frequency(self, hour: int) -> float:
+        total = self.hourly.sum()
+        return float(self.hourly[hour] / total) if total > 0 else 0.0
+
+    def country_frequency(self, country: str) -> float:
+        if self.decayed_total <= 0:
+            return 0.0
+        return self.countries.estimate(country) / self.decayed_total
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "decay": self.decay,
+            "count": self.count,
+            "mean": self.mean,
+            "m2": self.m2,
+            "scale": self.scale,
+            "decayed_total": self.decayed_total,
+            "hourly": self.hourly.tolist(),
+            "countries": self.countries.to_dict(),
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "StreamingBaseline":
+        baseline = cls()
+        baseline.decay = data["decay"]
+        baseline.count = data["count"]
+        baseline.mean = data["mean"]
+        baseline.m2 = data["m2"]
+        baseline.scale = data["scale"]
+        baseline.decayed_total = data["decayed_total"]
+        baseline.hourly = np.array(data["hourly"], dtype=np.float64)
+        baseline.countries = CountMinSketch.from_dict(data["countries"])
+        return baseline
+
+
+class BaselineStore:
+    """
+    Streaming baselines keyed by population: a global baseline plus one per
+    merchant category and per user segment. Snapshotted to a JSON file
+    once `snapshot_interval` observations have accumulated; observing never
+    writes, the owner persists with snapshot() or snapshot_state() and
+    write_snapshot() when snapshot_due says so.
+
+    Category and segment names come from clients, so at most `max_keyed`
+    keyed baselines are kept; beyond that the least recently used one is
+    dropped. The global baseline is never evicted.
+    """
+
+    GLOBAL_KEY = "global"
+
+    def __init__(self, snapshot_path: Optional[str] = None, snapshot_interval: int = 5000,
+                 max_keyed: Optional[int] = None):
+        self.snapshot_path = snapshot_path
+        self.snapshot_interval = snapshot_interval
+        self.max_keyed = max_keyed or int(os.getenv("ANOMALY_MAX_BASELINES", "1000"))
+        self.baselines: "OrderedDict[str, StreamingBaseline]" = OrderedDict()
+        self.evictions = 0
+        self._since_snapshot = 0
+
+    @staticmethod
+    def merchant_key(category: str) -> str:
+        return f"merchant:{category}"
+
+    @staticmethod
+    def segment_key(segment: str) -> str:
+        return f"segment:{segment}"
+
+    def get(self, key: str) -> Optional[StreamingBaseline]:
+        return self.baselines.get(key)
+
+    def get_or_create(self, key: str) -> StreamingBaseline:
+        baseline = self.baselines.get(key)
+        if baseline is None:
+            baseline = self.baselines[key] = StreamingBaseline()
+            self._evict()
+        else:
+            self.baselines.move_to_end(key)
+        return baseline
+
+    def _evict(self):
+        """Drop least recently used keyed baselines beyond max_keyed"""
+        keyed = len(self.baselines) - (self.GLOBAL_KEY in self.baselines)
+        while keyed > self.max_keyed:
+            key = next(k for k in self.baselines if k != self.GLOBAL_KEY)
+            del self.baselines[key]
+            self.evictions += 1
+            keyed -= 1
+            if self.evictions % 1000 == 1:
+                logger.warning(
+                    f"Anomaly baseline limit ({self.max_keyed}) reached; evicted {self.evictions} so far"
+                )
+
+    def observe(self, keys, amount: float, hour: Optional[int], country: str):
+        for key in keys:
+            self.get_or_create(key).observe(amount, hour, country)
+        self._since_snapshot += 1
+
+    @property
+    def snapshot_due(self) -> bool:
+        return bool(self.snapshot_path) and self._since_snapshot >= self.snapshot_interval
+
+    def snapshot_state(self) -> Dict[str, Any]:
+        """
+        Copy of all baselines as plain data, taken where they are mutated;
+        the copy can then be written from another thread.
+        """
+        self._since_snapshot = 0
+        return {key: baseline.to_dict() for key, baseline in self.baselines.items()}
+
+    def write_snapshot(self, data: Dict[str, Any]):
+        """Atomically write a snapshot_state() copy to the snapshot file"""
+        if not self.snapshot_path:
+            return
+        directory = os.path.dirname(os.path.abspath(self.snapshot_path))
+        os.makedirs(directory, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+        with os.fdopen(fd, "w") as f:
+            json.dump(data, f)
+        os.replace(tmp_path, self.snapshot_path)
+        logger.info(f"Snapshotted {len(data)} anomaly baselines to {self.snapshot_path}")
+
+    def snapshot(self):
+        """Atomically write all baselines to the snapshot file"""
+        if self.snapshot_path:
+            self.write_snapshot(self.snapshot_state())
+
+    def load(self) -> bool:
+        """Restore baselines from the snapshot file if it exists"""
+        if not self.snapshot_path or not os.path.exists(self.snapshot_path):
+            return False
+        try:
+            with open(self.snapshot_path) as f:
+                data = json.load(f)
+            self.baselines = OrderedDict(
+                (key, StreamingBaseline.from_dict(v)) for key, v in data.items()
+            )
+            self._evict()
+            logger.info(f"Restored {len(self.baselines)} anomaly baselines from {self.snapshot_path}")
+            return True
+        except Exception as e:
+            logger.error(f"Failed to load baseline snapshot: {e}")
+            return False
@@ -0,0 +1,142 @@
+"""
+FraudGuard ML Engine - Transaction Batch
+Columnar view of a batch of transactions for vectorized scoring
+"""
+
+import numpy as np
+import logging
+from typing import Dict, Any, List, Optional, Tuple
+from datetime import datetime
+
+logger = logging.getLogger(__name__)
+
+
+def _parse_timestamp(timestamp: Any) -> Optional[datetime]:
+    """Parse an ISO string or datetime, returning None when unusable"""
+    if not timestamp:
+        return None
+    if isinstance(timestamp, datetime):
+        return timestamp
+    try:
+        return datetime.fromisoformat(str(timestamp).replace("Z", "+00:00"))
+    except ValueError:
+        return None
+
+
+# Columns rules and features may refer to by name
+NUMERIC_COLUMNS = frozenset({
+    "amount", "hour", "weekday", "device_fingerprint_length", "velocity_ratio",
+})
+STRING_COLUMNS = frozenset({
+    "country", "user_email", "email_domain", "card_last_four", "device_fingerprint",
+    "merchant_category", "user_ip", "card_type",
+})
+
+
+class TransactionBatch:
+    """
+    Column-oriented representation of a list of transactions.
+    Every field is parsed and normalized exactly once so the model and the
+    rule engine can operate on NumPy arrays instead of per-row dicts.
+    """
+
+    def __init__(self, transactions: List[Dict[str, Any]]):
+        self.size = len(transactions)
+        self.transaction_ids = [str(tx.get("transaction_id", "")) for tx in transactions]
+
+        self.amount = np.array(
+            [float(tx.get("amount", 0) or 0) for tx in transactions], dtype=np.float64
+        )
+
+        # Time columns (-1 marks a missing or unparsable timestamp)
+        self.timestamps = [_parse_timestamp(tx.get("timestamp")) for tx in transactions]
+        self.has_timestamp = np.array([dt is not None for dt in self.timestamps], dtype=bool)
+        self.hour = np.array(
+            [dt.hour if dt is not None else -1 for dt in self.timestamps], dtype=np.int16
+        )
+        self.weekday = np.array(
+            [dt.weekday() if dt is not None else -1 for dt in self.timestamps], dtype=np.int16
+        )
+        self.epoch_seconds = np.array(
+            [dt.timestamp() if dt is not None else np.nan for dt in self.timestamps],
+            dtype=np.float64
+        )
+
+        # Categorical columns, normalized the same way the per-row code did
+        self.country = np.array(
+            [(tx.get("country") or "").upper() for tx in transactions], dtype=str
+        )
+        self.user_email = np.array(
+            [(tx.get("user_email") or "").lower() for tx in transactions], dtype=str
+        )
+        self.email_domain = np.array(
+            [self._email_domain(email) for email in self.user_email.tolist()], dtype=str
+        )
+        self.card_last_four = np.array(
+            [tx.get("card_last_four") or "" for tx in transactions], dtype=str
+        )
+        self.device_fingerprint = np.array(
+            [tx.get("device_fingerprint") or "" for tx in transactions], dtype=str
+        )
+        self.merchant_category = np.array(
+            [(tx.get("merchant_category") or "").lower() for tx in transactions], dtype=str
+        )
+        self.user_ip = np.array([tx.get("user_ip") or "" for tx in transactions], dtype=str)
+        self.card_type = np.array(
+            [(tx.get("card_type") or "").lower() for tx in transactions], dtype=str
+        )
+
+        self.device_fingerprint_length = np.char.str_len(self.device_fingerprint)
+
+        # Filled in by VelocityStore.record_batch: counts of shape
+        # (rows, key kinds, windows) and the normalized per-row ratio
+        self.velocity_counts: Optional[np.ndarray] = None
+        self.velocity_ratio: Optional[np.ndarray] = None
+
+        # Filled in by FraudDetectionModel.predict_batch
+        self.feature_matrix: Optional[np.ndarray] = None
+        self.model_version = None
+
+        self._factorized: Dict[str, Tuple[np.ndarray, np.ndarray]] = {}
+
+    @staticmethod
+    def _email_domain(email: str) -> str:
+        return email.split("@")[-1].lower() if "@" in email else ""
+
+    def __len__(self) -> int:
+        return self.size
+
+    def column(self, name: str) -> np.ndarray:
+        """Column array by name (velocity_ratio is zeros until velocity is recorded)"""
+        if name not in NUMERIC_COLUMNS and name not in STRING_COLUMNS:
+            raise KeyError(f"Unknown transaction column: {name}")
+        if name == "velocity_ratio" and self.velocity_ratio is None:
+            return np.zeros(self.size, dtype=np.float64)
+        return getattr(self, name)
+
+    def factorize(self, name: str) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Distinct values of a string column and the index of each row into them.
+        Cached, so every rule on the same column shares one pass over the data.
+        """
+        if name not in self._factorized:
+            self._factorized[name] = np.unique(self.column(name), return_inverse=True)
+        return self._factorized[name]
+
+    def row(self, index: int) -> Dict[str, Any]:
+        """Scalar field values for a single row (used to format rule descriptions)"""
+        velocity_count = 0
+        if self.velocity_counts is not None:
+            velocity_count = int(self.velocity_counts[index].max())
+        return {
+            "transaction_id": self.transaction_ids[index],
+            "amount": float(self.amount[index]),
+            "hour": int(self.hour[index]),
+            "country": str(self.country[index]),
+            "email_domain": str(self.email_domain[index]),
+            "device_fingerprint": str(self.device_fingerprint[index]),
+            "merchant_category": str(self.merchant_category[index]),
+            "user_ip": str(self.user_ip[index]),
+            "card_type": str(self.card_type[index]),
+            "velocity_count": velocity_count,
+        }
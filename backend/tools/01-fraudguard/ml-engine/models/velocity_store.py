@@ -0,0 +1,266 @@
+"""
+FraudGuard ML Engine - Velocity Store
+Sliding-window transaction counters keyed by user, card, device and IP
+"""
+
+import numpy as np
+import logging
+import os
+import time
+from abc import ABC, abstractmethod
+from array import array
+from collections import OrderedDict
+from threading import Lock
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from .transaction_batch import TransactionBatch
+
+logger = logging.getLogger(__name__)
+
+
+# (name, window length in seconds, number of buckets)
+WINDOWS: List[Tuple[str, int, int]] = [
+    ("1m", 60, 12),
+    ("1h", 3600, 12),
+    ("24h", 86400, 24),
+]
+
+# Transaction attributes tracked for velocity, as (key kind, batch column)
+KEY_FIELDS: List[Tuple[str, str]] = [
+    ("email", "user_email"),
+    ("card", "card_last_four"),
+    ("device", "device_fingerprint"),
+    ("ip", "user_ip"),
+]
+
+# Counts at or above these limits are treated as full velocity risk
+DEFAULT_LIMITS: Dict[str, int] = {"1m": 3, "1h": 10, "24h": 30}
+
+
+class _BucketCounter:
+    """
+    Bucketed counters for every window of a single key.
+    Buckets that slide out of a window are cleared lazily on the next access,
+    so updates and queries touch at most a fixed number of buckets.
+    """
+
+    __slots__ = ("buckets", "epochs", "totals")
+
+    def __init__(self):
+        self.buckets = array("I", bytes(4 * sum(n for _, _, n in WINDOWS)))
+        self.epochs = [-1] * len(WINDOWS)
+        self.totals = [0] * len(WINDOWS)
+
+    def _advance(self, w: int, offset: int, n: int, bucket: int):
+        last = self.epochs[w]
+        if bucket <= last:
+            return
+        if last < 0 or bucket - last >= n:
+            for i in range(offset, offset + n):
+                self.buckets[i] = 0
+            self.totals[w] = 0
+        else:
+            for b in range(last + 1, bucket + 1):
+                i = offset + b % n
+                self.totals[w] -= self.buckets[i]
+                self.buckets[i] = 0
+        self.epochs[w] = bucket
+
+    def update(self, ts: float, increment: int) -> Tuple[int, ...]:
+        offset = 0
+        for w, (_, length, n) in enumerate(WINDOWS):
+            bucket = int(ts // (length / n))
+            self._advance(w, offset, n, bucket)
+            # Late events still count while their bucket is inside the window
+            if increment and bucket > self.epochs[w] - n:
+                self.buckets[offset + bucket % n] += increment
+                self.totals[w] += increment
+            offset += n
+        return tuple(self.totals)
+
+    def counts(self, ts: float) -> Tuple[int, ...]:
+        """Window counts as of `ts`, without advancing or clearing any bucket"""
+        counts = []
+        offset = 0
+        for w, (_, length, n) in enumerate(WINDOWS):
+            bucket = int(ts // (length / n))
+            last = self.epochs[w]
+            # Buckets still held are (last - n, last]; count those inside (bucket - n, bucket]
+            first = max(bucket, last) - n + 1
+            counts.append(sum(
+                self.buckets[offset + b % n] for b in range(first, min(bucket, last) + 1)
+            ) if last >= 0 else 0)
+            offset += n
+        return tuple(counts)
+
+
+class VelocityBackend(ABC):
+    """Storage backend for velocity counters"""
+
+    @abstractmethod
+    def increment_many(self, events: Sequence[Tuple[str, float]]) -> List[Tuple[int, ...]]:
+        """Record one event per (key, timestamp) and return the window counts after each"""
+
+    @abstractmethod
+    def query(self, key: str, ts: float) -> Tuple[int, ...]:
+        """Window counts for a key as of `ts`; must not modify stored counters"""
+
+    def stats(self) -> Dict[str, int]:
+        return {}
+
+
+class InMemoryVelocityBackend(VelocityBackend):
+    """
+    Process-local backend with a bounded number of keys.
+    Idle keys are evicted in least-recently-used order.
+    """
+
+    def __init__(self, max_keys: int = 200_000):
+        self.max_keys = max_keys
+        self._counters: "OrderedDict[str, _BucketCounter]" = OrderedDict()
+        self._lock = Lock()
+        self.evictions = 0
+
+    def _counter(self, key: str) -> _BucketCounter:
+        counter = self._counters.get(key)
+        if counter is None:
+            counter = _BucketCounter()
+            self._counters[key] = counter
+            if len(self._counters) > self.max_keys:
+                self._counters.popitem(last=False)
+                self.evictions += 1
+        else:
+            self._counters.move_to_end(key)
+        return counter
+
+    def increment_many(self, events: Sequence[Tuple[str, float]]) -> List[Tuple[int, ...]]:
+        with self._lock:
+            return [self._counter(key).update(ts, 1) for key, ts in events]
+
+    def query(self, key: str, ts: float) -> Tuple[int, ...]:
+        with self._lock:
+            counter = self._counters.get(key)
+            if counter is None:
+                return (0,) * len(WINDOWS)
+            return counter.counts(ts)
+
+    def stats(self) -> Dict[str, int]:
+        return {"keys": len(self._counters), "max_keys": self.max_keys, "evictions": self.evictions}
+
+
+class RedisVelocityBackend(VelocityBackend):
+    """
+    Backend sharing counters across workers through Redis (or any server
+    speaking the Redis protocol). Each (key, window) is a hash of bucket ids
+    that expires once the window has passed.
+    """
+
+    def __init__(self, url: str, prefix: str = "fraudguard:velocity"):
+        import redis  # Optional dependency, only needed for this backend
+
+        self.client = redis.Redis.from_url(url)
+        self.prefix = prefix
+
+    def _window_keys(self, key: str, ts: float):
+        for name, length, n in WINDOWS:
+            width = length / n
+            yield f"{self.prefix}:{key}:{name}", int(ts // width), n, length
+
+    def _sum(self, fields: Dict[bytes, bytes], bucket: int, n: int) -> int:
+        return sum(int(v) for f, v in fields.items() if bucket - n < int(f) <= bucket)
+
+    def increment_many(self, events: Sequence[Tuple[str, float]]) -> List[Tuple[int, ...]]:
+        pipe = self.client.pipeline(transaction=False)
+        layout = []
+        for key, ts in events:
+            for hkey, bucket, n, length in self._window_keys(key, ts):
+                pipe.hincrby(hkey, bucket, 1)
+                pipe.expire(hkey, length * 2)
+                pipe.hgetall(hkey)
+                layout.append((hkey, bucket, n))
+        replies = pipe.execute()[2::3]
+
+        cleanup = self.client.pipeline(transaction=False)
+        counts = []
+        for (hkey, bucket, n), fields in zip(layout, replies):
+            counts.append(self._sum(fields, bucket, n))
+            stale = [f for f in fields if int(f) <= bucket - n]
+            if stale:
+                cleanup.hdel(hkey, *stale)
+        cleanup.execute()
+
+        width = len(WINDOWS)
+        return [tuple(counts[i:i + width]) for i in range(0, len(counts), width)]
+
+    def query(self, key: str, ts: float) -> Tuple[int, ...]:
+        return tuple(
+            self._sum(self.client.hgetall(hkey), bucket, n)
+            for hkey, bucket, n, _ in self._window_keys(key, ts)
+        )
+
+
+class VelocityStore:
+    """
+    Tracks transaction velocity for every key attribute of a transaction.
+    Produces a normalized velocity ratio per transaction (1.0 = at limit).
+    """
+
+    def __init__(self, backend: Optional[VelocityBackend] = None,
+                 limits: Optional[Dict[str, int]] = None):
+        self.backend = backend or InMemoryVelocityBackend()
+        self.limits = dict(DEFAULT_LIMITS, **(limits or {}))
+        self._limit_vector = np.array([self.limits[name] for name, _, _ in WINDOWS], dtype=np.float64)
+        self.is_loaded = True
+        logger.info(f"Velocity Store loaded ({type(self.backend).__name__})")
+
+    def record_batch(self, batch: TransactionBatch):
+        """
+        Record every transaction of the batch, in order, and attach the
+        resulting counts to the batch as `velocity_counts` / `velocity_ratio`.
+        """
+        n = len(batch)
+        now = time.time()
+        ts = np.where(np.isnan(batch.epoch_seconds), now, batch.epoch_seconds).tolist()
+
+        counts = np.zeros((n, len(KEY_FIELDS), len(WINDOWS)), dtype=np.int64)
+        events, slots = [], []
+        for k, (kind, column) in enumerate(KEY_FIELDS):
+            for i, value in enumerate(getattr(batch, column).tolist()):
+                if value:
+                    events.append((f"{kind}:{value}", ts[i]))
+                    slots.append((i, k))
+        if events:
+            rows, kinds = zip(*slots)
+            counts[list(rows), list(kinds)] = self.backend.increment_many(events)
+
+        batch.velocity_counts = counts
+        batch.velocity_ratio = np.minimum(1.0, (counts / self._limit_vector).max(axis=(1, 2)))
+
+    def query(self, kind: str, value: str, ts: Optional[float] = None) -> Dict[str, int]:
+        """
+        Counts per window for one key as of `ts` (default now). Read-only:
+        querying never moves the windows that event-time updates use.
+        """
+        counts = self.backend.query(f"{kind}:{value}", time.time() if ts is None else ts)
+        return {name: count for (name, _, _), count in zip(WINDOWS, counts)}
+
+    def stats(self) -> Dict[str, int]:
+        return self.backend.stats()
+
+
+def create_backend() -> VelocityBackend:
+    """Build the backend selected by VELOCITY_BACKEND (memory or redis)"""
+    kind = os.getenv("VELOCITY_BACKEND", "memory").lower()
+    if kind == "redis":
+        return RedisVelocityBackend(os.getenv("REDIS_URL", "redis://localhost:6379/0"))
+    return InMemoryVelocityBackend(int(os.getenv("VELOCITY_MAX_KEYS", 200_000)))
+
+
+# Singleton instance
+_store_instance = None
+
+def get_velocity_store() -> VelocityStore:
+    global _store_instance
+    if _store_instance is None:
+        _store_instance = VelocityStore(create_backend())
+    return _store_instance
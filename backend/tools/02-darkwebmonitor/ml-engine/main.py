@@ -3,13 +3,16 @@ DarkWebMonitor ML Engine - Main FastAPI Application
 Threat Intelligence Analysis & Correlation
 """
 
+import asyncio
 import logging
+import os
 from datetime import datetime
 from typing import Any, Dict, List, Optional
 
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Query
 from fastapi.middleware.cors import CORSMiddleware
 from models.correlation_engine import CorrelationEngine
+from models.feed_import import iter_feed, resolve_feed_path
 from models.pattern_detector import PatternDetector
 from models.threat_classifier import ThreatClassifier
 from pydantic import BaseModel, Field
@@ -48,17 +51,39 @@ class IOCInput(BaseModel):
     value: str
     context: Optional[str] = None
     source: Optional[str] = None
+    resolves_to: Optional[List[str]] = None  # Passive DNS: IPs of a domain or domains of an IP
 
 
 class ThreatInput(BaseModel):
     threat_id: str
     name: str
+    threat_type: Optional[str] = None
     description: Optional[str] = None
     iocs: List[IOCInput]
     ttps: Optional[List[Dict[str, str]]] = None
     source: Optional[str] = None
 
 
+class FeedImportRequest(BaseModel):
+    path: str  # STIX 2.x bundle (.json) or CSV feed, relative to THREAT_FEED_DIR
+
+
+class FuzzySample(BaseModel):
+    digest: str  # ssdeep or TLSH
+    label: Optional[str] = None  # Malware family
+    sample_id: Optional[str] = None  # e.g. SHA256 of the sample
+
+
+class FuzzyQuery(BaseModel):
+    digest: str
+    k: int = Field(10, ge=1, le=100)
+
+
+class FuzzyClusterRequest(BaseModel):
+    digests: List[str]
+    threshold: float = Field(50, gt=0, le=100)
+
+
 class ClassificationResult(BaseModel):
     threat_id: str
     threat_type: str  # 'malware', 'apt', 'campaign', 'vulnerability'
@@ -71,6 +96,7 @@ class ClassificationResult(BaseModel):
 class CorrelationResult(BaseModel):
     threat_id: str
     related_threats: List[Dict[str, Any]]
+    similar_threats: List[Dict[str, Any]] = []
     common_iocs: List[str]
     confidence: float
 
@@ -154,6 +180,7 @@ async def correlate_threats(threat: ThreatInput):
         return CorrelationResult(
             threat_id=threat.threat_id,
             related_threats=result["related_threats"],
+            similar_threats=result["similar_threats"],
             common_iocs=result["common_iocs"],
             confidence=result["confidence"],
         )
@@ -162,6 +189,65 @@ async def correlate_threats(threat: ThreatInput):
         raise HTTPException(status_code=500, detail=str(e))
 
 
+# Add threat to correlation DB
+@app.post("/threats")
+async def add_threat(threat: ThreatInput):
+    if not correlation_engine.add_threat(threat.model_dump()):
+        raise HTTPException(status_code=500, detail="Failed to add threat")
+    return {"status": "added", "threat_id": threat.threat_id}
+
+
+# Bulk-load threats from a feed
+@app.post("/threats/bulk")
+async def add_threats_bulk(threats: List[ThreatInput]):
+    try:
+        added = await asyncio.to_thread(
+            correlation_engine.add_threats, [t.model_dump() for t in threats]
+        )
+        return {"status": "added", "count": added, **correlation_engine.stats()}
+    except Exception as e:
+        logger.error(f"Error bulk-loading threats: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+# Import a STIX bundle or CSV feed file into the correlation DB
+@app.post("/threats/import")
+async def import_threat_feed(request: FeedImportRequest):
+    try:
+        # Parsing and the bulk insert run off the event loop
+        path = resolve_feed_path(request.path)
+        added = await asyncio.to_thread(lambda: correlation_engine.add_threats(iter_feed(path)))
+        return {"status": "imported", "count": added, **correlation_engine.stats()}
+    except (OSError, ValueError) as e:
+        raise HTTPException(status_code=400, detail=f"Cannot import feed: {e}")
+    except Exception as e:
+        logger.error(f"Error importing threat feed: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+# Cluster a feed dump into campaigns
+@app.post("/cluster-campaigns")
+async def cluster_campaigns(
+    threats: List[ThreatInput], threshold: float = Query(0.5, gt=0, le=1)
+):
+    if len(threats) > 100000:
+        raise HTTPException(status_code=400, detail="Maximum 100000 threats per request")
+    try:
+        logger.info(f"Clustering {len(threats)} threats into campaigns")
+        return correlation_engine.cluster_campaigns(
+            [t.model_dump() for t in threats], threshold
+        )
+    except Exception as e:
+        logger.error(f"Error clustering threats: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+# Correlation DB statistics
+@app.get("/threats/stats")
+async def threat_stats():
+    return correlation_engine.stats()
+
+
 # Detect patterns
 @app.post("/detect-patterns", response_model=List[PatternResult])
 async def detect_patterns(iocs: List[IOCInput]):
@@ -177,6 +263,103 @@ async def detect_patterns(iocs: List[IOCInput]):
         raise HTTPException(status_code=500, detail=str(e))
 
 
+# Score domains for DGA likelihood
+@app.post("/score-domains")
+async def score_domains(domains: List[str]):
+    if len(domains) > 100000:
+        raise HTTPException(status_code=400, detail="Maximum 100000 domains per request")
+    try:
+        logger.info(f"Scoring {len(domains)} domains for DGA activity")
+        results = pattern_detector.score_domains(domains)
+        return {
+            "results": results,
+            "dga_count": sum(1 for r in results if r["is_dga"]),
+            "threshold": pattern_detector.dga_scorer.threshold,
+        }
+    except Exception as e:
+        logger.error(f"Error scoring domains: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+# Densest IP prefixes in a feed
+@app.post("/ip-clusters")
+async def ip_clusters(
+    ips: List[str],
+    prefix_len: int = Query(24, ge=1, le=32),
+    ipv6_prefix_len: int = Query(48, ge=1, le=128),
+    top: int = Query(10, ge=1, le=1000),
+    min_count: int = Query(2, ge=1),
+):
+    try:
+        logger.info(f"Clustering {len(ips)} IPs at /{prefix_len} and /{ipv6_prefix_len}")
+        index = pattern_detector.ip_prefix_index(ips)
+        return {
+            "total": len(index),
+            "ipv4": index.densest(prefix_len, 4, top, min_count),
+            "ipv6": index.densest(ipv6_prefix_len, 6, top, min_count),
+            "by_asn": index.by_asn(top),
+        }
+    except Exception as e:
+        logger.error(f"Error clustering IPs: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+# IP <-> domain infrastructure graph
+@app.post("/infrastructure-graph")
+async def infrastructure_graph(iocs: List[IOCInput]):
+    try:
+        ioc_data = [ioc.model_dump() for ioc in iocs]
+        return pattern_detector.build_infrastructure_graph(
+            [i for i in ioc_data if i["ioc_type"] in ("ip", "ipv4", "ipv6")],
+            [i for i in ioc_data if i["ioc_type"] == "domain"],
+        )
+    except Exception as e:
+        logger.error(f"Error building infrastructure graph: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+# Load known sample digests into the fuzzy-hash index
+@app.post("/fuzzy-hashes")
+async def add_fuzzy_hashes(samples: List[FuzzySample]):
+    try:
+        added = pattern_detector.fuzzy_index.add_many(s.model_dump() for s in samples)
+        return {"status": "added", "count": added, **pattern_detector.fuzzy_index.stats()}
+    except Exception as e:
+        logger.error(f"Error loading fuzzy hashes: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+# Nearest known samples to a fuzzy digest
+@app.post("/fuzzy-hashes/similar")
+async def similar_fuzzy_hashes(query: FuzzyQuery):
+    try:
+        return pattern_detector.find_similar_samples(query.digest, query.k)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        logger.error(f"Error searching fuzzy hashes: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+# Cluster submitted fuzzy digests into families
+@app.post("/fuzzy-hashes/cluster")
+async def cluster_fuzzy_hashes(request: FuzzyClusterRequest):
+    if len(request.digests) > 100000:
+        raise HTTPException(status_code=400, detail="Maximum 100000 digests per request")
+    try:
+        clusters = pattern_detector.fuzzy_index.cluster(request.digests, request.threshold)
+        return {"clusters": clusters, "count": len(clusters)}
+    except Exception as e:
+        logger.error(f"Error clustering fuzzy hashes: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+# Fuzzy-hash index statistics
+@app.get("/fuzzy-hashes/stats")
+async def fuzzy_hash_stats():
+    return pattern_detector.fuzzy_index.stats()
+
+
 # Enrich IOC
 @app.post("/enrich-ioc")
 async def enrich_ioc(ioc: IOCInput):
@@ -208,12 +391,37 @@ async def get_model_info():
             "threat_classification",
             "ioc_correlation",
             "pattern_detection",
+            "dga_scoring",
+            "fuzzy_hash_clustering",
             "mitre_mapping",
             "ioc_enrichment",
         ],
     )
 
 
+async def fuzzy_index_save_loop():
+    interval = float(os.getenv("FUZZY_INDEX_SAVE_INTERVAL", "60"))
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            await asyncio.to_thread(pattern_detector.fuzzy_index.save_if_changed)
+        except Exception as e:
+            logger.error(f"Error saving fuzzy-hash index: {e}")
+
+
+@app.on_event("startup")
+async def start_fuzzy_index_saves():
+    app.state.fuzzy_index_saves = asyncio.create_task(fuzzy_index_save_loop())
+
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    """Close the threat store and persist the fuzzy-hash index on shutdown"""
+    app.state.fuzzy_index_saves.cancel()
+    correlation_engine.close()
+    pattern_detector.fuzzy_index.save_if_changed()
+
+
 if __name__ == "__main__":
     import uvicorn
 
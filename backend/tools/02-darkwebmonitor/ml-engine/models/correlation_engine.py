@@ -4,12 +4,23 @@ Correlates threats based on shared IOCs, TTPs, and patterns
 """
 
 import logging
+import os
 import uuid
-from datetime import datetime
-from typing import Any, Dict, List
+from collections import Counter
+from typing import Any, Dict, Iterable, List, Optional
 
 import numpy as np
 
+from .minhash import (
+    MinHasher,
+    cluster_signatures,
+    estimate_jaccard,
+    is_empty_signature,
+    threat_tokens,
+)
+from .threat_index import InMemoryThreatIndex, ioc_values, ttp_techniques
+from .threat_store import SQLiteThreatStore
+
 logger = logging.getLogger(__name__)
 
 
@@ -18,12 +29,27 @@ class CorrelationEngine:
     Threat correlation engine for finding relationships between threats.
     """
 
-    def __init__(self):
+    def __init__(self, store_path: Optional[str] = None):
         self.version = "1.0.0"
         self.is_loaded = True
-
-        # Simulated threat database (in production, would be actual DB)
-        self.threat_db = self._init_threat_db()
+        self.similarity_threshold = 0.5  # Minimum estimated Jaccard for "similar"
+
+        # MinHash signatures in an LSH index find near-duplicate threats
+        self.hasher = MinHasher()
+        self.bands = 32
+
+        # Threat store with IOC/TTP inverted indexes; on disk when a path is set
+        self.store_path = store_path or os.getenv("THREAT_STORE_PATH") or None
+        if self.store_path:
+            read_only = os.getenv("THREAT_STORE_READONLY", "false").lower() == "true"
+            self.index = SQLiteThreatStore(
+                self.store_path, self.hasher.num_perm, self.bands, read_only=read_only
+            )
+            if len(self.index) == 0 and not read_only:
+                self.add_threats(self._init_threat_db())
+        else:
+            self.index = InMemoryThreatIndex(self.hasher.num_perm, self.bands)
+            self.add_threats(self._init_threat_db())
 
         logger.info(f"Correlation Engine v{self.version} loaded")
 
@@ -64,48 +90,45 @@ class CorrelationEngine:
         ]
 
     def correlate(self, threat_data: Dict[str, Any]) -> Dict[str, Any]:
-        """Find correlated threats"""
-
-        input_iocs = threat_data.get("iocs", [])
-        input_ttps = threat_data.get("ttps", [])
+        """
+        Find correlated threats.
+        Only the postings of the query's own IOCs and TTPs are visited.
+        """
 
-        related_threats = []
-        common_iocs = []
+        input_ioc_values = ioc_values(threat_data)
+        input_ttp_techniques = ttp_techniques(threat_data)
+        self_id = self.index.internal_id(threat_data.get("threat_id", ""))
 
-        # Extract IOC values for comparison
-        input_ioc_values = set(ioc.get("value", "") for ioc in input_iocs)
-        input_ttp_techniques = set(ttp.get("technique", "") for ttp in input_ttps)
+        ioc_matches = self.index.match_iocs(input_ioc_values)
+        ttp_matches = self.index.match_ttps(input_ttp_techniques)
 
-        for threat in self.threat_db:
-            threat_ioc_values = set(
-                ioc.get("value", "") for ioc in threat.get("iocs", [])
-            )
-            threat_ttp_techniques = set(
-                ttp.get("technique", "") for ttp in threat.get("ttps", [])
-            )
+        related_threats = []
+        common_iocs = set()
 
-            # Find IOC overlap
-            ioc_overlap = input_ioc_values & threat_ioc_values
+        for internal_id in ioc_matches.keys() | ttp_matches.keys():
+            if internal_id == self_id:
+                continue
+            threat = self.index.get(internal_id)
 
-            # Find TTP overlap
-            ttp_overlap = input_ttp_techniques & threat_ttp_techniques
+            # IOC and TTP overlap
+            ioc_overlap = ioc_matches.get(internal_id, set())
+            ttp_overlap = ttp_matches.get(internal_id, set())
 
             # Calculate correlation score
-            if ioc_overlap or ttp_overlap:
-                correlation_score = len(ioc_overlap) * 30 + len(ttp_overlap) * 20
-
-                related_threats.append(
-                    {
-                        "threat_id": threat["threat_id"],
-                        "name": threat["name"],
-                        "threat_type": threat["threat_type"],
-                        "correlation_score": min(correlation_score, 100),
-                        "shared_iocs": list(ioc_overlap),
-                        "shared_ttps": list(ttp_overlap),
-                    }
-                )
-
-                common_iocs.extend(ioc_overlap)
+            correlation_score = len(ioc_overlap) * 30 + len(ttp_overlap) * 20
+
+            related_threats.append(
+                {
+                    "threat_id": threat["threat_id"],
+                    "name": threat["name"],
+                    "threat_type": threat["threat_type"],
+                    "correlation_score": min(correlation_score, 100),
+                    "shared_iocs": list(ioc_overlap),
+                    "shared_ttps": list(ttp_overlap),
+                }
+            )
+
+            common_iocs.update(ioc_overlap)
 
         # Sort by correlation score
         related_threats.sort(key=lambda x: x["correlation_score"], reverse=True)
@@ -119,14 +142,73 @@ class CorrelationEngine:
 
         return {
             "related_threats": related_threats[:10],  # Top 10
-            "common_iocs": list(set(common_iocs)),
+            "similar_threats": self.find_similar(threat_data, exclude=self_id),
+            "common_iocs": list(common_iocs),
             "confidence": round(confidence, 2),
         }
 
+    def find_similar(
+        self, threat_data: Dict[str, Any], exclude: Optional[int] = None, limit: int = 10
+    ) -> List[Dict[str, Any]]:
+        """Stored threats whose IOC/TTP sets are Jaccard-similar to the query"""
+        signature = self.hasher.signature(threat_tokens(threat_data))
+        if is_empty_signature(signature):
+            return []
+        candidates = [i for i in self.index.similar_candidates(signature) if i != exclude]
+        if not candidates:
+            return []
+
+        similarities = estimate_jaccard(signature, self.index.signatures(candidates))
+        ranked = sorted(zip(similarities.tolist(), candidates), reverse=True)
+
+        similar = []
+        for similarity, internal_id in ranked[:limit]:
+            if similarity < self.similarity_threshold:
+                break
+            threat = self.index.get(internal_id)
+            similar.append(
+                {
+                    "threat_id": threat["threat_id"],
+                    "name": threat["name"],
+                    "threat_type": threat["threat_type"],
+                    "jaccard": round(similarity, 3),
+                }
+            )
+        return similar
+
+    def cluster_campaigns(
+        self, threats: List[Dict[str, Any]], threshold: Optional[float] = None
+    ) -> Dict[str, Any]:
+        """Cluster a feed dump into campaigns of Jaccard-similar threats"""
+        threshold = self.similarity_threshold if threshold is None else threshold
+        if not threats:
+            return {"campaigns": [], "singletons": 0}
+        signatures = np.stack([self.hasher.signature(threat_tokens(t)) for t in threats])
+
+        campaigns = []
+        singletons = 0
+        for members in cluster_signatures(signatures, threshold, self.bands):
+            if len(members) == 1:
+                singletons += 1
+                continue
+            ioc_counts = Counter(v for i in members for v in ioc_values(threats[i]))
+            ttp_counts = Counter(t for i in members for t in ttp_techniques(threats[i]))
+            campaigns.append(
+                {
+                    "campaign_id": str(uuid.uuid4()),
+                    "size": len(members),
+                    "threat_ids": [threats[i].get("threat_id") for i in members],
+                    "top_iocs": [v for v, _ in ioc_counts.most_common(10)],
+                    "top_ttps": [t for t, _ in ttp_counts.most_common(5)],
+                }
+            )
+        campaigns.sort(key=lambda c: c["size"], reverse=True)
+        return {"campaigns": campaigns, "singletons": singletons}
+
     def add_threat(self, threat_data: Dict[str, Any]) -> bool:
         """Add threat to database for future correlation"""
         try:
-            self.threat_db.append(threat_data)
+            self._add(threat_data)
             logger.info(
                 f"Added threat {threat_data.get('threat_id')} to correlation DB"
             )
@@ -134,3 +216,23 @@ class CorrelationEngine:
         except Exception as e:
             logger.error(f"Error adding threat: {e}")
             return False
+
+    def _signed(self, threat_data: Dict[str, Any]):
+        return threat_data, self.hasher.signature(threat_tokens(threat_data))
+
+    def _add(self, threat_data: Dict[str, Any]):
+        self.index.add(*self._signed(threat_data))
+
+    def add_threats(self, threats: Iterable[Dict[str, Any]]) -> int:
+        """Bulk-load threats (e.g. from a feed); returns the number indexed"""
+        count = self.index.add_many(self._signed(t) for t in threats)
+        logger.info(f"Bulk-loaded {count} threats into correlation DB")
+        return count
+
+    def close(self):
+        """Release the on-disk threat store, if any"""
+        if isinstance(self.index, SQLiteThreatStore):
+            self.index.close()
+
+    def stats(self) -> Dict[str, int]:
+        return {"threats": len(self.index), "distinct_iocs": self.index.ioc_count}
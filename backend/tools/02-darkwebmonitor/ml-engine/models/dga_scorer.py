@@ -0,0 +1,287 @@
+"""
+DarkWebMonitor ML Engine - DGA Scorer
+Vectorized scoring of domains for algorithmically generated names
+"""
+
+import argparse
+import logging
+import os
+import re
+from typing import Any, Dict, Iterable, List, Optional
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MODEL_PATH = os.path.join(os.path.dirname(__file__), "..", "data", "dga_ngrams.npz")
+
+# Symbol 0 marks label boundaries, the last symbol any character outside the alphabet
+ALPHABET = "abcdefghijklmnopqrstuvwxyz0123456789-"
+BOUNDARY = 0
+OTHER = len(ALPHABET) + 1
+VOCAB = len(ALPHABET) + 2
+MAX_LABEL_LENGTH = 63
+
+# Short labels carry too little signal: scores are scaled from 0 below
+# MIN_LABEL_LENGTH up to full strength at FULL_LABEL_LENGTH, so names like
+# t.co, qq.com or 163.com are never flagged
+MIN_LABEL_LENGTH = 6
+FULL_LABEL_LENGTH = 10
+
+# Legitimate short names that must stay below the threshold with any model
+COMMON_SHORT_DOMAINS = [
+    "t.co", "x.com", "vk.com", "qq.com", "163.com", "9gag.com", "nyt.com", "wsj.com",
+    "w3.org", "4chan.org", "tumblr.com", "imgur.com", "tiktok.com", "xvideos.com",
+]
+
+FEATURES = [
+    "length",
+    "entropy",
+    "ngram_log_likelihood",
+    "digit_ratio",
+    "vowel_ratio",
+    "consonant_ratio",
+    "hyphen_ratio",
+]
+
+# Second-level labels under ccTLDs that are part of the suffix (example.co.uk)
+_SECOND_LEVEL_SUFFIXES = {"co", "com", "net", "org", "gov", "ac", "edu", "or", "ne", "go"}
+
+_LOOKUP = np.full(256, OTHER, dtype=np.int64)
+_LOOKUP[0] = BOUNDARY
+for _i, _c in enumerate(ALPHABET, start=1):
+    _LOOKUP[ord(_c)] = _i
+_IS_DIGIT = np.zeros(VOCAB, dtype=bool)
+_IS_DIGIT[[ALPHABET.index(c) + 1 for c in "0123456789"]] = True
+_IS_VOWEL = np.zeros(VOCAB, dtype=bool)
+_IS_VOWEL[[ALPHABET.index(c) + 1 for c in "aeiou"]] = True
+_IS_CONSONANT = np.zeros(VOCAB, dtype=bool)
+_IS_CONSONANT[[ALPHABET.index(c) + 1 for c in "bcdfghjklmnpqrstvwxyz"]] = True
+_HYPHEN = ALPHABET.index("-") + 1
+
+
+def registered_label(domain: str) -> str:
+    """The label a domain owner chooses: 'example' for www.example.co.uk"""
+    parts = [p for p in domain.strip().lower().rstrip(".").split(".") if p]
+    if not parts:
+        return ""
+    if len(parts) == 1:
+        return parts[0]
+    if len(parts) >= 3 and len(parts[-1]) == 2 and parts[-2] in _SECOND_LEVEL_SUFFIXES:
+        return parts[-3]
+    return parts[-2]
+
+
+def encode_labels(labels: List[str]):
+    """Labels as a (n, max_len) matrix of symbol codes (0-padded) and their lengths"""
+    labels = [label[:MAX_LABEL_LENGTH] for label in labels]
+    lengths = np.fromiter((len(label) for label in labels), dtype=np.int64, count=len(labels))
+    width = max(int(lengths.max()) if len(labels) else 0, 1)
+    raw = "".join(label.ljust(width, "\0") for label in labels).encode("latin-1", "replace")
+    codes = _LOOKUP[np.frombuffer(raw, dtype=np.uint8).reshape(len(labels), width)]
+    return codes, lengths
+
+
+def ngram_indices(codes: np.ndarray, order: int) -> np.ndarray:
+    """
+    Flat n-gram table index of every position, including the transition
+    into the end boundary. Column j is the n-gram ending at character j.
+    """
+    n = len(codes)
+    padded = np.hstack([
+        np.zeros((n, order - 1), dtype=np.int64),
+        codes,
+        np.zeros((n, 1), dtype=np.int64),
+    ])
+    positions = codes.shape[1] + 1
+    index = np.zeros((n, positions), dtype=np.int64)
+    for k in range(order):
+        index = index * VOCAB + padded[:, k:k + positions]
+    return index
+
+
+def label_features(codes: np.ndarray, lengths: np.ndarray, log_probs: np.ndarray,
+                   order: int) -> np.ndarray:
+    """Feature matrix (n, len(FEATURES)) for encoded labels"""
+    n, width = codes.shape
+    safe_lengths = np.maximum(lengths, 1).astype(np.float64)
+    in_label = np.arange(width) < lengths[:, None]
+
+    # Character histogram per label -> Shannon entropy
+    rows = np.broadcast_to(np.arange(n)[:, None], codes.shape)
+    counts = np.bincount(
+        (rows * VOCAB + codes)[in_label], minlength=n * VOCAB
+    ).reshape(n, VOCAB).astype(np.float64)
+    probabilities = counts / safe_lengths[:, None]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        entropy = -np.where(counts > 0, probabilities * np.log2(probabilities), 0.0).sum(axis=1)
+
+    # Mean n-gram log-likelihood over characters plus the end transition
+    transitions = np.arange(width + 1) < (lengths + 1)[:, None]
+    log_likelihood = np.where(transitions, log_probs[ngram_indices(codes, order)], 0.0)
+    mean_log_likelihood = log_likelihood.sum(axis=1) / (lengths + 1)
+
+    return np.column_stack([
+        lengths.astype(np.float64),
+        entropy,
+        mean_log_likelihood,
+        counts[:, _IS_DIGIT].sum(axis=1) / safe_lengths,
+        counts[:, _IS_VOWEL].sum(axis=1) / safe_lengths,
+        counts[:, _IS_CONSONANT].sum(axis=1) / safe_lengths,
+        counts[:, _HYPHEN] / safe_lengths,
+    ])
+
+
+class DGAScorer:
+    """
+    Scores batches of domains for DGA likelihood.
+
+    The model is a character n-gram table of conditional log-probabilities
+    learned from benign names, plus logistic-regression weights over the
+    label features. Both are loaded from a single .npz file.
+    """
+
+    def __init__(self, path: Optional[str] = None, threshold: float = 0.5):
+        self.path = os.path.abspath(path or os.getenv("DGA_MODEL_PATH", DEFAULT_MODEL_PATH))
+        self.threshold = threshold
+        with np.load(self.path) as model:
+            self.order = int(model["order"])
+            self.log_probs = model["log_probs"].astype(np.float32)
+            self.weights = model["weights"].astype(np.float64)
+            self.bias = float(model["bias"])
+            self.feature_mean = model["feature_mean"].astype(np.float64)
+            self.feature_std = model["feature_std"].astype(np.float64)
+        logger.info(f"Loaded {self.order}-gram DGA model from {self.path}")
+        flagged = [d for d, s in zip(COMMON_SHORT_DOMAINS, self.score(COMMON_SHORT_DOMAINS))
+                   if s >= self.threshold]
+        if flagged:
+            logger.warning(f"DGA model flags common short domains: {', '.join(flagged)}")
+
+    def features(self, domains: List[str]) -> np.ndarray:
+        codes, lengths = encode_labels([registered_label(d) for d in domains])
+        return label_features(codes, lengths, self.log_probs, self.order)
+
+    def score_features(self, features: np.ndarray) -> np.ndarray:
+        z = ((features - self.feature_mean) / self.feature_std) @ self.weights + self.bias
+        # Empty and short labels ("", "...", "qq") carry little or no evidence
+        strength = np.clip(
+            (features[:, 0] - (MIN_LABEL_LENGTH - 1)) / (FULL_LABEL_LENGTH - MIN_LABEL_LENGTH + 1), 0.0, 1.0
+        )
+        return strength / (1.0 + np.exp(-z))
+
+    def score(self, domains: List[str]) -> np.ndarray:
+        """DGA probability per domain"""
+        if not domains:
+            return np.zeros(0)
+        return self.score_features(self.features(domains))
+
+    def score_domains(self, domains: List[str]) -> List[Dict[str, Any]]:
+        """Per-domain scores with the features behind them"""
+        if not domains:
+            return []
+        features = self.features(domains)
+        scores = self.score_features(features)
+        return [
+            {
+                "domain": domain,
+                "dga_score": round(float(score), 4),
+                "is_dga": bool(score >= self.threshold),
+                "entropy": round(float(row[1]), 3),
+                "ngram_log_likelihood": round(float(row[2]), 3),
+                "digit_ratio": round(float(row[3]), 3),
+            }
+            for domain, score, row in zip(domains, scores, features)
+        ]
+
+
+# --- Training ---------------------------------------------------------------
+
+def _corpus_words(paths: Iterable[str]) -> List[str]:
+    words = set()
+    for path in paths:
+        with open(path, errors="ignore") as f:
+            words.update(re.findall(r"[a-z][a-z0-9-]{2,30}", f.read().lower()))
+    return sorted(words)
+
+
+def _synthetic_dga(rng: np.random.Generator, n: int) -> List[str]:
+    """Random names in the styles of common DGA families"""
+    letters = np.array(list("abcdefghijklmnopqrstuvwxyz"))
+    alnum = np.array(list("abcdefghijklmnopqrstuvwxyz0123456789"))
+    hexdigits = np.array(list("0123456789abcdef"))
+    names = []
+    for i in range(n):
+        style = i % 3
+        if style == 0:
+            names.append("".join(rng.choice(letters, rng.integers(8, 21))))
+        elif style == 1:
+            names.append("".join(rng.choice(alnum, rng.integers(8, 25))))
+        else:
+            names.append("".join(rng.choice(hexdigits, rng.integers(12, 33))))
+    return names
+
+
+def train(corpus_paths: List[str], out_path: str, order: int = 3, smoothing: float = 0.1,
+          epochs: int = 2000, learning_rate: float = 0.5, seed: int = 7) -> Dict[str, Any]:
+    """
+    Fit the n-gram table on words from benign text corpora and the feature
+    weights on those words (and pairs of them) against synthetic DGA names.
+    """
+    rng = np.random.default_rng(seed)
+    words = _corpus_words(corpus_paths)
+    if len(words) < 100:
+        raise ValueError(f"Need at least 100 corpus words, got {len(words)}")
+
+    codes, lengths = encode_labels(words)
+    grams = ngram_indices(codes, order)
+    valid = np.arange(grams.shape[1]) < (lengths + 1)[:, None]
+    counts = np.bincount(grams[valid], minlength=VOCAB ** order).astype(np.float64)
+    counts = counts.reshape(-1, VOCAB) + smoothing
+    log_probs = np.log(counts / counts.sum(axis=1, keepdims=True)).ravel()
+
+    # Benign names: corpus words and two-word concatenations
+    pairs = rng.choice(words, size=(len(words), 2))
+    benign = [w for w in words if len(w) >= 4] + ["".join(p) for p in pairs]
+    generated = _synthetic_dga(rng, len(benign))
+    samples = benign + generated
+    labels = np.concatenate([np.zeros(len(benign)), np.ones(len(generated))])
+
+    codes, lengths = encode_labels(samples)
+    features = label_features(codes, lengths, log_probs, order)
+    mean, std = features.mean(axis=0), features.std(axis=0) + 1e-9
+    x = (features - mean) / std
+
+    weights, bias = np.zeros(x.shape[1]), 0.0
+    for _ in range(epochs):
+        p = 1.0 / (1.0 + np.exp(-(x @ weights + bias)))
+        weights -= learning_rate * (x.T @ (p - labels) / len(labels) + 1e-4 * weights)
+        bias -= learning_rate * float((p - labels).mean())
+
+    p = 1.0 / (1.0 + np.exp(-(x @ weights + bias)))
+    accuracy = float(((p >= 0.5) == (labels > 0.5)).mean())
+
+    os.makedirs(os.path.dirname(os.path.abspath(out_path)), exist_ok=True)
+    np.savez_compressed(
+        out_path,
+        order=np.int64(order),
+        log_probs=log_probs.astype(np.float16),
+        weights=weights,
+        bias=np.float64(bias),
+        feature_mean=mean,
+        feature_std=std,
+    )
+    return {"words": len(words), "samples": len(samples), "training_accuracy": round(accuracy, 4)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Train the DGA n-gram model")
+    parser.add_argument("corpus", nargs="+", help="Text files with benign words or domain names")
+    parser.add_argument("--out", default=DEFAULT_MODEL_PATH, help="Output .npz path")
+    parser.add_argument("--order", type=int, default=3, help="Character n-gram order")
+    args = parser.parse_args()
+    print(train(args.corpus, args.out, order=args.order))
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    main()
@@ -0,0 +1,194 @@
+"""
+DarkWebMonitor ML Engine - Feed Import
+Parses STIX 2.x bundles and CSV IOC feeds into threat records
+"""
+
+import argparse
+import csv
+import json
+import logging
+import os
+import re
+from collections import OrderedDict
+from typing import Any, Dict, Iterator, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# STIX object types that become threats when indicators point at them
+THREAT_OBJECT_TYPES = {
+    "malware": "malware",
+    "threat-actor": "apt",
+    "intrusion-set": "apt",
+    "campaign": "campaign",
+}
+
+# STIX cyber-observable pattern paths mapped to IOC types
+PATTERN_IOC_TYPES = {
+    "domain-name:value": "domain",
+    "ipv4-addr:value": "ip",
+    "ipv6-addr:value": "ip",
+    "url:value": "url",
+    "email-addr:value": "email",
+    "file:hashes.MD5": "hash",
+    "file:hashes.'MD5'": "hash",
+    "file:hashes.'SHA-1'": "hash",
+    "file:hashes.'SHA-256'": "hash",
+    "file:hashes.SHA1": "hash",
+    "file:hashes.SHA256": "hash",
+}
+
+# Feeds the API may import from; the CLI reads any path it is given
+DEFAULT_FEED_DIR = os.path.join(os.path.dirname(__file__), "..", "data", "feeds")
+
+_PATTERN_TERM = re.compile(r"([\w-]+:[\w.'-]+)\s*=\s*'((?:[^'\\]|\\.)*)'")
+
+
+def parse_stix_pattern(pattern: str) -> List[Dict[str, str]]:
+    """IOCs from the equality comparisons of a STIX pattern"""
+    return [
+        {"ioc_type": PATTERN_IOC_TYPES.get(path, "unknown"), "value": value}
+        for path, value in _PATTERN_TERM.findall(pattern or "")
+    ]
+
+
+def _mitre_id(obj: Dict[str, Any]) -> str:
+    for ref in obj.get("external_references") or []:
+        if ref.get("source_name") == "mitre-attack" and ref.get("external_id"):
+            return ref["external_id"]
+    return ""
+
+
+def iter_stix_bundle(bundle: Dict[str, Any]) -> Iterator[Dict[str, Any]]:
+    """
+    Threats from a STIX 2.x bundle.
+    Malware, threat actors, intrusion sets and campaigns become threats that
+    collect the IOCs of indicators related to them ("indicates") and the ATT&CK
+    techniques they "use". Indicators that point at nothing become threats on
+    their own.
+    """
+    objects = {obj["id"]: obj for obj in bundle.get("objects") or [] if "id" in obj}
+    threats: Dict[str, Dict[str, Any]] = OrderedDict()
+    claimed = set()
+
+    def threat_for(stix_id: str) -> Dict[str, Any]:
+        if stix_id not in threats:
+            obj = objects[stix_id]
+            threats[stix_id] = {
+                "threat_id": stix_id,
+                "name": obj.get("name") or stix_id,
+                "threat_type": THREAT_OBJECT_TYPES[obj["type"]],
+                "iocs": [],
+                "ttps": [],
+            }
+        return threats[stix_id]
+
+    for rel in objects.values():
+        if rel.get("type") != "relationship":
+            continue
+        source = objects.get(rel.get("source_ref"))
+        target = objects.get(rel.get("target_ref"))
+        if source is None or target is None:
+            continue
+        kind = rel.get("relationship_type")
+        if (kind == "indicates" and source["type"] == "indicator"
+                and target["type"] in THREAT_OBJECT_TYPES):
+            threat_for(target["id"])["iocs"].extend(parse_stix_pattern(source.get("pattern")))
+            claimed.add(source["id"])
+        elif (kind == "uses" and source["type"] in THREAT_OBJECT_TYPES
+                and target["type"] == "attack-pattern"):
+            technique = _mitre_id(target)
+            if technique:
+                threat_for(source["id"])["ttps"].append({"technique": technique})
+
+    yield from threats.values()
+
+    for obj in objects.values():
+        if obj.get("type") == "indicator" and obj["id"] not in claimed:
+            iocs = parse_stix_pattern(obj.get("pattern"))
+            if iocs:
+                yield {
+                    "threat_id": obj["id"],
+                    "name": obj.get("name") or obj["id"],
+                    "threat_type": "unknown",
+                    "iocs": iocs,
+                    "ttps": [],
+                }
+
+
+def iter_csv_feed(path: str) -> Iterator[Dict[str, Any]]:
+    """
+    Threats from a CSV feed with one IOC or technique per row.
+    Columns: threat_id, name, threat_type, ioc_type, ioc_value (or value), technique.
+    """
+    threats: Dict[str, Dict[str, Any]] = OrderedDict()
+    with open(path, newline="") as f:
+        for row in csv.DictReader(f):
+            threat_id = (row.get("threat_id") or "").strip()
+            if not threat_id:
+                continue
+            threat = threats.setdefault(
+                threat_id,
+                {
+                    "threat_id": threat_id,
+                    "name": row.get("name") or threat_id,
+                    "threat_type": row.get("threat_type") or "unknown",
+                    "iocs": [],
+                    "ttps": [],
+                },
+            )
+            value = (row.get("ioc_value") or row.get("value") or "").strip()
+            if value:
+                threat["iocs"].append({"ioc_type": row.get("ioc_type") or "unknown", "value": value})
+            technique = (row.get("technique") or "").strip()
+            if technique:
+                threat["ttps"].append({"technique": technique})
+    yield from threats.values()
+
+
+def resolve_feed_path(path: str, feed_dir: Optional[str] = None) -> str:
+    """
+    Resolve a requested feed path (relative paths are taken from the feed
+    directory) and reject anything outside that directory.
+    """
+    feed_dir = os.path.realpath(feed_dir or os.getenv("THREAT_FEED_DIR") or DEFAULT_FEED_DIR)
+    resolved = os.path.realpath(os.path.join(feed_dir, path))
+    if os.path.commonpath([resolved, feed_dir]) != feed_dir:
+        raise ValueError(f"Feed must be inside the feed directory: {path}")
+    if not os.path.isfile(resolved):
+        raise ValueError(f"Feed file not found: {path}")
+    return resolved
+
+
+def iter_feed(path: str) -> Iterator[Dict[str, Any]]:
+    """Threats from a feed file, dispatched on its extension (.csv or STIX .json)"""
+    if os.path.splitext(path)[1].lower() == ".csv":
+        return iter_csv_feed(path)
+    with open(path) as f:
+        return iter_stix_bundle(json.load(f))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Import a threat feed into a threat store")
+    parser.add_argument("feed", nargs="+", help="STIX 2.x bundle (.json) or CSV feed files")
+    parser.add_argument(
+        "--store", default=os.getenv("THREAT_STORE_PATH"), help="SQLite threat store path"
+    )
+    args = parser.parse_args()
+    if not args.store:
+        parser.error("--store or THREAT_STORE_PATH is required")
+
+    from .correlation_engine import CorrelationEngine
+
+    engine = CorrelationEngine(store_path=args.store)
+    try:
+        for path in args.feed:
+            count = engine.add_threats(iter_feed(path))
+            print(f"{path}: imported {count} threats")
+        print(json.dumps(engine.stats()))
+    finally:
+        engine.close()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    main()
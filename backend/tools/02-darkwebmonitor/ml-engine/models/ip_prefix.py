@@ -0,0 +1,309 @@
+"""
+DarkWebMonitor ML Engine - IP Prefix Index
+Prefix aggregation of IP IOCs and longest-prefix ASN lookup
+"""
+
+import csv
+import ipaddress
+import logging
+import os
+import socket
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_ASN_TABLE_PATH = os.path.join(os.path.dirname(__file__), "..", "data", "asn_prefixes.csv")
+
+
+def _pack(value: str, family: int) -> Optional[bytes]:
+    try:
+        return socket.inet_pton(family, value)
+    except (OSError, ValueError):
+        pass
+    if "/" in value:
+        try:
+            network = ipaddress.ip_network(value, strict=False)
+        except ValueError:
+            return None
+        if network.version == (4 if family == socket.AF_INET else 6):
+            return network.network_address.packed
+    return None
+
+
+def parse_ips(values: List[str]) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Split IP strings into integer keys per family.
+    Returns (v4_keys uint64[n4], v4_rows, v6_keys uint64[n6, 2], v6_rows), where
+    the rows are positions in `values`. Values that are not IPs are dropped;
+    CIDR values are keyed by their network address.
+    """
+    v4_packed, v4_rows, v6_packed, v6_rows = [], [], [], []
+    for row, value in enumerate(values):
+        value = value.strip()
+        packed = _pack(value, socket.AF_INET) if ":" not in value else None
+        if packed is not None:
+            v4_packed.append(packed)
+            v4_rows.append(row)
+            continue
+        packed = _pack(value, socket.AF_INET6) if ":" in value else None
+        if packed is not None:
+            v6_packed.append(packed)
+            v6_rows.append(row)
+
+    v4 = np.frombuffer(b"".join(v4_packed), dtype=">u4").astype(np.uint64)
+    v6 = np.frombuffer(b"".join(v6_packed), dtype=">u8").astype(np.uint64).reshape(-1, 2)
+    return v4, np.array(v4_rows, dtype=np.int64), v6, np.array(v6_rows, dtype=np.int64)
+
+
+def _network(family: int, key: int, prefix_len: int) -> str:
+    if family == 4:
+        return str(ipaddress.IPv4Network((key, prefix_len)))
+    return str(ipaddress.IPv6Network((key, prefix_len)))
+
+
+def _prefix_keys(keys: np.ndarray, family: int, prefix_len: int) -> np.ndarray:
+    """Keys truncated to prefix_len bits, as a 1-d (v4) or (n, 2) (v6) array"""
+    if family == 4:
+        return keys >> np.uint64(32 - prefix_len) << np.uint64(32 - prefix_len)
+    hi, lo = keys[:, 0], keys[:, 1]
+    if prefix_len <= 64:
+        shift = np.uint64(64 - prefix_len)
+        return np.column_stack([hi >> shift << shift, np.zeros_like(lo)])
+    shift = np.uint64(128 - prefix_len)
+    return np.column_stack([hi, lo >> shift << shift])
+
+
+def _v6_search(keys: np.ndarray, value: int, side: str) -> int:
+    """searchsorted over lexicographically sorted (hi, lo) IPv6 keys"""
+    hi, lo = np.uint64(value >> 64), np.uint64(value & ((1 << 64) - 1))
+    start = int(np.searchsorted(keys[:, 0], hi, side="left"))
+    end = int(np.searchsorted(keys[:, 0], hi, side="right"))
+    return start + int(np.searchsorted(keys[start:end, 1], lo, side=side))
+
+
+class ASNTable:
+    """
+    Longest-prefix-match table from IP prefixes to origin ASNs.
+
+    Nested prefixes are flattened at load time into disjoint sorted ranges
+    owned by their most specific prefix, so a batch of addresses resolves with
+    a single searchsorted. IPv6 prefixes are matched on their upper 64 bits,
+    which covers every prefix length routed on the internet.
+
+    Accepts CSV with `prefix,asn[,name]` rows or iptoasn-style TSV with
+    `range_start  range_end  asn  country  description` rows.
+    """
+
+    def __init__(self):
+        self.names: Dict[int, str] = {}
+        self._bounds = {4: np.zeros(0, dtype=np.uint64), 6: np.zeros(0, dtype=np.uint64)}
+        self._owners = {4: np.zeros(0, dtype=np.int64), 6: np.zeros(0, dtype=np.int64)}
+        self.prefix_count = 0
+
+    def __len__(self) -> int:
+        return self.prefix_count
+
+    @classmethod
+    def load(cls, path: Optional[str] = None) -> "ASNTable":
+        path = path or os.getenv("ASN_TABLE_PATH", DEFAULT_ASN_TABLE_PATH)
+        table = cls()
+        if not os.path.exists(path):
+            logger.warning(f"ASN table {path} not found; ASN lookups disabled")
+            return table
+
+        ranges: Dict[int, List[Tuple[int, int, int]]] = {4: [], 6: []}
+        with open(path, newline="") as f:
+            first = f.readline()
+            f.seek(0)
+            reader = csv.reader(f, delimiter="\t" if "\t" in first else ",")
+            for row in reader:
+                if not row or row[0].startswith("#") or row[0] == "prefix":
+                    continue
+                try:
+                    parsed = table._parse_row(row)
+                except ValueError:
+                    continue
+                if parsed is not None:
+                    family, start, end, asn, name = parsed
+                    ranges[family].append((start, end, asn))
+                    if name:
+                        table.names.setdefault(asn, name)
+
+        for family, family_ranges in ranges.items():
+            table._build(family, family_ranges)
+        table.prefix_count = sum(len(r) for r in ranges.values())
+        logger.info(f"Loaded {table.prefix_count} ASN prefixes from {path}")
+        return table
+
+    @staticmethod
+    def _parse_row(row: List[str]):
+        if len(row) >= 3 and "/" not in row[0]:
+            start = ipaddress.ip_address(row[0].strip())
+            end = ipaddress.ip_address(row[1].strip())
+            asn_field, name = row[2], (row[4] if len(row) > 4 else "")
+        else:
+            network = ipaddress.ip_network(row[0].strip(), strict=False)
+            start, end = network.network_address, network.broadcast_address
+            asn_field, name = row[1], (row[2] if len(row) > 2 else "")
+        asn = int(asn_field.strip().upper().lstrip("AS") or 0)
+        if asn == 0:  # unrouted space
+            return None
+        if start.version == 4:
+            return 4, int(start), int(end), asn, name.strip()
+        return 6, int(start) >> 64, int(end) >> 64, asn, name.strip()
+
+    def _build(self, family: int, ranges: List[Tuple[int, int, int]]):
+        if not ranges:
+            return
+        starts = np.array([r[0] for r in ranges], dtype=np.uint64)
+        ends = np.array([r[1] for r in ranges], dtype=np.uint64)
+        asns = np.array([r[2] for r in ranges], dtype=np.int64)
+
+        # Elementary intervals between all range boundaries, painted from the
+        # widest range to the narrowest so the most specific prefix wins
+        bounds = np.unique(np.concatenate([starts, ends + np.uint64(1)]))
+        owners = np.full(len(bounds), -1, dtype=np.int64)
+        lo = np.searchsorted(bounds, starts)
+        hi = np.searchsorted(bounds, ends + np.uint64(1))
+        for i in np.argsort(ends - starts, kind="stable")[::-1]:
+            owners[lo[i]:hi[i]] = asns[i]
+        self._bounds[family] = bounds
+        self._owners[family] = owners
+
+    def lookup(self, keys: np.ndarray, family: int = 4) -> np.ndarray:
+        """Origin ASN per key (-1 when unrouted); v6 keys are (n, 2) arrays"""
+        if family == 6:
+            keys = keys[:, 0] if len(keys) else np.zeros(0, dtype=np.uint64)
+        bounds = self._bounds[family]
+        if not len(bounds) or not len(keys):
+            return np.full(len(keys), -1, dtype=np.int64)
+        slot = np.searchsorted(bounds, keys, side="right") - 1
+        return np.where(slot >= 0, self._owners[family][np.maximum(slot, 0)], -1)
+
+    def lookup_ip(self, value: str) -> Optional[int]:
+        v4, _, v6, _ = parse_ips([value])
+        asn = int(self.lookup(v4, 4)[0]) if len(v4) else (
+            int(self.lookup(v6, 6)[0]) if len(v6) else -1
+        )
+        return asn if asn >= 0 else None
+
+
+class IPPrefixIndex:
+    """
+    Binary radix tree over IP IOCs, stored implicitly as sorted integer keys.
+
+    Every trie node at depth L is the contiguous run of keys sharing their
+    first L bits, so node counts for any prefix length come from one
+    vectorized pass over the sorted keys, and a subtree is a searchsorted
+    range. Building the index sorts once; no per-node objects exist, which
+    keeps feeds with millions of addresses to a few seconds.
+    """
+
+    def __init__(self, values: List[str], asn_table: Optional[ASNTable] = None):
+        self.asn_table = asn_table or ASNTable()
+        v4, v4_rows, v6, v6_rows = parse_ips(values)
+        order4 = np.argsort(v4, kind="stable")
+        order6 = np.lexsort((v6[:, 1], v6[:, 0])) if len(v6) else np.zeros(0, dtype=np.int64)
+        self._keys = {4: v4[order4], 6: v6[order6]}
+        self._rows = {4: v4_rows[order4], 6: v6_rows[order6]}
+        self._values = values
+
+    def __len__(self) -> int:
+        return len(self._keys[4]) + len(self._keys[6])
+
+    def family_size(self, family: int) -> int:
+        return len(self._keys[family])
+
+    def _runs(self, family: int, prefix_len: int) -> Tuple[np.ndarray, np.ndarray]:
+        """Start offsets and lengths of the trie nodes at depth prefix_len"""
+        keys = self._keys[family]
+        if family == 4:
+            prefixes = _prefix_keys(keys, 4, prefix_len)
+            changed = prefixes[1:] != prefixes[:-1]
+        else:
+            prefixes = _prefix_keys(keys, 6, prefix_len)
+            changed = (prefixes[1:] != prefixes[:-1]).any(axis=1)
+        starts = np.concatenate([[0], np.flatnonzero(changed) + 1]).astype(np.int64)
+        return starts, np.diff(np.append(starts, len(keys)))
+
+    def densest(self, prefix_len: int, family: int = 4, top: int = 10,
+                min_count: int = 1, sample: int = 50) -> List[Dict[str, Any]]:
+        """
+        The `top` prefixes of the given length holding the most IOCs, each with
+        up to `sample` of its distinct IOC values.
+        """
+        max_len = 32 if family == 4 else 128
+        if not 0 < prefix_len <= max_len:
+            raise ValueError(f"IPv{family} prefix length must be in 1..{max_len}")
+        keys = self._keys[family]
+        if not len(keys):
+            return []
+
+        starts, counts = self._runs(family, prefix_len)
+        keep = np.flatnonzero(counts >= min_count)
+        if len(keep) > top:
+            keep = keep[np.argpartition(-counts[keep], top - 1)[:top]]
+        keep = keep[np.argsort(-counts[keep], kind="stable")]
+
+        # Distinct addresses per node (keys repeat when an IP is reported twice)
+        if family == 4:
+            distinct = np.concatenate([[True], keys[1:] != keys[:-1]])
+        else:
+            distinct = np.concatenate([[True], (keys[1:] != keys[:-1]).any(axis=1)])
+        distinct_before = np.concatenate([[0], np.cumsum(distinct)])
+
+        asns = self.asn_table.lookup(keys[starts[keep]], family)
+        clusters = []
+        for node, asn in zip(keep.tolist(), asns.tolist()):
+            start, count = int(starts[node]), int(counts[node])
+            if family == 4:
+                network_key = int(_prefix_keys(keys[start:start + 1], 4, prefix_len)[0])
+            else:
+                hi, lo = _prefix_keys(keys[start:start + 1], 6, prefix_len)[0]
+                network_key = (int(hi) << 64) | int(lo)
+            rows = self._rows[family][start:start + count]
+            clusters.append(
+                {
+                    "prefix": _network(family, network_key, prefix_len),
+                    "count": count,
+                    "unique_ips": int(distinct_before[start + count] - distinct_before[start]),
+                    "asn": asn if asn >= 0 else None,
+                    "as_name": self.asn_table.names.get(asn) if asn >= 0 else None,
+                    "iocs": list(dict.fromkeys(self._values[r] for r in rows.tolist()))[:sample],
+                }
+            )
+        return clusters
+
+    def count(self, network: str) -> int:
+        """Number of IOCs inside a CIDR block (a subtree of the trie)"""
+        net = ipaddress.ip_network(network, strict=False)
+        keys = self._keys[net.version]
+        if not len(keys):
+            return 0
+        if net.version == 4:
+            lo = np.searchsorted(keys, np.uint64(int(net.network_address)), side="left")
+            hi = np.searchsorted(keys, np.uint64(int(net.broadcast_address)), side="right")
+            return int(hi - lo)
+        first, last = int(net.network_address), int(net.broadcast_address)
+        return _v6_search(keys, last, "right") - _v6_search(keys, first, "left")
+
+    def by_asn(self, top: int = 10) -> List[Dict[str, Any]]:
+        """IOC counts per origin ASN"""
+        asns = np.concatenate([
+            self.asn_table.lookup(self._keys[4], 4), self.asn_table.lookup(self._keys[6], 6)
+        ])
+        asns = asns[asns >= 0]
+        if not len(asns):
+            return []
+        values, counts = np.unique(asns, return_counts=True)
+        order = np.argsort(-counts, kind="stable")[:top]
+        return [
+            {"asn": int(values[i]), "as_name": self.asn_table.names.get(int(values[i])),
+             "count": int(counts[i])}
+            for i in order
+        ]
+
+    def asn_of(self, value: str) -> Optional[int]:
+        return self.asn_table.lookup_ip(value)
@@ -0,0 +1,153 @@
+"""
+DarkWebMonitor ML Engine - MinHash / LSH
+Jaccard-similarity sketches over threat IOC and TTP sets
+"""
+
+import hashlib
+import logging
+from collections import defaultdict
+from typing import Dict, Iterable, List, Set, Tuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Mersenne prime used by the universal hash family (fits products in uint64)
+_PRIME = np.uint64((1 << 31) - 1)
+
+
+def threat_tokens(threat_data: Dict) -> Set[str]:
+    """Tokens a threat is sketched over: its IOC values and TTP techniques"""
+    tokens = {
+        f"ioc:{ioc.get('value')}" for ioc in threat_data.get("iocs") or [] if ioc.get("value")
+    }
+    tokens.update(
+        f"ttp:{ttp.get('technique')}"
+        for ttp in threat_data.get("ttps") or []
+        if ttp.get("technique")
+    )
+    return tokens
+
+
+class MinHasher:
+    """
+    Computes MinHash signatures with `num_perm` universal hash functions.
+    Token hashes come from blake2b, so signatures are stable across processes
+    and can be persisted.
+    """
+
+    def __init__(self, num_perm: int = 128, seed: int = 1):
+        self.num_perm = num_perm
+        rng = np.random.default_rng(seed)
+        self.a = rng.integers(1, int(_PRIME), size=num_perm, dtype=np.uint64)
+        self.b = rng.integers(0, int(_PRIME), size=num_perm, dtype=np.uint64)
+
+    @staticmethod
+    def _base_hashes(tokens: Iterable[str]) -> np.ndarray:
+        return np.array(
+            [
+                int.from_bytes(hashlib.blake2b(t.encode(), digest_size=4).digest(), "little")
+                for t in tokens
+            ],
+            dtype=np.uint64,
+        ) % _PRIME
+
+    def signature(self, tokens: Iterable[str]) -> np.ndarray:
+        """MinHash signature (uint32[num_perm]) of a token set"""
+        hashes = self._base_hashes(tokens)
+        if len(hashes) == 0:
+            return np.full(self.num_perm, np.iinfo(np.uint32).max, dtype=np.uint32)
+        permuted = (np.outer(hashes, self.a) + self.b) % _PRIME
+        return permuted.min(axis=0).astype(np.uint32)
+
+
+def is_empty_signature(signature: np.ndarray) -> bool:
+    """True for the signature of an empty token set (never indexed)"""
+    return bool(signature[0] == np.iinfo(np.uint32).max and (signature == signature[0]).all())
+
+
+def estimate_jaccard(signature: np.ndarray, others: np.ndarray) -> np.ndarray:
+    """Estimated Jaccard similarity of one signature against rows of `others`"""
+    return (others == signature).mean(axis=-1)
+
+
+class LSHIndex:
+    """
+    Locality-sensitive hash index with the banding technique.
+    Signatures are cut into `bands` bands of `num_perm / bands` rows; items
+    sharing any identical band are candidates. With the defaults (32 bands of
+    4 rows) pairs above roughly 0.4 Jaccard similarity collide with high
+    probability.
+    """
+
+    def __init__(self, num_perm: int = 128, bands: int = 32):
+        if num_perm % bands:
+            raise ValueError("num_perm must be divisible by bands")
+        self.bands = bands
+        self.rows = num_perm // bands
+        self._buckets: Dict[Tuple[int, bytes], List[int]] = defaultdict(list)
+
+    def band_keys(self, signature: np.ndarray) -> List[Tuple[int, bytes]]:
+        bands = signature.reshape(self.bands, self.rows)
+        return [(i, bands[i].tobytes()) for i in range(self.bands)]
+
+    def insert(self, item_id: int, signature: np.ndarray):
+        for key in self.band_keys(signature):
+            self._buckets[key].append(item_id)
+
+    def remove(self, item_id: int, signature: np.ndarray):
+        for key in self.band_keys(signature):
+            bucket = self._buckets.get(key)
+            if bucket and item_id in bucket:
+                bucket.remove(item_id)
+                if not bucket:
+                    del self._buckets[key]
+
+    def candidates(self, signature: np.ndarray) -> Set[int]:
+        found: Set[int] = set()
+        for key in self.band_keys(signature):
+            found.update(self._buckets.get(key, ()))
+        return found
+
+    def buckets(self) -> Iterable[List[int]]:
+        """Buckets holding more than one item"""
+        return (bucket for bucket in self._buckets.values() if len(bucket) > 1)
+
+
+def cluster_signatures(
+    signatures: np.ndarray, threshold: float, bands: int = 32
+) -> List[List[int]]:
+    """
+    Group rows of a signature matrix into clusters of near-duplicates.
+    Candidates come from LSH buckets, are confirmed by estimated Jaccard
+    >= threshold, and are merged with union-find.
+    """
+    n = len(signatures)
+    lsh = LSHIndex(signatures.shape[1] if n else bands, bands)
+    for i in range(n):
+        if not is_empty_signature(signatures[i]):
+            lsh.insert(i, signatures[i])
+
+    parent = list(range(n))
+
+    def find(x: int) -> int:
+        while parent[x] != x:
+            parent[x] = parent[parent[x]]
+            x = parent[x]
+        return x
+
+    # Compare each bucket's members with its first member only, which keeps
+    # the work linear in bucket size even for large near-identical campaigns
+    for bucket in lsh.buckets():
+        head, members = bucket[0], np.array(bucket[1:])
+        similar = members[estimate_jaccard(signatures[head], signatures[members]) >= threshold]
+        root_head = find(head)
+        for member in similar.tolist():
+            root = find(member)
+            if root != root_head:
+                parent[root] = root_head
+
+    clusters: Dict[int, List[int]] = defaultdict(list)
+    for i in range(n):
+        clusters[find(i)].append(i)
+    return list(clusters.values())
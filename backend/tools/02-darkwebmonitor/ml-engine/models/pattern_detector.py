@@ -4,24 +4,53 @@ Detects patterns and relationships between IOCs
 """
 
 import logging
+import os
+import re
 import uuid
+from collections import defaultdict
 from datetime import datetime
-from typing import Any, Dict, List
+from typing import Any, Dict, List, Optional
 
 import numpy as np
+from victorykit_ml.fuzzy_index import FuzzyHashIndex, digest_kind
+
+from .dga_scorer import DGAScorer
+from .ip_prefix import ASNTable, IPPrefixIndex
 
 logger = logging.getLogger(__name__)
 
+DEFAULT_FUZZY_INDEX_PATH = os.path.join(os.path.dirname(__file__), "..", "data", "fuzzy_index.npz")
+
 
 class PatternDetector:
     """
     Pattern detection model for identifying relationships between IOCs.
     """
 
-    def __init__(self):
+    def __init__(
+        self,
+        dga_model_path: Optional[str] = None,
+        asn_table_path: Optional[str] = None,
+        fuzzy_index_path: Optional[str] = None,
+    ):
         self.version = "1.0.0"
         self.is_loaded = True
 
+        # Character n-gram model scoring domains for DGA likelihood
+        self.dga_scorer = DGAScorer(dga_model_path)
+
+        # Prefix -> origin ASN table for IP clustering
+        self.asn_table = ASNTable.load(asn_table_path)
+
+        # Prefix lengths IP clusters are reported at, per address family
+        self.cluster_prefix_lengths = {4: 24, 6: 48}
+
+        # ssdeep/TLSH digests of known samples for malware family clustering
+        self.fuzzy_index = FuzzyHashIndex.load(
+            fuzzy_index_path or os.getenv("FUZZY_INDEX_PATH", DEFAULT_FUZZY_INDEX_PATH)
+        )
+        self.family_similarity_threshold = 50
+
         # Pattern types
         self.pattern_types = [
             "infrastructure_overlap",
@@ -43,13 +72,17 @@ class PatternDetector:
         ioc_groups = {}
         for ioc in iocs:
             ioc_type = ioc.get("ioc_type", "unknown")
+            if ioc_type in ("ipv4", "ipv6"):
+                ioc_type = "ip"
+            elif ioc_type in ("ssdeep", "tlsh", "fuzzy_hash"):
+                ioc_type = "hash"
             if ioc_type not in ioc_groups:
                 ioc_groups[ioc_type] = []
             ioc_groups[ioc_type].append(ioc)
 
         # Detect infrastructure overlap
         if "ip" in ioc_groups and "domain" in ioc_groups:
-            patterns.append(
+            patterns.extend(
                 self._detect_infrastructure_overlap(
                     ioc_groups["ip"], ioc_groups["domain"]
                 )
@@ -63,56 +96,120 @@ class PatternDetector:
 
         # Detect IP clustering
         if "ip" in ioc_groups and len(ioc_groups["ip"]) >= 3:
-            ip_pattern = self._detect_ip_clustering(ioc_groups["ip"])
-            if ip_pattern:
-                patterns.append(ip_pattern)
+            patterns.extend(self._detect_ip_clustering(ioc_groups["ip"]))
 
         # Detect hash family
-        if "hash" in ioc_groups and len(ioc_groups["hash"]) >= 2:
-            hash_pattern = self._detect_hash_family(ioc_groups["hash"])
-            if hash_pattern:
-                patterns.append(hash_pattern)
+        if "hash" in ioc_groups:
+            patterns.extend(self._detect_hash_family(ioc_groups["hash"]))
 
         return [p for p in patterns if p]
 
-    def _detect_infrastructure_overlap(
+    def build_infrastructure_graph(
         self, ips: List[Dict], domains: List[Dict]
     ) -> Dict[str, Any]:
-        """Detect shared infrastructure between IPs and domains"""
+        """
+        Bipartite IP <-> domain graph.
+        An edge links a domain and an IP when either lists the other in
+        `resolves_to` or names it in its context. Connected components are
+        groups of domains served from shared infrastructure.
+        """
+
+        ip_values = {ip.get("value", "").lower() for ip in ips} - {""}
+        domain_values = {d.get("value", "").lower() for d in domains} - {""}
+
+        edges = set()
+        for ioc, is_ip in [(ip, True) for ip in ips] + [(d, False) for d in domains]:
+            value = ioc.get("value", "").lower()
+            linked = {v.lower() for v in ioc.get("resolves_to") or []}
+            linked.update(
+                token.strip(".:")
+                for token in re.split(r"[^\w.:-]+", (ioc.get("context") or "").lower())
+            )
+            if is_ip:
+                edges.update((value, domain) for domain in linked & domain_values)
+            else:
+                edges.update((ip, value) for ip in linked & ip_values)
+
+        parent: Dict[str, str] = {}
+
+        def find(node: str) -> str:
+            parent.setdefault(node, node)
+            while parent[node] != node:
+                parent[node] = parent[parent[node]]
+                node = parent[node]
+            return node
+
+        for ip, domain in edges:
+            parent[find("ip:" + ip)] = find("domain:" + domain)
+
+        members: Dict[str, List[str]] = defaultdict(list)
+        for node in list(parent):
+            members[find(node)].append(node)
+
+        components = []
+        for nodes in members.values():
+            component_ips = sorted(n[3:] for n in nodes if n.startswith("ip:"))
+            component_domains = sorted(n[7:] for n in nodes if n.startswith("domain:"))
+            asns = {self.asn_table.lookup_ip(ip) for ip in component_ips} - {None}
+            components.append(
+                {
+                    "ips": component_ips,
+                    "domains": component_domains,
+                    "asns": sorted(asns),
+                }
+            )
+        components.sort(key=lambda c: len(c["ips"]) + len(c["domains"]), reverse=True)
 
         return {
-            "pattern_id": str(uuid.uuid4()),
-            "pattern_type": "infrastructure_overlap",
-            "description": f"Detected potential shared infrastructure: "
-            f"{len(ips)} IPs and {len(domains)} domains may be related",
-            "affected_iocs": [
-                *[ip.get("value", "") for ip in ips[:5]],
-                *[d.get("value", "") for d in domains[:5]],
-            ],
-            "risk_score": min(60 + len(ips) * 5 + len(domains) * 3, 95),
+            "nodes": {"ips": len(ip_values), "domains": len(domain_values)},
+            "edges": sorted(edges),
+            "components": components,
         }
 
+    def _detect_infrastructure_overlap(
+        self, ips: List[Dict], domains: List[Dict]
+    ) -> List[Dict[str, Any]]:
+        """Detect domains and IPs sharing infrastructure"""
+
+        graph = self.build_infrastructure_graph(ips, domains)
+
+        patterns = []
+        for component in graph["components"]:
+            n_ips, n_domains = len(component["ips"]), len(component["domains"])
+            # A single domain on a single IP is just a resolution
+            if n_ips < 2 and n_domains < 2:
+                continue
+            asn_note = (
+                f" (AS{', AS'.join(map(str, component['asns']))})"
+                if component["asns"]
+                else ""
+            )
+            patterns.append(
+                {
+                    "pattern_id": str(uuid.uuid4()),
+                    "pattern_type": "infrastructure_overlap",
+                    "description": f"Shared infrastructure: {n_domains} domains "
+                    f"resolve to {n_ips} common IPs{asn_note}",
+                    "affected_iocs": [*component["ips"][:10], *component["domains"][:10]],
+                    "risk_score": min(60 + n_ips * 5 + n_domains * 3, 95),
+                }
+            )
+        return patterns[:5]
+
+    def score_domains(self, domains: List[str]) -> List[Dict[str, Any]]:
+        """DGA scores and features for a batch of domains"""
+        return self.dga_scorer.score_domains(domains)
+
     def _detect_dga_pattern(self, domains: List[Dict]) -> Dict[str, Any]:
         """Detect domain generation algorithm patterns"""
 
         domain_values = [d.get("value", "") for d in domains]
 
-        # Check for DGA-like patterns (random-looking domains)
-        suspicious_count = 0
-        for domain in domain_values:
-            parts = domain.split(".")
-            if parts:
-                main_part = parts[0]
-                # Check for random character patterns
-                if len(main_part) > 10 and not any(
-                    word in main_part.lower()
-                    for word in ["google", "amazon", "microsoft", "facebook"]
-                ):
-                    consonant_ratio = sum(
-                        1 for c in main_part.lower() if c in "bcdfghjklmnpqrstvwxyz"
-                    ) / max(len(main_part), 1)
-                    if consonant_ratio > 0.7:
-                        suspicious_count += 1
+        # Score all domains at once and rank the suspicious ones first
+        scores = self.dga_scorer.score(domain_values)
+        suspicious = np.flatnonzero(scores >= self.dga_scorer.threshold)
+        suspicious = suspicious[np.argsort(-scores[suspicious], kind="stable")]
+        suspicious_count = len(suspicious)
 
         if suspicious_count >= 2:
             return {
@@ -120,57 +217,82 @@ class PatternDetector:
                 "pattern_type": "domain_generation",
                 "description": f"Potential DGA activity detected: {suspicious_count} "
                 f"domains exhibit random generation patterns",
-                "affected_iocs": domain_values[:10],
+                "affected_iocs": [domain_values[i] for i in suspicious[:10]],
                 "risk_score": min(70 + suspicious_count * 5, 95),
             }
 
         return None
 
-    def _detect_ip_clustering(self, ips: List[Dict]) -> Dict[str, Any]:
-        """Detect IP address clustering patterns"""
+    def ip_prefix_index(self, ip_values: List[str]) -> IPPrefixIndex:
+        """Prefix index over IP IOC values, annotated with origin ASNs"""
+        return IPPrefixIndex(ip_values, self.asn_table)
 
-        ip_values = [ip.get("value", "") for ip in ips]
-
-        # Group by /24 subnet
-        subnets = {}
-        for ip in ip_values:
-            parts = ip.split(".")
-            if len(parts) == 4:
-                subnet = ".".join(parts[:3])
-                if subnet not in subnets:
-                    subnets[subnet] = []
-                subnets[subnet].append(ip)
+    def _detect_ip_clustering(self, ips: List[Dict]) -> List[Dict[str, Any]]:
+        """Detect IP address clustering patterns"""
 
-        # Find clusters
-        largest_cluster = max(subnets.values(), key=len, default=[])
+        index = self.ip_prefix_index([ip.get("value", "") for ip in ips])
 
-        if len(largest_cluster) >= 3:
-            return {
-                "pattern_id": str(uuid.uuid4()),
-                "pattern_type": "ip_clustering",
-                "description": f"IP clustering detected: {len(largest_cluster)} IPs "
-                f"in same /24 subnet",
-                "affected_iocs": largest_cluster,
-                "risk_score": min(50 + len(largest_cluster) * 8, 90),
-            }
+        clusters = []
+        for family, prefix_len in self.cluster_prefix_lengths.items():
+            clusters.extend(index.densest(prefix_len, family, top=5, min_count=3))
+        clusters.sort(key=lambda c: c["unique_ips"], reverse=True)
 
-        return None
+        patterns = []
+        for cluster in clusters[:5]:
+            if cluster["unique_ips"] < 3:
+                continue
+            owner = f" announced by AS{cluster['asn']}" if cluster["asn"] is not None else ""
+            patterns.append(
+                {
+                    "pattern_id": str(uuid.uuid4()),
+                    "pattern_type": "ip_clustering",
+                    "description": f"IP clustering detected: {cluster['unique_ips']} IPs "
+                    f"in {cluster['prefix']}{owner}",
+                    "affected_iocs": cluster["iocs"],
+                    "risk_score": min(50 + cluster["unique_ips"] * 8, 90),
+                }
+            )
+        return patterns
 
-    def _detect_hash_family(self, hashes: List[Dict]) -> Dict[str, Any]:
-        """Detect malware family based on hash patterns"""
+    def _detect_hash_family(self, hashes: List[Dict]) -> List[Dict[str, Any]]:
+        """Detect malware families by fuzzy-hash similarity"""
 
-        hash_values = [h.get("value", "") for h in hashes]
+        # Only ssdeep/TLSH digests can be compared; exact hashes say nothing
+        # about relatedness
+        digests = [
+            h.get("value", "").strip() for h in hashes if digest_kind(h.get("value", ""))
+        ]
+        if not digests:
+            return []
 
-        # In production, would use ML similarity analysis
-        # For now, simulate detection
-        if len(hash_values) >= 2:
-            return {
-                "pattern_id": str(uuid.uuid4()),
-                "pattern_type": "hash_family",
-                "description": f"Potential malware family detected: {len(hash_values)} "
-                f"samples may be related variants",
-                "affected_iocs": hash_values,
-                "risk_score": min(60 + len(hash_values) * 10, 95),
-            }
+        patterns = []
+        for cluster in self.fuzzy_index.cluster(
+            digests, self.family_similarity_threshold
+        ):
+            if cluster["size"] < 2 and not cluster["family"]:
+                continue
+            family = cluster["family"]
+            description = (
+                f"Malware family {family}: {cluster['size']} samples match known variants"
+                if family
+                else f"Potential malware family detected: {cluster['size']} "
+                f"samples are fuzzy-hash variants of each other"
+            )
+            patterns.append(
+                {
+                    "pattern_id": str(uuid.uuid4()),
+                    "pattern_type": "hash_family",
+                    "description": description,
+                    "affected_iocs": cluster["digests"],
+                    "risk_score": min(60 + cluster["size"] * 10 + (10 if family else 0), 95),
+                }
+            )
+        return patterns
 
-        return None
+    def find_similar_samples(self, digest: str, k: int = 10) -> Dict[str, Any]:
+        """Nearest known samples to a fuzzy digest, with the voted family"""
+        return {
+            "digest": digest,
+            "matches": self.fuzzy_index.nearest(digest, k),
+            "family": self.fuzzy_index.family(digest, self.family_similarity_threshold),
+        }
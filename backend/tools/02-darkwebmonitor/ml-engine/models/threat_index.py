@@ -0,0 +1,149 @@
+"""
+DarkWebMonitor ML Engine - Threat Index
+Inverted indexes from IOC values and TTP techniques to stored threats
+"""
+
+import logging
+import sys
+from array import array
+from collections import defaultdict
+from threading import RLock
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+
+import numpy as np
+
+from .minhash import LSHIndex, is_empty_signature
+
+logger = logging.getLogger(__name__)
+
+
+def ioc_values(threat_data: Dict[str, Any]) -> Set[str]:
+    """Distinct non-empty IOC values of a threat"""
+    return {ioc.get("value", "") for ioc in threat_data.get("iocs") or []} - {""}
+
+
+def ttp_techniques(threat_data: Dict[str, Any]) -> Set[str]:
+    """Distinct non-empty TTP technique ids of a threat"""
+    return {ttp.get("technique", "") for ttp in threat_data.get("ttps") or []} - {""}
+
+
+class InMemoryThreatIndex:
+    """
+    In-process threat store with inverted indexes.
+
+    Threats get dense integer ids. Each IOC value and TTP technique maps to a
+    compact array of the ids of threats containing it, so a lookup costs only
+    the postings of the values being looked up. Each threat's MinHash
+    signature is kept alongside it and indexed in an LSH index.
+    Nothing is persisted; see SQLiteThreatStore for the on-disk store.
+    """
+
+    def __init__(self, num_perm: int = 128, bands: int = 32):
+        self._threats: List[Dict[str, Any]] = []
+        self._signatures: List[Optional[np.ndarray]] = []
+        self._ids: Dict[str, int] = {}
+        self._ioc_postings: Dict[str, array] = defaultdict(lambda: array("I"))
+        self._ttp_postings: Dict[str, array] = defaultdict(lambda: array("I"))
+        self.lsh = LSHIndex(num_perm, bands)
+        self._lock = RLock()
+
+    def __len__(self) -> int:
+        return len(self._ids)
+
+    @property
+    def ioc_count(self) -> int:
+        return len(self._ioc_postings)
+
+    def _remove(self, internal_id: int):
+        threat = self._threats[internal_id]
+        for value in ioc_values(threat):
+            postings = self._ioc_postings[value]
+            postings.remove(internal_id)
+            if not postings:
+                del self._ioc_postings[value]
+        for technique in ttp_techniques(threat):
+            postings = self._ttp_postings[technique]
+            postings.remove(internal_id)
+            if not postings:
+                del self._ttp_postings[technique]
+        signature = self._signatures[internal_id]
+        if signature is not None and not is_empty_signature(signature):
+            self.lsh.remove(internal_id, signature)
+
+    def add(self, threat_data: Dict[str, Any], signature: Optional[np.ndarray] = None) -> int:
+        """Insert or replace a threat and index its IOCs, TTPs and signature"""
+        record = {
+            "threat_id": threat_data["threat_id"],
+            "name": threat_data.get("name") or "",
+            "threat_type": threat_data.get("threat_type") or "unknown",
+            "iocs": [
+                {"ioc_type": ioc.get("ioc_type", "unknown"), "value": sys.intern(ioc["value"])}
+                for ioc in threat_data.get("iocs") or []
+                if ioc.get("value")
+            ],
+            "ttps": [
+                {"technique": sys.intern(ttp["technique"])}
+                for ttp in threat_data.get("ttps") or []
+                if ttp.get("technique")
+            ],
+        }
+        with self._lock:
+            internal_id = self._ids.get(record["threat_id"])
+            if internal_id is None:
+                internal_id = len(self._threats)
+                self._threats.append(record)
+                self._signatures.append(signature)
+                self._ids[record["threat_id"]] = internal_id
+            else:
+                self._remove(internal_id)
+                self._threats[internal_id] = record
+                self._signatures[internal_id] = signature
+
+            for value in ioc_values(record):
+                self._ioc_postings[value].append(internal_id)
+            for technique in ttp_techniques(record):
+                self._ttp_postings[technique].append(internal_id)
+            if signature is not None and not is_empty_signature(signature):
+                self.lsh.insert(internal_id, signature)
+        return internal_id
+
+    def add_many(self, threats: Iterable[Tuple[Dict[str, Any], Optional[np.ndarray]]]) -> int:
+        """Bulk insert of (threat, signature) pairs; returns the number indexed"""
+        count = 0
+        with self._lock:
+            for threat_data, signature in threats:
+                self.add(threat_data, signature)
+                count += 1
+        return count
+
+    def match_iocs(self, values: Iterable[str]) -> Dict[int, Set[str]]:
+        """Threat ids containing any of the values, with the values they share"""
+        matches: Dict[int, Set[str]] = defaultdict(set)
+        with self._lock:
+            for value in values:
+                for internal_id in self._ioc_postings.get(value, ()):
+                    matches[internal_id].add(value)
+        return matches
+
+    def match_ttps(self, techniques: Iterable[str]) -> Dict[int, Set[str]]:
+        """Threat ids using any of the techniques, with the techniques they share"""
+        matches: Dict[int, Set[str]] = defaultdict(set)
+        with self._lock:
+            for technique in techniques:
+                for internal_id in self._ttp_postings.get(technique, ()):
+                    matches[internal_id].add(technique)
+        return matches
+
+    def get(self, internal_id: int) -> Dict[str, Any]:
+        return self._threats[internal_id]
+
+    def internal_id(self, threat_id: str) -> Optional[int]:
+        return self._ids.get(threat_id)
+
+    def similar_candidates(self, signature: np.ndarray) -> Set[int]:
+        """Threat ids sharing at least one LSH band with the signature"""
+        with self._lock:
+            return self.lsh.candidates(signature)
+
+    def signatures(self, internal_ids: List[int]) -> np.ndarray:
+        return np.stack([self._signatures[i] for i in internal_ids])
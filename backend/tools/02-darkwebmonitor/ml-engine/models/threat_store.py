@@ -0,0 +1,279 @@
+"""
+DarkWebMonitor ML Engine - Threat Store
+Persistent SQLite threat store with interned IOCs and on-disk indexes
+"""
+
+import hashlib
+import logging
+import os
+import sqlite3
+from collections import defaultdict
+from threading import RLock
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+
+import numpy as np
+
+from .minhash import is_empty_signature
+from .threat_index import ioc_values, ttp_techniques
+
+logger = logging.getLogger(__name__)
+
+# SQLite limits the number of bound parameters per statement
+_CHUNK = 900
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS iocs (
+    id INTEGER PRIMARY KEY,
+    value TEXT NOT NULL UNIQUE,
+    ioc_type TEXT
+);
+CREATE TABLE IF NOT EXISTS techniques (
+    id INTEGER PRIMARY KEY,
+    value TEXT NOT NULL UNIQUE
+);
+CREATE TABLE IF NOT EXISTS threats (
+    id INTEGER PRIMARY KEY,
+    threat_id TEXT NOT NULL UNIQUE,
+    name TEXT,
+    threat_type TEXT,
+    signature BLOB
+);
+CREATE TABLE IF NOT EXISTS threat_iocs (
+    ioc INTEGER NOT NULL,
+    threat INTEGER NOT NULL,
+    PRIMARY KEY (ioc, threat)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS threat_iocs_by_threat ON threat_iocs (threat);
+CREATE TABLE IF NOT EXISTS threat_ttps (
+    technique INTEGER NOT NULL,
+    threat INTEGER NOT NULL,
+    PRIMARY KEY (technique, threat)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS threat_ttps_by_threat ON threat_ttps (threat);
+CREATE TABLE IF NOT EXISTS lsh_bands (
+    band_key INTEGER NOT NULL,
+    threat INTEGER NOT NULL,
+    PRIMARY KEY (band_key, threat)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS lsh_bands_by_threat ON lsh_bands (threat);
+"""
+
+
+def _chunks(items: List[Any]) -> Iterable[List[Any]]:
+    for i in range(0, len(items), _CHUNK):
+        yield items[i:i + _CHUNK]
+
+
+class SQLiteThreatStore:
+    """
+    Threat store persisted in a single SQLite file.
+
+    IOC values and techniques are interned into their own tables and referenced
+    by integer id. The (ioc, threat) and (technique, threat) tables are
+    clustered on the IOC/technique id, so they serve directly as the inverted
+    indexes, and LSH bands are stored the same way. Nothing is loaded into
+    Python at startup; lookups read pages through SQLite's memory map, which
+    the OS shares between worker processes opening the same file.
+    """
+
+    def __init__(self, path: str, num_perm: int = 128, bands: int = 32,
+                 read_only: bool = False, mmap_size: int = 1 << 30):
+        self.path = path
+        self.num_perm = num_perm
+        self.bands = bands
+        self.rows = num_perm // bands
+        self.read_only = read_only
+        self._lock = RLock()
+
+        if read_only:
+            self.conn = sqlite3.connect(f"file:{path}?mode=ro", uri=True, check_same_thread=False)
+        else:
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+            self.conn = sqlite3.connect(path, check_same_thread=False)
+            self.conn.execute("PRAGMA journal_mode=WAL")
+            self.conn.execute("PRAGMA synchronous=NORMAL")
+            self.conn.executescript(_SCHEMA)
+        self.conn.execute(f"PRAGMA mmap_size={int(mmap_size)}")
+        logger.info(f"Opened threat store {path} ({len(self)} threats)")
+
+    def __len__(self) -> int:
+        return self.conn.execute("SELECT COUNT(*) FROM threats").fetchone()[0]
+
+    @property
+    def ioc_count(self) -> int:
+        return self.conn.execute("SELECT COUNT(*) FROM iocs").fetchone()[0]
+
+    def band_keys(self, signature: np.ndarray) -> List[int]:
+        """Signed 64-bit keys for each LSH band of a signature"""
+        bands = signature.reshape(self.bands, self.rows)
+        return [
+            int.from_bytes(
+                hashlib.blake2b(bytes([i]) + bands[i].tobytes(), digest_size=8).digest(),
+                "little",
+                signed=True,
+            )
+            for i in range(self.bands)
+        ]
+
+    def _intern(self, table: str, values: Set[str], ioc_types: Optional[Dict[str, str]] = None
+                ) -> List[int]:
+        if not values:
+            return []
+        if ioc_types is not None:
+            self.conn.executemany(
+                f"INSERT OR IGNORE INTO {table} (value, ioc_type) VALUES (?, ?)",
+                [(v, ioc_types.get(v)) for v in values],
+            )
+        else:
+            self.conn.executemany(
+                f"INSERT OR IGNORE INTO {table} (value) VALUES (?)", [(v,) for v in values]
+            )
+        ids = []
+        for chunk in _chunks(list(values)):
+            placeholders = ",".join("?" * len(chunk))
+            ids.extend(
+                row[0]
+                for row in self.conn.execute(
+                    f"SELECT id FROM {table} WHERE value IN ({placeholders})", chunk
+                )
+            )
+        return ids
+
+    def _add(self, threat_data: Dict[str, Any], signature: Optional[np.ndarray]) -> int:
+        threat_id = threat_data["threat_id"]
+        blob = signature.astype(np.uint32).tobytes() if signature is not None else None
+        internal_id = self.conn.execute(
+            "INSERT INTO threats (threat_id, name, threat_type, signature) VALUES (?, ?, ?, ?) "
+            "ON CONFLICT (threat_id) DO UPDATE SET name = excluded.name, "
+            "threat_type = excluded.threat_type, signature = excluded.signature "
+            "RETURNING id",
+            (
+                threat_id,
+                threat_data.get("name") or "",
+                threat_data.get("threat_type") or "unknown",
+                blob,
+            ),
+        ).fetchone()[0]
+
+        # Replacing a threat drops its previous postings
+        old_iocs = [row[0] for row in self.conn.execute(
+            "SELECT ioc FROM threat_iocs WHERE threat = ?", (internal_id,))]
+        old_techniques = [row[0] for row in self.conn.execute(
+            "SELECT technique FROM threat_ttps WHERE threat = ?", (internal_id,))]
+        for table in ("threat_iocs", "threat_ttps", "lsh_bands"):
+            self.conn.execute(f"DELETE FROM {table} WHERE threat = ?", (internal_id,))
+
+        ioc_types = {
+            ioc["value"]: ioc.get("ioc_type", "unknown")
+            for ioc in threat_data.get("iocs") or []
+            if ioc.get("value")
+        }
+        self.conn.executemany(
+            "INSERT OR IGNORE INTO threat_iocs (ioc, threat) VALUES (?, ?)",
+            [(i, internal_id) for i in self._intern("iocs", ioc_values(threat_data), ioc_types)],
+        )
+        self.conn.executemany(
+            "INSERT OR IGNORE INTO threat_ttps (technique, threat) VALUES (?, ?)",
+            [(i, internal_id) for i in self._intern("techniques", ttp_techniques(threat_data))],
+        )
+        if signature is not None and not is_empty_signature(signature):
+            self.conn.executemany(
+                "INSERT OR IGNORE INTO lsh_bands (band_key, threat) VALUES (?, ?)",
+                [(key, internal_id) for key in self.band_keys(signature)],
+            )
+
+        # IOCs and techniques the previous version referenced may now be orphaned
+        self._collect("iocs", "threat_iocs", "ioc", old_iocs)
+        self._collect("techniques", "threat_ttps", "technique", old_techniques)
+        return internal_id
+
+    def _collect(self, table: str, postings: str, column: str, ids: List[int]):
+        """Delete rows of `table` among `ids` that no posting references any more"""
+        for chunk in _chunks(ids):
+            placeholders = ",".join("?" * len(chunk))
+            self.conn.execute(
+                f"DELETE FROM {table} WHERE id IN ({placeholders}) "
+                f"AND NOT EXISTS (SELECT 1 FROM {postings} WHERE {postings}.{column} = {table}.id)",
+                chunk,
+            )
+
+    def add(self, threat_data: Dict[str, Any], signature: Optional[np.ndarray] = None) -> int:
+        """Insert or replace a threat in its own transaction"""
+        with self._lock, self.conn:
+            return self._add(threat_data, signature)
+
+    def add_many(self, threats: Iterable[Tuple[Dict[str, Any], Optional[np.ndarray]]]) -> int:
+        """Bulk insert of (threat, signature) pairs in a single transaction"""
+        count = 0
+        with self._lock, self.conn:
+            for threat_data, signature in threats:
+                self._add(threat_data, signature)
+                count += 1
+        return count
+
+    def _match(self, sql: str, values: Iterable[str]) -> Dict[int, Set[str]]:
+        matches: Dict[int, Set[str]] = defaultdict(set)
+        with self._lock:
+            for chunk in _chunks(list(values)):
+                placeholders = ",".join("?" * len(chunk))
+                for threat, value in self.conn.execute(sql.format(placeholders), chunk):
+                    matches[threat].add(value)
+        return matches
+
+    def match_iocs(self, values: Iterable[str]) -> Dict[int, Set[str]]:
+        """Threat ids containing any of the values, with the values they share"""
+        return self._match(
+            "SELECT ti.threat, i.value FROM iocs i JOIN threat_iocs ti ON ti.ioc = i.id "
+            "WHERE i.value IN ({})",
+            values,
+        )
+
+    def match_ttps(self, techniques: Iterable[str]) -> Dict[int, Set[str]]:
+        """Threat ids using any of the techniques, with the techniques they share"""
+        return self._match(
+            "SELECT tt.threat, t.value FROM techniques t "
+            "JOIN threat_ttps tt ON tt.technique = t.id WHERE t.value IN ({})",
+            techniques,
+        )
+
+    def get(self, internal_id: int) -> Dict[str, Any]:
+        with self._lock:
+            row = self.conn.execute(
+                "SELECT threat_id, name, threat_type FROM threats WHERE id = ?", (internal_id,)
+            ).fetchone()
+        return {"threat_id": row[0], "name": row[1], "threat_type": row[2]}
+
+    def internal_id(self, threat_id: str) -> Optional[int]:
+        with self._lock:
+            row = self.conn.execute(
+                "SELECT id FROM threats WHERE threat_id = ?", (threat_id,)
+            ).fetchone()
+        return row[0] if row else None
+
+    def similar_candidates(self, signature: np.ndarray) -> Set[int]:
+        """Threat ids sharing at least one LSH band with the signature"""
+        keys = self.band_keys(signature)
+        placeholders = ",".join("?" * len(keys))
+        with self._lock:
+            return {
+                row[0]
+                for row in self.conn.execute(
+                    f"SELECT DISTINCT threat FROM lsh_bands WHERE band_key IN ({placeholders})",
+                    keys,
+                )
+            }
+
+    def signatures(self, internal_ids: List[int]) -> np.ndarray:
+        found: Dict[int, bytes] = {}
+        with self._lock:
+            for chunk in _chunks(internal_ids):
+                placeholders = ",".join("?" * len(chunk))
+                found.update(
+                    self.conn.execute(
+                        f"SELECT id, signature FROM threats WHERE id IN ({placeholders})", chunk
+                    )
+                )
+        return np.stack([np.frombuffer(found[i], dtype=np.uint32) for i in internal_ids])
+
+    def close(self):
+        self.conn.close()
@@ -3,14 +3,18 @@ ZeroDayDetect ML Engine - Main FastAPI Application
 Real-time Threat Detection & Behavioral Analysis
 """
 
+import asyncio
 import logging
+import os
 from datetime import datetime
 from typing import Any, Dict, List, Optional
 
 from fastapi import FastAPI, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse
 from models.anomaly_detector import AnomalyDetector
 from models.behavior_analyzer import BehaviorAnalyzer
+from models.event_batch import NetworkEventBatch
 from models.threat_detector import ThreatDetector
 from pydantic import BaseModel, Field
 
@@ -54,6 +58,7 @@ class NetworkEventInput(BaseModel):
     packet_count: int = 1
     timestamp: Optional[datetime] = None
     payload_sample: Optional[str] = None  # Base64 encoded
+    entity_id: Optional[str] = None  # Profile to attribute to; defaults to source_ip
 
 
 class EndpointEventInput(BaseModel):
@@ -76,6 +81,22 @@ class DetectionResult(BaseModel):
     confidence: float = Field(..., ge=0, le=100)
     indicators: List[str]
     recommended_action: str
+    matched_rules: List[str] = []  # Endpoint signature ids that fired
+
+
+class BatchDetectionResult(BaseModel):
+    event_id: str
+    is_threat: bool
+    threat_type: Optional[str] = None
+    severity: str
+    confidence: float
+    recommended_action: str
+    is_anomaly: bool
+    anomaly_score: float
+    anomaly_type: str
+    # Only filled in when detail is requested
+    indicators: Optional[List[str]] = None
+    baseline_comparison: Optional[Dict[str, Any]] = None
 
 
 class BehaviorResult(BaseModel):
@@ -86,6 +107,29 @@ class BehaviorResult(BaseModel):
     anomalous_behaviors: List[Dict[str, Any]]
 
 
+class IngestResult(BaseModel):
+    ingested: int
+    entities: int
+
+
+class BeaconResult(BaseModel):
+    source_ip: str
+    destination_ip: str
+    destination_port: int
+    connections: int
+    period_seconds: float
+    jitter: float
+    periodicity: float
+    size_cv: float
+    beacon_score: float
+
+
+class BeaconingReport(BaseModel):
+    last_sweep: Optional[datetime] = None
+    flows_tracked: int
+    beacons: List[BeaconResult]
+
+
 class AnomalyResult(BaseModel):
     event_id: str
     is_anomaly: bool
@@ -154,38 +198,112 @@ async def detect_endpoint_threat(event: EndpointEventInput):
             confidence=result["confidence"],
             indicators=result["indicators"],
             recommended_action=result["recommended_action"],
+            matched_rules=result["matched_rules"],
         )
     except Exception as e:
         logger.error(f"Error detecting endpoint threat: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
 
+# Maximum events accepted by /detect/batch
+MAX_BATCH_SIZE = 100000
+
+
 # Batch detection
-@app.post("/detect/batch", response_model=List[DetectionResult])
-async def batch_detect(events: List[NetworkEventInput]):
-    if len(events) > 100:
-        raise HTTPException(status_code=400, detail="Maximum 100 events per batch")
+@app.post("/detect/batch", response_model=List[BatchDetectionResult])
+async def batch_detect(events: List[NetworkEventInput], detail: bool = False):
+    """
+    Threat and anomaly detection for a batch of network events.
+    The batch is scored column-wise in one pass; indicators and baseline
+    comparisons are only included with `detail=true`.
+    """
+    if len(events) > MAX_BATCH_SIZE:
+        raise HTTPException(
+            status_code=400, detail=f"Maximum {MAX_BATCH_SIZE} events per batch"
+        )
 
-    results = []
-    for event in events:
-        try:
-            result = await detect_network_threat(event)
-            results.append(result)
-        except Exception as e:
-            logger.error(f"Error in batch detection for {event.event_id}: {e}")
+    try:
+        # Field values straight from the models; model_dump() would copy each
+        batch = NetworkEventBatch([vars(e) for e in events])
+        threats = threat_detector.detect_network_batch(batch, detail=detail)
+        anomalies = anomaly_detector.detect_batch(batch, detail=detail)
+
+        columns = {
+            "event_id": batch.event_ids,
+            "is_threat": threats["is_threat"].tolist(),
+            "threat_type": threats["threat_type"].tolist(),
+            "severity": threats["severity"].tolist(),
+            "confidence": threats["confidence"].astype(float).tolist(),
+            "recommended_action": threats["recommended_action"].tolist(),
+            "is_anomaly": anomalies["is_anomaly"].tolist(),
+            "anomaly_score": anomalies["anomaly_score"].tolist(),
+            "anomaly_type": anomalies["anomaly_type"].tolist(),
+        }
+        if detail:
+            columns["indicators"] = threats["indicators"]
+            columns["baseline_comparison"] = anomalies["baseline_comparison"]
+
+        # Rows are built from validated columns, so skip response validation
+        return JSONResponse([dict(zip(columns, row)) for row in zip(*columns.values())])
+    except Exception as e:
+        logger.error(f"Error in batch detection: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
 
-    return results
+
+# Ingest events into behavior profiles
+@app.post("/ingest/events", response_model=IngestResult)
+async def ingest_events(events: List[NetworkEventInput]):
+    if len(events) > 100000:
+        raise HTTPException(status_code=400, detail="Maximum 100000 events per batch")
+
+    try:
+        event_data = [e.model_dump() for e in events]
+        result = behavior_analyzer.ingest(event_data)
+        threat_detector.beacon_detector.ingest(event_data)
+        return IngestResult(**result)
+    except Exception as e:
+        logger.error(f"Error ingesting events: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+# Beaconing flows found by the periodic sweep
+@app.get("/detect/beaconing", response_model=BeaconingReport)
+async def detect_beaconing(refresh: bool = False, limit: int = 100):
+    try:
+        detector = threat_detector.beacon_detector
+        if refresh or detector.last_sweep is None:
+            await asyncio.to_thread(detector.sweep)
+        beacons = sorted(
+            detector.beacons.values(), key=lambda b: b["beacon_score"], reverse=True
+        )
+        return BeaconingReport(
+            last_sweep=datetime.fromtimestamp(detector.last_sweep),
+            flows_tracked=len(detector),
+            beacons=beacons[:limit],
+        )
+    except Exception as e:
+        logger.error(f"Error detecting beaconing: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+# Get an entity's behavior profile
+@app.get("/profiles/{entity_id}")
+async def get_profile(entity_id: str):
+    profile = behavior_analyzer.get_profile(entity_id)
+    if profile is None:
+        raise HTTPException(status_code=404, detail="No profile for entity")
+    return profile
 
 
 # Analyze behavior
 @app.post("/analyze/behavior", response_model=BehaviorResult)
 async def analyze_behavior(
-    entity_id: str, entity_type: str, events: List[NetworkEventInput]
+    entity_id: str, entity_type: str, events: Optional[List[NetworkEventInput]] = None
 ):
     try:
         logger.info(f"Analyzing behavior for {entity_type}:{entity_id}")
 
-        event_data = [e.model_dump() for e in events]
+        event_data = [e.model_dump() for e in events or []]
         result = behavior_analyzer.analyze(entity_id, entity_type, event_data)
 
         return BehaviorResult(
@@ -220,6 +338,24 @@ async def detect_anomaly(event: NetworkEventInput):
         raise HTTPException(status_code=500, detail=str(e))
 
 
+# Endpoint signature statistics
+@app.get("/rules/stats")
+async def get_rule_stats():
+    return threat_detector.signature_engine.stats()
+
+
+# Reload endpoint signatures from the rule files
+@app.post("/rules/reload")
+async def reload_rules():
+    engine = threat_detector.signature_engine
+    if not engine.reload():
+        raise HTTPException(
+            status_code=422, detail="Rule files failed to compile; previous rules kept"
+        )
+    stats = engine.stats()
+    return {"status": "reloaded", "version": stats["version"], "rules": stats["rules"]}
+
+
 # Get model info
 @app.get("/model-info", response_model=ModelInfo)
 async def get_model_info():
@@ -231,6 +367,27 @@ async def get_model_info():
     )
 
 
+async def beacon_sweep_loop():
+    interval = float(os.getenv("BEACON_SWEEP_INTERVAL", "300"))
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            await asyncio.to_thread(threat_detector.beacon_detector.sweep)
+        except Exception as e:
+            logger.error(f"Error in beacon sweep: {e}")
+
+
+@app.on_event("startup")
+async def start_beacon_sweep():
+    app.state.beacon_sweep = asyncio.create_task(beacon_sweep_loop())
+
+
+@app.on_event("shutdown")
+async def save_profiles():
+    app.state.beacon_sweep.cancel()
+    behavior_analyzer.save()
+
+
 if __name__ == "__main__":
     import uvicorn
 
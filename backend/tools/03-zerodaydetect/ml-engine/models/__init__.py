@@ -3,7 +3,15 @@ ZeroDayDetect ML Models Package
 """
 
 from .anomaly_detector import AnomalyDetector
+from .beacon_detector import BeaconDetector
 from .behavior_analyzer import BehaviorAnalyzer
+from .entity_profiles import EntityProfileStore
 from .threat_detector import ThreatDetector
 
-__all__ = ["ThreatDetector", "BehaviorAnalyzer", "AnomalyDetector"]
+__all__ = [
+    "ThreatDetector",
+    "BehaviorAnalyzer",
+    "AnomalyDetector",
+    "EntityProfileStore",
+    "BeaconDetector",
+]
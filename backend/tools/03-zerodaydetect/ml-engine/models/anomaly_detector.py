@@ -9,6 +9,8 @@ from typing import Any, Dict
 
 import numpy as np
 
+from .event_batch import NetworkEventBatch
+
 logger = logging.getLogger(__name__)
 
 
@@ -35,82 +37,117 @@ class AnomalyDetector:
     def detect(self, event: Dict[str, Any]) -> Dict[str, Any]:
         """Detect anomalies in network event"""
 
-        bytes_sent = event.get("bytes_sent", 0)
-        bytes_received = event.get("bytes_received", 0)
-        total_bytes = bytes_sent + bytes_received
-        packet_count = event.get("packet_count", 1)
-        dest_port = event.get("destination_port", 0)
+        result = self.detect_batch(NetworkEventBatch([event]), detail=True)
+        return {
+            "is_anomaly": bool(result["is_anomaly"][0]),
+            "anomaly_score": float(result["anomaly_score"][0]),
+            "anomaly_type": str(result["anomaly_type"][0]),
+            "baseline_comparison": result["baseline_comparison"][0],
+        }
 
-        anomaly_scores = []
-        baseline_comparison = {}
-        anomaly_type = "none"
+    def detect_batch(
+        self, batch: NetworkEventBatch, detail: bool = False
+    ) -> Dict[str, Any]:
+        """
+        Detect anomalies in a batch of network events.
+        Z-scores, port rarity and packet sizes are computed for the whole
+        batch at once; baseline comparisons are only built when `detail`
+        is set.
+        """
+
+        total_bytes = batch.total_bytes
+        packet_count = batch.packet_count
+        dest_port = batch.destination_port
 
         # Bytes anomaly score (z-score based)
-        if total_bytes > 0:
-            bytes_zscore = (total_bytes - self.stats["bytes_mean"]) / max(
-                self.stats["bytes_std"], 1
-            )
-            anomaly_scores.append(min(abs(bytes_zscore) / 3, 1))
-            baseline_comparison["bytes"] = {
-                "value": total_bytes,
-                "baseline_mean": self.stats["bytes_mean"],
-                "z_score": round(bytes_zscore, 2),
-            }
-            if bytes_zscore > 3:
-                anomaly_type = "high_volume"
+        has_bytes = total_bytes > 0
+        bytes_zscore = (total_bytes - self.stats["bytes_mean"]) / max(
+            self.stats["bytes_std"], 1
+        )
+        bytes_score = np.minimum(np.abs(bytes_zscore) / 3, 1)
 
         # Packet count anomaly
-        if packet_count > 0:
-            packet_zscore = (packet_count - self.stats["packet_mean"]) / max(
-                self.stats["packet_std"], 1
-            )
-            anomaly_scores.append(min(abs(packet_zscore) / 3, 1))
-            baseline_comparison["packets"] = {
-                "value": packet_count,
-                "baseline_mean": self.stats["packet_mean"],
-                "z_score": round(packet_zscore, 2),
-            }
-            if packet_zscore > 3:
-                anomaly_type = "high_packet_count"
+        has_packets = packet_count > 0
+        packet_zscore = (packet_count - self.stats["packet_mean"]) / max(
+            self.stats["packet_std"], 1
+        )
+        packet_score = np.minimum(np.abs(packet_zscore) / 3, 1)
 
         # Port rarity
         port_dist = self.stats["port_distribution"]
-        port_probability = port_dist.get(dest_port, port_dist["other"])
-        if port_probability < 0.1:
-            anomaly_scores.append(0.5)
-            baseline_comparison["port"] = {
-                "value": dest_port,
-                "probability": port_probability,
-                "is_common": False,
-            }
-            if anomaly_type == "none":
-                anomaly_type = "rare_port"
-        else:
-            baseline_comparison["port"] = {
-                "value": dest_port,
-                "probability": port_probability,
-                "is_common": True,
-            }
+        port_probability = np.full(len(batch), port_dist["other"], dtype=np.float64)
+        for port, probability in port_dist.items():
+            if port != "other":
+                port_probability[dest_port == port] = probability
+        rare_port = port_probability < 0.1
 
         # Bytes per packet ratio anomaly
-        if packet_count > 0:
-            bytes_per_packet = total_bytes / packet_count
-            if bytes_per_packet > 1500:  # Jumbo frames or fragmentation
-                anomaly_scores.append(0.4)
-                baseline_comparison["bytes_per_packet"] = {
-                    "value": bytes_per_packet,
-                    "normal_range": "60-1500",
-                }
-                if anomaly_type == "none":
-                    anomaly_type = "unusual_packet_size"
-
-        # Calculate overall anomaly score
-        overall_score = np.mean(anomaly_scores) * 100 if anomaly_scores else 0
+        bytes_per_packet = np.divide(
+            total_bytes,
+            packet_count,
+            out=np.zeros_like(total_bytes),
+            where=has_packets,
+        )
+        large_packets = has_packets & (bytes_per_packet > 1500)  # Jumbo frames or fragmentation
+
+        # Calculate overall anomaly score as the mean of the applicable scores
+        score_sum = (
+            np.where(has_bytes, bytes_score, 0)
+            + np.where(has_packets, packet_score, 0)
+            + 0.5 * rare_port
+            + 0.4 * large_packets
+        )
+        score_count = has_bytes.astype(int) + has_packets + rare_port + large_packets
+        overall_score = np.divide(
+            score_sum * 100,
+            score_count,
+            out=np.zeros_like(score_sum),
+            where=score_count > 0,
+        )
         is_anomaly = overall_score > 40
 
-        return {
+        # Packet count outranks volume; the others only fill in
+        anomaly_type = np.full(len(batch), "none", dtype=object)
+        anomaly_type[large_packets] = "unusual_packet_size"
+        anomaly_type[rare_port] = "rare_port"
+        anomaly_type[has_bytes & (bytes_zscore > 3)] = "high_volume"
+        anomaly_type[has_packets & (packet_zscore > 3)] = "high_packet_count"
+        anomaly_type[~is_anomaly] = "none"
+
+        result = {
             "is_anomaly": is_anomaly,
-            "anomaly_score": round(overall_score, 2),
-            "anomaly_type": anomaly_type if is_anomaly else "none",
-            "baseline_comparison": baseline_comparison,
+            "anomaly_score": np.round(overall_score, 2),
+            "anomaly_type": anomaly_type,
+            "baseline_comparison": None,
         }
+
+        if detail:
+            comparisons = []
+            for i in range(len(batch)):
+                baseline_comparison = {}
+                if has_bytes[i]:
+                    baseline_comparison["bytes"] = {
+                        "value": int(total_bytes[i]),
+                        "baseline_mean": self.stats["bytes_mean"],
+                        "z_score": round(bytes_zscore[i].item(), 2),
+                    }
+                if has_packets[i]:
+                    baseline_comparison["packets"] = {
+                        "value": int(packet_count[i]),
+                        "baseline_mean": self.stats["packet_mean"],
+                        "z_score": round(packet_zscore[i].item(), 2),
+                    }
+                baseline_comparison["port"] = {
+                    "value": int(dest_port[i]),
+                    "probability": port_probability[i].item(),
+                    "is_common": not bool(rare_port[i]),
+                }
+                if large_packets[i]:
+                    baseline_comparison["bytes_per_packet"] = {
+                        "value": bytes_per_packet[i].item(),
+                        "normal_range": "60-1500",
+                    }
+                comparisons.append(baseline_comparison)
+            result["baseline_comparison"] = comparisons
+
+        return result
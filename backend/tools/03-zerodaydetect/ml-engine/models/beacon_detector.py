@@ -0,0 +1,263 @@
+"""
+ZeroDayDetect ML Engine - Beacon Detector
+Periodic sweep for C2 beaconing over per-flow timestamp ring buffers
+"""
+
+import logging
+import time
+from threading import RLock
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from .entity_profiles import epoch_seconds
+
+logger = logging.getLogger(__name__)
+
+FlowKey = Tuple[str, str, int]
+
+
+class BeaconDetector:
+    """
+    Beaconing detection keyed by (source, destination, port).
+
+    Each flow keeps the timestamps and payload sizes of its last
+    `ring_size` connections in a row of preallocated ring buffers. A sweep
+    scores every active flow at once:
+
+    - interval jitter: median absolute deviation of inter-arrival times
+      relative to their median, discounted when the median interval does
+      not account for the flow's whole time span
+    - periodicity: autocorrelation (via FFT) of connection counts binned at
+      a quarter of the median interval, read at a lag of one interval
+    - size regularity: coefficient of variation of bytes per connection
+
+    Results of the last sweep are kept so per-event detection can look a
+    flow's verdict up without rescoring it.
+    """
+
+    def __init__(
+        self,
+        capacity: int = 100000,
+        ring_size: int = 32,
+        min_events: int = 8,
+        active_window: float = 86400.0,
+        threshold: float = 60.0,
+    ):
+        self.capacity = capacity
+        self.ring_size = ring_size
+        self.min_events = min_events
+        self.active_window = active_window
+        self.threshold = threshold
+        self.chunk_size = 20000
+
+        self._lock = RLock()
+        self._slots: Dict[FlowKey, int] = {}
+        self._keys: List[Optional[FlowKey]] = [None] * capacity
+        self._free = list(range(capacity - 1, -1, -1))
+
+        self.timestamps = np.zeros((capacity, ring_size), dtype=np.float64)
+        self.sizes = np.zeros((capacity, ring_size), dtype=np.float32)
+        self.counts = np.zeros(capacity, dtype=np.int64)
+        self.last_seen = np.zeros(capacity, dtype=np.float64)
+
+        self.last_sweep: Optional[float] = None
+        self.beacons: Dict[FlowKey, Dict[str, Any]] = {}
+
+    def __len__(self) -> int:
+        return len(self._slots)
+
+    def _evict(self, count: int, pinned: set):
+        occupied = np.array(
+            [slot for slot in self._slots.values() if slot not in pinned], dtype=np.int64
+        )
+        if not len(occupied):
+            raise ValueError(f"More than {self.capacity} flows in one batch")
+        oldest = occupied[np.argsort(self.last_seen[occupied], kind="stable")[:count]]
+        for slot in oldest.tolist():
+            del self._slots[self._keys[slot]]
+            self._keys[slot] = None
+            self._free.append(slot)
+        self.counts[oldest] = 0
+        self.last_seen[oldest] = 0
+
+    def _slot(self, key: FlowKey, pinned: set) -> int:
+        slot = self._slots.get(key)
+        if slot is None:
+            if not self._free:
+                self._evict(max(1, self.capacity // 100), pinned)
+            slot = self._free.pop()
+            self._slots[key] = slot
+            self._keys[slot] = key
+        pinned.add(slot)
+        return slot
+
+    def ingest(self, events: List[Dict[str, Any]], now: Optional[float] = None) -> int:
+        """Append connection records to their flows' ring buffers"""
+        if not events:
+            return 0
+        now = time.time() if now is None else now
+
+        with self._lock:
+            pinned = set()
+            slots = np.array(
+                [
+                    self._slot(
+                        (
+                            e.get("source_ip") or "",
+                            e.get("destination_ip") or "",
+                            int(e.get("destination_port") or 0),
+                        ),
+                        pinned,
+                    )
+                    for e in events
+                ],
+                dtype=np.int64,
+            )
+            seconds = np.array(
+                [epoch_seconds(e.get("timestamp"), now) for e in events], dtype=np.float64
+            )
+            sizes = np.array(
+                [(e.get("bytes_sent") or 0) + (e.get("bytes_received") or 0) for e in events],
+                dtype=np.float32,
+            )
+
+            # Position of each record within its flow's run in this batch;
+            # only the latest `ring_size` records of a run survive
+            order = np.lexsort((seconds, slots))
+            slots, seconds, sizes = slots[order], seconds[order], sizes[order]
+            starts = np.flatnonzero(np.r_[True, slots[1:] != slots[:-1]])
+            run_lengths = np.diff(np.r_[starts, len(slots)])
+            rank = np.arange(len(slots)) - np.repeat(starts, run_lengths)
+            keep = rank >= np.repeat(run_lengths, run_lengths) - self.ring_size
+
+            positions = (self.counts[slots] + rank) % self.ring_size
+            self.timestamps[slots[keep], positions[keep]] = seconds[keep]
+            self.sizes[slots[keep], positions[keep]] = sizes[keep]
+            np.add.at(self.counts, slots, 1)
+            np.maximum.at(self.last_seen, slots, seconds)
+
+        return len(events)
+
+    def _score(self, timestamps: np.ndarray, sizes: np.ndarray, filled: np.ndarray
+               ) -> Dict[str, np.ndarray]:
+        """Beaconing features for rows of (unordered) ring buffers"""
+        rows, ring = timestamps.shape
+        valid = np.arange(ring)[None, :] < filled[:, None]
+
+        # Sort each row by time, pushing unused slots to the end
+        order = np.argsort(np.where(valid, timestamps, np.inf), axis=1)
+        timestamps = np.take_along_axis(timestamps, order, axis=1)
+        sizes = np.take_along_axis(sizes.astype(np.float64), order, axis=1)
+
+        intervals = np.where(valid[:, 1:], np.diff(timestamps, axis=1), np.nan)
+        median = np.nanmedian(intervals, axis=1)
+        mad = np.nanmedian(np.abs(intervals - median[:, None]), axis=1)
+        jitter = mad / np.maximum(median, 1e-3)
+
+        sizes = np.where(valid, sizes, np.nan)
+        size_cv = np.nanstd(sizes, axis=1) / np.maximum(np.nanmean(sizes, axis=1), 1.0)
+
+        # Connection counts in bins of a quarter interval; a beacon shows up
+        # as an autocorrelation peak at a lag of four bins
+        n_bins = 4 * ring
+        width = np.maximum(median / 4, 1e-3)
+        bins = np.floor((timestamps - timestamps[:, :1]) / width[:, None] + 0.5)
+        in_range = valid & (bins < n_bins)
+        counts = np.zeros((rows, n_bins))
+        row_index = np.broadcast_to(np.arange(rows)[:, None], bins.shape)
+        np.add.at(counts, (row_index[in_range], bins[in_range].astype(np.int64)), 1)
+        used = np.minimum(np.nanmax(np.where(in_range, bins, np.nan), axis=1) + 1, n_bins)
+        used = np.nan_to_num(used, nan=1).astype(np.int64)
+        inside = np.arange(n_bins)[None, :] < used[:, None]
+        centered = np.where(
+            inside, counts - counts.sum(axis=1, keepdims=True) / used[:, None], 0
+        )
+        spectrum = np.fft.rfft(centered, n=2 * n_bins, axis=1)
+        acf = np.fft.irfft(spectrum * np.conj(spectrum), n=2 * n_bins, axis=1)[:, :n_bins]
+        # Unbiased estimate: each lag has fewer overlapping bins
+        overlap = np.maximum(used[:, None] - np.arange(n_bins)[None, :], 1)
+        acf = acf / overlap
+        periodicity = np.clip(acf[:, 3:6].max(axis=1) / np.maximum(acf[:, 0], 1e-9), 0, 1)
+        periodicity *= in_range.sum(axis=1) / np.maximum(filled, 1)
+
+        # Bursts separated by long silences have a small, steady median
+        # interval too; a beacon's median interval spans the whole window
+        span = timestamps.max(axis=1, where=valid, initial=-np.inf) - timestamps[:, 0]
+        coverage = np.clip(median * (filled - 1) / np.maximum(span, 1e-3), 0, 1)
+        interval_regularity = np.clip(1 - jitter / 0.5, 0, 1) * coverage
+        size_regularity = np.clip(1 - size_cv, 0, 1)
+        score = 100 * (
+            0.45 * interval_regularity + 0.35 * periodicity + 0.2 * size_regularity
+        )
+
+        return {
+            "period": median,
+            "jitter": jitter,
+            "periodicity": periodicity,
+            "size_cv": size_cv,
+            "score": score,
+        }
+
+    def sweep(self, now: Optional[float] = None) -> List[Dict[str, Any]]:
+        """Score every active flow and remember the beacons found"""
+        now = time.time() if now is None else now
+        started = time.time()
+
+        with self._lock:
+            active = np.flatnonzero(
+                (self.counts >= self.min_events)
+                & (self.last_seen >= now - self.active_window)
+            )
+            timestamps = self.timestamps[active]
+            sizes = self.sizes[active]
+            filled = np.minimum(self.counts[active], self.ring_size)
+            keys = [self._keys[slot] for slot in active.tolist()]
+            totals = self.counts[active]
+
+        beacons = []
+        for lo in range(0, len(active), self.chunk_size):
+            hi = lo + self.chunk_size
+            features = self._score(timestamps[lo:hi], sizes[lo:hi], filled[lo:hi])
+            for i in np.flatnonzero(features["score"] >= self.threshold).tolist():
+                source_ip, destination_ip, port = keys[lo + i]
+                beacons.append(
+                    {
+                        "source_ip": source_ip,
+                        "destination_ip": destination_ip,
+                        "destination_port": port,
+                        "connections": int(totals[lo + i]),
+                        "period_seconds": round(float(features["period"][i]), 3),
+                        "jitter": round(float(features["jitter"][i]), 4),
+                        "periodicity": round(float(features["periodicity"][i]), 4),
+                        "size_cv": round(float(features["size_cv"][i]), 4),
+                        "beacon_score": round(float(features["score"][i]), 2),
+                    }
+                )
+        beacons.sort(key=lambda b: b["beacon_score"], reverse=True)
+
+        with self._lock:
+            self.beacons = {
+                (b["source_ip"], b["destination_ip"], b["destination_port"]): b
+                for b in beacons
+            }
+            self.last_sweep = now
+
+        logger.info(
+            f"Beacon sweep scored {len(active)} flows in {time.time() - started:.2f}s, "
+            f"{len(beacons)} beaconing"
+        )
+        return beacons
+
+    def verdict(self, source_ip: str, destination_ip: str, port: int
+                ) -> Optional[Dict[str, Any]]:
+        """The flow's beacon result from the last sweep, if it was flagged"""
+        return self.beacons.get((source_ip, destination_ip, port))
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "flows": len(self),
+            "capacity": self.capacity,
+            "beacons": len(self.beacons),
+            "last_sweep": self.last_sweep,
+        }
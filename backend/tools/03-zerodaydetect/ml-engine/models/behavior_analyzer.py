@@ -4,25 +4,29 @@ Behavioral analysis for detecting anomalous patterns
 """
 
 import logging
-from collections import defaultdict
+import os
 from datetime import datetime
-from typing import Any, Dict, List
+from typing import Any, Dict, List, Optional
 
 import numpy as np
 
+from .entity_profiles import HOURS_PER_WEEK, EntityProfileStore
+
 logger = logging.getLogger(__name__)
 
+DAY_NAMES = ["Monday", "Tuesday", "Wednesday", "Thursday", "Friday", "Saturday", "Sunday"]
+
 
 class BehaviorAnalyzer:
     """
     Behavioral analysis model for detecting deviations from baseline.
     """
 
-    def __init__(self):
+    def __init__(self, profile_store_path: Optional[str] = None):
         self.version = "1.0.0"
         self.is_loaded = True
 
-        # Simulated baselines (in production, would be learned from data)
+        # Static baselines used until an entity's profile has enough history
         self.baselines = {
             "avg_bytes_per_hour": 50000,
             "avg_connections_per_hour": 100,
@@ -31,29 +35,82 @@ class BehaviorAnalyzer:
             "work_hours": (9, 18),  # 9 AM to 6 PM
         }
 
+        # Streaming per-entity profiles learned from ingested events
+        self.profiles = EntityProfileStore.load(
+            profile_store_path
+            or os.getenv("ENTITY_PROFILE_PATH", "data/entity_profiles.npz"),
+            capacity=int(os.getenv("ENTITY_PROFILE_CAPACITY", "100000")),
+        )
+        self.min_hour_observations = 3
+        self.min_port_history = 100
+        self.rare_port_share = 0.01
+        self.z_threshold = 3.0
+        self.min_log_std = 0.25
+
         logger.info(f"Behavior Analyzer v{self.version} loaded")
 
+    def ingest(self, events: List[Dict[str, Any]]) -> Dict[str, int]:
+        """Fold a batch of network events into the per-entity profiles"""
+        return self.profiles.ingest(events)
+
+    def get_profile(self, entity_id: str) -> Optional[Dict[str, Any]]:
+        return self.profiles.profile(entity_id)
+
+    def save(self):
+        self.profiles.save()
+
+    def _exceeds(self, current: float, baseline: float, log_std: float) -> bool:
+        """Whether `current` is `z_threshold` deviations above a learned baseline"""
+        z = (np.log1p(current) - np.log1p(baseline)) / max(log_std, self.min_log_std)
+        return z > self.z_threshold
+
     def analyze(
         self, entity_id: str, entity_type: str, events: List[Dict[str, Any]]
     ) -> Dict[str, Any]:
-        """Analyze behavior patterns for an entity"""
-
-        if not events:
+        """
+        Analyze behavior patterns for an entity.
+        Events passed in are recorded against the entity's profile first; with
+        no events, the entity's current hour is scored against its profile.
+        Static baselines apply until the profile has enough history.
+        """
+
+        # Port rarity is judged against history, before these events count
+        unique_ports = sorted({e.get("destination_port", 0) for e in events or []})
+        history = self.profiles.profile(entity_id)
+        if history and history["total_events"] >= self.min_port_history:
+            frequency = self.profiles.port_frequency(entity_id, unique_ports)
+            unusual_ports = [
+                port
+                for port, share in zip(unique_ports, frequency)
+                if share < self.rare_port_share
+            ]
+        else:
+            unusual_ports = [p for p in unique_ports if p not in self.baselines["typical_ports"]]
+
+        if events:
+            self.profiles.ingest([{**e, "entity_id": entity_id} for e in events])
+
+        profile = self.profiles.profile(entity_id)
+        if profile is None:
             return {"baseline_deviation": 0, "risk_score": 0, "anomalous_behaviors": []}
 
         anomalies = []
         deviation_scores = []
 
-        # Calculate metrics from events
-        total_bytes = sum(
-            e.get("bytes_sent", 0) + e.get("bytes_received", 0) for e in events
-        )
-        unique_destinations = len(set(e.get("destination_ip", "") for e in events))
-        unique_ports = set(e.get("destination_port", 0) for e in events)
+        current, baseline = profile["current"], profile["baseline"]
+        hour_warm = profile["hour_of_week_observations"] >= self.min_hour_observations
+        profile_warm = profile["hours_observed"] >= self.min_hour_observations
 
         # Check bytes deviation
-        bytes_deviation = total_bytes / max(self.baselines["avg_bytes_per_hour"], 1)
-        if bytes_deviation > 3:
+        total_bytes = current["bytes"]
+        if hour_warm:
+            expected_bytes = max(baseline["bytes"], 1)
+            bytes_high = self._exceeds(total_bytes, expected_bytes, baseline["bytes_log_std"])
+        else:
+            expected_bytes = max(self.baselines["avg_bytes_per_hour"], 1)
+            bytes_high = total_bytes / expected_bytes > 3
+        bytes_deviation = total_bytes / expected_bytes
+        if bytes_high:
             deviation_scores.append(bytes_deviation)
             anomalies.append(
                 {
@@ -65,23 +122,39 @@ class BehaviorAnalyzer:
             )
 
         # Check connection count
-        if len(events) > self.baselines["avg_connections_per_hour"] * 2:
-            conn_deviation = len(events) / self.baselines["avg_connections_per_hour"]
+        connections = current["connections"]
+        if hour_warm:
+            expected_connections = max(baseline["connections"], 1)
+            connections_high = self._exceeds(
+                connections, expected_connections, baseline["connections_log_std"]
+            )
+        else:
+            expected_connections = self.baselines["avg_connections_per_hour"]
+            connections_high = connections > expected_connections * 2
+        if connections_high:
+            conn_deviation = connections / expected_connections
             deviation_scores.append(conn_deviation)
             anomalies.append(
                 {
                     "type": "high_connection_count",
                     "description": f"Connection count {conn_deviation:.1f}x above baseline",
                     "severity": "MEDIUM",
-                    "value": len(events),
+                    "value": int(connections),
                 }
             )
 
         # Check unique destinations
-        if unique_destinations > self.baselines["avg_unique_destinations"] * 2:
-            dest_deviation = (
-                unique_destinations / self.baselines["avg_unique_destinations"]
+        unique_destinations = round(current["unique_destinations"])
+        if profile_warm:
+            expected_destinations = max(baseline["unique_destinations"], 1)
+            destinations_high = self._exceeds(
+                unique_destinations, expected_destinations, baseline["destinations_log_std"]
             )
+        else:
+            expected_destinations = self.baselines["avg_unique_destinations"]
+            destinations_high = unique_destinations > expected_destinations * 2
+        if destinations_high:
+            dest_deviation = unique_destinations / expected_destinations
             deviation_scores.append(dest_deviation)
             anomalies.append(
                 {
@@ -93,42 +166,57 @@ class BehaviorAnalyzer:
             )
 
         # Check for unusual ports
-        unusual_ports = unique_ports - set(self.baselines["typical_ports"])
         if unusual_ports:
             deviation_scores.append(len(unusual_ports) / 5)
             anomalies.append(
                 {
                     "type": "unusual_ports",
-                    "description": f"Using non-standard ports: {list(unusual_ports)[:5]}",
+                    "description": f"Using non-standard ports: {unusual_ports[:5]}",
                     "severity": "LOW",
-                    "value": list(unusual_ports),
+                    "value": unusual_ports,
                 }
             )
 
-        # Check for off-hours activity
-        for event in events:
-            timestamp = event.get("timestamp")
-            if timestamp:
-                if isinstance(timestamp, str):
-                    dt = datetime.fromisoformat(timestamp.replace("Z", "+00:00"))
-                else:
-                    dt = timestamp
-                hour = dt.hour
-                work_start, work_end = self.baselines["work_hours"]
-                if hour < work_start or hour > work_end:
-                    anomalies.append(
-                        {
-                            "type": "off_hours_activity",
-                            "description": f"Activity detected outside work hours ({hour}:00)",
-                            "severity": "LOW",
-                            "value": hour,
-                        }
-                    )
-                    deviation_scores.append(1.5)
-                    break  # Only report once
+        # Check for off-hours activity: an hour of the week this entity has
+        # never been active in, or outside work hours until it has a week
+        # of history
+        if profile["hours_observed"] >= HOURS_PER_WEEK:
+            how = profile["hour_of_week"]
+            if profile["hour_of_week_observations"] == 0:
+                day, hour = divmod(how, 24)
+                anomalies.append(
+                    {
+                        "type": "off_hours_activity",
+                        "description": f"First activity on {DAY_NAMES[day]} at {hour}:00",
+                        "severity": "LOW",
+                        "value": hour,
+                    }
+                )
+                deviation_scores.append(1.5)
+        else:
+            for event in events or []:
+                timestamp = event.get("timestamp")
+                if timestamp:
+                    if isinstance(timestamp, str):
+                        dt = datetime.fromisoformat(timestamp.replace("Z", "+00:00"))
+                    else:
+                        dt = timestamp
+                    hour = dt.hour
+                    work_start, work_end = self.baselines["work_hours"]
+                    if hour < work_start or hour > work_end:
+                        anomalies.append(
+                            {
+                                "type": "off_hours_activity",
+                                "description": f"Activity detected outside work hours ({hour}:00)",
+                                "severity": "LOW",
+                                "value": hour,
+                            }
+                        )
+                        deviation_scores.append(1.5)
+                        break  # Only report once
 
         # Calculate overall deviation and risk
-        baseline_deviation = np.mean(deviation_scores) if deviation_scores else 0
+        baseline_deviation = float(np.mean(deviation_scores)) if deviation_scores else 0
         risk_score = min(baseline_deviation * 20, 100)
 
         return {
@@ -0,0 +1,379 @@
+"""
+ZeroDayDetect ML Engine - Entity Profiles
+Streaming per-entity behavior baselines built from sketches
+"""
+
+import logging
+import os
+import time
+import zlib
+from datetime import datetime, timezone
+from threading import RLock
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+HOURS_PER_WEEK = 168
+
+# HyperLogLog precisions: 256 registers (~6.5% error) for destinations and
+# 64 registers (~13%) for ports, which top out at 65536 anyway
+DST_PRECISION = 8
+PORT_PRECISION = 6
+
+# Count-min sketch of destination ports
+CMS_DEPTH = 2
+CMS_WIDTH = 128
+_CMS_SEEDS = np.array([0x9E3779B97F4A7C15, 0xC2B2AE3D27D4EB4F], dtype=np.uint64)
+
+_MASK64 = np.uint64(0xFFFFFFFFFFFFFFFF)
+
+
+def splitmix64(x: np.ndarray) -> np.ndarray:
+    """Vectorized 64-bit finalizer used to spread hashes over all bits"""
+    with np.errstate(over="ignore"):
+        z = (x.astype(np.uint64) + np.uint64(0x9E3779B97F4A7C15)) & _MASK64
+        z = ((z ^ (z >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)) & _MASK64
+        z = ((z ^ (z >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)) & _MASK64
+        return z ^ (z >> np.uint64(31))
+
+
+def hash_strings(values: List[str]) -> np.ndarray:
+    """Stable 64-bit hashes of strings (stable across processes, unlike hash())"""
+    crc = np.fromiter(
+        (zlib.crc32(v.encode()) for v in values), dtype=np.uint64, count=len(values)
+    )
+    return splitmix64(crc)
+
+
+def hll_positions(hashes: np.ndarray, precision: int):
+    """Register index and rank (position of the first 1-bit) of each hash"""
+    index = (hashes >> np.uint64(64 - precision)).astype(np.int64)
+    rest = ((hashes << np.uint64(precision)) & _MASK64) >> np.uint64(32)
+    with np.errstate(divide="ignore"):
+        rank = np.where(rest == 0, 33, 32 - np.floor(np.log2(rest.astype(np.float64))))
+    return index, rank.astype(np.uint8)
+
+
+def hll_estimate(registers: np.ndarray) -> np.ndarray:
+    """Cardinality estimates for rows of HyperLogLog registers"""
+    m = registers.shape[-1]
+    alpha = {16: 0.673, 32: 0.697, 64: 0.709}.get(m, 0.7213 / (1 + 1.079 / m))
+    raw = alpha * m * m / np.power(2.0, -registers.astype(np.float64)).sum(axis=-1)
+    zeros = (registers == 0).sum(axis=-1)
+    with np.errstate(divide="ignore"):
+        linear = m * np.log(m / np.maximum(zeros, 1))
+    return np.where((raw <= 2.5 * m) & (zeros > 0), linear, raw)
+
+
+def hour_of_week(hours: np.ndarray) -> np.ndarray:
+    """Monday-based hour of week for absolute hours since the epoch (a Thursday)"""
+    return ((hours // 24 + 3) % 7) * 24 + hours % 24
+
+
+def epoch_seconds(timestamp: Any, default: float) -> float:
+    if timestamp is None:
+        return default
+    if isinstance(timestamp, str):
+        timestamp = datetime.fromisoformat(timestamp.replace("Z", "+00:00"))
+    if isinstance(timestamp, datetime):
+        if timestamp.tzinfo is None:
+            timestamp = timestamp.replace(tzinfo=timezone.utc)
+        return timestamp.timestamp()
+    return float(timestamp)
+
+
+class EntityProfileStore:
+    """
+    Bounded-memory behavior profiles for up to `capacity` entities.
+
+    Every profile lives in a row of preallocated arrays:
+
+    - HyperLogLog registers for distinct destinations and ports in the
+      current hour
+    - a count-min sketch of destination port frequencies
+    - byte and connection totals for the current hour
+    - EWMAs of hourly bytes and connections for each of the 168 hours of
+      the week, plus an EWMA of the hourly distinct destination count
+    - EWMA variances of the log-ratio between observed and expected values,
+      which turn deviations into z-scores
+
+    Events fold into the current hour; when an entity's hour rolls over, the
+    finished hour updates the EWMAs. Hours without events are not folded,
+    so baselines describe active hours. Ingest is vectorized per batch,
+    and reading a profile touches only its own row. When the store is full,
+    the least recently seen entities are evicted.
+    """
+
+    def __init__(self, capacity: int = 100000, alpha: float = 0.1,
+                 path: Optional[str] = None):
+        self.capacity = capacity
+        self.alpha = alpha
+        self.path = path
+        self._lock = RLock()
+        self._slots: Dict[str, int] = {}
+        self._entities: List[Optional[str]] = [None] * capacity
+        self._free = list(range(capacity - 1, -1, -1))
+
+        self.hll_dst = np.zeros((capacity, 1 << DST_PRECISION), dtype=np.uint8)
+        self.hll_port = np.zeros((capacity, 1 << PORT_PRECISION), dtype=np.uint8)
+        self.cms_port = np.zeros((capacity, CMS_DEPTH, CMS_WIDTH), dtype=np.uint32)
+        self.current_hour = np.full(capacity, -1, dtype=np.int64)
+        self.current_bytes = np.zeros(capacity, dtype=np.float64)
+        self.current_conns = np.zeros(capacity, dtype=np.float64)
+        self.ewma_bytes = np.zeros((capacity, HOURS_PER_WEEK), dtype=np.float32)
+        self.ewma_conns = np.zeros((capacity, HOURS_PER_WEEK), dtype=np.float32)
+        self.hours_seen = np.zeros((capacity, HOURS_PER_WEEK), dtype=np.uint8)
+        self.ewma_dst = np.zeros(capacity, dtype=np.float32)
+        self.var_bytes = np.zeros(capacity, dtype=np.float32)
+        self.var_conns = np.zeros(capacity, dtype=np.float32)
+        self.var_dst = np.zeros(capacity, dtype=np.float32)
+        self.hours_folded = np.zeros(capacity, dtype=np.int64)
+        self.total_events = np.zeros(capacity, dtype=np.int64)
+        self.last_seen = np.zeros(capacity, dtype=np.float64)
+
+    def __len__(self) -> int:
+        return len(self._slots)
+
+    # Slot management
+
+    _ARRAYS = (
+        "hll_dst", "hll_port", "cms_port", "current_bytes", "current_conns",
+        "ewma_bytes", "ewma_conns", "hours_seen", "ewma_dst", "var_bytes",
+        "var_conns", "var_dst", "hours_folded", "total_events", "last_seen",
+    )
+
+    def _evict(self, count: int, pinned: set):
+        occupied = np.array(
+            [slot for slot in self._slots.values() if slot not in pinned], dtype=np.int64
+        )
+        if not len(occupied):
+            raise ValueError(f"More than {self.capacity} entities in one batch")
+        oldest = occupied[np.argsort(self.last_seen[occupied], kind="stable")[:count]]
+        for slot in oldest.tolist():
+            del self._slots[self._entities[slot]]
+            self._entities[slot] = None
+            self._free.append(slot)
+        for name in self._ARRAYS:
+            getattr(self, name)[oldest] = 0
+        self.current_hour[oldest] = -1
+        logger.info(f"Evicted {len(oldest)} idle entity profiles")
+
+    def _slot(self, entity_id: str, pinned: set) -> int:
+        """Slot of an entity, allocated on first sight; pinned slots are never evicted"""
+        slot = self._slots.get(entity_id)
+        if slot is None:
+            if not self._free:
+                self._evict(max(1, self.capacity // 100), pinned)
+            slot = self._free.pop()
+            self._slots[entity_id] = slot
+            self._entities[slot] = entity_id
+        pinned.add(slot)
+        return slot
+
+    # Ingest
+
+    def _fold(self, slots: np.ndarray):
+        """Fold the finished current hour of each slot into its EWMAs"""
+        slots = slots[self.current_hour[slots] >= 0]
+        if not len(slots):
+            return
+        how = hour_of_week(self.current_hour[slots])
+        a = self.alpha
+
+        for ewma, var, current in (
+            (self.ewma_bytes, self.var_bytes, self.current_bytes),
+            (self.ewma_conns, self.var_conns, self.current_conns),
+        ):
+            observed = current[slots]
+            expected = ewma[slots, how].astype(np.float64)
+            first = self.hours_seen[slots, how] == 0
+            residual = np.log1p(observed) - np.log1p(expected)
+            var[slots] = np.where(
+                first, var[slots], (1 - a) * var[slots] + a * residual ** 2
+            )
+            ewma[slots, how] = np.where(first, observed, (1 - a) * expected + a * observed)
+
+        distinct = hll_estimate(self.hll_dst[slots])
+        expected = self.ewma_dst[slots].astype(np.float64)
+        first = self.hours_folded[slots] == 0
+        residual = np.log1p(distinct) - np.log1p(expected)
+        self.var_dst[slots] = np.where(
+            first, self.var_dst[slots], (1 - a) * self.var_dst[slots] + a * residual ** 2
+        )
+        self.ewma_dst[slots] = np.where(first, distinct, (1 - a) * expected + a * distinct)
+
+        self.hours_seen[slots, how] = np.minimum(self.hours_seen[slots, how].astype(int) + 1, 255)
+        self.hours_folded[slots] += 1
+        self.current_bytes[slots] = 0
+        self.current_conns[slots] = 0
+        self.hll_dst[slots] = 0
+        self.hll_port[slots] = 0
+
+    def ingest(self, events: List[Dict[str, Any]], now: Optional[float] = None) -> Dict[str, int]:
+        """
+        Update profiles from a batch of network events. Each event is
+        attributed to `entity_id`, falling back to `source_ip`.
+        """
+        if not events:
+            return {"ingested": 0, "entities": 0}
+        now = time.time() if now is None else now
+
+        with self._lock:
+            pinned = set()
+            slots = np.array(
+                [
+                    self._slot(e.get("entity_id") or e.get("source_ip") or "unknown", pinned)
+                    for e in events
+                ],
+                dtype=np.int64,
+            )
+            seconds = np.array(
+                [epoch_seconds(e.get("timestamp"), now) for e in events], dtype=np.float64
+            )
+            hours = (seconds // 3600).astype(np.int64)
+            volume = np.array(
+                [(e.get("bytes_sent") or 0) + (e.get("bytes_received") or 0) for e in events],
+                dtype=np.float64,
+            )
+            ports = np.array([e.get("destination_port") or 0 for e in events], dtype=np.uint64)
+            dst_hashes = hash_strings([e.get("destination_ip") or "" for e in events])
+            port_hashes = splitmix64(ports)
+
+            # Port frequencies are lifetime counts and ignore hour boundaries
+            with np.errstate(over="ignore"):
+                columns = (splitmix64(port_hashes[:, None] ^ _CMS_SEEDS[None, :])
+                           % np.uint64(CMS_WIDTH)).astype(np.int64)
+            for row in range(CMS_DEPTH):
+                np.add.at(self.cms_port, (slots, row, columns[:, row]), 1)
+            np.add.at(self.total_events, slots, 1)
+            np.maximum.at(self.last_seen, slots, seconds)
+
+            # Events older than the entity's current hour cannot reopen it
+            late = hours < self.current_hour[slots]
+            slots, hours = slots[~late], hours[~late]
+            volume, dst_hashes, port_hashes = volume[~late], dst_hashes[~late], port_hashes[~late]
+
+            # Process each entity's distinct hours in order: round k handles
+            # the k-th hour of every entity present in the batch
+            order = np.lexsort((hours, slots))
+            slots, hours = slots[order], hours[order]
+            volume, dst_hashes, port_hashes = volume[order], dst_hashes[order], port_hashes[order]
+            new_group = np.ones(len(slots), dtype=bool)
+            new_group[1:] = (slots[1:] != slots[:-1]) | (hours[1:] != hours[:-1])
+            new_entity = np.ones(len(slots), dtype=bool)
+            new_entity[1:] = slots[1:] != slots[:-1]
+            group = np.cumsum(new_group) - 1
+            first_group = np.maximum.accumulate(np.where(new_entity, group, 0))
+            rounds = group - first_group
+
+            dst_index, dst_rank = hll_positions(dst_hashes, DST_PRECISION)
+            port_index, port_rank = hll_positions(port_hashes, PORT_PRECISION)
+            for r in range(int(rounds.max()) + 1 if len(rounds) else 0):
+                in_round = rounds == r
+                round_slots, round_hours = slots[in_round], hours[in_round]
+                starts = new_group[in_round]
+                group_slots, group_hours = round_slots[starts], round_hours[starts]
+                rolling = group_hours > self.current_hour[group_slots]
+                self._fold(group_slots[rolling])
+                self.current_hour[group_slots] = np.maximum(
+                    self.current_hour[group_slots], group_hours
+                )
+                np.add.at(self.current_bytes, round_slots, volume[in_round])
+                np.add.at(self.current_conns, round_slots, 1)
+                np.maximum.at(self.hll_dst, (round_slots, dst_index[in_round]), dst_rank[in_round])
+                np.maximum.at(
+                    self.hll_port, (round_slots, port_index[in_round]), port_rank[in_round]
+                )
+
+        return {"ingested": len(events), "entities": int(len(np.unique(slots)))}
+
+    # Queries
+
+    def port_frequency(self, entity_id: str, ports: List[int]) -> np.ndarray:
+        """Estimated fraction of the entity's events that went to each port"""
+        slot = self._slots.get(entity_id)
+        if slot is None or not ports:
+            return np.zeros(len(ports))
+        hashes = splitmix64(np.array(ports, dtype=np.uint64))
+        with np.errstate(over="ignore"):
+            columns = (splitmix64(hashes[:, None] ^ _CMS_SEEDS[None, :])
+                       % np.uint64(CMS_WIDTH)).astype(np.int64)
+        counts = self.cms_port[slot, np.arange(CMS_DEPTH)[None, :], columns].min(axis=1)
+        return counts / max(int(self.total_events[slot]), 1)
+
+    def profile(self, entity_id: str) -> Optional[Dict[str, Any]]:
+        """Current-hour activity and the baseline for that hour of the week"""
+        slot = self._slots.get(entity_id)
+        if slot is None:
+            return None
+        hour = int(self.current_hour[slot])
+        how = int(hour_of_week(np.array([hour]))[0])
+        return {
+            "entity_id": entity_id,
+            "total_events": int(self.total_events[slot]),
+            "hours_observed": int(self.hours_folded[slot]),
+            "hour_of_week": how,
+            "hour_of_week_observations": int(self.hours_seen[slot, how]),
+            "current": {
+                "bytes": float(self.current_bytes[slot]),
+                "connections": float(self.current_conns[slot]),
+                "unique_destinations": float(hll_estimate(self.hll_dst[slot])),
+                "unique_ports": float(hll_estimate(self.hll_port[slot])),
+            },
+            "baseline": {
+                "bytes": float(self.ewma_bytes[slot, how]),
+                "connections": float(self.ewma_conns[slot, how]),
+                "unique_destinations": float(self.ewma_dst[slot]),
+                "bytes_log_std": float(np.sqrt(self.var_bytes[slot])),
+                "connections_log_std": float(np.sqrt(self.var_conns[slot])),
+                "destinations_log_std": float(np.sqrt(self.var_dst[slot])),
+            },
+            "last_seen": float(self.last_seen[slot]),
+        }
+
+    def stats(self) -> Dict[str, Any]:
+        nbytes = sum(getattr(self, name).nbytes for name in self._ARRAYS) + self.current_hour.nbytes
+        return {"entities": len(self), "capacity": self.capacity, "memory_bytes": nbytes}
+
+    # Persistence
+
+    def save(self, path: Optional[str] = None):
+        path = path or self.path
+        if not path:
+            return
+        with self._lock:
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+            tmp_path = f"{path}.tmp.npz"
+            arrays = {name: getattr(self, name) for name in self._ARRAYS}
+            np.savez(
+                tmp_path,
+                entities=np.array([e or "" for e in self._entities], dtype="U"),
+                current_hour=self.current_hour,
+                **arrays,
+            )
+            os.replace(tmp_path, path)
+        logger.info(f"Saved {len(self)} entity profiles to {path}")
+
+    @classmethod
+    def load(cls, path: Optional[str], capacity: int = 100000, alpha: float = 0.1
+             ) -> "EntityProfileStore":
+        """Load a snapshot, or return an empty store bound to `path`"""
+        store = cls(capacity, alpha, path)
+        if not path or not os.path.exists(path):
+            return store
+        with np.load(path) as data:
+            entities = data["entities"].tolist()
+            if len(entities) != capacity:
+                logger.warning(
+                    f"Profile snapshot capacity {len(entities)} != {capacity}; using snapshot's"
+                )
+                store = cls(len(entities), alpha, path)
+            for name in cls._ARRAYS + ("current_hour",):
+                getattr(store, name)[:] = data[name]
+        store._entities = [e or None for e in entities]
+        store._slots = {e: i for i, e in enumerate(entities) if e}
+        store._free = [i for i in range(store.capacity - 1, -1, -1) if not entities[i]]
+        logger.info(f"Loaded {len(store)} entity profiles from {path}")
+        return store
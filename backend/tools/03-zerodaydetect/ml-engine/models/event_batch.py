@@ -0,0 +1,49 @@
+"""
+ZeroDayDetect ML Engine - Network Event Batch
+Columnar view of a batch of network events for vectorized detection
+"""
+
+import logging
+from typing import Any, Dict, List
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+
+class NetworkEventBatch:
+    """
+    Column-oriented representation of a list of network events.
+    Each field is extracted once into a NumPy array so threat and anomaly
+    detection can score the whole batch without per-event dict access.
+    """
+
+    def __init__(self, events: List[Dict[str, Any]]):
+        self.size = len(events)
+        self.event_ids = [str(e.get("event_id", "")) for e in events]
+
+        self.source_ip = np.array([e.get("source_ip") or "" for e in events], dtype=str)
+        self.destination_ip = np.array(
+            [e.get("destination_ip") or "" for e in events], dtype=str
+        )
+        self.destination_port = np.array(
+            [e.get("destination_port") or 0 for e in events], dtype=np.int64
+        )
+        self.protocol = np.array(
+            [(e.get("protocol") or "").upper() for e in events], dtype=str
+        )
+        self.bytes_sent = np.array(
+            [e.get("bytes_sent") or 0 for e in events], dtype=np.float64
+        )
+        self.bytes_received = np.array(
+            [e.get("bytes_received") or 0 for e in events], dtype=np.float64
+        )
+        self.packet_count = np.array(
+            [e.get("packet_count", 1) or 0 for e in events], dtype=np.float64
+        )
+
+        self.total_bytes = self.bytes_sent + self.bytes_received
+
+    def __len__(self) -> int:
+        return self.size
+
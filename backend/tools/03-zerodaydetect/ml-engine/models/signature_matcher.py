@@ -0,0 +1,291 @@
+"""
+ZeroDayDetect ML Engine - Signature Matcher
+Sigma-like endpoint signatures compiled into one matcher per field
+"""
+
+import json
+import logging
+import os
+import re
+import time
+from collections import defaultdict
+from threading import Lock
+from typing import Any, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_RULES_PATH = os.path.join(os.path.dirname(__file__), "..", "rules")
+
+# Event fields signatures may match against
+FIELDS = ("process_name", "process_path", "parent_process", "command_line", "user")
+MODIFIERS = ("contains", "startswith", "endswith")
+
+LEVEL_WEIGHTS = {"informational": 0, "low": 15, "medium": 25, "high": 40, "critical": 50}
+
+# Bit flags describing where a literal matched within a field value
+CONTAINS, STARTSWITH, ENDSWITH = 1, 2, 4
+MODIFIER_FLAGS = {"contains": CONTAINS, "startswith": STARTSWITH, "endswith": ENDSWITH}
+
+
+def _trie_pattern(node: Dict[str, Any]) -> str:
+    """Regex for a character trie; optional groups make longer literals win"""
+    branches = [
+        re.escape(char) + _trie_pattern(child)
+        for char, child in sorted(node.items())
+        if char != ""
+    ]
+    if not branches:
+        return ""
+    if len(branches) == 1 and "" not in node:
+        return branches[0]
+    pattern = "(?:" + "|".join(branches) + ")"
+    return pattern + "?" if "" in node else pattern
+
+
+class LiteralMatcher:
+    """
+    Finds every occurrence of a set of literals in one regex scan.
+
+    The literals are merged into a trie-shaped regex wrapped in a lookahead,
+    so the scan tests each text position once and the cost per position is
+    bounded by the trie depth rather than the number of literals. The
+    lookahead yields the longest literal at each position; shorter literals
+    that are prefixes of it are added from a precomputed table.
+    """
+
+    def __init__(self, literals: List[str]):
+        self.literals = literals
+        self.ids = {literal: i for i, literal in enumerate(literals)}
+
+        trie: Dict[str, Any] = {}
+        for literal in literals:
+            node = trie
+            for char in literal:
+                node = node.setdefault(char, {})
+            node[""] = True
+        self.regex = re.compile(f"(?=({_trie_pattern(trie)}))", re.DOTALL) if literals else None
+
+        self.prefixes = [
+            [self.ids[literal[:n]] for n in range(1, len(literal) + 1) if literal[:n] in self.ids]
+            for literal in literals
+        ]
+
+    def find(self, text: str) -> Dict[int, int]:
+        """Literal id -> CONTAINS/STARTSWITH/ENDSWITH flags for every literal in text"""
+        found: Dict[int, int] = {}
+        if self.regex is None or not text:
+            return found
+        for match in self.regex.finditer(text):
+            start = match.start()
+            for literal_id in self.prefixes[self.ids[match.group(1)]]:
+                flags = CONTAINS
+                if start == 0:
+                    flags |= STARTSWITH
+                if start + len(self.literals[literal_id]) == len(text):
+                    flags |= ENDSWITH
+                found[literal_id] = found.get(literal_id, 0) | flags
+        return found
+
+
+class Selection:
+    """One `field|modifier[|all]` entry of a rule's detection block"""
+
+    __slots__ = ("field", "flag", "literal_ids", "require_all")
+
+    def __init__(self, field: str, flag: int, literal_ids: List[int], require_all: bool):
+        self.field = field
+        self.flag = flag
+        self.literal_ids = literal_ids
+        self.require_all = require_all
+
+    def matches(self, found: Dict[int, int]) -> bool:
+        hits = (found.get(i, 0) & self.flag for i in self.literal_ids)
+        return all(hits) if self.require_all else any(hits)
+
+
+class SignatureRule:
+    """A compiled endpoint signature"""
+
+    __slots__ = (
+        "id", "title", "level", "weight", "threat_type", "tags", "condition", "selections",
+    )
+
+    def __init__(self, spec: Dict[str, Any], literal_id):
+        self.id = spec["id"]
+        self.title = spec.get("title", self.id)
+        self.level = spec.get("level", "medium")
+        if self.level not in LEVEL_WEIGHTS:
+            raise ValueError(f"Rule {self.id}: invalid level '{self.level}'")
+        self.weight = float(spec.get("weight", LEVEL_WEIGHTS[self.level]))
+        self.threat_type = spec.get("threat_type")
+        self.tags = list(spec.get("tags", []))
+        self.condition = spec.get("condition", "all")
+        if self.condition not in ("all", "any"):
+            raise ValueError(f"Rule {self.id}: condition must be 'all' or 'any'")
+
+        detection = spec.get("detection") or {}
+        if not detection:
+            raise ValueError(f"Rule {self.id}: no detection")
+        self.selections = []
+        for key, values in detection.items():
+            field, *modifiers = key.split("|")
+            modifier = modifiers[0] if modifiers else "contains"
+            rest = modifiers[1:]
+            if field not in FIELDS:
+                raise ValueError(f"Rule {self.id}: unknown field '{field}'")
+            if modifier not in MODIFIERS or rest not in ([], ["all"]):
+                raise ValueError(f"Rule {self.id}: unsupported modifier in '{key}'")
+            values = [values] if isinstance(values, str) else list(values)
+            if not values or not all(isinstance(v, str) and v for v in values):
+                raise ValueError(f"Rule {self.id}: '{key}' needs non-empty strings")
+            self.selections.append(
+                Selection(
+                    field,
+                    MODIFIER_FLAGS[modifier],
+                    [literal_id(field, v.lower()) for v in values],
+                    rest == ["all"],
+                )
+            )
+
+    def matches(self, found: Dict[str, Dict[int, int]]) -> bool:
+        results = (s.matches(found[s.field]) for s in self.selections)
+        return all(results) if self.condition == "all" else any(results)
+
+
+class SignatureSet:
+    """Immutable compiled signatures; swapped as a whole on reload"""
+
+    def __init__(self, specs: List[Dict[str, Any]], version: str):
+        self.version = version
+        literals: Dict[str, Dict[str, int]] = defaultdict(dict)
+
+        def literal_id(field: str, literal: str) -> int:
+            return literals[field].setdefault(literal, len(literals[field]))
+
+        self.rules = [SignatureRule(spec, literal_id) for spec in specs]
+        ids = [rule.id for rule in self.rules]
+        if len(set(ids)) != len(ids):
+            raise ValueError("Duplicate signature ids")
+
+        self.matchers = {
+            field: LiteralMatcher(sorted(ids, key=ids.get)) for field, ids in literals.items()
+        }
+
+        # Only rules with a literal present in the event can fire
+        self.candidates: Dict[Tuple[str, int], List[int]] = defaultdict(list)
+        for index, rule in enumerate(self.rules):
+            for key in {(s.field, i) for s in rule.selections for i in s.literal_ids}:
+                self.candidates[key].append(index)
+
+    def __len__(self) -> int:
+        return len(self.rules)
+
+    def match(self, event: Dict[str, Any]) -> List[SignatureRule]:
+        """Rules that fire for the event, scanning each field once"""
+        found = {
+            field: matcher.find((event.get(field) or "").lower())
+            for field, matcher in self.matchers.items()
+        }
+        candidates = sorted(
+            {
+                index
+                for field, hits in found.items()
+                for literal_id in hits
+                for index in self.candidates[(field, literal_id)]
+            }
+        )
+        return [self.rules[i] for i in candidates if self.rules[i].matches(found)]
+
+
+class SignatureEngine:
+    """
+    Loads endpoint signatures from JSON rule files (a file or a directory of
+    `*.json` files), compiles them once and matches events against them. The
+    files are re-read when their modification times change; rule files that
+    fail to compile are logged and the previous signatures stay active.
+    """
+
+    def __init__(self, path: Optional[str] = None, check_interval: float = 5.0):
+        self.path = os.path.abspath(
+            path or os.getenv("ENDPOINT_RULES_PATH", DEFAULT_RULES_PATH)
+        )
+        self.check_interval = check_interval
+        self._mtimes: Dict[str, float] = {}
+        self._last_check = 0.0
+        self._lock = Lock()
+        self._hits: Dict[str, int] = defaultdict(int)
+        self.signatures = self._load()
+
+    def _files(self) -> List[str]:
+        if os.path.isdir(self.path):
+            return sorted(
+                os.path.join(self.path, name)
+                for name in os.listdir(self.path)
+                if name.endswith(".json")
+            )
+        return [self.path]
+
+    def _load(self) -> SignatureSet:
+        specs, versions, mtimes = [], [], {}
+        for file_path in self._files():
+            with open(file_path) as f:
+                spec = json.load(f)
+            mtimes[file_path] = os.path.getmtime(file_path)
+            rules = spec["rules"] if isinstance(spec, dict) else spec
+            specs.extend(rules)
+            if isinstance(spec, dict) and "version" in spec:
+                versions.append(f"{os.path.basename(file_path)}@{spec['version']}")
+        signatures = SignatureSet(specs, ",".join(versions) or "unversioned")
+        self._mtimes = mtimes
+        logger.info(
+            f"Compiled {len(signatures)} endpoint signatures from {len(mtimes)} rule files"
+        )
+        return signatures
+
+    def reload(self) -> bool:
+        """Recompile the rule files. Returns False and keeps the old rules on error."""
+        with self._lock:
+            try:
+                self.signatures = self._load()
+                return True
+            except Exception as e:
+                logger.error(
+                    f"Signature reload failed, keeping {len(self.signatures)} rules: {e}"
+                )
+                return False
+
+    def maybe_reload(self):
+        """Reload when a rule file changed (checked at most every check_interval seconds)"""
+        now = time.monotonic()
+        if now - self._last_check < self.check_interval:
+            return
+        self._last_check = now
+        try:
+            mtimes = {path: os.path.getmtime(path) for path in self._files()}
+        except OSError:
+            return
+        if mtimes != self._mtimes:
+            self.reload()
+
+    def match(self, event: Dict[str, Any]) -> List[SignatureRule]:
+        self.maybe_reload()
+        fired = self.signatures.match(event)
+        if fired:
+            with self._lock:
+                for rule in fired:
+                    self._hits[rule.id] += 1
+        return fired
+
+    def stats(self) -> Dict[str, Any]:
+        signatures = self.signatures
+        with self._lock:
+            hits = {rule.id: self._hits.get(rule.id, 0) for rule in signatures.rules}
+        return {
+            "version": signatures.version,
+            "path": self.path,
+            "rules": len(signatures),
+            "literals": {
+                field: len(matcher.literals) for field, matcher in signatures.matchers.items()
+            },
+            "hits": {rule_id: n for rule_id, n in hits.items() if n},
+        }
@@ -4,11 +4,16 @@ Real-time network and endpoint threat detection
 """
 
 import logging
+import os
 from datetime import datetime
 from typing import Any, Dict, List
 
 import numpy as np
 
+from .beacon_detector import BeaconDetector
+from .event_batch import NetworkEventBatch
+from .signature_matcher import SignatureEngine
+
 logger = logging.getLogger(__name__)
 
 
@@ -27,92 +32,132 @@ class ThreatDetector:
         # Known malicious indicators
         self.malicious_ports = [4444, 5555, 6666, 31337, 12345, 1337]
         self.suspicious_ports = [22, 23, 3389, 5900, 445, 135, 139]
-        self.malicious_processes = [
-            "mimikatz",
-            "psexec",
-            "cobalt",
-            "metasploit",
-            "nc.exe",
-            "ncat.exe",
-            "powershell -enc",
-        ]
+
+        # Endpoint signatures (known tools, LOLBins) compiled from rule files
+        self.signature_engine = SignatureEngine()
+
+        # Per-flow connection history swept periodically for beaconing
+        self.beacon_detector = BeaconDetector(
+            capacity=int(os.getenv("BEACON_MAX_FLOWS", "100000"))
+        )
 
         logger.info(f"Threat Detector v{self.version} loaded")
 
     def detect_network(self, event: Dict[str, Any]) -> Dict[str, Any]:
         """Detect threats in network events"""
 
-        indicators = []
-        threat_score = 0
-        threat_type = None
+        result = self.detect_network_batch(NetworkEventBatch([event]), detail=True)
+        return {
+            "is_threat": bool(result["is_threat"][0]),
+            "threat_type": result["threat_type"][0],
+            "severity": str(result["severity"][0]),
+            "confidence": float(result["confidence"][0]),
+            "indicators": result["indicators"][0],
+            "recommended_action": str(result["recommended_action"][0]),
+        }
 
-        dest_port = event.get("destination_port", 0)
-        protocol = event.get("protocol", "").upper()
-        bytes_sent = event.get("bytes_sent", 0)
-        bytes_received = event.get("bytes_received", 0)
-        dest_ip = event.get("destination_ip", "")
+    def detect_network_batch(
+        self, batch: NetworkEventBatch, detail: bool = False
+    ) -> Dict[str, Any]:
+        """
+        Detect threats in a batch of network events.
+        Every check is a boolean mask over the batch; indicator strings are
+        only formatted when `detail` is set.
+        """
 
-        # Check for known malicious ports
-        if dest_port in self.malicious_ports:
-            threat_score += 40
-            threat_type = "c2_communication"
-            indicators.append(f"Known C2 port: {dest_port}")
+        dest_port = batch.destination_port
+        dest_ip = batch.destination_ip
+        bytes_sent = batch.bytes_sent
+        size = len(batch)
 
-        # Check for suspicious ports
-        elif dest_port in self.suspicious_ports:
-            threat_score += 20
-            indicators.append(f"Suspicious port: {dest_port}")
+        # Check for known malicious ports, then suspicious ports
+        malicious_port = np.isin(dest_port, self.malicious_ports)
+        suspicious_port = ~malicious_port & np.isin(dest_port, self.suspicious_ports)
 
         # Check for unusual data transfer
-        if bytes_sent > 10000000:  # 10MB
-            threat_score += 15
-            indicators.append("Large data exfiltration detected")
-            if not threat_type:
-                threat_type = "data_exfiltration"
+        exfiltration = bytes_sent > 10000000  # 10MB
 
-        # Check for beaconing patterns (regular intervals)
-        if bytes_sent > 0 and bytes_sent < 1000 and bytes_received < 1000:
-            threat_score += 10
-            indicators.append("Potential beaconing activity")
+        # Check for beaconing: flows the last sweep found periodic
+        beacons = [None] * size
+        if self.beacon_detector.beacons:
+            for i, key in enumerate(
+                zip(batch.source_ip.tolist(), dest_ip.tolist(), dest_port.tolist())
+            ):
+                beacons[i] = self.beacon_detector.verdict(*key)
+        beaconing = np.array([b is not None for b in beacons], dtype=bool)
 
         # Check for internal lateral movement
-        if dest_ip.startswith("192.168.") or dest_ip.startswith("10."):
-            if dest_port in [445, 3389, 22, 5985]:
-                threat_score += 15
-                indicators.append("Potential lateral movement")
-                if not threat_type:
-                    threat_type = "lateral_movement"
+        internal = np.char.startswith(dest_ip, "192.168.") | np.char.startswith(
+            dest_ip, "10."
+        )
+        lateral = internal & np.isin(dest_port, [445, 3389, 22, 5985])
 
         # DNS tunneling check (port 53 with unusual data)
-        if dest_port == 53 and bytes_sent > 1000:
-            threat_score += 25
-            indicators.append("Potential DNS tunneling")
-            threat_type = "dns_tunneling"
+        dns_tunneling = (dest_port == 53) & (bytes_sent > 1000)
+
+        threat_score = (
+            40 * malicious_port
+            + 20 * suspicious_port
+            + 15 * exfiltration
+            + 30 * beaconing
+            + 15 * lateral
+            + 25 * dns_tunneling
+        )
+
+        # Earlier checks name the threat type unless DNS tunneling overrides
+        threat_type = np.full(size, None, dtype=object)
+        for mask, name in [
+            (lateral, "lateral_movement"),
+            (beaconing, "c2_beaconing"),
+            (exfiltration, "data_exfiltration"),
+            (malicious_port, "c2_communication"),
+            (dns_tunneling, "dns_tunneling"),
+        ]:
+            threat_type[mask] = name
 
         # Calculate severity and confidence
         is_threat = threat_score >= 30
-        severity = self._calculate_severity(threat_score)
-        confidence = min(50 + threat_score, 98)
+        severity = self._calculate_severity_batch(threat_score)
+        confidence = np.minimum(50 + threat_score, 98)
 
         # Recommended action
-        if threat_score >= 60:
-            action = "block_and_isolate"
-        elif threat_score >= 40:
-            action = "block_connection"
-        elif threat_score >= 20:
-            action = "alert_and_monitor"
-        else:
-            action = "log_only"
+        action = np.array(
+            ["log_only", "alert_and_monitor", "block_connection", "block_and_isolate"]
+        )[np.searchsorted([20, 40, 60], threat_score, side="right")]
 
-        return {
+        result = {
+            "threat_score": threat_score,
             "is_threat": is_threat,
             "threat_type": threat_type,
             "severity": severity,
             "confidence": confidence,
-            "indicators": indicators or ["No threat indicators detected"],
             "recommended_action": action,
+            "indicators": None,
         }
 
+        if detail:
+            indicators = [[] for _ in range(size)]
+            for i in np.flatnonzero(malicious_port):
+                indicators[i].append(f"Known C2 port: {dest_port[i]}")
+            for i in np.flatnonzero(suspicious_port):
+                indicators[i].append(f"Suspicious port: {dest_port[i]}")
+            for i in np.flatnonzero(exfiltration):
+                indicators[i].append("Large data exfiltration detected")
+            for i in np.flatnonzero(beaconing):
+                indicators[i].append(
+                    f"Beaconing every ~{beacons[i]['period_seconds']:.0f}s "
+                    f"(jitter {beacons[i]['jitter']:.0%})"
+                )
+            for i in np.flatnonzero(lateral):
+                indicators[i].append("Potential lateral movement")
+            for i in np.flatnonzero(dns_tunneling):
+                indicators[i].append("Potential DNS tunneling")
+            result["indicators"] = [
+                ind or ["No threat indicators detected"] for ind in indicators
+            ]
+
+        return result
+
     def detect_endpoint(self, event: Dict[str, Any]) -> Dict[str, Any]:
         """Detect threats in endpoint events"""
 
@@ -120,17 +165,18 @@ class ThreatDetector:
         threat_score = 0
         threat_type = None
 
-        process_name = event.get("process_name", "").lower()
-        command_line = event.get("command_line", "").lower()
-        parent_process = event.get("parent_process", "").lower()
+        process_name = (event.get("process_name") or "").lower()
+        command_line = (event.get("command_line") or "").lower()
+        parent_process = (event.get("parent_process") or "").lower()
         event_type = event.get("event_type", "")
 
-        # Check for known malicious processes
-        for mal_proc in self.malicious_processes:
-            if mal_proc in process_name or mal_proc in command_line:
-                threat_score += 50
-                threat_type = "malware_execution"
-                indicators.append(f"Known malicious tool: {mal_proc}")
+        # Match all endpoint signatures in one pass over each field
+        matched_rules = self.signature_engine.match(event)
+        for rule in matched_rules:
+            threat_score += rule.weight
+            if rule.threat_type:
+                threat_type = rule.threat_type
+            indicators.append(rule.title)
 
         # Check for suspicious PowerShell
         if "powershell" in process_name:
@@ -185,8 +231,15 @@ class ThreatDetector:
             "confidence": confidence,
             "indicators": indicators or ["No threat indicators detected"],
             "recommended_action": action,
+            "matched_rules": [rule.id for rule in matched_rules],
         }
 
+    def _calculate_severity_batch(self, scores: np.ndarray) -> np.ndarray:
+        """Vectorized _calculate_severity"""
+        return np.array(["INFO", "LOW", "MEDIUM", "HIGH", "CRITICAL"])[
+            np.searchsorted([15, 30, 50, 70], scores, side="right")
+        ]
+
     def _calculate_severity(self, score: int) -> str:
         """Calculate severity based on threat score"""
         if score >= 70:
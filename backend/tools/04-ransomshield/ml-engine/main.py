@@ -3,17 +3,26 @@ MalwareHunter ML Engine - Main FastAPI Application
 Malware Analysis & Classification
 """
 
-from fastapi import FastAPI, HTTPException, UploadFile, File
+from fastapi import FastAPI, HTTPException, UploadFile, File, Request
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel, Field
 from typing import List, Optional, Dict, Any
 from datetime import datetime
+import asyncio
 import logging
 import base64
+import hashlib
+import json
+import os
+from functools import partial
 
 from models.malware_classifier import MalwareClassifier
 from models.static_analyzer import StaticAnalyzer
 from models.behavior_predictor import BehaviorPredictor
+from models.sample_file import CHUNK_SIZE, spool_stream
+from models.result_cache import ResultCache, input_key, sha256_key
+from models.worker_pool import AnalysisPool
 
 # Configure logging
 logging.basicConfig(
@@ -43,6 +52,15 @@ malware_classifier = MalwareClassifier()
 static_analyzer = StaticAnalyzer()
 behavior_predictor = BehaviorPredictor()
 
+# Analysis results shared by every endpoint that sees the same sample
+result_cache = ResultCache()
+
+# CPU-bound analysis runs in worker processes, off the event loop
+analysis_pool = AnalysisPool()
+
+# Largest number of samples per /batch-classify request
+MAX_BATCH_SAMPLES = int(os.getenv("BATCH_MAX_SAMPLES", "1000"))
+
 
 # Pydantic models
 class SampleInput(BaseModel):
@@ -52,6 +70,28 @@ class SampleInput(BaseModel):
     file_size: Optional[int] = None
     file_type: Optional[str] = None
     content_base64: Optional[str] = None  # Base64 encoded file content
+    ssdeep: Optional[str] = None  # Fuzzy hashes for family matching
+    tlsh: Optional[str] = None
+
+
+class FuzzySample(BaseModel):
+    digest: str  # ssdeep or TLSH
+    label: Optional[str] = None  # Malware family
+    sample_id: Optional[str] = None  # SHA256 of the sample
+
+
+class FuzzyQuery(BaseModel):
+    digest: str
+    k: int = Field(10, ge=1, le=100)
+
+
+class FuzzyClusterRequest(BaseModel):
+    digests: List[str]
+    threshold: float = Field(50, gt=0, le=100)
+
+
+class HashLookupRequest(BaseModel):
+    hashes: List[str]  # MD5, SHA-1 or SHA-256 hex digests
 
 
 class ClassificationResult(BaseModel):
@@ -74,6 +114,14 @@ class StaticAnalysisResult(BaseModel):
     packed: bool
     signed: bool
     risk_indicators: List[Dict[str, Any]]
+    # Only available when the sample's bytes were analyzed
+    sha256: Optional[str] = None
+    md5: Optional[str] = None
+    sections: List[Dict[str, Any]] = []
+    import_count: int = 0
+    imported_dlls: List[str] = []
+    string_counts: Dict[str, int] = {}
+    iocs: Dict[str, List[str]] = {}
 
 
 class BehaviorPrediction(BaseModel):
@@ -113,7 +161,16 @@ async def classify_sample(sample: SampleInput):
     try:
         logger.info(f"Classifying sample {sample.sample_id}")
         
-        result = malware_classifier.classify(sample.model_dump())
+        # The verdict also depends on the fuzzy digests and file metadata
+        result = await result_cache.get_or_compute(
+            "classify",
+            malware_classifier.cache_version,
+            input_key(sha256_key(sample.file_hash), sample.model_dump(
+                include={"file_name", "file_type", "ssdeep", "tlsh"}
+            )),
+            partial(analysis_pool.submit, "classify", sample.model_dump()),
+            versioned=True
+        )
         
         return ClassificationResult(
             sample_id=sample.sample_id,
@@ -123,26 +180,41 @@ async def classify_sample(sample: SampleInput):
             confidence=result["confidence"],
             threat_level=result["threat_level"]
         )
+    except TimeoutError as e:
+        logger.error(f"Timed out classifying sample {sample.sample_id}: {e}")
+        raise HTTPException(status_code=504, detail=str(e))
     except Exception as e:
         logger.error(f"Error classifying sample: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
 
-# Batch classify
-@app.post("/batch-classify", response_model=List[ClassificationResult])
+# Batch classify, streaming one NDJSON line per sample as it finishes
+@app.post("/batch-classify")
 async def batch_classify(samples: List[SampleInput]):
-    if len(samples) > 50:
-        raise HTTPException(status_code=400, detail="Maximum 50 samples per batch")
+    if len(samples) > MAX_BATCH_SAMPLES:
+        raise HTTPException(
+            status_code=400, detail=f"Maximum {MAX_BATCH_SAMPLES} samples per batch"
+        )
     
-    results = []
-    for sample in samples:
+    async def classify_one(sample: SampleInput) -> Dict[str, Any]:
         try:
             result = await classify_sample(sample)
-            results.append(result)
-        except Exception as e:
-            logger.error(f"Error classifying sample {sample.sample_id}: {e}")
+            return result.model_dump()
+        except HTTPException as e:
+            return {"sample_id": sample.sample_id, "error": e.detail, "status_code": e.status_code}
     
-    return results
+    async def results():
+        # Every sample is submitted at once; the pool's bounded queue paces them
+        tasks = [asyncio.create_task(classify_one(sample)) for sample in samples]
+        try:
+            for finished in asyncio.as_completed(tasks):
+                yield json.dumps(await finished, default=str) + "\n"
+        finally:
+            # Client went away: drop samples that have not finished
+            for task in tasks:
+                task.cancel()
+    
+    return StreamingResponse(results(), media_type="application/x-ndjson")
 
 
 # Static analysis
@@ -151,32 +223,113 @@ async def analyze_static(sample: SampleInput):
     try:
         logger.info(f"Static analysis for sample {sample.sample_id}")
         
-        result = static_analyzer.analyze(sample.model_dump())
+        # Analyses of the sample's bytes are keyed by their own digest;
+        # hash-only estimates echo the claimed type and size, so those
+        # are part of their key
+        if sample.content_base64:
+            analyzer = "static"
+            sha256 = hashlib.sha256(base64.b64decode(sample.content_base64)).hexdigest()
+        else:
+            analyzer = "static_hash"
+            sha256 = input_key(sha256_key(sample.file_hash), sample.model_dump(
+                include={"file_type", "file_size"}
+            ))
+        
+        result = await result_cache.get_or_compute(
+            analyzer,
+            static_analyzer.version,
+            sha256,
+            partial(analysis_pool.submit, "static", sample.model_dump())
+        )
         
         return StaticAnalysisResult(
             sample_id=sample.sample_id,
             file_hash=sample.file_hash,
-            file_type=result["file_type"],
-            file_size=result["file_size"],
-            entropy=result["entropy"],
-            imports=result["imports"],
-            suspicious_strings=result["suspicious_strings"],
-            packed=result["packed"],
-            signed=result["signed"],
-            risk_indicators=result["risk_indicators"]
+            **result
         )
+    except TimeoutError as e:
+        logger.error(f"Timed out in static analysis of sample {sample.sample_id}: {e}")
+        raise HTTPException(status_code=504, detail=str(e))
     except Exception as e:
         logger.error(f"Error in static analysis: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
 
+# Largest sample accepted by the upload endpoints
+MAX_SAMPLE_BYTES = int(os.getenv("SAMPLE_MAX_BYTES", str(1024 * 1024 * 1024)))
+
+
+async def analyze_spooled(chunks, sample_id: Optional[str], file_name: Optional[str]):
+    """Spool a byte stream to disk, then analyze the memory-mapped file off the event loop"""
+    try:
+        path, size, sha256, md5 = await spool_stream(
+            chunks, static_analyzer.spool_dir, MAX_SAMPLE_BYTES
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    
+    def remove_spooled():
+        if os.path.exists(path):
+            os.unlink(path)
+    
+    async def analyze():
+        try:
+            return await analysis_pool.submit(
+                "static_file",
+                {"path": path, "sha256": sha256, "md5": md5, "file_name": file_name}
+            )
+        finally:
+            remove_spooled()
+    
+    try:
+        logger.info(f"Static analysis of uploaded sample {sha256} ({size} bytes)")
+        # The spooled file is removed by whichever of these runs
+        result = await result_cache.get_or_compute(
+            "static", static_analyzer.version, sha256, analyze, on_skip=remove_spooled
+        )
+        return StaticAnalysisResult(
+            sample_id=sample_id or sha256,
+            file_hash=sha256,
+            **result
+        )
+    except TimeoutError as e:
+        logger.error(f"Timed out analyzing uploaded sample {sha256}: {e}")
+        raise HTTPException(status_code=504, detail=str(e))
+    except Exception as e:
+        logger.error(f"Error analyzing uploaded sample: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+# Static analysis of a multipart file upload
+@app.post("/analyze/upload", response_model=StaticAnalysisResult)
+async def analyze_upload(file: UploadFile = File(...), sample_id: Optional[str] = None):
+    async def chunks():
+        while chunk := await file.read(CHUNK_SIZE):
+            yield chunk
+    
+    return await analyze_spooled(chunks(), sample_id, file.filename)
+
+
+# Static analysis of a raw streamed request body
+@app.post("/analyze/stream", response_model=StaticAnalysisResult)
+async def analyze_stream(
+    request: Request, sample_id: Optional[str] = None, file_name: Optional[str] = None
+):
+    return await analyze_spooled(request.stream(), sample_id, file_name)
+
+
 # Predict behavior
 @app.post("/predict/behavior", response_model=BehaviorPrediction)
 async def predict_behavior(sample: SampleInput):
     try:
         logger.info(f"Behavior prediction for sample {sample.sample_id}")
         
-        result = behavior_predictor.predict(sample.model_dump())
+        result = await result_cache.get_or_compute(
+            "behavior",
+            behavior_predictor.version,
+            sha256_key(sample.file_hash),
+            partial(analysis_pool.submit, "behavior", sample.model_dump())
+        )
         
         return BehaviorPrediction(
             sample_id=sample.sample_id,
@@ -186,6 +339,9 @@ async def predict_behavior(sample: SampleInput):
             registry_activity=result["registry_activity"],
             overall_risk=result["overall_risk"]
         )
+    except TimeoutError as e:
+        logger.error(f"Timed out predicting behavior of sample {sample.sample_id}: {e}")
+        raise HTTPException(status_code=504, detail=str(e))
     except Exception as e:
         logger.error(f"Error predicting behavior: {e}")
         raise HTTPException(status_code=500, detail=str(e))
@@ -202,6 +358,136 @@ async def lookup_hash(file_hash: str):
         raise HTTPException(status_code=500, detail=str(e))
 
 
+# Largest number of hashes per batch lookup
+MAX_LOOKUP_BATCH = int(os.getenv("HASH_LOOKUP_MAX_BATCH", "10000"))
+
+
+# Batch lookup against the known-bad hash corpus
+@app.post("/lookup/batch")
+async def lookup_hashes(request: HashLookupRequest):
+    if len(request.hashes) > MAX_LOOKUP_BATCH:
+        raise HTTPException(
+            status_code=400, detail=f"Maximum {MAX_LOOKUP_BATCH} hashes per batch"
+        )
+    
+    try:
+        results = await asyncio.to_thread(malware_classifier.lookup_many, request.hashes)
+        return {
+            "total": len(results),
+            "found": sum(1 for r in results if r["found"]),
+            "results": results
+        }
+    except Exception as e:
+        logger.error(f"Error in batch hash lookup: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+# Known-bad hash store statistics
+@app.get("/hashes/stats")
+async def hash_store_stats():
+    return malware_classifier.hash_store.stats()
+
+
+# Pick up tables rebuilt by the feed import tool
+@app.post("/hashes/reload")
+async def reload_hash_store():
+    hash_store = malware_classifier.hash_store
+    if not hash_store.reload():
+        raise HTTPException(status_code=500, detail="Hash store reload failed")
+    return {"status": "reloaded", "generation": hash_store.generation, "hashes": len(hash_store)}
+
+
+# Load known sample digests into the fuzzy-hash index
+@app.post("/samples/fuzzy")
+async def add_fuzzy_samples(samples: List[FuzzySample]):
+    try:
+        fuzzy_index = malware_classifier.fuzzy_index
+        added = fuzzy_index.add_many(s.model_dump() for s in samples)
+        return {"status": "added", "count": added, **fuzzy_index.stats()}
+    except Exception as e:
+        logger.error(f"Error loading fuzzy hashes: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+# Nearest known samples to a fuzzy digest
+@app.post("/similar")
+async def similar_samples(query: FuzzyQuery):
+    try:
+        fuzzy_index = malware_classifier.fuzzy_index
+        return {
+            "digest": query.digest,
+            "matches": fuzzy_index.nearest(query.digest, query.k),
+            "family": fuzzy_index.family(
+                query.digest, malware_classifier.family_similarity_threshold
+            )
+        }
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        logger.error(f"Error searching similar samples: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+# Cluster submitted samples into families
+@app.post("/cluster")
+async def cluster_samples(request: FuzzyClusterRequest):
+    if len(request.digests) > 100000:
+        raise HTTPException(status_code=400, detail="Maximum 100000 digests per request")
+    
+    try:
+        clusters = malware_classifier.fuzzy_index.cluster(request.digests, request.threshold)
+        return {"clusters": clusters, "count": len(clusters)}
+    except Exception as e:
+        logger.error(f"Error clustering samples: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+# Fuzzy-hash index statistics
+@app.get("/samples/fuzzy/stats")
+async def fuzzy_sample_stats():
+    return malware_classifier.fuzzy_index.stats()
+
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    """Stop the workers, persist the fuzzy-hash index and cached results on shutdown"""
+    app.state.fuzzy_index_saves.cancel()
+    await analysis_pool.stop()
+    malware_classifier.fuzzy_index.save_if_changed()
+    result_cache.close()
+
+
+async def fuzzy_index_save_loop():
+    # Workers reload the index when its file changes, so this also bounds
+    # how long they classify against a stale corpus
+    interval = float(os.getenv("FUZZY_INDEX_SAVE_INTERVAL", "30"))
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            await asyncio.to_thread(malware_classifier.fuzzy_index.save_if_changed)
+        except Exception as e:
+            logger.error(f"Error saving fuzzy-hash index: {e}")
+
+
+@app.on_event("startup")
+async def startup_event():
+    """Start the analysis worker processes and periodic fuzzy-index saves"""
+    await analysis_pool.start()
+    app.state.fuzzy_index_saves = asyncio.create_task(fuzzy_index_save_loop())
+
+
+# Shared result cache statistics
+@app.get("/cache/stats")
+async def cache_stats():
+    return result_cache.stats()
+
+
+# Analysis worker pool statistics
+@app.get("/workers/stats")
+async def worker_stats():
+    return analysis_pool.stats()
+
+
 # Get model info
 @app.get("/model-info", response_model=ModelInfo)
 async def get_model_info():
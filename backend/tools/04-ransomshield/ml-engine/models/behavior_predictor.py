@@ -41,7 +41,7 @@ class BehaviorPredictor:
         
         # Network behaviors
         if (hash_int % 10) < 7:  # 70% chance
-            behavior = np.random.choice(self.behavior_types["network"])
+            behavior = self._pick("network", hash_int >> 4)
             predicted_behaviors.append({
                 "category": "network",
                 "behavior": behavior,
@@ -51,7 +51,7 @@ class BehaviorPredictor:
         
         # File behaviors
         if (hash_int % 10) < 5:  # 50% chance
-            behavior = np.random.choice(self.behavior_types["file"])
+            behavior = self._pick("file", hash_int >> 8)
             predicted_behaviors.append({
                 "category": "file",
                 "behavior": behavior,
@@ -61,7 +61,7 @@ class BehaviorPredictor:
         
         # Registry behaviors
         if (hash_int % 10) < 4:  # 40% chance
-            behavior = np.random.choice(self.behavior_types["registry"])
+            behavior = self._pick("registry", hash_int >> 12)
             predicted_behaviors.append({
                 "category": "registry",
                 "behavior": behavior,
@@ -71,7 +71,7 @@ class BehaviorPredictor:
         
         # Process behaviors
         if (hash_int % 10) < 3:  # 30% chance
-            behavior = np.random.choice(self.behavior_types["process"])
+            behavior = self._pick("process", hash_int >> 16)
             predicted_behaviors.append({
                 "category": "process",
                 "behavior": behavior,
@@ -95,6 +95,12 @@ class BehaviorPredictor:
             "overall_risk": overall_risk
         }
     
+    def _pick(self, category: str, seed: int) -> str:
+        """Behavior of a category, derived from the hash so a sample always gets the same one"""
+        
+        options = self.behavior_types[category]
+        return options[seed % len(options)]
+    
     def _get_behavior_description(self, behavior: str) -> str:
         """Get human-readable description"""
         
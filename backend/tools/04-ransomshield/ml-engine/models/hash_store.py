@@ -0,0 +1,476 @@
+"""
+MalwareHunter ML Engine - Known Hash Store
+Memory-mapped sorted tables of known-bad MD5/SHA-1/SHA-256 hashes with Bloom prefilters
+"""
+
+import argparse
+import gzip
+import json
+import logging
+import os
+import re
+import shutil
+import tempfile
+import time
+from threading import RLock
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_STORE_PATH = os.path.join("data", "hash_store")
+
+# Digest bytes per hash type; keys are stored as big-endian 64-bit words so
+# that numeric order equals byte order (SHA-1 is zero-padded to 24 bytes)
+HASH_BYTES = {"md5": 16, "sha1": 20, "sha256": 32}
+HASH_TYPES = {2 * n: kind for kind, n in HASH_BYTES.items()}
+
+# Feed lines: a hex digest, optionally followed by a family label
+_FEED_LINE = re.compile(
+    r"^\s*([0-9A-Fa-f]{64}|[0-9A-Fa-f]{40}|[0-9A-Fa-f]{32})\s*(?:[,;\t ]\s*\"?([^\"\r\n]*?)\"?)?\s*$"
+)
+
+_HEX = re.compile(r"[0-9A-Fa-f]+")
+
+# Imports are partitioned on the top byte of the key before sorting
+BUCKET_BITS = 8
+IMPORT_CHUNK_LINES = 1_000_000
+BLOOM_BITS_PER_KEY = 10
+MAX_LABELS = 65535
+
+
+def _words(nbytes: int) -> int:
+    return (nbytes + 7) // 8
+
+
+def hash_type(value: str) -> Optional[str]:
+    """'md5', 'sha1', 'sha256' or None for anything that is not a hex digest"""
+    value = (value or "").strip()
+    kind = HASH_TYPES.get(len(value))
+    return kind if kind and _HEX.fullmatch(value) else None
+
+
+def hex_to_keys(hexes: List[str], kind: str) -> np.ndarray:
+    """(n, words) uint64 keys for hex digests of one hash type"""
+    nbytes = HASH_BYTES[kind]
+    raw = np.frombuffer(bytes.fromhex("".join(hexes)), dtype=np.uint8).reshape(-1, nbytes)
+    padded = np.zeros((len(hexes), _words(nbytes) * 8), dtype=np.uint8)
+    padded[:, :nbytes] = raw
+    return padded.view(">u8").astype(np.uint64)
+
+
+def bloom_positions(keys: np.ndarray, n_bits: int, n_hashes: int) -> np.ndarray:
+    """
+    (n, n_hashes) bit positions by double hashing. The keys are digests
+    already, so their first two words serve as the two base hashes.
+    """
+    h1 = keys[:, 0][:, None]
+    h2 = (keys[:, 1] | np.uint64(1))[:, None]
+    return (h1 + np.arange(n_hashes, dtype=np.uint64)[None, :] * h2) % np.uint64(n_bits)
+
+
+class HashTable:
+    """
+    One hash type's sorted key table (column-major, so the first key word
+    is a contiguous binary-searchable array), its label ids and its Bloom
+    filter. All three stay memory-mapped, so worker processes opening the
+    same generation share one copy through the page cache.
+    """
+
+    def __init__(self, directory: str, kind: str, spec: Dict[str, Any]):
+        self.kind = kind
+        self.files = spec["files"]
+        self.keys = np.load(os.path.join(directory, self.files["keys"]), mmap_mode="r")
+        self.labels = np.load(os.path.join(directory, self.files["labels"]), mmap_mode="r")
+        self.bloom = np.load(os.path.join(directory, self.files["bloom"]), mmap_mode="r")
+        self.bloom_hashes = spec["bloom_hashes"]
+        self.bloom_bits = len(self.bloom) * 8
+
+    def __len__(self) -> int:
+        return self.keys.shape[1]
+
+    def maybe_contains(self, keys: np.ndarray) -> np.ndarray:
+        positions = bloom_positions(keys, self.bloom_bits, self.bloom_hashes)
+        bits = self.bloom[positions >> np.uint64(3)] >> (positions & np.uint64(7)).astype(np.uint8)
+        return (bits & 1).all(axis=1)
+
+    def find(self, keys: np.ndarray) -> np.ndarray:
+        """Row of each key in the table, -1 when absent"""
+        rows = np.full(len(keys), -1, dtype=np.int64)
+        if not len(self) or not len(keys):
+            return rows
+        first = self.keys[0]
+        lo = np.searchsorted(first, keys[:, 0], side="left")
+        hi = np.searchsorted(first, keys[:, 0], side="right")
+        for i in np.flatnonzero(hi > lo).tolist():
+            # Distinct digests sharing their first 64 bits are vanishingly rare
+            for row in range(lo[i], hi[i]):
+                if np.array_equal(self.keys[:, row], keys[i]):
+                    rows[i] = row
+                    break
+        return rows
+
+
+class KnownHashStore:
+    """
+    Known-bad file hashes on disk.
+
+    Each hash type has a sorted fixed-width table searched by binary search
+    over a memory mapping, so lookups touch a handful of pages however large
+    the corpus is. A Bloom filter per table (~1% false positives at 10 bits
+    per key) answers most negatives without touching the table. Tables are
+    rebuilt by `import_feeds` into new files and published by atomically
+    replacing `meta.json`; readers in other processes pick the new
+    generation up on their next lookup after `check_interval` seconds.
+    """
+
+    def __init__(self, path: Optional[str] = None, check_interval: float = 5.0):
+        self.path = os.path.abspath(path or os.getenv("HASH_STORE_PATH", DEFAULT_STORE_PATH))
+        self.check_interval = check_interval
+        self._lock = RLock()
+        self._last_check = 0.0
+        self._meta_mtime: Optional[float] = None
+        self.generation = 0
+        self.label_names: List[str] = []
+        self.tables: Dict[str, HashTable] = {}
+        self.counters = {"lookups": 0, "bloom_negatives": 0, "table_probes": 0, "hits": 0}
+        self.reload()
+
+    @property
+    def meta_path(self) -> str:
+        return os.path.join(self.path, "meta.json")
+
+    def __len__(self) -> int:
+        return sum(len(table) for table in self.tables.values())
+
+    def reload(self) -> bool:
+        """Open the tables named by meta.json. Returns False and keeps the old ones on error."""
+        with self._lock:
+            try:
+                mtime = os.path.getmtime(self.meta_path)
+            except OSError:
+                return False
+            try:
+                with open(self.meta_path) as f:
+                    meta = json.load(f)
+                tables = {
+                    kind: HashTable(self.path, kind, spec) for kind, spec in meta["tables"].items()
+                }
+            except Exception as e:
+                logger.error(f"Hash store reload failed, keeping generation {self.generation}: {e}")
+                return False
+            self.tables = tables
+            self.label_names = meta["labels"]
+            self.generation = meta["generation"]
+            self._meta_mtime = mtime
+            logger.info(f"Loaded {len(self)} known hashes (generation {self.generation}) from {self.path}")
+            return True
+
+    def maybe_reload(self):
+        """Reload when another process published a new generation"""
+        now = time.monotonic()
+        if now - self._last_check < self.check_interval:
+            return
+        self._last_check = now
+        try:
+            mtime = os.path.getmtime(self.meta_path)
+        except OSError:
+            return
+        if mtime != self._meta_mtime:
+            self.reload()
+
+    # Lookups
+
+    def lookup_many(self, hashes: List[str]) -> List[Optional[Dict[str, Any]]]:
+        """For each hash: {hash, hash_type, malware_family} if known, else None"""
+        self.maybe_reload()
+        tables, label_names = self.tables, self.label_names
+        results: List[Optional[Dict[str, Any]]] = [None] * len(hashes)
+
+        by_kind: Dict[str, List[int]] = {}
+        for i, value in enumerate(hashes):
+            kind = hash_type(value)
+            if kind in tables:
+                by_kind.setdefault(kind, []).append(i)
+
+        bloom_negatives = probes = hits = 0
+        for kind, indexes in by_kind.items():
+            table = tables[kind]
+            keys = hex_to_keys([hashes[i].strip() for i in indexes], kind)
+            candidates = np.flatnonzero(table.maybe_contains(keys))
+            bloom_negatives += len(indexes) - len(candidates)
+            probes += len(candidates)
+            rows = table.find(keys[candidates])
+            for candidate, row in zip(candidates.tolist(), rows.tolist()):
+                if row < 0:
+                    continue
+                label = int(table.labels[row])
+                results[indexes[candidate]] = {
+                    "hash": hashes[indexes[candidate]].strip().lower(),
+                    "hash_type": kind,
+                    "malware_family": label_names[label - 1] if label else None,
+                }
+                hits += 1
+
+        with self._lock:
+            self.counters["lookups"] += len(hashes)
+            self.counters["bloom_negatives"] += bloom_negatives
+            self.counters["table_probes"] += probes
+            self.counters["hits"] += hits
+        return results
+
+    def lookup(self, value: str) -> Optional[Dict[str, Any]]:
+        return self.lookup_many([value])[0]
+
+    def stats(self) -> Dict[str, Any]:
+        tables = self.tables
+        return {
+            "path": self.path,
+            "generation": self.generation,
+            "hashes": len(self),
+            "families": len(self.label_names),
+            "tables": {
+                kind: {
+                    "hashes": len(table),
+                    "bloom_bytes": len(table.bloom),
+                    "bloom_hashes": table.bloom_hashes,
+                }
+                for kind, table in tables.items()
+            },
+            **self.counters,
+        }
+
+    # Bulk import
+
+    def import_feeds(self, paths: Iterable[str], bits_per_key: int = BLOOM_BITS_PER_KEY
+                     ) -> Dict[str, Any]:
+        """
+        Merge feed files (one hex digest per line, optionally followed by a
+        family label; .gz accepted) into the store as a new generation.
+
+        Digests are partitioned by their top byte into spill files, so each
+        partition is sorted and merged with the matching slice of the
+        current table on its own and memory stays bounded by the partition
+        size rather than the corpus size. A digest already known keeps its
+        label unless the feed supplies one.
+        """
+        started = time.time()
+        os.makedirs(self.path, exist_ok=True)
+        with self._lock:
+            self.reload()
+            label_names = list(self.label_names)
+            label_ids = {name: i + 1 for i, name in enumerate(label_names)}
+            generation = self.generation + 1
+            current = dict(self.tables)
+
+            work = tempfile.mkdtemp(prefix="import-", dir=self.path)
+            try:
+                lines = invalid = 0
+                spilled: Dict[str, int] = {}
+                for path in paths:
+                    for chunk in _read_feed(path):
+                        lines += len(chunk)
+                        parsed, bad = _parse_feed_lines(chunk, label_ids, label_names)
+                        invalid += bad
+                        for kind, (hexes, labels) in parsed.items():
+                            rows = np.column_stack(
+                                [hex_to_keys(hexes, kind), np.array(labels, dtype=np.uint64)]
+                            )
+                            self._spill(work, kind, rows)
+                            spilled[kind] = spilled.get(kind, 0) + len(rows)
+                if len(label_names) > MAX_LABELS:
+                    raise ValueError(f"More than {MAX_LABELS} family labels")
+
+                specs = {kind: {"files": t.files, "bloom_hashes": t.bloom_hashes}
+                         for kind, t in current.items()}
+                added = {}
+                for kind in spilled:
+                    old = current.get(kind)
+                    specs[kind] = self._build_table(work, kind, old, generation, bits_per_key)
+                    added[kind] = specs[kind].pop("count") - (len(old) if old else 0)
+
+                meta = {
+                    "generation": generation,
+                    "labels": label_names,
+                    "tables": specs,
+                    "updated_at": time.time(),
+                }
+                tmp_meta = os.path.join(work, "meta.json")
+                with open(tmp_meta, "w") as f:
+                    json.dump(meta, f)
+                os.replace(tmp_meta, self.meta_path)
+            finally:
+                shutil.rmtree(work, ignore_errors=True)
+
+            self.reload()
+            self._remove_stale_files()
+
+        result = {
+            "lines": lines,
+            "invalid": invalid,
+            "added": added,
+            "seconds": round(time.time() - started, 2),
+            **self.stats(),
+        }
+        logger.info(f"Imported {sum(added.values())} new hashes from {lines} feed lines")
+        return result
+
+    def _spill(self, work: str, kind: str, rows: np.ndarray):
+        buckets = (rows[:, 0] >> np.uint64(64 - BUCKET_BITS)).astype(np.int64)
+        order = np.argsort(buckets, kind="stable")
+        rows, buckets = rows[order], buckets[order]
+        bounds = np.searchsorted(buckets, np.arange((1 << BUCKET_BITS) + 1))
+        for bucket in np.flatnonzero(np.diff(bounds)).tolist():
+            with open(os.path.join(work, f"{kind}.{bucket:03d}.spill"), "ab") as f:
+                rows[bounds[bucket]:bounds[bucket + 1]].tofile(f)
+
+    def _build_table(self, work: str, kind: str, old: Optional[HashTable], generation: int,
+                     bits_per_key: int) -> Dict[str, Any]:
+        """Sort and deduplicate every partition, then write the table and its filter"""
+        words = _words(HASH_BYTES[kind])
+        if old is not None and len(old):
+            old_bounds = np.searchsorted(
+                old.keys[0],
+                np.arange(1 << BUCKET_BITS, dtype=np.uint64) << np.uint64(64 - BUCKET_BITS),
+            )
+            old_bounds = np.r_[old_bounds, len(old)]
+        else:
+            old_bounds = None
+
+        sizes = []
+        for bucket in range(1 << BUCKET_BITS):
+            parts = []
+            if old_bounds is not None and old_bounds[bucket + 1] > old_bounds[bucket]:
+                lo, hi = old_bounds[bucket], old_bounds[bucket + 1]
+                parts.append(np.column_stack([old.keys[:, lo:hi].T, old.labels[lo:hi].astype(np.uint64)]))
+            spill = os.path.join(work, f"{kind}.{bucket:03d}.spill")
+            if os.path.exists(spill):
+                parts.append(np.fromfile(spill, dtype=np.uint64).reshape(-1, words + 1))
+            if not parts:
+                sizes.append(0)
+                continue
+            rows = np.concatenate(parts) if len(parts) > 1 else parts[0]
+            # Sort by key, labelled rows after unlabelled ones, later rows
+            # last; the last row of every run of equal keys wins
+            order = np.lexsort(
+                (np.arange(len(rows)), rows[:, words] > 0) + tuple(rows[:, w] for w in reversed(range(words)))
+            )
+            rows = rows[order]
+            last = np.r_[(rows[1:, :words] != rows[:-1, :words]).any(axis=1), True]
+            rows = rows[last]
+            rows.tofile(os.path.join(work, f"{kind}.{bucket:03d}.sorted"))
+            sizes.append(len(rows))
+
+        total = int(sum(sizes))
+        files = {
+            "keys": f"{kind}.{generation}.keys.npy",
+            "labels": f"{kind}.{generation}.labels.npy",
+            "bloom": f"{kind}.{generation}.bloom.npy",
+        }
+        keys = np.lib.format.open_memmap(
+            os.path.join(self.path, files["keys"]), mode="w+", dtype=np.uint64, shape=(words, total)
+        )
+        labels = np.lib.format.open_memmap(
+            os.path.join(self.path, files["labels"]), mode="w+", dtype=np.uint16, shape=(total,)
+        )
+        n_bits = max(total * bits_per_key, 64) // 8 * 8
+        n_hashes = max(1, round(bits_per_key * np.log(2)))
+        bloom = np.zeros(n_bits // 8, dtype=np.uint8)
+
+        offset = 0
+        for bucket, size in enumerate(sizes):
+            if not size:
+                continue
+            path = os.path.join(work, f"{kind}.{bucket:03d}.sorted")
+            rows = np.fromfile(path, dtype=np.uint64).reshape(-1, words + 1)
+            keys[:, offset:offset + size] = rows[:, :words].T
+            labels[offset:offset + size] = rows[:, words]
+            _bloom_add(bloom, rows[:, :words], n_bits, n_hashes)
+            offset += size
+            os.unlink(path)
+        keys.flush()
+        labels.flush()
+        del keys, labels
+        np.save(os.path.join(self.path, files["bloom"]), bloom)
+
+        return {"files": files, "bloom_hashes": n_hashes, "count": total}
+
+    def _remove_stale_files(self):
+        """Delete table files no longer referenced (open mappings stay valid)"""
+        live = {name for table in self.tables.values() for name in table.files.values()}
+        for name in os.listdir(self.path):
+            if name.endswith(".npy") and name not in live:
+                try:
+                    os.unlink(os.path.join(self.path, name))
+                except OSError:
+                    pass
+
+
+def _bloom_add(bloom: np.ndarray, keys: np.ndarray, n_bits: int, n_hashes: int):
+    positions = bloom_positions(keys, n_bits, n_hashes).ravel()
+    byte_index = (positions >> np.uint64(3)).astype(np.int64)
+    masks = (np.uint8(1) << (positions & np.uint64(7)).astype(np.uint8)).astype(np.uint8)
+    order = np.argsort(byte_index, kind="stable")
+    byte_index, masks = byte_index[order], masks[order]
+    starts = np.flatnonzero(np.r_[True, byte_index[1:] != byte_index[:-1]])
+    bloom[byte_index[starts]] |= np.bitwise_or.reduceat(masks, starts)
+
+
+def _read_feed(path: str, chunk_lines: int = IMPORT_CHUNK_LINES) -> Iterator[List[str]]:
+    opener = gzip.open if path.endswith(".gz") else open
+    with opener(path, "rt", encoding="utf-8", errors="replace") as f:
+        chunk = []
+        for line in f:
+            chunk.append(line)
+            if len(chunk) >= chunk_lines:
+                yield chunk
+                chunk = []
+        if chunk:
+            yield chunk
+
+
+def _parse_feed_lines(lines: List[str], label_ids: Dict[str, int], label_names: List[str]
+                      ) -> Tuple[Dict[str, Tuple[List[str], List[int]]], int]:
+    """Digests and label ids per hash type; blank lines and comments are skipped"""
+    parsed: Dict[str, Tuple[List[str], List[int]]] = {}
+    invalid = 0
+    for line in lines:
+        match = _FEED_LINE.match(line)
+        if match is None:
+            stripped = line.strip()
+            if stripped and not stripped.startswith("#"):
+                invalid += 1
+            continue
+        digest, label = match.group(1), (match.group(2) or "").strip()
+        label_id = 0
+        if label:
+            label_id = label_ids.get(label)
+            if label_id is None:
+                label_names.append(label)
+                label_id = label_ids[label] = len(label_names)
+        hexes, labels = parsed.setdefault(HASH_TYPES[len(digest)], ([], []))
+        hexes.append(digest)
+        labels.append(label_id)
+    return parsed, invalid
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Import known-bad hash feeds into a hash store")
+    parser.add_argument(
+        "feed", nargs="+", help="Text/CSV feed files (.gz accepted): digest[,family] per line"
+    )
+    parser.add_argument(
+        "--store", default=os.getenv("HASH_STORE_PATH", DEFAULT_STORE_PATH), help="Store directory"
+    )
+    parser.add_argument(
+        "--bits-per-key", type=int, default=BLOOM_BITS_PER_KEY, help="Bloom filter size per hash"
+    )
+    args = parser.parse_args()
+    store = KnownHashStore(args.store)
+    print(json.dumps(store.import_feeds(args.feed, args.bits_per_key)))
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    main()
@@ -0,0 +1,227 @@
+"""
+MalwareHunter ML Engine - Result Cache
+Analysis results shared across endpoints, keyed by sample SHA-256 and engine version
+"""
+
+import asyncio
+import hashlib
+import inspect
+import json
+import logging
+import os
+import re
+import sqlite3
+import time
+from collections import OrderedDict
+from threading import RLock
+from typing import Any, Callable, Dict, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+CacheKey = Tuple[str, str, str]  # (analyzer, engine version, sha256)
+
+_SHA256 = re.compile(r"^[0-9a-f]{64}$")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS results (
+    analyzer TEXT NOT NULL,
+    version TEXT NOT NULL,
+    sha256 TEXT NOT NULL,
+    result TEXT NOT NULL,
+    stored_at REAL NOT NULL,
+    PRIMARY KEY (analyzer, version, sha256)
+) WITHOUT ROWID;
+"""
+
+
+def sha256_key(value: Optional[str]) -> Optional[str]:
+    """Normalized SHA-256 hex digest, or None if the value is not one"""
+    value = (value or "").strip().lower()
+    return value if _SHA256.match(value) else None
+
+
+def input_key(sha256: Optional[str], inputs: Dict[str, Any]) -> Optional[str]:
+    """
+    Cache key for a result that also depends on request fields other than
+    the sample's bytes: the SHA-256 followed by a digest of those fields.
+    """
+    if sha256 is None:
+        return None
+    digest = hashlib.sha256(json.dumps(inputs, sort_keys=True, default=str).encode()).hexdigest()
+    return f"{sha256}:{digest[:16]}"
+
+
+class ResultCache:
+    """
+    LRU cache of analysis results.
+
+    Entries are keyed by (analyzer, engine version, SHA-256), so a new model
+    or rule version never serves stale results. When `path` is set, entries
+    evicted from memory spill to a SQLite file and are promoted back on
+    their next hit. Concurrent requests for the same key share one
+    computation: the first caller starts it and later callers await the
+    same task. Cached results are shared; callers must not mutate them.
+    """
+
+    def __init__(self, max_entries: Optional[int] = None, path: Optional[str] = None):
+        self.max_entries = max_entries or int(os.getenv("RESULT_CACHE_SIZE", "10000"))
+        self.path = path if path is not None else os.getenv("RESULT_CACHE_PATH")
+        self._entries: "OrderedDict[CacheKey, Dict[str, Any]]" = OrderedDict()
+        self._inflight: Dict[CacheKey, asyncio.Task] = {}
+        self._waiters: Dict[CacheKey, int] = {}
+        self._lock = RLock()
+        self.counters = {"hits": 0, "disk_hits": 0, "misses": 0, "coalesced": 0, "spilled": 0}
+
+        self.conn = None
+        if self.path:
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            self.conn = sqlite3.connect(self.path, check_same_thread=False)
+            self.conn.execute("PRAGMA journal_mode=WAL")
+            self.conn.execute("PRAGMA synchronous=NORMAL")
+            self.conn.executescript(_SCHEMA)
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, analyzer: str, version: str, sha256: str) -> Optional[Dict[str, Any]]:
+        key = (analyzer, version, sha256)
+        with self._lock:
+            result = self._entries.get(key)
+            if result is not None:
+                self._entries.move_to_end(key)
+                self.counters["hits"] += 1
+                return result
+            if self.conn is not None:
+                row = self.conn.execute(
+                    "SELECT result FROM results WHERE analyzer = ? AND version = ? AND sha256 = ?",
+                    key,
+                ).fetchone()
+                if row is not None:
+                    self.counters["disk_hits"] += 1
+                    result = json.loads(row[0])
+                    self._insert(key, result)
+                    return result
+            self.counters["misses"] += 1
+            return None
+
+    def put(self, analyzer: str, version: str, sha256: str, result: Dict[str, Any]):
+        with self._lock:
+            self._insert((analyzer, version, sha256), result)
+
+    def _insert(self, key: CacheKey, result: Dict[str, Any]):
+        self._entries[key] = result
+        self._entries.move_to_end(key)
+        if len(self._entries) <= self.max_entries:
+            return
+        evicted = []
+        while len(self._entries) > self.max_entries:
+            evicted.append(self._entries.popitem(last=False))
+        self._spill(evicted)
+
+    def _spill(self, entries):
+        if self.conn is None or not entries:
+            return
+        now = time.time()
+        with self.conn:
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO results VALUES (?, ?, ?, ?, ?)",
+                [(*key, json.dumps(result, default=str), now) for key, result in entries],
+            )
+        self.counters["spilled"] += len(entries)
+
+    async def get_or_compute(self, analyzer: str, version: str, sha256: Optional[str],
+                             compute: Callable[[], Any],
+                             on_skip: Optional[Callable[[], None]] = None,
+                             versioned: bool = False) -> Dict[str, Any]:
+        """
+        Cached result for the key, computing it on a miss: awaited if
+        `compute` is a coroutine function, otherwise run in a worker thread.
+        Without a SHA-256 the result is computed and not cached. `on_skip` is
+        called when `compute` will not run (cache hit or coalesced request),
+        e.g. to release resources the computation would have cleaned up.
+        With `versioned`, `compute` returns (version, result) and the result
+        is stored under the version it was actually computed with, which
+        may be newer or older than the one it was looked up by.
+        """
+        if sha256 is None:
+            return await self._run(compute)
+
+        key = (analyzer, version, sha256)
+        task = self._inflight.get(key)
+        result = self.get(*key) if task is None else None
+        if result is not None:
+            if on_skip is not None:
+                on_skip()
+            return result
+
+        if task is None:
+            task = asyncio.ensure_future(self._compute(key, compute, versioned))
+            self._inflight[key] = task
+        else:
+            with self._lock:
+                self.counters["coalesced"] += 1
+            if on_skip is not None:
+                on_skip()
+
+        # The work is shared, so it is only cancelled once every caller waiting
+        # on it has gone away
+        self._waiters[key] = self._waiters.get(key, 0) + 1
+        try:
+            return await asyncio.shield(task)
+        except asyncio.CancelledError:
+            if self._waiters[key] == 1 and not task.done():
+                task.cancel()
+            raise
+        finally:
+            self._waiters[key] -= 1
+            if not self._waiters[key]:
+                del self._waiters[key]
+
+    @staticmethod
+    async def _run(compute: Callable[[], Any]) -> Dict[str, Any]:
+        if inspect.iscoroutinefunction(compute):
+            return await compute()
+        return await asyncio.to_thread(compute)
+
+    async def _compute(self, key: CacheKey, compute: Callable[[], Any],
+                       versioned: bool = False) -> Dict[str, Any]:
+        try:
+            result = await self._run(compute)
+            analyzer, version, sha256 = key
+            if versioned:
+                version, result = result
+            self.put(analyzer, version, sha256, result)
+            return result
+        finally:
+            self._inflight.pop(key, None)
+
+    def flush(self):
+        """Write every in-memory entry to the disk store"""
+        with self._lock:
+            self._spill(list(self._entries.items()))
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            if self.conn is not None:
+                with self.conn:
+                    self.conn.execute("DELETE FROM results")
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            stats = {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "in_flight": len(self._inflight),
+                **self.counters,
+            }
+            if self.conn is not None:
+                stats["disk_path"] = self.path
+                stats["disk_entries"] = self.conn.execute("SELECT COUNT(*) FROM results").fetchone()[0]
+        return stats
+
+    def close(self):
+        if self.conn is not None:
+            self.flush()
+            self.conn.close()
+            self.conn = None
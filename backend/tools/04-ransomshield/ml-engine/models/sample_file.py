@@ -0,0 +1,385 @@
+"""
+MalwareHunter ML Engine - Sample File
+Spooling, memory-mapped scanning and lazy PE parsing of submitted samples
+"""
+
+import hashlib
+import logging
+import mmap
+import os
+import re
+import struct
+import tempfile
+from functools import cached_property
+from typing import Any, AsyncIterator, Dict, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Bytes read (or viewed through the mmap) at a time
+CHUNK_SIZE = 8 * 1024 * 1024
+
+# Shortest printable run reported as a string, and the longest kept verbatim
+MIN_STRING_LENGTH = 6
+MAX_STRING_LENGTH = 4096
+
+IOC_PATTERNS = {
+    "url": r"https?://[^\s\"'<>]{4,}",
+    "ipv4": r"\b(?:(?:25[0-5]|2[0-4]\d|1?\d?\d)\.){3}(?:25[0-5]|2[0-4]\d|1?\d?\d)\b",
+    "onion": r"\b(?:[a-z2-7]{56}|[a-z2-7]{16})\.onion\b",
+    "bitcoin": r"\b(?:bc1[ac-hj-np-z02-9]{25,62}|[13][a-km-zA-HJ-NP-Z1-9]{25,34})\b",
+    "email": r"\b[\w.+-]{1,64}@[A-Za-z0-9-]{1,63}\.[A-Za-z0-9.-]{2,63}\b",
+    "registry": r"\b(?i:HKEY_[A-Z_]+|HKLM|HKCU)\\[^\s\"']+",
+}
+_IOC_RE = re.compile("|".join(f"(?P<{name}>{p})" for name, p in IOC_PATTERNS.items()))
+
+# Magic numbers for the file types we recognise
+MAGIC = [
+    (b"\x7fELF", "ELF"),
+    (b"%PDF", "PDF"),
+    (b"PK\x03\x04", "ZIP"),
+    (b"\xd0\xcf\x11\xe0\xa1\xb1\x1a\xe1", "OLE"),
+    (b"Rar!", "RAR"),
+    (b"7z\xbc\xaf\x27\x1c", "7Z"),
+    (b"#!", "SCRIPT"),
+]
+
+IMAGE_SCN_MEM_EXECUTE = 0x20000000
+MAX_SECTIONS = 96
+MAX_IMPORT_DLLS = 1024
+MAX_IMPORTS = 65536
+
+
+def entropy_from_counts(counts: np.ndarray) -> float:
+    """Shannon entropy in bits per byte from a 256-bin byte histogram"""
+    total = counts.sum()
+    if total == 0:
+        return 0.0
+    p = counts[counts > 0] / total
+    return float(-(p * np.log2(p)).sum())
+
+
+def _printable(units: np.ndarray) -> np.ndarray:
+    return (units >= 0x20) & (units <= 0x7E)
+
+
+def _runs(mask: np.ndarray, min_length: int = MIN_STRING_LENGTH) -> Tuple[np.ndarray, np.ndarray]:
+    """Start and end indexes of runs of True at least `min_length` long"""
+    padded = np.zeros(len(mask) + 2, dtype=bool)
+    padded[1:-1] = mask
+    edges = np.flatnonzero(padded[1:] != padded[:-1])
+    starts, ends = edges[::2], edges[1::2]
+    long_enough = ends - starts >= min_length
+    return starts[long_enough], ends[long_enough]
+
+
+async def spool_stream(
+    chunks: AsyncIterator[bytes],
+    directory: Optional[str] = None,
+    max_bytes: Optional[int] = None,
+) -> Tuple[str, int, str, str]:
+    """
+    Write an async byte stream to a temporary file, hashing it on the way.
+    Returns (path, size, sha256, md5); raises ValueError past `max_bytes`.
+    """
+    sha256, md5 = hashlib.sha256(), hashlib.md5()
+    size = 0
+    fd, path = tempfile.mkstemp(prefix="sample-", dir=directory)
+    try:
+        with os.fdopen(fd, "wb") as f:
+            async for chunk in chunks:
+                size += len(chunk)
+                if max_bytes is not None and size > max_bytes:
+                    raise ValueError(f"Sample exceeds {max_bytes} bytes")
+                sha256.update(chunk)
+                md5.update(chunk)
+                f.write(chunk)
+    except BaseException:
+        os.unlink(path)
+        raise
+    return path, size, sha256.hexdigest(), md5.hexdigest()
+
+
+class SampleFile:
+    """
+    A sample on disk, memory-mapped read-only.
+
+    Every scan walks the mapping in CHUNK_SIZE windows, so memory use stays
+    constant regardless of file size; PE structures are parsed on first use.
+    Use as a context manager (or call close()) to release the mapping.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._file = open(path, "rb")
+        self.size = os.fstat(self._file.fileno()).st_size
+        self._mm = (
+            mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ) if self.size else None
+        )
+
+    def close(self):
+        if self._mm is not None:
+            self._mm.close()
+            self._mm = None
+        self._file.close()
+
+    def __enter__(self) -> "SampleFile":
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def read(self, offset: int, length: int) -> bytes:
+        """Bytes at a file offset (short or empty when out of range)"""
+        if self._mm is None or offset < 0 or offset >= self.size:
+            return b""
+        return self._mm[offset:offset + length]
+
+    def _chunks(self, start: int = 0, end: Optional[int] = None) -> Iterator[memoryview]:
+        end = self.size if end is None else min(end, self.size)
+        if self._mm is None:
+            return
+        view = memoryview(self._mm)
+        try:
+            for offset in range(max(start, 0), end, CHUNK_SIZE):
+                chunk = view[offset:min(offset + CHUNK_SIZE, end)]
+                yield chunk
+                chunk.release()
+        finally:
+            view.release()
+
+    # Whole-file measurements
+
+    def hashes(self) -> Dict[str, str]:
+        sha256, md5 = hashlib.sha256(), hashlib.md5()
+        for chunk in self._chunks():
+            sha256.update(chunk)
+            md5.update(chunk)
+        return {"sha256": sha256.hexdigest(), "md5": md5.hexdigest()}
+
+    def byte_histogram(self, start: int = 0, end: Optional[int] = None) -> np.ndarray:
+        counts = np.zeros(256, dtype=np.int64)
+        for chunk in self._chunks(start, end):
+            counts += np.bincount(np.frombuffer(chunk, dtype=np.uint8), minlength=256)
+        return counts
+
+    def entropy(self, start: int = 0, end: Optional[int] = None) -> float:
+        return entropy_from_counts(self.byte_histogram(start, end))
+
+    @cached_property
+    def file_type(self) -> str:
+        head = self.read(0, 8)
+        if head[:2] == b"MZ":
+            if self.pe is None:
+                return "MZ"
+            return "PE32+" if self.pe["is_64"] else "PE32"
+        for magic, name in MAGIC:
+            if head.startswith(magic):
+                return name
+        return "unknown"
+
+    def strings(self, keep: int = 50) -> Dict[str, Any]:
+        """
+        ASCII and UTF-16LE strings: counts, the first `keep` of them, and
+        the IOCs (URLs, IPs, onion and bitcoin addresses, emails, registry
+        keys) found in any of them. Runs are located with NumPy masks per
+        chunk, so a string straddling a chunk boundary counts as two.
+        """
+        counts = {"ascii": 0, "utf16": 0}
+        sample: List[str] = []
+        iocs: Dict[str, set] = {name: set() for name in IOC_PATTERNS}
+
+        for chunk in self._chunks():
+            data = np.frombuffer(chunk, dtype=np.uint8)
+            # UTF-16LE characters may start at either byte parity
+            candidates = [("ascii", data)] + [
+                ("utf16", data[phase:phase + (len(data) - phase) // 2 * 2].reshape(-1, 2))
+                for phase in (0, 1)
+            ]
+            for kind, units in candidates:
+                if kind == "ascii":
+                    chars, printable = units, _printable(units)
+                else:
+                    chars, printable = units[:, 0], _printable(units[:, 0]) & (units[:, 1] == 0)
+                starts, ends = _runs(printable)
+                counts[kind] += len(starts)
+                if not len(starts):
+                    continue
+                raw = chars.tobytes()
+                for start, end in zip(starts[: keep - len(sample)].tolist(), ends.tolist()):
+                    sample.append(raw[start:min(end, start + MAX_STRING_LENGTH)].decode())
+
+                # All of the chunk's strings, newline-separated, in one regex pass
+                text = b"\n".join(raw[s:e] for s, e in zip(starts.tolist(), ends.tolist()))
+                for ioc in _IOC_RE.finditer(text.decode("ascii")):
+                    values = iocs[ioc.lastgroup]
+                    if len(values) < 100:
+                        values.add(ioc.group())
+            del data, candidates, units, chars
+
+        return {
+            "counts": counts,
+            "sample": sample,
+            "iocs": {name: sorted(values) for name, values in iocs.items() if values},
+        }
+
+    def find_patterns(self, patterns: List[str]) -> List[str]:
+        """Which of the ASCII literal patterns occur anywhere in the file (case-insensitive)"""
+        needles = {p: p.lower().encode() for p in patterns}
+        overlap = max((len(n) for n in needles.values()), default=1) - 1
+        found = set()
+        for offset in range(0, self.size, CHUNK_SIZE):
+            window = self.read(offset, CHUNK_SIZE + overlap).lower()
+            found.update(p for p, needle in needles.items() if p not in found and needle in window)
+            if len(found) == len(needles):
+                break
+        return [p for p in patterns if p in found]
+
+    # PE parsing
+
+    def _rva_to_offset(self, rva: int) -> Optional[int]:
+        for section in self.pe["sections"]:
+            start = section["virtual_address"]
+            span = max(section["virtual_size"], section["raw_size"])
+            if start <= rva < start + span:
+                offset = rva - start + section["raw_offset"]
+                return offset if offset < self.size else None
+        return None
+
+    def _cstring(self, offset: Optional[int], limit: int = 256) -> str:
+        if offset is None:
+            return ""
+        raw = self.read(offset, limit)
+        return raw.split(b"\x00", 1)[0].decode("ascii", "replace")
+
+    @cached_property
+    def pe(self) -> Optional[Dict[str, Any]]:
+        """
+        PE headers and section table, or None if the file is not a PE.
+        Headers cut short after the optional header magic still parse, with
+        "truncated" set and the missing directories and sections left out.
+        """
+        if self.read(0, 2) != b"MZ" or self.size < 0x40:
+            return None
+        raw = self.read(0x3C, 4)
+        if len(raw) < 4:
+            return None
+        e_lfanew = struct.unpack("<I", raw)[0]
+        if self.read(e_lfanew, 4) != b"PE\x00\x00":
+            return None
+        coff = self.read(e_lfanew + 4, 20)
+        if len(coff) < 20:
+            return None
+        machine, n_sections, timestamp, _, _, optional_size, characteristics = struct.unpack(
+            "<HHIIIHH", coff
+        )
+
+        optional = e_lfanew + 24
+        raw = self.read(optional, 2)
+        if len(raw) < 2:
+            return None
+        magic = struct.unpack("<H", raw)[0]
+        if magic not in (0x10B, 0x20B):
+            return None
+        is_64 = magic == 0x20B
+        truncated = False
+        directories_at = optional + (112 if is_64 else 96)
+        count_raw = self.read(directories_at - 4, 4)
+        if len(count_raw) == 4:
+            n_directories = min(struct.unpack("<I", count_raw)[0], 16)
+        else:
+            n_directories, truncated = 0, True
+        directories = []
+        for i in range(n_directories):
+            entry = self.read(directories_at + 8 * i, 8)
+            if len(entry) < 8:
+                truncated = True
+                break
+            directories.append(struct.unpack("<II", entry))
+        directories += [(0, 0)] * (16 - len(directories))
+
+        sections = []
+        table = optional + optional_size
+        for i in range(min(n_sections, MAX_SECTIONS)):
+            header = self.read(table + 40 * i, 40)
+            if len(header) < 40:
+                truncated = True
+                break
+            name, virtual_size, virtual_address, raw_size, raw_offset = struct.unpack(
+                "<8sIIII", header[:24]
+            )
+            section_flags = struct.unpack("<I", header[36:40])[0]
+            sections.append({
+                "name": name.rstrip(b"\x00").decode("ascii", "replace"),
+                "virtual_address": virtual_address,
+                "virtual_size": virtual_size,
+                "raw_offset": raw_offset,
+                "raw_size": raw_size,
+                "executable": bool(section_flags & IMAGE_SCN_MEM_EXECUTE),
+            })
+
+        return {
+            "machine": machine,
+            "is_64": is_64,
+            "timestamp": timestamp,
+            "characteristics": characteristics,
+            "sections": sections,
+            "import_directory": directories[1],
+            # The security directory holds a file offset, not an RVA
+            "signed": directories[4][0] > 0 and directories[4][1] > 0,
+            "is_dotnet": directories[14][1] > 0,
+            "truncated": truncated,
+        }
+
+    @cached_property
+    def imports(self) -> Dict[str, List[str]]:
+        """Imported function names (or #ordinals) per DLL, from the import directory"""
+        if self.pe is None or not self.pe["import_directory"][0]:
+            return {}
+        thunk_size = 8 if self.pe["is_64"] else 4
+        thunk_format = "<Q" if self.pe["is_64"] else "<I"
+        ordinal_flag = 1 << (thunk_size * 8 - 1)
+
+        imports: Dict[str, List[str]] = {}
+        total = 0
+        descriptor = self._rva_to_offset(self.pe["import_directory"][0])
+        for _ in range(MAX_IMPORT_DLLS):
+            raw = self.read(descriptor, 20) if descriptor is not None else b""
+            if len(raw) < 20 or raw == b"\x00" * 20:
+                break
+            original_thunk, _, _, name_rva, first_thunk = struct.unpack("<IIIII", raw)
+            dll = self._cstring(self._rva_to_offset(name_rva)).lower()
+            functions = imports.setdefault(dll, [])
+            thunk = self._rva_to_offset(original_thunk or first_thunk)
+            while thunk is not None and total < MAX_IMPORTS:
+                entry = self.read(thunk, thunk_size)
+                if len(entry) < thunk_size:
+                    break
+                value = struct.unpack(thunk_format, entry)[0]
+                if value == 0:
+                    break
+                if value & ordinal_flag:
+                    functions.append(f"#{value & 0xFFFF}")
+                else:
+                    hint_name = self._rva_to_offset(value & 0x7FFFFFFF)
+                    functions.append(self._cstring(hint_name + 2 if hint_name is not None else None))
+                total += 1
+                thunk += thunk_size
+            descriptor += 20
+        return imports
+
+    def section_entropy(self) -> List[Dict[str, Any]]:
+        """Sections with the entropy of their raw data"""
+        if self.pe is None:
+            return []
+        return [
+            {
+                **section,
+                "entropy": round(
+                    self.entropy(section["raw_offset"], section["raw_offset"] + section["raw_size"]),
+                    3,
+                ),
+            }
+            for section in self.pe["sections"]
+        ]
@@ -0,0 +1,317 @@
+"""
+MalwareHunter ML Engine - Analysis Worker Pool
+Runs the CPU-bound analyzers in worker processes with bounded queueing and per-sample timeouts
+"""
+
+import asyncio
+import logging
+import multiprocessing
+import os
+from threading import Lock
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+def build_analyzers() -> Dict[str, Callable[[Dict[str, Any]], Any]]:
+    """
+    Analyzer entry points by job kind; each worker process builds its own.
+    An analyzer is constructed on the first job that needs it, so a worker
+    only holds the models for the kinds of job it has actually run.
+    """
+    from .behavior_predictor import BehaviorPredictor
+    from .malware_classifier import MalwareClassifier
+    from .static_analyzer import StaticAnalyzer
+
+    instances: Dict[type, Any] = {}
+    lock = Lock()
+
+    def lazy(cls: type, method: Callable[[Any, Dict[str, Any]], Any]):
+        def run(sample: Dict[str, Any]):
+            with lock:
+                if cls not in instances:
+                    instances[cls] = cls()
+            return method(instances[cls], sample)
+        return run
+
+    return {
+        # (cache version, verdict); the API process saves the fuzzy index
+        # periodically after loads and the classifier picks that up
+        "classify": lazy(MalwareClassifier, MalwareClassifier.classify_versioned),
+        "static": lazy(StaticAnalyzer, StaticAnalyzer.analyze),
+        "static_file": lazy(StaticAnalyzer, lambda analyzer, job: analyzer.analyze_file(job["path"], job)),
+        "behavior": lazy(BehaviorPredictor, BehaviorPredictor.predict),
+    }
+
+
+def _worker_main(conn):
+    """Worker process: answer (kind, sample) jobs until the pipe closes"""
+    logging.basicConfig(
+        level=logging.INFO,
+        format=f"%(asctime)s - worker-{os.getpid()} - %(name)s - %(levelname)s - %(message)s"
+    )
+    analyzers = build_analyzers()
+    conn.send(("ready", None))
+    while True:
+        try:
+            job = conn.recv()
+        except (EOFError, KeyboardInterrupt):
+            break
+        if job is None:
+            break
+        kind, sample = job
+        try:
+            conn.send(("ok", analyzers[kind](sample)))
+        except Exception as e:
+            conn.send(("error", f"{type(e).__name__}: {e}"))
+
+
+class WorkerError(Exception):
+    """An analyzer raised inside a worker, or the worker died"""
+
+
+class _Job:
+    __slots__ = ("kind", "sample", "timeout", "future")
+
+    def __init__(self, kind: str, sample: Dict[str, Any], timeout: float,
+                 future: asyncio.Future):
+        self.kind = kind
+        self.sample = sample
+        self.timeout = timeout
+        self.future = future
+
+
+class _Worker:
+    """One worker process and the pipe to it"""
+
+    def __init__(self, context):
+        self.conn, child = context.Pipe()
+        self.process = context.Process(target=_worker_main, args=(child,), daemon=True)
+        self.process.start()
+        child.close()
+
+    async def receive(self, timeout: Optional[float] = None):
+        """Next message from the worker, waiting on the pipe without blocking the loop"""
+        loop = asyncio.get_running_loop()
+        readable = loop.create_future()
+
+        def on_readable():
+            if not readable.done():
+                readable.set_result(None)
+
+        fd = self.conn.fileno()
+        loop.add_reader(fd, on_readable)
+        try:
+            await asyncio.wait_for(readable, timeout)
+        finally:
+            loop.remove_reader(fd)
+        return self.conn.recv()
+
+    def kill(self):
+        self.process.kill()
+        self.process.join(5)
+        self.conn.close()
+
+
+class AnalysisPool:
+    """
+    Pool of analyzer worker processes.
+
+    Jobs wait in a bounded queue; `submit` blocks while it is full, which
+    pushes back on callers instead of buffering unbounded work. Each worker
+    runs one job at a time. A job that exceeds its timeout has its worker
+    killed and replaced, so a pathological sample cannot hold a core; so
+    does a job whose caller goes away while it runs, and one whose caller
+    goes away before it starts is skipped. A worker that fails
+    to start is retried with exponential backoff. With no workers the
+    analyzers run in threads of the calling process instead.
+    """
+
+    def __init__(self, workers: Optional[int] = None, queue_depth: Optional[int] = None,
+                 timeout: Optional[float] = None):
+        self.workers = (
+            workers if workers is not None
+            else int(os.getenv("ANALYSIS_WORKERS", str(os.cpu_count() or 1)))
+        )
+        self.queue_depth = queue_depth or int(os.getenv("ANALYSIS_QUEUE_DEPTH", "64"))
+        self.timeout = timeout or float(os.getenv("ANALYSIS_TIMEOUT", "60"))
+        self.retry_delay = float(os.getenv("ANALYSIS_WORKER_RETRY_DELAY", "1"))
+        self.retry_max_delay = float(os.getenv("ANALYSIS_WORKER_RETRY_MAX_DELAY", "60"))
+        self.counters = {
+            "completed": 0, "failed": 0, "timed_out": 0, "skipped": 0,
+            "cancelled": 0, "restarts": 0, "start_failures": 0,
+        }
+        self._context = multiprocessing.get_context("spawn")
+        self._queue: Optional[asyncio.Queue] = None
+        self._dispatchers: List[asyncio.Task] = []
+        self._busy = 0
+        # Workers currently failing to start
+        self._down = set()
+        self._local: Optional[Dict[str, Callable]] = None
+
+    async def start(self):
+        self._queue = asyncio.Queue(maxsize=self.queue_depth)
+        if self.workers <= 0:
+            self._local = await asyncio.to_thread(build_analyzers)
+            logger.info("Analysis pool running analyzers in threads")
+            return
+        self._dispatchers = [
+            asyncio.create_task(self._dispatch(i)) for i in range(self.workers)
+        ]
+        logger.info(f"Analysis pool started with {self.workers} workers")
+
+    async def stop(self):
+        for task in self._dispatchers:
+            task.cancel()
+        await asyncio.gather(*self._dispatchers, return_exceptions=True)
+        self._dispatchers = []
+        self._down.clear()
+
+    async def submit(self, kind: str, sample: Dict[str, Any],
+                     timeout: Optional[float] = None) -> Dict[str, Any]:
+        """
+        Run one analyzer job and return its result. Raises TimeoutError past
+        the timeout and WorkerError when the analyzer fails.
+        """
+        timeout = timeout or self.timeout
+        if self._queue is None:
+            raise RuntimeError("Analysis pool is not started")
+
+        if self._local is not None:
+            try:
+                result = await asyncio.wait_for(
+                    asyncio.to_thread(self._local[kind], sample), timeout
+                )
+            except asyncio.TimeoutError:
+                self.counters["timed_out"] += 1
+                raise TimeoutError(f"{kind} exceeded {timeout:.0f}s") from None
+            except Exception as e:
+                self.counters["failed"] += 1
+                raise WorkerError(f"{type(e).__name__}: {e}") from e
+            self.counters["completed"] += 1
+            return result
+
+        if len(self._down) == len(self._dispatchers) or all(task.done() for task in self._dispatchers):
+            raise WorkerError("No analysis workers are running")
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put(_Job(kind, sample, timeout, future))
+        return await future
+
+    async def _start_worker(self) -> _Worker:
+        worker = _Worker(self._context)
+        try:
+            await worker.receive()
+        except Exception:
+            worker.kill()
+            raise
+        return worker
+
+    async def _start_worker_retrying(self, index: int) -> _Worker:
+        """Start worker `index`, retrying with exponential backoff until it comes up"""
+        delay = self.retry_delay
+        while True:
+            try:
+                worker = await self._start_worker()
+            except Exception as e:
+                self.counters["start_failures"] += 1
+                self._down.add(index)
+                logger.error(f"Worker {index} failed to start: {e!r}; retrying in {delay:g}s")
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, self.retry_max_delay)
+                continue
+            if index in self._down:
+                self._down.discard(index)
+                logger.info(f"Worker {index} started")
+            return worker
+
+    async def _dispatch(self, index: int):
+        worker = await self._start_worker_retrying(index)
+        try:
+            while True:
+                job = await self._queue.get()
+                if job.future.done():
+                    # The caller gave up while the job was queued
+                    self.counters["skipped"] += 1
+                    continue
+
+                self._busy += 1
+                try:
+                    reply = await self._run(worker, job)
+                    if reply is None:
+                        # The caller gave up while the job was running; the
+                        # worker is still busy with it, so replace it
+                        self.counters["cancelled"] += 1
+                        logger.info(f"Caller cancelled a {job.kind} job on worker {index}; restarting it")
+                        worker = await self._restart(index, worker)
+                        continue
+                    status, value = reply
+                except asyncio.TimeoutError:
+                    self.counters["timed_out"] += 1
+                    logger.warning(
+                        f"Worker {index} exceeded {job.timeout:.0f}s on a {job.kind} job; restarting it"
+                    )
+                    self._fail(job, TimeoutError(f"{job.kind} exceeded {job.timeout:.0f}s"))
+                    worker = await self._restart(index, worker)
+                    continue
+                except (EOFError, OSError) as e:
+                    self.counters["failed"] += 1
+                    logger.error(f"Worker {index} died on a {job.kind} job: {e}")
+                    self._fail(job, WorkerError("Worker process died"))
+                    worker = await self._restart(index, worker)
+                    continue
+                except asyncio.CancelledError:
+                    self._fail(job, WorkerError("Analysis pool stopped"))
+                    raise
+                finally:
+                    self._busy -= 1
+
+                if status == "ok":
+                    self.counters["completed"] += 1
+                    if not job.future.done():
+                        job.future.set_result(value)
+                else:
+                    self.counters["failed"] += 1
+                    self._fail(job, WorkerError(value))
+        finally:
+            try:
+                worker.conn.send(None)
+                worker.process.join(1)
+            except (OSError, ValueError):
+                pass
+            if worker.process.is_alive():
+                worker.kill()
+
+    @staticmethod
+    async def _run(worker: _Worker, job: _Job) -> Optional[Tuple[str, Any]]:
+        """The worker's reply to the job, or None if its caller cancelled it first"""
+        worker.conn.send((job.kind, job.sample))
+        receiving = asyncio.ensure_future(worker.receive(job.timeout))
+        try:
+            await asyncio.wait((receiving, job.future), return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            if not receiving.done():
+                receiving.cancel()
+                await asyncio.wait((receiving,))
+        if receiving.cancelled():
+            return None
+        return receiving.result()
+
+    async def _restart(self, index: int, worker: _Worker) -> _Worker:
+        worker.kill()
+        self.counters["restarts"] += 1
+        return await self._start_worker_retrying(index)
+
+    @staticmethod
+    def _fail(job: _Job, error: Exception):
+        if not job.future.done():
+            job.future.set_exception(error)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "workers": self.workers,
+            "busy": self._busy,
+            "queued": self._queue.qsize() if self._queue is not None else 0,
+            "queue_depth": self.queue_depth,
+            "timeout": self.timeout,
+            **self.counters,
+        }
@@ -8,11 +8,16 @@ from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel, Field
 from typing import List, Optional, Dict, Any
 from datetime import datetime
+from functools import partial
+import asyncio
 import logging
+import os
 
-from models.url_analyzer import URLAnalyzer
+from models.url_analyzer import FEATURES, URLAnalyzer
 from models.content_scanner import ContentScanner
 from models.brand_detector import BrandDetector
+from models.verdict_cache import VerdictCache
+from models.domain_parser import cache_stats as domain_cache_stats
 
 # Configure logging
 logging.basicConfig(
@@ -42,6 +47,39 @@ url_analyzer = URLAnalyzer()
 content_scanner = ContentScanner()
 brand_detector = BrandDetector()
 
+BRAND_BATCH_MAX = int(os.getenv("BRAND_BATCH_MAX", "10000"))
+ANALYZE_BATCH_MAX = int(os.getenv("ANALYZE_BATCH_MAX", "10000"))
+
+
+def verdict_features(url: str) -> str:
+    """
+    What a URL's verdict depends on beyond its host and path shape: the
+    URL feature flags (and the length they report) and the brand names
+    embedded anywhere in it, query values included.
+    """
+    flags, details = url_analyzer.extract_features(url)
+    signature = "".join("1" if flag else "0" for flag in flags)
+    if flags[FEATURES.index("long_url")]:
+        signature += f":{details['length']}"
+    return f"{signature}|{','.join(brand_detector.index.embedded_brands(url))}"
+
+
+# URL verdicts, shared by /analyze/url and /check
+verdict_cache = VerdictCache(features=verdict_features)
+
+
+def compute_verdict(url: str) -> Dict[str, Any]:
+    return compute_verdicts([url])[0]
+
+
+def compute_verdicts(urls: List[str]) -> List[Dict[str, Any]]:
+    results = url_analyzer.analyze_many(urls)
+    brands = brand_detector.detect_many(urls)
+    return [
+        {"risk_level": result["risk_level"], "analysis": result, "brand": brand}
+        for result, brand in zip(results, brands)
+    ]
+
 
 # Pydantic models
 class URLInput(BaseModel):
@@ -88,6 +126,26 @@ class BrandImpersonation(BaseModel):
     is_impersonation: bool
 
 
+class NearestBrandsRequest(BaseModel):
+    domains: List[str]
+    max_distance: Optional[int] = Field(None, ge=0, le=2)
+    limit: int = Field(5, ge=1, le=50)
+
+
+class BrandMatch(BaseModel):
+    brand: str
+    label: str
+    token: str
+    distance: float
+    homoglyph: bool
+    score: float
+
+
+class NearestBrands(BaseModel):
+    domain: str
+    matches: List[BrandMatch]
+
+
 class ModelInfo(BaseModel):
     model_version: str
     last_trained: str
@@ -116,8 +174,11 @@ async def analyze_url(url_input: URLInput):
     try:
         logger.info(f"Analyzing URL {url_input.url_id}")
         
-        result = url_analyzer.analyze(url_input.model_dump())
-        brand_result = brand_detector.detect(url_input.url)
+        verdict = await verdict_cache.get_or_compute(
+            url_input.url, partial(compute_verdict, url_input.url)
+        )
+        result = verdict["analysis"]
+        brand_result = verdict["brand"]
         
         return PhishingResult(
             url_id=url_input.url_id,
@@ -136,18 +197,37 @@ async def analyze_url(url_input: URLInput):
 # Batch analyze URLs
 @app.post("/analyze/batch", response_model=List[PhishingResult])
 async def batch_analyze(urls: List[URLInput]):
-    if len(urls) > 100:
-        raise HTTPException(status_code=400, detail="Maximum 100 URLs per batch")
-    
-    results = []
-    for url in urls:
-        try:
-            result = await analyze_url(url)
-            results.append(result)
-        except Exception as e:
-            logger.error(f"Error analyzing URL {url.url_id}: {e}")
+    if len(urls) > ANALYZE_BATCH_MAX:
+        raise HTTPException(status_code=400, detail=f"Maximum {ANALYZE_BATCH_MAX} URLs per batch")
     
-    return results
+    try:
+        # Cached verdicts first; the rest are analyzed together, once per distinct URL
+        verdicts = {}
+        for url_input in urls:
+            if url_input.url not in verdicts:
+                verdicts[url_input.url] = verdict_cache.get(url_input.url)
+        misses = [url for url, verdict in verdicts.items() if verdict is None]
+        if misses:
+            computed = await asyncio.to_thread(compute_verdicts, misses)
+            for url, verdict in zip(misses, computed):
+                verdict_cache.put(url, verdict)
+                verdicts[url] = verdict
+        
+        return [
+            PhishingResult(
+                url_id=url_input.url_id,
+                url=url_input.url,
+                is_phishing=verdicts[url_input.url]["analysis"]["is_phishing"],
+                confidence=verdicts[url_input.url]["analysis"]["confidence"],
+                risk_level=verdicts[url_input.url]["analysis"]["risk_level"],
+                indicators=verdicts[url_input.url]["analysis"]["indicators"],
+                targeted_brand=verdicts[url_input.url]["brand"].get("brand")
+            )
+            for url_input in urls
+        ]
+    except Exception as e:
+        logger.error(f"Error analyzing URL batch: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
 
 
 # Analyze email content
@@ -192,17 +272,83 @@ async def detect_brand(url_input: URLInput):
         raise HTTPException(status_code=500, detail=str(e))
 
 
+# Detect brand impersonation for many URLs
+@app.post("/detect/brand/batch", response_model=List[BrandImpersonation])
+async def detect_brand_batch(urls: List[URLInput]):
+    if len(urls) > BRAND_BATCH_MAX:
+        raise HTTPException(status_code=400, detail=f"Maximum {BRAND_BATCH_MAX} URLs per batch")
+    try:
+        results = await asyncio.to_thread(brand_detector.detect_many, [u.url for u in urls])
+        return [
+            BrandImpersonation(
+                url=url_input.url,
+                impersonated_brand=result.get("brand"),
+                similarity_score=result["similarity_score"],
+                legitimate_domain=result.get("legitimate_domain"),
+                is_impersonation=result["is_impersonation"]
+            )
+            for url_input, result in zip(urls, results)
+        ]
+    except Exception as e:
+        logger.error(f"Error detecting brands: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+# Nearest protected brands for each domain
+@app.post("/brands/nearest", response_model=List[NearestBrands])
+async def nearest_brands(request: NearestBrandsRequest):
+    if len(request.domains) > BRAND_BATCH_MAX:
+        raise HTTPException(status_code=400, detail=f"Maximum {BRAND_BATCH_MAX} domains per batch")
+    try:
+        def lookup():
+            return [
+                NearestBrands(
+                    domain=domain,
+                    matches=brand_detector.nearest_brands(domain, request.max_distance, request.limit)
+                )
+                for domain in request.domains
+            ]
+        return await asyncio.to_thread(lookup)
+    except Exception as e:
+        logger.error(f"Error finding nearest brands: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+
 # Quick URL check
 @app.get("/check/{url:path}")
 async def quick_check(url: str):
     try:
-        result = url_analyzer.quick_check(url)
-        return result
+        verdict = await verdict_cache.get_or_compute(url, partial(compute_verdict, url))
+        return url_analyzer.summarize(url, verdict["analysis"])
     except Exception as e:
         logger.error(f"Error checking URL: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
 
+# URL verdict cache statistics
+@app.get("/cache/stats")
+async def cache_stats():
+    return {"verdicts": verdict_cache.stats(), "domains": domain_cache_stats()}
+
+
+# Content phrase list statistics
+@app.get("/phrases/stats")
+async def phrase_stats():
+    return content_scanner.phrases.stats()
+
+
+# Recompile the content phrase lists without restarting
+@app.post("/phrases/reload")
+async def reload_phrases():
+    phrases = content_scanner.phrases
+    if not phrases.reload():
+        raise HTTPException(
+            status_code=422, detail="Phrase files failed to load; previous phrases kept"
+        )
+    stats = phrases.stats()
+    return {"status": "reloaded", "version": stats["version"], "phrases": stats["phrases"]}
+
+
 # Get model info
 @app.get("/model-info", response_model=ModelInfo)
 async def get_model_info():
@@ -3,11 +3,13 @@ PhishGuard ML Engine - Brand Detector Model
 Detect brand impersonation in phishing attempts
 """
 
-import numpy as np
+import json
 import logging
-from typing import Dict, Any, Optional
-from urllib.parse import urlparse
-import re
+import os
+from typing import Dict, Any, List, Optional
+
+from .brand_index import BrandIndex
+from .domain_parser import ParsedDomain, parse_domain, parse_url
 
 logger = logging.getLogger(__name__)
 
@@ -17,8 +19,16 @@ class BrandDetector:
     Detect brand impersonation in URLs and content.
     """
     
-    def __init__(self):
-        self.version = "1.0.0"
+    # Lowest fuzzy-match score reported as typosquatting. One edit is a
+    # large share of a short brand name, and 4-6 letter names sit one edit
+    # away from ordinary words (apple/apply, chase/chose), so those need a
+    # closer match: a single adjacent-key slip, or one edit to a 6-letter name.
+    FUZZY_MIN_SCORE = 70
+    SHORT_BRAND_MIN_SCORE = 80
+    SHORT_BRAND_LENGTH = 6
+    
+    def __init__(self, brands_path: Optional[str] = None):
+        self.version = "1.1.0"
         self.is_loaded = True
         
         # Known brands and their legitimate domains
@@ -43,69 +53,106 @@ class BrandDetector:
             "usps": ["usps.com"]
         }
         
-        logger.info(f"Brand Detector v{self.version} loaded")
+        # Customer and partner domains extend the built-in list
+        self.brands_path = brands_path or os.getenv("BRAND_DOMAINS_PATH")
+        if self.brands_path:
+            self.known_brands.update(self._load_brands(self.brands_path))
+        
+        self.index = BrandIndex(
+            self.known_brands,
+            max_distance=int(os.getenv("BRAND_MAX_EDIT_DISTANCE", "2"))
+        )
+        
+        logger.info(f"Brand Detector v{self.version} loaded with {len(self.known_brands)} brands")
+    
+    @staticmethod
+    def _load_brands(path: str) -> Dict[str, List[str]]:
+        """Read a `{"brand": ["domain", ...]}` JSON file"""
+        with open(path) as f:
+            brands = json.load(f)
+        return {
+            brand.strip().lower(): [domain.strip().lower() for domain in domains]
+            for brand, domains in brands.items()
+            if brand.strip() and domains
+        }
     
     def detect(self, url: str) -> Dict[str, Any]:
         """Detect brand impersonation"""
         
         try:
-            parsed = urlparse(url)
-            domain = parsed.netloc.lower()
-            path = parsed.path.lower()
-            full_url = url.lower()
+            _, host = parse_url(url)
+            domain = host.host
+            labels = self._name_labels(host)
             
-            detected_brand = None
-            legitimate_domain = None
-            similarity_score = 0
-            is_impersonation = False
+            # A brand's own domain (or a subdomain of it) is not impersonating it
+            owner = self.index.legitimate_brand(domain)
+            if owner is not None:
+                return self._result(owner, 100, False)
             
-            # Check each brand
-            for brand, legit_domains in self.known_brands.items():
-                # Check if brand name appears in URL
-                if brand in full_url:
-                    detected_brand = brand
-                    legitimate_domain = legit_domains[0]
-                    
-                    # Check if it's actually the legitimate domain
-                    is_legitimate = any(
-                        domain == legit or domain.endswith('.' + legit)
-                        for legit in legit_domains
-                    )
-                    
-                    if is_legitimate:
-                        similarity_score = 100
-                        is_impersonation = False
-                    else:
-                        # Calculate similarity
-                        similarity_score = self._calculate_similarity(domain, legit_domains[0])
-                        is_impersonation = True
-                    
-                    break
-                
-                # Check for typosquatting
-                typosquat_score = self._check_typosquat(domain, brand)
-                if typosquat_score > 70:
-                    detected_brand = brand
-                    legitimate_domain = legit_domains[0]
-                    similarity_score = typosquat_score
-                    is_impersonation = True
-                    break
+            # Brand name anywhere in the URL; the longest (most specific) wins
+            embedded = self.index.embedded_brands(url)
+            if embedded:
+                brand = max(embedded, key=len)
+                legitimate = self.known_brands[brand][0]
+                return self._result(brand, self._calculate_similarity(domain, legitimate), True)
             
-            return {
-                "brand": detected_brand,
-                "legitimate_domain": legitimate_domain,
-                "similarity_score": similarity_score,
-                "is_impersonation": is_impersonation
-            }
+            # Brand spelled with lookalike characters (paypa1-login, аpple)
+            host_name = ".".join(labels) or domain
+            disguised = self.index.homoglyph_brands(host_name)
+            if disguised:
+                return self._result(max(disguised, key=len), 85, True)
+            
+            # Typosquatted host labels (paypall, gogle, micosoft)
+            best = None
+            for token in self.index.tokens(labels):
+                for match in self.index.nearest(token, limit=1):
+                    if match["score"] > self._min_score(match["label"]) and (
+                        best is None or match["score"] > best["score"]
+                    ):
+                        best = match
+            if best is not None:
+                return self._result(best["brand"], best["score"], True)
+            
+            return self._result(None, 0, False)
             
         except Exception as e:
             logger.error(f"Error detecting brand: {e}")
-            return {
-                "brand": None,
-                "legitimate_domain": None,
-                "similarity_score": 0,
-                "is_impersonation": False
-            }
+            return self._result(None, 0, False)
+    
+    def detect_many(self, urls: List[str]) -> List[Dict[str, Any]]:
+        return [self.detect(url) for url in urls]
+    
+    def nearest_brands(self, domain: str, max_distance: Optional[int] = None,
+                       limit: int = 5) -> List[Dict[str, Any]]:
+        """Brands nearest to any label of a domain, best first"""
+        _, host = parse_url(domain)
+        best: Dict[str, Dict[str, Any]] = {}
+        for token in self.index.tokens(self._name_labels(host) or [host.host]):
+            for match in self.index.nearest(token, max_distance, limit):
+                current = best.get(match["brand"])
+                if current is None or match["score"] > current["score"]:
+                    best[match["brand"]] = dict(match, token=token)
+        return sorted(best.values(), key=lambda m: (-m["score"], m["distance"], m["brand"]))[:limit]
+    
+    def _min_score(self, label: str) -> float:
+        if len(label) <= self.SHORT_BRAND_LENGTH:
+            return self.SHORT_BRAND_MIN_SCORE
+        return self.FUZZY_MIN_SCORE
+    
+    @staticmethod
+    def _name_labels(host: ParsedDomain) -> List[str]:
+        """Subdomain labels and the registrable label; the public suffix is left out"""
+        if not host.registrable_domain:
+            return []
+        return (host.subdomain.split(".") if host.subdomain else []) + [host.label]
+    
+    def _result(self, brand: Optional[str], score: float, is_impersonation: bool) -> Dict[str, Any]:
+        return {
+            "brand": brand,
+            "legitimate_domain": self.known_brands[brand][0] if brand else None,
+            "similarity_score": score,
+            "is_impersonation": is_impersonation
+        }
     
     def _calculate_similarity(self, domain: str, legitimate: str) -> float:
         """Calculate domain similarity score"""
@@ -114,8 +161,8 @@ class BrandDetector:
         # In production, would use more sophisticated algorithms
         
         # Remove TLD for comparison
-        domain_base = domain.split('.')[0] if '.' in domain else domain
-        legit_base = legitimate.split('.')[0] if '.' in legitimate else legitimate
+        domain_base = parse_domain(domain).label or domain
+        legit_base = parse_domain(legitimate).label or legitimate
         
         # Check for common typosquat patterns
         patterns = [
@@ -137,43 +184,3 @@ class BrandDetector:
             return min(similarity, 70)
         
         return 0
-    
-    def _check_typosquat(self, domain: str, brand: str) -> float:
-        """Check for typosquatting patterns"""
-        
-        domain_base = domain.split('.')[0]
-        
-        # Common typosquat patterns
-        # Character substitution (e.g., paypa1, paypai)
-        # Character addition (e.g., paypall, ppaypal)
-        # Character omission (e.g., paypl, paypa)
-        # Character swap (e.g., paypla)
-        
-        if len(domain_base) < 3 or len(brand) < 3:
-            return 0
-        
-        # Check for brand with common substitutions
-        substitutions = {
-            'a': ['@', '4'],
-            'e': ['3'],
-            'i': ['1', 'l', '!'],
-            'o': ['0'],
-            's': ['$', '5'],
-            'l': ['1', 'i'],
-        }
-        
-        # Generate variations
-        brand_lower = brand.lower()
-        for char, subs in substitutions.items():
-            for sub in subs:
-                variant = brand_lower.replace(char, sub)
-                if variant in domain_base:
-                    return 85
-        
-        # Check length similarity
-        if abs(len(domain_base) - len(brand)) <= 2:
-            common_chars = sum(1 for c in brand if c in domain_base)
-            if common_chars >= len(brand) - 2:
-                return 75
-        
-        return 0
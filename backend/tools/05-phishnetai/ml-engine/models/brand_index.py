@@ -0,0 +1,267 @@
+"""
+PhishGuard ML Engine - Brand Index
+Confusable-aware SymSpell deletion index over brand domain labels
+"""
+
+import logging
+import re
+import unicodedata
+from collections import defaultdict
+from itertools import combinations
+from typing import Any, Dict, List, Optional, Set
+
+from .phrase_matcher import KeywordAutomaton
+
+logger = logging.getLogger(__name__)
+
+# Characters (and sequences) that render like a Latin letter, folded to one
+# canonical form. Digits and letters that pass for each other share a form,
+# so "paypa1", "paypai" and "paypal" all have the skeleton "paypal".
+CONFUSABLES = {
+    # Digits
+    "0": "o", "1": "l", "3": "e", "4": "a", "5": "s", "7": "t", "8": "b", "9": "g",
+    # Latin lookalikes
+    "i": "l", "|": "l", "!": "l", "@": "a", "$": "s",
+    # Cyrillic
+    "а": "a", "в": "b", "е": "e", "ё": "e", "һ": "h", "і": "l", "ї": "l", "ј": "j",
+    "к": "k", "м": "m", "н": "h", "о": "o", "р": "p", "с": "c", "т": "t", "у": "y",
+    "х": "x", "ѕ": "s", "ԁ": "d", "ԛ": "q", "ԝ": "w", "ո": "n", "ս": "u",
+    # Greek
+    "α": "a", "β": "b", "ε": "e", "η": "n", "ι": "l", "κ": "k", "ν": "v", "ο": "o",
+    "ρ": "p", "τ": "t", "υ": "u", "χ": "x", "ω": "w",
+    # Other scripts and symbols
+    "ɡ": "g", "ɑ": "a", "ı": "l", "ł": "l", "ø": "o", "đ": "d", "ß": "ss",
+}
+MULTI_CONFUSABLES = [("rn", "m"), ("vv", "w"), ("cl", "d")]
+
+_KEYBOARD_ROWS = ["1234567890", "qwertyuiop", "asdfghjkl", "zxcvbnm"]
+
+
+def _keyboard_neighbors() -> Dict[str, Set[str]]:
+    """QWERTY keys adjacent to each key (same row, and the rows above and below)"""
+    neighbors: Dict[str, Set[str]] = defaultdict(set)
+    for r, row in enumerate(_KEYBOARD_ROWS):
+        for c, key in enumerate(row):
+            for dr, dcs in ((0, (-1, 1)), (-1, (0, 1)), (1, (-1, 0))):
+                if 0 <= r + dr < len(_KEYBOARD_ROWS):
+                    other = _KEYBOARD_ROWS[r + dr]
+                    for dc in dcs:
+                        if 0 <= c + dc < len(other):
+                            neighbors[key].add(other[c + dc])
+    return dict(neighbors)
+
+
+KEYBOARD_NEIGHBORS = _keyboard_neighbors()
+
+# A fat-finger substitution costs less than an arbitrary one
+ADJACENT_KEY_COST = 0.5
+
+_MULTI_RE = re.compile("|".join(re.escape(a) for a, _ in MULTI_CONFUSABLES))
+_MULTI_MAP = dict(MULTI_CONFUSABLES)
+_TOKEN_SPLIT = re.compile(r"[^0-9a-zÀ-￿]+")
+
+
+def skeleton(text: str) -> str:
+    """Canonical form of a label: diacritics stripped, confusables folded"""
+    text = unicodedata.normalize("NFKD", text.lower())
+    text = "".join(CONFUSABLES.get(c, c) for c in text if not unicodedata.combining(c))
+    return _MULTI_RE.sub(lambda m: _MULTI_MAP[m.group()], text)
+
+
+def edit_distance(a: str, b: str, limit: float = float("inf")) -> float:
+    """
+    Optimal string alignment distance where substituting a key for an
+    adjacent one on a QWERTY keyboard costs ADJACENT_KEY_COST. Returns a
+    value above `limit` as soon as the distance is known to exceed it.
+    """
+    if abs(len(a) - len(b)) > limit:
+        return limit + 1
+    previous2: List[float] = []
+    previous = [float(j) for j in range(len(b) + 1)]
+    for i in range(1, len(a) + 1):
+        current = [float(i)] + [0.0] * len(b)
+        ca = a[i - 1]
+        for j in range(1, len(b) + 1):
+            cb = b[j - 1]
+            if ca == cb:
+                cost = 0.0
+            elif cb in KEYBOARD_NEIGHBORS.get(ca, ()):
+                cost = ADJACENT_KEY_COST
+            else:
+                cost = 1.0
+            value = min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + cost)
+            if i > 1 and j > 1 and ca == b[j - 2] and a[i - 2] == cb:
+                value = min(value, previous2[j - 2] + 1)
+            current[j] = value
+        if min(current) > limit:
+            return limit + 1
+        previous2, previous = previous, current
+    return previous[-1]
+
+
+def _deletes(word: str, max_distance: int) -> Set[str]:
+    """Every string obtained by deleting up to `max_distance` characters"""
+    results = {word}
+    for n in range(1, min(max_distance, len(word)) + 1):
+        for positions in combinations(range(len(word)), n):
+            drop = set(positions)
+            results.add("".join(c for i, c in enumerate(word) if i not in drop))
+    return results
+
+
+class BrandIndex:
+    """
+    Nearest-brand lookup for domain labels.
+
+    Every brand name is indexed by its confusable skeleton. Labels of a
+    brand's legitimate domains are only matched exactly, through
+    legitimate_brand(): many are ordinary words (live, office, messenger)
+    that would fuzzy-match unrelated hosts. A SymSpell deletion
+    index maps every string reachable by deleting up to `max_distance`
+    characters to the labels it came from; a query generates its own
+    deletes and only the labels sharing one are scored, so lookup cost
+    depends on the query length rather than the number of brands.
+    Candidates are ranked by keyboard-weighted edit distance between
+    skeletons; a label whose skeleton matches a brand's exactly but whose
+    spelling differs is a homoglyph.
+
+    Brand names are also compiled into an Aho-Corasick automaton (over
+    raw names and skeletons) to find brands embedded anywhere in a URL
+    in one pass.
+    """
+
+    def __init__(self, brands: Dict[str, List[str]], max_distance: int = 2,
+                 min_fuzzy_length: int = 4):
+        self.brands = brands
+        self.max_distance = max_distance
+        self.min_fuzzy_length = min_fuzzy_length
+
+        # Legitimate domains -> brand
+        self.legitimate: Dict[str, str] = {}
+        # Indexed labels with their brand; label ids index these lists
+        self.labels: List[str] = []
+        self.skeletons: List[str] = []
+        self.label_brands: List[str] = []
+
+        for brand, domains in brands.items():
+            for domain in domains:
+                self.legitimate[domain.lower()] = brand
+            label = brand.lower()
+            if len(label) < 2 or label in self.labels:
+                continue
+            self.labels.append(label)
+            self.skeletons.append(skeleton(label))
+            self.label_brands.append(brand)
+
+        self.deletes: Dict[str, List[int]] = defaultdict(list)
+        for label_id, label_skeleton in enumerate(self.skeletons):
+            if len(label_skeleton) < self.min_fuzzy_length:
+                continue
+            for variant in _deletes(label_skeleton, self.max_distance):
+                self.deletes[variant].append(label_id)
+
+        # Brand names embedded in URLs, found in one pass
+        names = list(brands)
+        self._names = KeywordAutomaton([name.lower() for name in names])
+        self._name_brands = names
+        name_skeletons = sorted({skeleton(name) for name in names})
+        self._skeleton_names = KeywordAutomaton(name_skeletons)
+        self._skeleton_brands: Dict[str, List[str]] = defaultdict(list)
+        for name in names:
+            self._skeleton_brands[skeleton(name)].append(name)
+
+        logger.info(
+            f"Indexed {len(self.labels)} labels of {len(brands)} brands "
+            f"({len(self.deletes)} delete variants)"
+        )
+
+    def __len__(self) -> int:
+        return len(self.brands)
+
+    def _limit(self, label: str) -> int:
+        """Edits allowed for a label: fewer for short labels, which collide easily"""
+        if len(label) < self.min_fuzzy_length:
+            return 0
+        return 1 if len(label) < 8 else self.max_distance
+
+    def nearest(self, label: str, max_distance: Optional[int] = None,
+                limit: int = 5) -> List[Dict[str, Any]]:
+        """Brands whose labels are within `max_distance` edits of the label's skeleton"""
+        query = skeleton(label)
+        k = self._limit(query) if max_distance is None else min(max_distance, self.max_distance)
+        candidates: Set[int] = set()
+        for variant in _deletes(query, k):
+            candidates.update(self.deletes.get(variant, ()))
+
+        best: Dict[str, Dict[str, Any]] = {}
+        for label_id in candidates:
+            target = self.skeletons[label_id]
+            distance = edit_distance(query, target, k)
+            if distance > k:
+                continue
+            brand = self.label_brands[label_id]
+            if brand in best and best[brand]["distance"] <= distance:
+                continue
+            exact = label.lower() == self.labels[label_id]
+            best[brand] = {
+                "brand": brand,
+                "label": self.labels[label_id],
+                "distance": distance,
+                "homoglyph": distance == 0 and not exact,
+                "score": self._score(distance, len(target), exact),
+            }
+        return sorted(best.values(), key=lambda m: (m["distance"], -m["score"], m["brand"]))[:limit]
+
+    @staticmethod
+    def _score(distance: float, length: int, exact: bool) -> float:
+        if exact:
+            return 100.0
+        if distance == 0:
+            return 95.0
+        return round(max(0.0, min(90.0, 100 * (1 - distance / max(length, 1)))), 1)
+
+    def legitimate_brand(self, host: str) -> Optional[str]:
+        """Brand owning the host or one of its parent domains"""
+        labels = host.split(".")
+        for i in range(len(labels)):
+            brand = self.legitimate.get(".".join(labels[i:]))
+            if brand is not None:
+                return brand
+        return None
+
+    def embedded_brands(self, text: str) -> List[str]:
+        """
+        Brand names occurring in text. Names shorter than min_fuzzy_length
+        must form a whole token (so "ups" does not match "groups").
+        """
+        text = text.lower()
+        found = []
+        for end, name_id in self._names.iter_matches(text):
+            name = self._name_brands[name_id]
+            start = end - len(name)
+            if len(name) < self.min_fuzzy_length and (
+                (start > 0 and text[start - 1].isalnum()) or (end < len(text) and text[end].isalnum())
+            ):
+                continue
+            if name not in found:
+                found.append(name)
+        return found
+
+    def homoglyph_brands(self, text: str) -> List[str]:
+        """Brands whose skeleton occurs in the text's skeleton (e.g. "paypa1-login")"""
+        found = []
+        for name_id in self._skeleton_names.find(skeleton(text)):
+            for brand in self._skeleton_brands[self._skeleton_names.phrases[name_id]]:
+                if len(brand) >= self.min_fuzzy_length and brand not in found:
+                    found.append(brand)
+        return found
+
+    @staticmethod
+    def tokens(labels: List[str]) -> List[str]:
+        """Labels and their hyphen/punctuation-separated parts"""
+        tokens = []
+        for label in labels:
+            for token in [label] + _TOKEN_SPLIT.split(label):
+                if token and token not in tokens:
+                    tokens.append(token)
+        return tokens
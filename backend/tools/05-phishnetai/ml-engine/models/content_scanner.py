@@ -5,9 +5,12 @@ Scan email and web content for phishing indicators
 
 import numpy as np
 import logging
-from typing import Dict, Any, List
+from typing import Dict, Any, List, Optional
 import re
 
+from .domain_parser import parse_domain
+from .phrase_matcher import PhraseMatcher
+
 logger = logging.getLogger(__name__)
 
 
@@ -16,29 +19,13 @@ class ContentScanner:
     Content analysis for phishing detection in emails and web pages.
     """
     
-    def __init__(self):
+    def __init__(self, phrases_path: Optional[str] = None):
         self.version = "1.0.0"
         self.is_loaded = True
         
-        # Phishing keywords
-        self.phishing_keywords = [
-            "verify your account", "confirm your identity", "update your information",
-            "suspended", "unusual activity", "unauthorized access", "security alert",
-            "click here immediately", "act now", "limited time", "expires today",
-            "confirm password", "verify payment", "update billing"
-        ]
-        
-        # Urgency indicators
-        self.urgency_words = [
-            "urgent", "immediately", "action required", "expires", "suspended",
-            "within 24 hours", "final warning", "act now", "don't delay"
-        ]
-        
-        # Spam indicators
-        self.spam_keywords = [
-            "free", "winner", "congratulations", "claim your prize",
-            "limited offer", "exclusive deal", "buy now", "discount"
-        ]
+        # Phishing, urgency and spam phrases, compiled into one automaton
+        # and reloaded when the phrase files change
+        self.phrases = PhraseMatcher(phrases_path)
         
         logger.info(f"Content Scanner v{self.version} loaded")
     
@@ -57,26 +44,27 @@ class ContentScanner:
         phishing_score = 0
         spam_score = 0
         
+        # One pass over the text finds the phrases of every category
+        matches = self.phrases.match(full_text)
+        
         # Check for phishing keywords
-        for keyword in self.phishing_keywords:
-            if keyword in full_text:
-                phishing_score += 10
-                indicators.append(f"Phishing keyword: '{keyword}'")
+        for keyword, weight in matches.get("phishing", []):
+            phishing_score += weight
+            indicators.append(f"Phishing keyword: '{keyword}'")
         
         # Check for urgency
-        urgency_count = sum(1 for word in self.urgency_words if word in full_text)
+        urgency = matches.get("urgency", [])
+        urgency_count = len(urgency)
         if urgency_count > 0:
-            phishing_score += urgency_count * 5
+            phishing_score += sum(weight for _, weight in urgency)
             indicators.append(f"Urgency indicators found ({urgency_count})")
         
         # Check for spam keywords
-        for keyword in self.spam_keywords:
-            if keyword in full_text:
-                spam_score += 5
+        spam_score += sum(weight for _, weight in matches.get("spam", []))
         
         # Check sender legitimacy
         if re.search(r'@[^@]+\.[a-z]{2,}', sender):
-            domain = sender.split('@')[-1]
+            domain = parse_domain(sender.split('@')[-1].rstrip('>')).host
             # Check for suspicious sender patterns
             if any(x in domain for x in ['secure-', 'account-', 'verify-', 'update-']):
                 phishing_score += 20
@@ -85,7 +73,8 @@ class ContentScanner:
         # Check for mismatched display name
         if '<' in sender and '>' in sender:
             display_name = sender.split('<')[0].strip()
-            email_domain = sender.split('@')[-1].replace('>', '')
+            # Only the registrable domain counts: paypal.evil.com is not PayPal's
+            email_domain = parse_domain(sender.split('@')[-1].replace('>', '')).registrable_domain
             if any(brand in display_name.lower() for brand in ['paypal', 'amazon', 'apple', 'microsoft']):
                 if not any(x in email_domain for x in ['paypal', 'amazon', 'apple', 'microsoft']):
                     phishing_score += 30
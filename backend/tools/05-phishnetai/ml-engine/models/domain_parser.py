@@ -0,0 +1,182 @@
+"""
+PhishGuard ML Engine - Domain Parser
+Public-suffix-aware host parsing shared by the analyzers
+"""
+
+import ipaddress
+import logging
+import os
+import re
+from functools import lru_cache
+from threading import Lock
+from typing import Dict, List, NamedTuple, Optional, Tuple
+from urllib.parse import ParseResult, urlparse
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_SUFFIX_LIST_PATH = os.path.join(
+    os.path.dirname(__file__), "..", "suffixes", "public_suffix_list.dat"
+)
+DOMAIN_CACHE_SIZE = int(os.getenv("DOMAIN_CACHE_SIZE", "65536"))
+
+_RULE = "$"  # marks a node where a rule ends
+_EXCEPTION = "!"  # marks a node where an exception rule ends
+
+_SCHEME = re.compile(r"^[a-zA-Z][a-zA-Z0-9+.-]*://")
+
+
+class ParsedDomain(NamedTuple):
+    """A host split at its public suffix. Fields are empty strings when absent."""
+    host: str  # lowercased, IDNA-decoded, without userinfo, port or trailing dot
+    subdomain: str  # "login.secure" in login.secure.paypal.co.uk
+    registrable_domain: str  # "paypal.co.uk"
+    suffix: str  # "co.uk"
+    is_ip: bool = False
+
+    @property
+    def label(self) -> str:
+        """The registrable label, e.g. "paypal" in login.paypal.co.uk"""
+        return self.registrable_domain.split(".", 1)[0]
+
+    @property
+    def tld(self) -> str:
+        return self.host.rsplit(".", 1)[-1] if self.host and not self.is_ip else ""
+
+    @property
+    def subdomain_count(self) -> int:
+        return len(self.subdomain.split(".")) if self.subdomain else 0
+
+
+class SuffixTrie:
+    """
+    Public Suffix List rules compiled into a trie keyed by labels from the
+    right (com -> co -> ...). Rules are stored IDNA-decoded, matching hosts
+    as parse_domain presents them. Wildcard (`*.ck`) and exception
+    (`!www.ck`) rules follow the PSL algorithm; a host matching no rule
+    has its last label as its suffix.
+    """
+
+    def __init__(self, rules: List[str]):
+        self.root: Dict[str, dict] = {}
+        self.rules = 0
+        for rule in rules:
+            exception = rule.startswith("!")
+            labels = rule.lstrip("!").split(".")
+            node = self.root
+            for label in reversed(labels):
+                node = node.setdefault(label, {})
+            node[_EXCEPTION if exception else _RULE] = True
+            self.rules += 1
+
+    @classmethod
+    def load(cls, path: str) -> "SuffixTrie":
+        rules = []
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                rule = line.split("//", 1)[0].strip().lower()
+                if rule:
+                    rules.append(rule)
+        trie = cls(rules)
+        logger.info(f"Loaded {trie.rules} public suffix rules from {os.path.basename(path)}")
+        return trie
+
+    def suffix_length(self, labels: List[str]) -> int:
+        """Number of trailing labels forming the public suffix"""
+        node = self.root
+        length = 1  # the implicit "*" rule
+        for depth, label in enumerate(reversed(labels), start=1):
+            wildcard = node.get("*")
+            child = node.get(label)
+            if child is not None and child.get(_EXCEPTION):
+                # An exception rule makes the matched label registrable
+                return depth - 1
+            if wildcard is not None and (child is None or not child.get(_RULE)):
+                length = depth
+            node = child
+            if node is None:
+                break
+            if node.get(_RULE):
+                length = depth
+        return min(length, len(labels))
+
+
+_trie: Optional[SuffixTrie] = None
+_trie_lock = Lock()
+
+
+def get_suffix_trie() -> SuffixTrie:
+    """The suffix trie from PUBLIC_SUFFIX_LIST_PATH (or the bundled list), loaded once"""
+    global _trie
+    if _trie is None:
+        with _trie_lock:
+            if _trie is None:
+                _trie = SuffixTrie.load(
+                    os.getenv("PUBLIC_SUFFIX_LIST_PATH", DEFAULT_SUFFIX_LIST_PATH)
+                )
+    return _trie
+
+
+def _decode_label(label: str) -> str:
+    if label.startswith("xn--"):
+        try:
+            return label.encode("ascii").decode("idna")
+        except UnicodeError:
+            pass
+    return label
+
+
+@lru_cache(maxsize=DOMAIN_CACHE_SIZE)
+def parse_domain(host: str) -> ParsedDomain:
+    """
+    Split a host (or a URL netloc, with optional userinfo and port) into
+    subdomain, registrable domain and public suffix. Punycode labels are
+    decoded once here; results are memoized per host.
+    """
+    host = host.strip().lower().rsplit("@", 1)[-1]
+    if host.startswith("["):
+        host = host[1:].split("]", 1)[0]
+    elif host.count(":") == 1:
+        host = host.split(":", 1)[0]
+    host = host.strip(".")
+
+    try:
+        ipaddress.ip_address(host)
+        return ParsedDomain(host, "", "", "", True)
+    except ValueError:
+        pass
+
+    labels = [_decode_label(label) for label in host.split(".")] if host else []
+    host = ".".join(labels)
+    if not labels:
+        return ParsedDomain("", "", "", "")
+
+    length = get_suffix_trie().suffix_length(labels)
+    if length >= len(labels):
+        # The host is itself a public suffix
+        return ParsedDomain(host, "", "", host)
+    suffix = ".".join(labels[len(labels) - length:])
+    registrable = ".".join(labels[len(labels) - length - 1:])
+    subdomain = ".".join(labels[:len(labels) - length - 1])
+    return ParsedDomain(host, subdomain, registrable, suffix)
+
+
+@lru_cache(maxsize=DOMAIN_CACHE_SIZE)
+def parse_url(url: str) -> Tuple[ParseResult, ParsedDomain]:
+    """urlparse the URL (assuming http:// when it has no scheme) and parse its host"""
+    if url.startswith("//"):
+        url = f"http:{url}"
+    elif not _SCHEME.match(url):
+        url = f"http://{url}"
+    parsed = urlparse(url)
+    return parsed, parse_domain(parsed.netloc)
+
+
+def cache_stats() -> Dict[str, Dict[str, int]]:
+    stats = {}
+    for name, func in (("domains", parse_domain), ("urls", parse_url)):
+        info = func.cache_info()
+        stats[name] = {
+            "hits": info.hits, "misses": info.misses,
+            "size": info.currsize, "max_size": info.maxsize,
+        }
+    return stats
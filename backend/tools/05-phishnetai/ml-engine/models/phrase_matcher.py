@@ -0,0 +1,216 @@
+"""
+PhishGuard ML Engine - Phrase Matcher
+Aho-Corasick automaton over categorized, weighted phrase lists
+"""
+
+import json
+import logging
+import os
+import time
+from collections import defaultdict, deque
+from threading import Lock
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_PHRASES_PATH = os.path.join(os.path.dirname(__file__), "..", "phrases")
+
+
+class KeywordAutomaton:
+    """
+    Aho-Corasick automaton: finds every occurrence of every phrase in one
+    left-to-right pass over the text, however many phrases there are.
+
+    States are integers; `goto[state]` maps a character to the next state
+    and `fail[state]` is the state for the longest proper suffix that is
+    also a trie path. `output[state]` holds the ids of every phrase ending
+    there, including those reached through failure links, so the scan never
+    walks the failure chain to report matches.
+    """
+
+    def __init__(self, phrases: List[str]):
+        self.phrases = phrases
+        self.goto: List[Dict[str, int]] = [{}]
+        self.fail: List[int] = [0]
+        self.output: List[Tuple[int, ...]] = [()]
+
+        for phrase_id, phrase in enumerate(phrases):
+            state = 0
+            for char in phrase:
+                next_state = self.goto[state].get(char)
+                if next_state is None:
+                    next_state = len(self.goto)
+                    self.goto[state][char] = next_state
+                    self.goto.append({})
+                    self.fail.append(0)
+                    self.output.append(())
+                state = next_state
+            self.output[state] += (phrase_id,)
+
+        # Breadth-first, so a state's failure target is final before its children
+        queue = deque(self.goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for char, child in self.goto[state].items():
+                queue.append(child)
+                target = self.fail[state]
+                while target and char not in self.goto[target]:
+                    target = self.fail[target]
+                self.fail[child] = self.goto[target].get(char, 0)
+                self.output[child] += self.output[self.fail[child]]
+
+    def __len__(self) -> int:
+        return len(self.phrases)
+
+    def iter_matches(self, text: str) -> Iterator[Tuple[int, int]]:
+        """(end index, phrase id) for every occurrence, in text order"""
+        goto, fail, output = self.goto, self.fail, self.output
+        state = 0
+        for index, char in enumerate(text):
+            while state and char not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(char, 0)
+            if output[state]:
+                for phrase_id in output[state]:
+                    yield index + 1, phrase_id
+
+    def find(self, text: str) -> Dict[int, int]:
+        """Phrase id -> number of occurrences in text"""
+        counts: Dict[int, int] = defaultdict(int)
+        for _, phrase_id in self.iter_matches(text):
+            counts[phrase_id] += 1
+        return counts
+
+
+class PhraseSet:
+    """Compiled phrase lists; swapped as a whole on reload"""
+
+    def __init__(self, categories: Dict[str, Dict[str, Any]], version: str):
+        self.version = version
+        self.categories = categories
+        # Phrases listed in several categories share one automaton entry
+        tags: Dict[str, List[Tuple[str, float]]] = defaultdict(list)
+        for category, spec in categories.items():
+            for phrase, weight in spec["phrases"]:
+                tags[phrase].append((category, weight))
+        self.automaton = KeywordAutomaton(list(tags))
+        self.tags = [tags[phrase] for phrase in self.automaton.phrases]
+
+    def __len__(self) -> int:
+        return len(self.automaton)
+
+    def match(self, text: str) -> Dict[str, List[Tuple[str, float]]]:
+        """Category -> [(phrase, weight)] for the distinct phrases found in text"""
+        matches: Dict[str, List[Tuple[str, float]]] = {name: [] for name in self.categories}
+        for phrase_id in sorted(self.automaton.find(text)):
+            phrase = self.automaton.phrases[phrase_id]
+            for category, weight in self.tags[phrase_id]:
+                matches[category].append((phrase, weight))
+        return matches
+
+
+class PhraseMatcher:
+    """
+    Loads phrase lists from JSON files (a file or a directory of `*.json`
+    files) and compiles them into one automaton. Each file has the form
+    `{"version": ..., "categories": {name: {"weight": w, "phrases": [...]}}}`;
+    a phrase is a string or a `[phrase, weight]` pair, and files listing the
+    same category extend it. The files are re-read when their modification
+    times change; files that fail to load are logged and the previous
+    phrases stay active.
+    """
+
+    def __init__(self, path: Optional[str] = None, check_interval: float = 5.0):
+        self.path = os.path.abspath(
+            path or os.getenv("CONTENT_PHRASES_PATH", DEFAULT_PHRASES_PATH)
+        )
+        self.check_interval = check_interval
+        self._mtimes: Dict[str, float] = {}
+        self._last_check = 0.0
+        self._lock = Lock()
+        self.phrases = self._load()
+
+    def _files(self) -> List[str]:
+        if os.path.isdir(self.path):
+            return sorted(
+                os.path.join(self.path, name)
+                for name in os.listdir(self.path)
+                if name.endswith(".json")
+            )
+        return [self.path]
+
+    def _load(self) -> PhraseSet:
+        categories: Dict[str, Dict[str, Any]] = {}
+        versions, mtimes = [], {}
+        for file_path in self._files():
+            with open(file_path) as f:
+                spec = json.load(f)
+            mtimes[file_path] = os.path.getmtime(file_path)
+            for name, entry in spec["categories"].items():
+                category = categories.setdefault(name, {"weight": 1.0, "phrases": {}})
+                category["weight"] = float(entry.get("weight", category["weight"]))
+                for item in entry.get("phrases", []):
+                    phrase, weight = (item, None) if isinstance(item, str) else item
+                    phrase = phrase.strip().lower()
+                    if not phrase:
+                        raise ValueError(f"{file_path}: empty phrase in '{name}'")
+                    category["phrases"][phrase] = weight
+            if "version" in spec:
+                versions.append(f"{os.path.basename(file_path)}@{spec['version']}")
+
+        # Phrases without their own weight take their category's
+        compiled = {
+            name: {
+                "weight": category["weight"],
+                "phrases": [
+                    (phrase, float(category["weight"] if weight is None else weight))
+                    for phrase, weight in category["phrases"].items()
+                ],
+            }
+            for name, category in categories.items()
+        }
+        phrases = PhraseSet(compiled, ",".join(versions) or "unversioned")
+        self._mtimes = mtimes
+        logger.info(
+            f"Compiled {len(phrases)} phrases in {len(compiled)} categories from {len(mtimes)} files"
+        )
+        return phrases
+
+    def reload(self) -> bool:
+        """Recompile the phrase files. Returns False and keeps the old phrases on error."""
+        with self._lock:
+            try:
+                self.phrases = self._load()
+                return True
+            except Exception as e:
+                logger.error(f"Phrase reload failed, keeping {len(self.phrases)} phrases: {e}")
+                return False
+
+    def maybe_reload(self):
+        """Reload when a phrase file changed (checked at most every check_interval seconds)"""
+        now = time.monotonic()
+        if now - self._last_check < self.check_interval:
+            return
+        self._last_check = now
+        try:
+            mtimes = {path: os.path.getmtime(path) for path in self._files()}
+        except OSError:
+            return
+        if mtimes != self._mtimes:
+            self.reload()
+
+    def match(self, text: str) -> Dict[str, List[Tuple[str, float]]]:
+        self.maybe_reload()
+        return self.phrases.match(text.lower())
+
+    def stats(self) -> Dict[str, Any]:
+        phrases = self.phrases
+        return {
+            "version": phrases.version,
+            "path": self.path,
+            "phrases": len(phrases),
+            "states": len(phrases.automaton.goto),
+            "categories": {
+                name: len(category["phrases"]) for name, category in phrases.categories.items()
+            },
+        }
@@ -5,174 +5,213 @@ Analyze URLs for phishing indicators
 
 import numpy as np
 import logging
-from typing import Dict, Any, List
-from urllib.parse import urlparse
-import hashlib
+from typing import Dict, Any, List, Tuple
 import re
 
+from .domain_parser import parse_url
+
 logger = logging.getLogger(__name__)
 
+# Binary URL features, in indicator order, with the score each one adds
+FEATURES = [
+    "ip_address",
+    "suspicious_tld",
+    "url_shortener",
+    "suspicious_pattern",
+    "many_subdomains",
+    "homograph",
+    "embedded_credentials",
+    "long_url",
+    "no_https",
+    "parse_error",
+]
+FEATURE_WEIGHTS = np.array([30, 15, 10, 20, 15, 25, 30, 10, 10, 20], dtype=np.int32)
+
+# A score at or above RISK_THRESHOLDS[i] has risk level RISK_LEVELS[i + 1]
+RISK_THRESHOLDS = np.array([25, 50, 70])
+RISK_LEVELS = np.array(["SAFE", "SUSPICIOUS", "LIKELY_PHISHING", "PHISHING"])
+
 
 class URLAnalyzer:
     """
     ML-based URL analysis for phishing detection.
+    
+    Analysis is split into feature extraction (one parse and one combined
+    regex search per URL, set lookups for TLDs and shorteners) and scoring,
+    which runs on the feature matrix of a whole batch at once.
     """
     
     def __init__(self):
-        self.version = "1.0.0"
+        self.version = "1.1.0"
         self.last_trained = "2025-01-15T00:00:00Z"
         self.accuracy = 96.8
         self.is_loaded = True
         
         # Suspicious TLDs
-        self.suspicious_tlds = [".xyz", ".top", ".club", ".online", ".site", ".icu", ".work"]
-        
-        # Known phishing patterns
-        self.phishing_patterns = [
-            r"login.*verify",
-            r"account.*update",
-            r"secure.*banking",
-            r"verify.*identity",
-            r"suspended.*account",
-            r"confirm.*password"
-        ]
+        self.suspicious_tlds = frozenset(["xyz", "top", "club", "online", "site", "icu", "work"])
+        
+        # Known phishing patterns, searched as one alternation of named groups
+        self.phishing_patterns = {
+            "login_verify": r"login.*verify",
+            "account_update": r"account.*update",
+            "secure_banking": r"secure.*banking",
+            "verify_identity": r"verify.*identity",
+            "suspended_account": r"suspended.*account",
+            "confirm_password": r"confirm.*password"
+        }
+        self.phishing_regex = re.compile(
+            "|".join(f"(?P<{name}>{pattern})" for name, pattern in self.phishing_patterns.items())
+        )
         
         # URL shorteners
-        self.url_shorteners = ["bit.ly", "t.co", "goo.gl", "tinyurl.com", "is.gd"]
+        self.url_shorteners = frozenset(["bit.ly", "t.co", "goo.gl", "tinyurl.com", "is.gd"])
         
         logger.info(f"URL Analyzer v{self.version} loaded")
     
-    def analyze(self, url_data: Dict[str, Any]) -> Dict[str, Any]:
-        """Analyze URL for phishing"""
+    def extract_features(self, url: str) -> Tuple[List[bool], Dict[str, Any]]:
+        """Feature flags (in FEATURES order) and the details their indicators report"""
         
-        url = url_data.get("url", "")
-        source = url_data.get("source", "unknown")
-        
-        indicators = []
-        phishing_score = 0
+        flags = [False] * len(FEATURES)
+        details: Dict[str, Any] = {"length": len(url)}
         
         try:
-            parsed = urlparse(url)
-            domain = parsed.netloc.lower()
-            path = parsed.path.lower()
-            
-            # Check for IP address in URL
-            if re.match(r'\d+\.\d+\.\d+\.\d+', domain):
-                phishing_score += 30
-                indicators.append({
-                    "type": "ip_address",
-                    "description": "URL uses IP address instead of domain",
-                    "severity": "HIGH"
-                })
-            
-            # Check TLD
-            for tld in self.suspicious_tlds:
-                if domain.endswith(tld):
-                    phishing_score += 15
-                    indicators.append({
-                        "type": "suspicious_tld",
-                        "description": f"Suspicious TLD: {tld}",
-                        "severity": "MEDIUM"
-                    })
-                    break
-            
-            # Check for URL shorteners
-            for shortener in self.url_shorteners:
-                if shortener in domain:
-                    phishing_score += 10
-                    indicators.append({
-                        "type": "url_shortener",
-                        "description": "URL uses URL shortening service",
-                        "severity": "LOW"
-                    })
-                    break
-            
-            # Check for suspicious patterns in path
-            for pattern in self.phishing_patterns:
-                if re.search(pattern, url.lower()):
-                    phishing_score += 20
-                    indicators.append({
-                        "type": "suspicious_pattern",
-                        "description": f"Suspicious pattern detected in URL",
-                        "severity": "HIGH"
-                    })
-                    break
-            
-            # Check for excessive subdomains
-            subdomain_count = domain.count('.')
-            if subdomain_count > 3:
-                phishing_score += 15
-                indicators.append({
-                    "type": "many_subdomains",
-                    "description": f"Excessive subdomains ({subdomain_count})",
-                    "severity": "MEDIUM"
-                })
-            
-            # Check for homograph attacks (mixed character sets)
-            if any(ord(c) > 127 for c in domain):
-                phishing_score += 25
-                indicators.append({
-                    "type": "homograph",
-                    "description": "Possible homograph attack with non-ASCII characters",
-                    "severity": "HIGH"
-                })
+            parsed, host = parse_url(url)
+            domain = host.host
             
-            # Check for @ symbol in URL (credential phishing)
-            if '@' in url:
-                phishing_score += 30
-                indicators.append({
-                    "type": "embedded_credentials",
-                    "description": "URL contains @ symbol (possible credential obfuscation)",
-                    "severity": "CRITICAL"
-                })
+            flags[0] = host.is_ip
+            flags[1] = host.tld in self.suspicious_tlds
+            details["tld"] = host.tld
+            flags[2] = host.registrable_domain in self.url_shorteners or domain in self.url_shorteners
             
-            # Check URL length
-            if len(url) > 100:
-                phishing_score += 10
-                indicators.append({
-                    "type": "long_url",
-                    "description": f"Unusually long URL ({len(url)} characters)",
-                    "severity": "LOW"
-                })
+            match = self.phishing_regex.search(url.lower())
+            flags[3] = match is not None
+            details["pattern"] = match.lastgroup if match else None
             
-            # Check for HTTPS
-            if parsed.scheme != "https":
-                phishing_score += 10
-                indicators.append({
-                    "type": "no_https",
-                    "description": "URL does not use HTTPS",
-                    "severity": "MEDIUM"
-                })
+            # Labels left of the registrable domain
+            details["subdomains"] = host.subdomain_count
+            flags[4] = host.subdomain_count > 2
             
+            # Mixed character sets in the (IDNA-decoded) host
+            flags[5] = not domain.isascii()
+            flags[6] = "@" in url
+            flags[7] = len(url) > 100
+            flags[8] = parsed.scheme != "https"
+        
         except Exception as e:
             logger.error(f"Error parsing URL: {e}")
-            phishing_score += 20
-        
-        # Determine risk level
-        is_phishing = phishing_score >= 40
-        if phishing_score >= 70:
-            risk_level = "PHISHING"
-        elif phishing_score >= 50:
-            risk_level = "LIKELY_PHISHING"
-        elif phishing_score >= 25:
-            risk_level = "SUSPICIOUS"
-        else:
-            risk_level = "SAFE"
-        
-        # Calculate confidence
-        confidence = min(50 + phishing_score, 98)
+            flags = [False] * len(FEATURES)
+            flags[-1] = True
+        
+        return flags, details
+    
+    def score(self, features: np.ndarray) -> Dict[str, np.ndarray]:
+        """Scores, risk levels and confidences for a (URLs x FEATURES) matrix"""
         
+        scores = features.astype(np.int32) @ FEATURE_WEIGHTS
         return {
-            "is_phishing": is_phishing,
-            "confidence": confidence,
-            "risk_level": risk_level,
-            "indicators": indicators or [{"type": "none", "description": "No suspicious indicators found", "severity": "NONE"}]
+            "scores": scores,
+            "is_phishing": scores >= 40,
+            "risk_levels": RISK_LEVELS[np.searchsorted(RISK_THRESHOLDS, scores, side="right")],
+            "confidences": np.minimum(50 + scores, 98)
         }
     
+    def analyze(self, url_data: Dict[str, Any]) -> Dict[str, Any]:
+        """Analyze URL for phishing"""
+        
+        return self.analyze_many([url_data.get("url", "")])[0]
+    
+    def analyze_many(self, urls: List[str]) -> List[Dict[str, Any]]:
+        """Analyze a batch of URLs, scoring their features as one matrix"""
+        
+        features = np.zeros((len(urls), len(FEATURES)), dtype=bool)
+        details = []
+        for row, url in enumerate(urls):
+            flags, url_details = self.extract_features(url)
+            features[row] = flags
+            details.append(url_details)
+        
+        scored = self.score(features)
+        
+        return [
+            {
+                "is_phishing": bool(scored["is_phishing"][row]),
+                "confidence": int(scored["confidences"][row]),
+                "risk_level": str(scored["risk_levels"][row]),
+                "indicators": self._indicators(features[row], details[row])
+            }
+            for row in range(len(urls))
+        ]
+    
+    @staticmethod
+    def _indicators(flags: np.ndarray, details: Dict[str, Any]) -> List[Dict[str, Any]]:
+        """Indicator descriptions for one URL's feature flags"""
+        
+        indicators = []
+        if flags[0]:
+            indicators.append({
+                "type": "ip_address",
+                "description": "URL uses IP address instead of domain",
+                "severity": "HIGH"
+            })
+        if flags[1]:
+            indicators.append({
+                "type": "suspicious_tld",
+                "description": f"Suspicious TLD: .{details['tld']}",
+                "severity": "MEDIUM"
+            })
+        if flags[2]:
+            indicators.append({
+                "type": "url_shortener",
+                "description": "URL uses URL shortening service",
+                "severity": "LOW"
+            })
+        if flags[3]:
+            indicators.append({
+                "type": "suspicious_pattern",
+                "description": "Suspicious pattern detected in URL",
+                "severity": "HIGH"
+            })
+        if flags[4]:
+            indicators.append({
+                "type": "many_subdomains",
+                "description": f"Excessive subdomains ({details['subdomains']})",
+                "severity": "MEDIUM"
+            })
+        if flags[5]:
+            indicators.append({
+                "type": "homograph",
+                "description": "Possible homograph attack with non-ASCII characters",
+                "severity": "HIGH"
+            })
+        if flags[6]:
+            indicators.append({
+                "type": "embedded_credentials",
+                "description": "URL contains @ symbol (possible credential obfuscation)",
+                "severity": "CRITICAL"
+            })
+        if flags[7]:
+            indicators.append({
+                "type": "long_url",
+                "description": f"Unusually long URL ({details['length']} characters)",
+                "severity": "LOW"
+            })
+        if flags[8]:
+            indicators.append({
+                "type": "no_https",
+                "description": "URL does not use HTTPS",
+                "severity": "MEDIUM"
+            })
+        return indicators or [{"type": "none", "description": "No suspicious indicators found", "severity": "NONE"}]
+    
     def quick_check(self, url: str) -> Dict[str, Any]:
         """Quick URL check without detailed analysis"""
         
-        result = self.analyze({"url": url})
+        return self.summarize(url, self.analyze({"url": url}))
+    
+    @staticmethod
+    def summarize(url: str, result: Dict[str, Any]) -> Dict[str, Any]:
+        """Quick check response from a full analysis result"""
+        
         return {
             "url": url,
             "safe": result["risk_level"] == "SAFE",
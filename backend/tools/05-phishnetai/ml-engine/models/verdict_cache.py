@@ -0,0 +1,225 @@
+"""
+PhishGuard ML Engine - Verdict Cache
+Two-level URL verdict cache with per-risk TTLs and request coalescing
+"""
+
+import asyncio
+import logging
+import os
+import re
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Optional
+from urllib.parse import parse_qsl, urlencode
+
+from .domain_parser import parse_url
+
+logger = logging.getLogger(__name__)
+
+# Verdicts that could flip soonest (a clean domain gets compromised) expire first
+DEFAULT_TTLS = {
+    "PHISHING": 86400.0,
+    "LIKELY_PHISHING": 21600.0,
+    "SUSPICIOUS": 3600.0,
+    "SAFE": 900.0,
+}
+
+_DEFAULT_PORTS = {"http": "80", "https": "443"}
+
+# Path segments that vary per recipient in campaign and tracking links:
+# numbers, hex digests/UUIDs, long opaque tokens
+_ID_SEGMENT = re.compile(
+    r"\d+|[0-9a-f]{8,}|[0-9a-f]{8}(?:-[0-9a-f]{4}){3}-[0-9a-f]{12}|(?=[\w=-]*\d)[\w=-]{20,}",
+    re.IGNORECASE,
+)
+
+
+def _segment_shape(segment: str) -> str:
+    return "{id}" if _ID_SEGMENT.fullmatch(segment) else segment
+
+
+def normalize_url(url: str) -> str:
+    """
+    Exact cache key: scheme and host lowercased (host IDNA-decoded),
+    default port and fragment dropped, query parameters sorted.
+    """
+    parsed, host = parse_url(url.strip())
+    scheme = parsed.scheme.lower()
+    netloc = host.host
+    try:
+        port = parsed.port
+    except ValueError:
+        port = None
+    if port is not None and str(port) != _DEFAULT_PORTS.get(scheme):
+        netloc = f"{netloc}:{port}"
+    if "@" in parsed.netloc:
+        netloc = f"{parsed.netloc.rsplit('@', 1)[0]}@{netloc}"
+    query = urlencode(sorted(parse_qsl(parsed.query, keep_blank_values=True)))
+    return f"{scheme}://{netloc}{parsed.path or '/'}" + (f"?{query}" if query else "")
+
+
+def shape_key(url: str, features: str) -> Optional[str]:
+    """
+    Shape cache key: the host with the shapes of the path segments and
+    the query parameter names, plus `features`, a signature of everything
+    else in the URL the verdict depends on. ID-like path segments collapse
+    to "{id}", so links from one campaign that differ only in
+    per-recipient tokens share a key as long as their signatures match.
+    None for hosts without a registrable domain (IP addresses, bare
+    suffixes).
+    """
+    parsed, host = parse_url(url.strip())
+    if not host.registrable_domain:
+        return None
+    path = "/".join(_segment_shape(segment) for segment in parsed.path.split("/"))
+    params = ",".join(sorted({name for name, _ in parse_qsl(parsed.query, keep_blank_values=True)}))
+    return f"{parsed.scheme.lower()}://{host.host}{path}?{params}#{features}"
+
+
+class VerdictCache:
+    """
+    Verdicts keyed first by the exact normalized URL, then by host plus
+    path shape, so a campaign's per-recipient links hit after the first
+    one is analyzed. Parts of a URL dropped from its shape (query values,
+    collapsed segments) can still change the verdict, so the shape level
+    is only used with a `features` callable returning a signature of what
+    the verdict depends on; URLs share a shape entry only when their
+    signatures are equal. Each level is an LRU bounded separately;
+    entries expire after a TTL chosen by the verdict's risk level. A
+    verdict is a dict with a "risk_level" key. Concurrent lookups of the
+    same URL share one computation. Cached verdicts are shared; callers
+    must not mutate them.
+    """
+
+    def __init__(self, max_entries: Optional[int] = None, max_shapes: Optional[int] = None,
+                 ttls: Optional[Dict[str, float]] = None,
+                 features: Optional[Callable[[str], str]] = None):
+        self.max_entries = max_entries or int(os.getenv("VERDICT_CACHE_SIZE", "100000"))
+        self.max_shapes = max_shapes or int(os.getenv("VERDICT_SHAPE_CACHE_SIZE", "20000"))
+        self.ttls = ttls or {
+            level: float(os.getenv(f"VERDICT_TTL_{level}", str(ttl)))
+            for level, ttl in DEFAULT_TTLS.items()
+        }
+        self.features = features
+        self._exact: "OrderedDict[str, tuple[float, Dict[str, Any]]]" = OrderedDict()
+        self._shapes: "OrderedDict[str, tuple[float, Dict[str, Any]]]" = OrderedDict()
+        self._inflight: Dict[str, asyncio.Task] = {}
+        self._waiters: Dict[str, int] = {}
+        self.counters = {
+            "exact_hits": 0, "shape_hits": 0, "misses": 0,
+            "coalesced": 0, "expired": 0, "evicted": 0,
+        }
+
+    def __len__(self) -> int:
+        return len(self._exact)
+
+    def _shape(self, url: str) -> Optional[str]:
+        return shape_key(url, self.features(url)) if self.features is not None else None
+
+    def _lookup(self, entries: OrderedDict, key: Optional[str], now: float) -> Optional[Dict[str, Any]]:
+        if key is None:
+            return None
+        entry = entries.get(key)
+        if entry is None:
+            return None
+        expires_at, verdict = entry
+        if expires_at <= now:
+            del entries[key]
+            self.counters["expired"] += 1
+            return None
+        entries.move_to_end(key)
+        return verdict
+
+    def _store(self, entries: OrderedDict, key: Optional[str], expires_at: float,
+               verdict: Dict[str, Any], max_entries: int):
+        if key is None:
+            return
+        entries[key] = (expires_at, verdict)
+        entries.move_to_end(key)
+        while len(entries) > max_entries:
+            entries.popitem(last=False)
+            self.counters["evicted"] += 1
+
+    def get(self, url: str) -> Optional[Dict[str, Any]]:
+        """Cached verdict for the URL from either level, or None"""
+        return self._get(normalize_url(url), self._shape(url))
+
+    def _get(self, exact: str, shape: Optional[str]) -> Optional[Dict[str, Any]]:
+        now = time.monotonic()
+        verdict = self._lookup(self._exact, exact, now)
+        if verdict is not None:
+            self.counters["exact_hits"] += 1
+            return verdict
+        verdict = self._lookup(self._shapes, shape, now)
+        if verdict is not None:
+            self.counters["shape_hits"] += 1
+            # Promote, so the next identical URL hits the exact level
+            self._store(self._exact, exact, self._shapes[shape][0], verdict, self.max_entries)
+            return verdict
+        self.counters["misses"] += 1
+        return None
+
+    def put(self, url: str, verdict: Dict[str, Any]):
+        self._put(normalize_url(url), self._shape(url), verdict)
+
+    def _put(self, exact: str, shape: Optional[str], verdict: Dict[str, Any]):
+        ttl = self.ttls.get(verdict.get("risk_level"), min(self.ttls.values()))
+        expires_at = time.monotonic() + ttl
+        self._store(self._exact, exact, expires_at, verdict, self.max_entries)
+        self._store(self._shapes, shape, expires_at, verdict, self.max_shapes)
+
+    async def get_or_compute(self, url: str, compute: Callable[[], Dict[str, Any]]) -> Dict[str, Any]:
+        """
+        Cached verdict for the URL, computing it on a miss in a worker
+        thread. Concurrent misses for the same normalized URL await one
+        computation, which is cancelled only once every caller has gone.
+        """
+        exact, shape = normalize_url(url), self._shape(url)
+        task = self._inflight.get(exact)
+        if task is None:
+            verdict = self._get(exact, shape)
+            if verdict is not None:
+                return verdict
+            task = asyncio.ensure_future(self._compute(exact, shape, compute))
+            self._inflight[exact] = task
+        else:
+            self.counters["coalesced"] += 1
+
+        self._waiters[exact] = self._waiters.get(exact, 0) + 1
+        try:
+            return await asyncio.shield(task)
+        except asyncio.CancelledError:
+            if self._waiters[exact] == 1 and not task.done():
+                task.cancel()
+            raise
+        finally:
+            self._waiters[exact] -= 1
+            if not self._waiters[exact]:
+                del self._waiters[exact]
+
+    async def _compute(self, exact: str, shape: Optional[str],
+                       compute: Callable[[], Dict[str, Any]]) -> Dict[str, Any]:
+        try:
+            verdict = await asyncio.to_thread(compute)
+            self._put(exact, shape, verdict)
+            return verdict
+        finally:
+            self._inflight.pop(exact, None)
+
+    def clear(self):
+        self._exact.clear()
+        self._shapes.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        hits = self.counters["exact_hits"] + self.counters["shape_hits"]
+        lookups = hits + self.counters["misses"]
+        return {
+            "entries": len(self._exact),
+            "max_entries": self.max_entries,
+            "shapes": len(self._shapes),
+            "max_shapes": self.max_shapes,
+            "in_flight": len(self._inflight),
+            "hit_rate": round(hits / lookups, 4) if lookups else 0.0,
+            "ttls": self.ttls,
+            **self.counters,
+        }